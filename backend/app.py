@@ -3,8 +3,14 @@ from flask_migrate import Migrate
 from flask_cors import CORS
 from database.models import db, User, BankAccount, Transaction, Category
 from database.config import Config
-from datetime import datetime, timedelta
-from werkzeug.security import generate_password_hash, check_password_hash
+from database import routing
+from services import cache, category_service, identity_service, metrics, password_service
+from services.analytics_service import DIMENSIONS, analyze
+from services.search_service import search
+from services.transaction_service import changes_since
+import read_views
+from read_views import cached_response, get_date_range, page_params, response_cache_key, revalidatable
+from datetime import date, timedelta
 import jwt
 import os
 from dotenv import load_dotenv
@@ -12,22 +18,10 @@ from flask_jwt_extended import JWTManager, create_access_token, jwt_required, ge
 
 load_dotenv()
 
-def get_date_range(time_period):
-    now = datetime.utcnow()
-    if time_period == 'month':
-        start_date = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-    elif time_period == 'ytd':
-        start_date = now.replace(month=1, day=1, hour=0, minute=0, second=0, microsecond=0)
-    elif time_period == 'year':
-        start_date = now.replace(year=now.year - 1, hour=0, minute=0, second=0, microsecond=0)
-    else:
-        start_date = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-    return start_date, now
-
 def create_app():
     app = Flask(__name__)
     app.config.from_object(Config)
-    app.config['SQLALCHEMY_DATABASE_URI'] = 'postgresql://postgres:postgres@db:5432/spendapp'
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = routing.engine_options(app.config, app.config['SQLALCHEMY_DATABASE_URI'])
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
     app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'your-secret-key')
     app.config['JWT_SECRET_KEY'] = 'your-secret-key'  # Change this in production
@@ -38,22 +32,42 @@ def create_app():
         r"/*": {
             "origins": ["http://localhost:3000"],
             "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"],
-            "allow_headers": ["Content-Type", "Authorization"],
+            "allow_headers": ["Content-Type", "Authorization", "If-None-Match"],
             "supports_credentials": True,
-            "expose_headers": ["Content-Type", "Authorization"]
+            "expose_headers": ["Content-Type", "Authorization", "ETag", "X-Data-Version"]
         }
     })
     
     # Initialize database
     db.init_app(app)
     migrate = Migrate(app, db)
+    routing.init_app(app)
+    cache.init_app(app)
+    identity_service.init_app(app)
+    category_service.init_app(app)
+    metrics.init_app(app)
     
     # Register blueprints
-    from routes import main, auth
+    from routes import main, auth, plaid_routes, budgets, rules, export, imports
     app.register_blueprint(main.bp)
     app.register_blueprint(auth.router)  # Remove url_prefix to match frontend
+    app.register_blueprint(plaid_routes.plaid_bp)
+    app.register_blueprint(budgets.bp)
+    app.register_blueprint(rules.bp)
+    app.register_blueprint(export.bp)
+    app.register_blueprint(imports.bp)
+    
+    from commands import register_commands
+    register_commands(app)
     
     jwt = JWTManager(app)
+
+    @app.errorhandler(password_service.HashingBusy)
+    def hashing_busy(error):
+        response = jsonify({'detail': 'Too many sign-in attempts in progress, please retry shortly'})
+        response.status_code = 503
+        response.headers['Retry-After'] = str(error.retry_after)
+        return response
     
     return app
 
@@ -69,7 +83,7 @@ def register():
     user = User(
         email=data['email'],
         full_name=data.get('fullName'),
-        hashed_password=generate_password_hash(data['password'])
+        hashed_password=password_service.hash_password(data['password'])
     )
     
     db.session.add(user)
@@ -81,9 +95,15 @@ def register():
 def login():
     data = request.get_json()
     user = User.query.filter_by(email=data['email']).first()
-    
-    if not user or not check_password_hash(user.hashed_password, data['password']):
+    if not user:
         return jsonify({'detail': 'Invalid email or password'}), 401
+
+    valid, upgraded = password_service.verify_password(user.hashed_password, data['password'])
+    if not valid:
+        return jsonify({'detail': 'Invalid email or password'}), 401
+    if upgraded:
+        user.hashed_password = upgraded
+        db.session.commit()
         
     access_token = create_access_token(identity=user.id)
     return jsonify({
@@ -98,75 +118,102 @@ def login():
 @app.route('/api/me', methods=['GET'])
 @jwt_required()
 def get_current_user():
-    user_id = get_jwt_identity()
-    user = User.query.get(user_id)
-    
-    if not user:
-        return jsonify({'detail': 'User not found'}), 404
-    
-    return jsonify({
-        'id': user.id,
-        'email': user.email,
-        'full_name': user.full_name
-    })
+    return read_views.run(read_views.current_user(get_jwt_identity()))
 
 @app.route('/api/transactions', methods=['GET'])
 @jwt_required()
+@routing.replica_reads
 def get_transactions():
+    return read_views.run(read_views.transactions(get_jwt_identity()))
+
+@app.route('/api/transactions/changes', methods=['GET'])
+@jwt_required()
+def get_transaction_changes():
     user_id = get_jwt_identity()
-    time_period = request.args.get('time_period', 'month')
-    start_date, end_date = get_date_range(time_period)
-    
-    # Get all bank accounts for the user
-    bank_accounts = BankAccount.query.filter_by(user_id=user_id).all()
-    account_ids = [account.id for account in bank_accounts]
-    
-    # Get transactions for the specified time period
-    transactions = Transaction.query.filter(
-        Transaction.bank_account_id.in_(account_ids),
-        Transaction.date.between(start_date, end_date)
-    ).order_by(Transaction.date.desc()).all()
-    
-    return jsonify([{
-        'id': t.id,
-        'date': t.date.isoformat(),
-        'description': t.description,
-        'amount': t.amount,
-        'category': t.category,
-        'merchant': t.merchant
-    } for t in transactions])
+    try:
+        since = int(request.args.get('since', ''))
+    except ValueError:
+        since = -1
+    if since < 0:
+        return jsonify({'detail': 'since must be a non-negative integer'}), 400
+    
+    version = cache.data_version(user_id)
+    if version is None:
+        return jsonify({'detail': 'User not found'}), 404
+    changes = {'added': [], 'modified': [], 'removed': []}
+    if since < version:
+        # Version 0 predates change tracking, so there is nothing to diff against
+        changes = changes_since(user_id, since) if since > 0 else None
+    if changes is None:
+        return jsonify({'version': version, 'reset': True})
+    return jsonify({'version': version, 'reset': False, **changes})
+
+@app.route('/api/transactions/search', methods=['GET'])
+@jwt_required()
+@routing.replica_reads
+def search_transactions():
+    user_id = get_jwt_identity()
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({'detail': 'q is required'}), 400
+    
+    # ?start/?end are ISO dates, ?min_amount/?max_amount bound the absolute amount
+    try:
+        start_date = date.fromisoformat(request.args['start']) if 'start' in request.args else None
+        end_date = date.fromisoformat(request.args['end']) if 'end' in request.args else None
+    except ValueError:
+        return jsonify({'detail': 'start and end must be dates (YYYY-MM-DD)'}), 400
+    try:
+        min_amount = float(request.args['min_amount']) if 'min_amount' in request.args else None
+        max_amount = float(request.args['max_amount']) if 'max_amount' in request.args else None
+    except ValueError:
+        return jsonify({'detail': 'min_amount and max_amount must be numbers'}), 400
+    try:
+        limit, cursor = page_params()
+        transactions, next_cursor = search(user_id, query, start_date, end_date, min_amount, max_amount, limit, cursor)
+    except ValueError as e:
+        return jsonify({'detail': str(e)}), 400
+    return jsonify({'transactions': transactions, 'next_cursor': next_cursor})
 
 @app.route('/api/summary', methods=['GET'])
 @jwt_required()
+@routing.replica_reads
 def get_summary():
+    return read_views.run(read_views.summary(get_jwt_identity()))
+
+@app.route('/api/analytics', methods=['GET'])
+@jwt_required()
+@routing.replica_reads
+def get_analytics():
     user_id = get_jwt_identity()
     time_period = request.args.get('time_period', 'month')
     start_date, end_date = get_date_range(time_period)
-    
-    # Get all bank accounts for the user
-    bank_accounts = BankAccount.query.filter_by(user_id=user_id).all()
-    account_ids = [account.id for account in bank_accounts]
-    
-    # Get transactions for the specified time period
-    transactions = Transaction.query.filter(
-        Transaction.bank_account_id.in_(account_ids),
-        Transaction.date.between(start_date, end_date)
-    ).all()
-    
-    # Calculate summary
-    income = sum(t.amount for t in transactions if t.amount > 0)
-    expenses = sum(abs(t.amount) for t in transactions if t.amount < 0)
-    net = income - expenses
-    
-    return jsonify({
-        'income': income,
-        'expenses': expenses,
-        'net': net,
-        'period': {
-            'start': start_date.isoformat(),
-            'end': end_date.isoformat()
-        }
-    })
+    dimensions = [d for d in request.args.get('dimensions', ','.join(DIMENSIONS)).split(',') if d]
+    
+    key = response_cache_key(user_id, 'analytics', start_date.date(), end_date.date())
+    hit = cached_response(key, 'application/json')
+    if hit:
+        return hit
+    
+    # ?top=N keeps the N highest-spend categories, merchants and accounts
+    try:
+        top = int(request.args['top']) if 'top' in request.args else None
+    except ValueError:
+        return jsonify({'detail': 'top must be a positive integer'}), 400
+    try:
+        analytics = analyze(user_id, start_date.date(), end_date.date(), dimensions, top)
+    except ValueError as e:
+        return jsonify({'detail': str(e)}), 400
+    
+    analytics['period'] = {
+        'start': start_date.isoformat(),
+        'end': end_date.isoformat()
+    }
+    response = jsonify(analytics)
+    if key:
+        cache.store(key, response.get_data())
+    response.headers['X-Cache'] = 'MISS'
+    return revalidatable(response, key)
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0', debug=True)
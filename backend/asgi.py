@@ -0,0 +1,144 @@
+"""ASGI entry point: async handlers for the read endpoints, the Flask app for the rest.
+
+    uvicorn asgi:application --host 0.0.0.0 --port 8000
+
+GET /api/me, /api/transactions and /api/summary run on the event loop
+against an AsyncSession, so one process can wait on many slow queries at
+once without pinning a thread per request. They run the same views as the
+Flask app, from read_views.py, inside a Flask request context: the app's
+before-request hooks, JWT checks, error handlers and after-request hooks
+apply, and views the app serves from a replica (@replica_reads) read from
+the same replica here. Every other request is handed to the WSGI app on a
+thread pool.
+
+Cache calls, identity cache included, go to a worker thread when the cache
+is Redis, so a slow cache server does not stall the loop; the in-process
+cache is called inline.
+"""
+import asyncio
+import io
+import sys
+from contextlib import AsyncExitStack
+from a2wsgi import WSGIMiddleware
+from flask import request
+from flask_jwt_extended import get_jwt_identity, verify_jwt_in_request
+from sqlalchemy.exc import OperationalError
+import read_views
+from app import app
+from database import async_db
+
+ROUTES = {
+    '/api/me': read_views.current_user,
+    '/api/transactions': read_views.transactions,
+    '/api/summary': read_views.summary
+}
+
+def build_environ(scope):
+    """A WSGI environ for an ASGI request without a body, so Flask can parse it"""
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode().decode('latin1'),
+        'PATH_INFO': scope['path'].encode().decode('latin1'),
+        'QUERY_STRING': scope['query_string'].decode('latin1'),
+        'SERVER_PROTOCOL': f"HTTP/{scope['http_version']}",
+        'SERVER_NAME': (scope.get('server') or ('localhost', 80))[0],
+        'SERVER_PORT': str((scope.get('server') or ('localhost', 80))[1]),
+        'REMOTE_ADDR': (scope.get('client') or ('', 0))[0],
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False
+    }
+    for name, value in scope['headers']:
+        name, value = name.decode('latin1'), value.decode('latin1')
+        key = name.upper().replace('-', '_')
+        if key not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            key = f'HTTP_{key}'
+        environ[key] = f'{environ[key]},{value}' if key in environ else value
+    return environ
+
+async def _send(send, response):
+    body = getattr(response, 'async_body', None)
+    if body is not None:
+        # Streamed: the length is not known up front
+        response.headers.pop('Content-Length', None)
+    await send({
+        'type': 'http.response.start',
+        'status': response.status_code,
+        'headers': [(name.lower().encode('latin1'), value.encode('latin1')) for name, value in response.headers.items()]
+    })
+    if body is None:
+        await send({'type': 'http.response.body', 'body': response.get_data()})
+        return
+    async for chunk in body:
+        await send({'type': 'http.response.body', 'body': chunk.encode(), 'more_body': True})
+    await send({'type': 'http.response.body', 'body': b''})
+
+async def _serve(view, stack):
+    """The view's response, read from a replica when the Flask view uses one and one is current enough"""
+    user_id = get_jwt_identity()
+    replicas = app.extensions.get('db_replicas')
+    replica = None
+    if replicas and getattr(app.view_functions[request.url_rule.endpoint], 'replica_reads', False):
+        # Sampling a replica's lag is a blocking query
+        replica = await asyncio.to_thread(replicas.choose, user_id)
+    if replica is not None:
+        session = await stack.enter_async_context(async_db.session(replica))
+        try:
+            return await read_views.arun(view(user_id), session)
+        except OperationalError as e:
+            replicas.mark_down(replica, e)
+            await session.close()
+    session = await stack.enter_async_context(async_db.session())
+    return await read_views.arun(view(user_id), session)
+
+async def handle(view, scope, send):
+    with app.request_context(build_environ(scope)):
+        async with AsyncExitStack() as stack:
+            try:
+                # The before-request hooks, as Flask's own dispatch runs them
+                response = app.preprocess_request()
+                if response is None:
+                    verify_jwt_in_request()
+                    response = await _serve(view, stack)
+                response = app.make_response(response)
+            except Exception as e:
+                # JWT failures and the like get the app's error handlers
+                try:
+                    response = app.make_response(app.handle_user_exception(e))
+                except Exception as unhandled:
+                    response = app.make_response(app.handle_exception(unhandled))
+            response = app.process_response(response)
+            # The body may still be streaming from the session
+            await _send(send, response)
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            async_db.init_app(app)
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await async_db.dispose()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+class Application:
+    """Routes the async read endpoints and passes everything else to Flask"""
+
+    def __init__(self, flask_app):
+        self.wsgi = WSGIMiddleware(flask_app)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await _lifespan(receive, send)
+        view = ROUTES.get(scope['path']) if scope['type'] == 'http' and scope['method'] == 'GET' else None
+        if view is None:
+            return await self.wsgi(scope, receive, send)
+        async_db.init_app(app)
+        await handle(view, scope, send)
+
+application = Application(app)
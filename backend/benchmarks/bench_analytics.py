@@ -0,0 +1,63 @@
+"""/api/analytics breakdowns in one statement against a latency budget.
+
+    python -m benchmarks.bench_analytics [--sizes 1000000] [--budget-ms 1500]
+
+Seeds one user per size and times analyze() over the past year for all four
+dimensions, with and without a top-N cut, next to the alternative it
+replaces: downloading the raw transactions and aggregating them client-side.
+Exits non-zero if any analyze() run's median exceeds the budget.
+"""
+import argparse
+import sys
+from collections import defaultdict
+from datetime import date, timedelta
+from sqlalchemy import text
+from benchmarks.common import app, db, reset_schema, seed_user, measure, print_table
+from services.analytics_service import analyze
+from services.transaction_service import iter_transactions
+
+def client_side(user_id, start_date, end_date):
+    """What the frontend would otherwise do with /api/transactions (spend per category, merchant and month)"""
+    totals = defaultdict(lambda: defaultdict(float))
+    for transaction in iter_transactions(user_id, start_date, end_date):
+        for dimension, key in (('category', transaction['category']), ('merchant', transaction['merchant']),
+                               ('month', transaction['date'][:7])):
+            totals[dimension][key] += max(-transaction['amount'], 0)
+    return totals
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000000])
+    parser.add_argument('--budget-ms', type=float, default=1500)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    end_date = date.today()
+    start_date = end_date - timedelta(days=365)
+    rows = []
+    over_budget = False
+    with app.app_context():
+        for size in args.sizes:
+            reset_schema()
+            user_id = seed_user(size)
+            db.session.execute(text('ANALYZE'))
+            db.session.commit()
+            for name, fn, budgeted in [
+                ('client-side', lambda: client_side(user_id, start_date, end_date), False),
+                ('analyze', lambda: analyze(user_id, start_date, end_date), True),
+                ('analyze top=10', lambda: analyze(user_id, start_date, end_date, top=10), True),
+            ]:
+                seconds, peak = measure(fn, args.repeat)
+                within = seconds * 1000 <= args.budget_ms
+                over_budget |= budgeted and not within
+                rows.append([size, name, f'{seconds * 1000:.1f}', f'{peak / 1024:.0f}',
+                             ('yes' if within else 'NO') if budgeted else '-'])
+        reset_schema()
+
+    print(f'Latency budget: {args.budget_ms:g} ms')
+    print_table(['transactions', 'implementation', 'median ms', 'peak KiB', 'within budget'], rows)
+    if over_budget:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
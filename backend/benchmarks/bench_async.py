@@ -0,0 +1,184 @@
+"""Concurrent clients against the sync (threaded WSGI) and async (ASGI) read paths.
+
+    DATABASE_URL=postgresql://... python -m benchmarks.bench_async [--clients 1000] [--requests 5000] [--db-latency-ms 20]
+
+Each mode serves the app from its own process: the Flask app on werkzeug's
+threaded server (a thread per in-flight request), or asgi.py on uvicorn.
+`--clients` connections are kept busy issuing uncached GETs to
+/api/summary and /api/transactions?limit=50 until `--requests` have
+completed. Both modes get the same number of database connections; errors
+are mostly requests that waited longer than the pool timeout for one.
+
+On Postgres, database traffic goes through a local proxy adding
+`--db-latency-ms` per round trip, standing in for a database that is not on
+the same host; that wait is what the async path can overlap.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from sqlalchemy.engine import make_url
+from benchmarks.common import free_port, process_status, wait_for
+
+# Flask-SQLAlchemy's default QueuePool size
+POOL_SIZE, MAX_OVERFLOW = 5, 10
+PATHS = ['/api/summary?time_period=year', '/api/transactions?time_period=month&limit=50']
+
+def serve(mode, port):
+    """Runs in the server process"""
+    if mode == 'async':
+        import uvicorn
+        uvicorn.run('asgi:application', host='127.0.0.1', port=port, log_level='warning', backlog=4096)
+        return
+    import logging
+    from werkzeug.serving import make_server
+    from app import app
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = make_server('127.0.0.1', port, app, threaded=True)
+    server.socket.listen(4096)
+    server.serve_forever()
+
+class LatencyProxy:
+    """Forwards TCP connections to `target`, delaying every chunk by half the round trip"""
+
+    def __init__(self, target, latency):
+        self.target = target
+        self.delay = latency / 2
+        self.port = free_port()
+        self.loop = asyncio.new_event_loop()
+
+    async def _pipe(self, reader, writer):
+        try:
+            while data := await reader.read(65536):
+                await asyncio.sleep(self.delay)
+                writer.write(data)
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def _handle(self, client_reader, client_writer):
+        server_reader, server_writer = await asyncio.open_connection(*self.target)
+        await asyncio.gather(self._pipe(client_reader, server_writer), self._pipe(server_reader, client_writer))
+
+    def start(self):
+        async def run():
+            await asyncio.start_server(self._handle, '127.0.0.1', self.port)
+        self.loop.run_until_complete(run())
+        threading.Thread(target=self.loop.run_forever, daemon=True).start()
+
+async def _get(port, path, token):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(f'GET {path} HTTP/1.1\r\nHost: bench\r\nAuthorization: Bearer {token}\r\n'
+                 f'Connection: close\r\n\r\n'.encode())
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    return int(response.split(b' ', 2)[1])
+
+async def load(port, token, clients, total):
+    latencies, errors, remaining = [], 0, total
+
+    async def client(i):
+        nonlocal errors, remaining
+        while remaining > 0:
+            remaining -= 1
+            started = time.perf_counter()
+            try:
+                status = await _get(port, PATHS[i % len(PATHS)], token)
+            except (OSError, IndexError, ValueError):
+                status = None
+            latencies.append(time.perf_counter() - started)
+            if status != 200:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client(i) for i in range(clients)))
+    return time.perf_counter() - started, latencies, errors
+
+class ThreadSampler(threading.Thread):
+    """Tracks the most threads a process had running at once"""
+
+    def __init__(self, pid):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.peak = 0
+        self.done = threading.Event()
+
+    def run(self):
+        while not self.done.wait(0.05):
+            self.peak = max(self.peak, process_status(self.pid)[1])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--clients', type=int, default=1000)
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--transactions', type=int, default=20000)
+    parser.add_argument('--db-latency-ms', type=float, default=20)
+    parser.add_argument('--serve', choices=['sync', 'async'], help=argparse.SUPPRESS)
+    parser.add_argument('--port', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.serve:
+        return serve(args.serve, args.port)
+
+    from flask_jwt_extended import create_access_token
+    from benchmarks.common import app, db, reset_schema, seed_user, print_table
+    from services.rollup_service import rebuild
+
+    with app.app_context():
+        reset_schema()
+        user_id = seed_user(args.transactions)
+        rebuild(user_id)
+        db.session.commit()
+        token = create_access_token(identity=user_id)
+        db.session.remove()
+
+    database_url = os.environ['DATABASE_URL']
+    url = make_url(database_url)
+    if url.get_backend_name() == 'postgresql' and args.db_latency_ms:
+        proxy = LatencyProxy((url.host or '127.0.0.1', url.port or 5432), args.db_latency_ms / 1000)
+        proxy.start()
+        database_url = url.set(host='127.0.0.1', port=proxy.port).render_as_string(hide_password=False)
+
+    # The async pool is sized like Flask-SQLAlchemy's default one
+    env = dict(
+        os.environ, DATABASE_URL=database_url, CACHE_BACKEND='none',
+        ASYNC_POOL_SIZE=str(POOL_SIZE), ASYNC_MAX_OVERFLOW=str(MAX_OVERFLOW)
+    )
+    rows = []
+    for mode in ('sync', 'async'):
+        port = free_port()
+        # Requests that time out waiting for a connection are counted, not logged
+        server = subprocess.Popen([sys.executable, '-m', 'benchmarks.bench_async', '--serve', mode, '--port', str(port)],
+                                  env=env, stderr=subprocess.DEVNULL)
+        try:
+            wait_for(port)
+            asyncio.run(load(port, token, 10, 50))  # warm up connections and imports
+            sampler = ThreadSampler(server.pid)
+            sampler.start()
+            elapsed, latencies, errors = asyncio.run(load(port, token, args.clients, args.requests))
+            sampler.done.set()
+            rss, _ = process_status(server.pid)
+        finally:
+            server.terminate()
+            server.wait()
+        latencies.sort()
+        rows.append([
+            mode, args.clients, len(latencies), errors, f'{len(latencies) / elapsed:.0f}',
+            f'{statistics.median(latencies) * 1000:.0f}', f'{latencies[int(len(latencies) * 0.99) - 1] * 1000:.0f}',
+            f'{rss:.0f}', sampler.peak
+        ])
+
+    with app.app_context():
+        reset_schema()
+    print(f'{args.transactions} transactions, {POOL_SIZE}+{MAX_OVERFLOW} database connections per server, '
+          f'{args.db_latency_ms:g} ms added database round trip')
+    print_table(['mode', 'clients', 'requests', 'errors', 'req/s', 'p50 ms', 'p99 ms', 'peak RSS MiB', 'peak threads'], rows)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,146 @@
+"""Categorization at ingest and set-based recategorization after a rule change.
+
+    DATABASE_URL=postgresql://... python -m benchmarks.bench_categorize [--transactions 1000000] [--rules 200]
+
+Categorize: a batch of `--batch` raw card descriptions is normalized and
+categorized against `--rules` user rules plus the built-in ones, first by
+trying every rule on every row, then with the compiled Matcher, cold (empty
+memo) and warm.
+
+Recategorize: a user with `--transactions` rows gets a new rule and the
+whole history is re-derived with category_service.recategorize(), next to a
+per-row ORM loop over `--naive-transactions` rows of another user,
+extrapolated to the same size.
+"""
+import argparse
+import random
+import re
+import time
+from sqlalchemy import select, text
+from benchmarks.common import MERCHANTS, app, db, describe, reset_schema, seed_user, measure, print_table
+from database.models import BankAccount, Category, CategoryRule, Transaction
+from database.dialects import is_postgres
+from services import category_service
+from services.category_service import Matcher, in_range, normalize_merchant
+
+def batch(size):
+    rng = random.Random(7)
+    return [
+        {'description': describe(rng, rng.choice(MERCHANTS)), 'merchant': None, 'amount': -round(rng.uniform(1, 250), 2)}
+        for _ in range(size)
+    ]
+
+def naive_category(rules, merchant, amount):
+    """Every rule tried in turn, as a loop over the rules would"""
+    key = (merchant or '').lower()
+    for rule in rules:
+        if rule.pattern is None:
+            matched = True
+        elif rule.kind == 'contains':
+            matched = rule.pattern.lower() in key
+        else:
+            matched = re.search(rule.pattern, key, re.I) is not None
+        if matched and in_range(rule, abs(amount)):
+            return rule.category_id
+    return None
+
+def naive_recategorize(user_id):
+    """The per-row alternative: load every transaction, match it in Python, write it back through the ORM"""
+    rules = category_service.matcher(user_id).rules
+    accounts = select(BankAccount.id).where(BankAccount.user_id == user_id)
+    changed = 0
+    for transaction in Transaction.query.filter(Transaction.bank_account_id.in_(accounts)):
+        category_id = naive_category(rules, transaction.merchant or normalize_merchant(transaction.description),
+                                     transaction.amount)
+        if category_id != transaction.category_id:
+            transaction.category_id = category_id
+            changed += 1
+    db.session.commit()
+    return changed
+
+def add_rules(user_id, count):
+    """`count` user rules that match none of the seeded merchants, then one that does"""
+    category_id = Category.query.first().id
+    db.session.add_all(
+        CategoryRule(user_id=user_id, category_id=category_id, pattern=f'merchant {i}', priority=i)
+        for i in range(count)
+    )
+    db.session.commit()
+
+def toggle_rule(user_id):
+    """Add a rule moving every 'Grocery Store' row, or remove it; either way the history must change"""
+    rule = CategoryRule.query.filter_by(user_id=user_id, pattern='grocery').first()
+    if rule:
+        db.session.delete(rule)
+    else:
+        shopping = Category.query.filter_by(name='Shopping').first()
+        db.session.add(CategoryRule(user_id=user_id, category_id=shopping.id, pattern='grocery', priority=-1))
+    db.session.commit()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--transactions', type=int, default=1000000)
+    parser.add_argument('--naive-transactions', type=int, default=20000)
+    parser.add_argument('--batch', type=int, default=100000)
+    parser.add_argument('--rules', type=int, default=200)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    rows = []
+    with app.app_context():
+        reset_schema()
+        user_id = seed_user(args.transactions, describe=describe)
+        naive_user_id = seed_user(args.naive_transactions, seed=43, describe=describe)
+        for owner in (user_id, naive_user_id):
+            add_rules(owner, args.rules)
+        if is_postgres():
+            db.session.execute(text('ANALYZE'))
+            db.session.commit()
+
+        rules = category_service.matcher(user_id).rules
+        raw = batch(args.batch)
+
+        def naive_batch():
+            for row in raw:
+                naive_category(rules, normalize_merchant(row['description']), row['amount'])
+
+        def compiled_batch(compiled):
+            for row in raw:
+                compiled.category(normalize_merchant(row['description']), row['amount'])
+
+        warm = Matcher(rules)
+        compiled_batch(warm)
+        for name, fn in [
+            ('every rule per row', naive_batch),
+            ('compiled, cold memo', lambda: compiled_batch(Matcher(rules))),
+            ('compiled, warm memo', lambda: compiled_batch(warm)),
+        ]:
+            seconds, _ = measure(fn, args.repeat)
+            rows.append(['categorize', name, args.batch, f'{seconds * 1000:.0f}', f'{args.batch / seconds:,.0f}'])
+
+        timings, changed = [], 0
+        for _ in range(args.repeat):
+            toggle_rule(user_id)
+            started = time.perf_counter()
+            changed = category_service.recategorize(user_id)
+            db.session.commit()
+            timings.append(time.perf_counter() - started)
+        seconds = sorted(timings)[len(timings) // 2]
+        rows.append(['recategorize', f'set-based ({changed} changed)', args.transactions,
+                     f'{seconds * 1000:.0f}', f'{args.transactions / seconds:,.0f}'])
+
+        toggle_rule(naive_user_id)
+        started = time.perf_counter()
+        naive_recategorize(naive_user_id)
+        seconds = time.perf_counter() - started
+        per_row = seconds / args.naive_transactions
+        rows.append(['recategorize', 'per-row ORM', args.naive_transactions, f'{seconds * 1000:.0f}', f'{1 / per_row:,.0f}'])
+        rows.append(['recategorize', 'per-row ORM (extrapolated)', args.transactions,
+                     f'{per_row * args.transactions * 1000:.0f}', f'{1 / per_row:,.0f}'])
+        reset_schema()
+
+    print(f'{args.rules} user rules + {len(category_service.BUILTIN_RULES)} built-in')
+    print_table(['operation', 'implementation', 'rows', 'median ms', 'rows/s'], rows)
+
+if __name__ == '__main__':
+    main()
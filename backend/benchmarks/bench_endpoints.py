@@ -0,0 +1,262 @@
+"""Throughput, latency percentiles, SQL statements and memory of the main endpoints.
+
+    DATABASE_URL=postgresql://... python -m benchmarks.bench_endpoints [--scales 1000 10000 100000]
+        [--concurrency 8] [--requests 400] [--output endpoints.json] [--baseline old.json] [--max-regression 0.15]
+    python -m benchmarks.bench_endpoints --compare old.json new.json [--max-regression 0.15]
+
+For every scale a user with that many transactions (a year of them, from
+services.seed_service) is created. The app is then served from its own
+process on werkzeug's threaded server, with the response cache off unless
+`--cache` is given. `--concurrency` clients keep each endpoint busy for
+`--requests` requests after a short warm-up. Each endpoint and scale gets a
+result row:
+- throughput and p50/p95/p99 latency
+- SQL statements per request, counted inside the server
+- the server's peak RSS while it ran; the peak is reset between endpoints
+  where the kernel allows
+
+Results are written to `--output` as JSON. Given `--baseline` (an earlier
+output), or with `--compare OLD NEW`, the two runs are diffed. The command
+exits non-zero when an endpoint regressed by more than `--max-regression`:
+- p95 latency rose
+- throughput fell
+- peak RSS grew
+- it issues more SQL statements per request
+Small absolute changes in latency and memory are ignored as noise.
+"""
+import argparse
+import http.client
+import json
+import os
+import platform
+import signal
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime
+from urllib.parse import urlencode
+from benchmarks.common import free_port, percentile, print_table, process_status, reset_peak_rss, wait_for
+
+# name -> (method, path, JSON body); `{email}` and `{password}` are filled in per scale
+ENDPOINTS = {
+    'login': ('POST', '/login', {'email': '{email}', 'password': '{password}'}),
+    'me': ('GET', '/api/me', None),
+    'transactions': ('GET', '/api/transactions?' + urlencode({'time_period': 'year', 'limit': 50}), None),
+    'summary': ('GET', '/api/summary?time_period=year', None),
+}
+PASSWORD = 'bench-password'
+WARM_UP = 20
+# Changes smaller than these are noise whatever the ratio
+LATENCY_FLOOR_MS = 1.0
+RSS_FLOOR_MIB = 5.0
+QUERY_FLOOR = 0.5
+
+def serve(port):
+    """Runs in the server process: the app plus a route reporting how many SQL statements ran"""
+    import logging
+    from flask import jsonify
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+    from werkzeug.serving import make_server
+    from app import app
+
+    lock, statements = threading.Lock(), [0]
+
+    @event.listens_for(Engine, 'before_cursor_execute')
+    def count(*args):
+        with lock:
+            statements[0] += 1
+
+    app.add_url_rule('/_bench/statements', 'bench_statements', lambda: jsonify(statements=statements[0]))
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    make_server('127.0.0.1', port, app, threaded=True).serve_forever()
+
+def drive(port, method, path, body, headers, concurrency, total):
+    """Keep `concurrency` connections busy until `total` requests are done; (seconds, latencies, errors)"""
+    latencies, errors, remaining, lock = [], [0], [total], threading.Lock()
+
+    def client():
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=120)
+        while True:
+            with lock:
+                if not remaining[0]:
+                    break
+                remaining[0] -= 1
+            started = time.perf_counter()
+            try:
+                conn.request(method, path, body=body, headers=headers)
+                response = conn.getresponse()
+                response.read()
+                status = response.status
+            except (OSError, http.client.HTTPException):
+                conn.close()
+                status = None
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+                if status is None or status >= 400:
+                    errors[0] += 1
+        conn.close()
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - started, latencies, errors[0]
+
+def statements(port):
+    conn = http.client.HTTPConnection('127.0.0.1', port)
+    conn.request('GET', '/_bench/statements')
+    count = json.loads(conn.getresponse().read())['statements']
+    conn.close()
+    return count
+
+def seed(scales):
+    """Create a user per scale; {scale: (email, token)}"""
+    from flask_jwt_extended import create_access_token
+    from benchmarks.common import app, db, reset_schema
+    from database.models import User
+    from services import password_service, seed_service
+
+    users = {}
+    with app.app_context():
+        reset_schema()
+        for scale in scales:
+            seed_service.generate(1, accounts=3, transactions=scale, days=365, seed=scale, password=PASSWORD)
+            email = seed_service.email(scale, 0)
+            user_id = db.session.execute(db.select(User.id).where(User.email == email)).scalar_one()
+            users[scale] = (email, create_access_token(identity=user_id))
+        db.session.remove()
+    password_service.shutdown()
+    return users
+
+def run(args):
+    users = seed(sorted(args.scales))
+    port = free_port()
+    env = dict(os.environ)
+    if not args.cache:
+        env['CACHE_BACKEND'] = 'none'
+    # Its own process group, so stopping it also stops its password hashing workers
+    server = subprocess.Popen([sys.executable, '-m', 'benchmarks.bench_endpoints', '--serve', '--port', str(port)],
+                              env=env, start_new_session=True)
+    results, rss_resets = [], True
+    try:
+        wait_for(port)
+        for scale, (email, token) in users.items():
+            for name in args.endpoints:
+                method, path, body = ENDPOINTS[name]
+                headers = {'Authorization': f'Bearer {token}'}
+                if body is not None:
+                    body = json.dumps({k: v.format(email=email, password=PASSWORD) for k, v in body.items()})
+                    headers['Content-Type'] = 'application/json'
+                drive(port, method, path, body, headers, args.concurrency, WARM_UP)
+
+                before = statements(port)
+                rss_resets = reset_peak_rss(server.pid) and rss_resets
+                seconds, latencies, errors = drive(port, method, path, body, headers, args.concurrency, args.requests)
+                queries = statements(port) - before
+                results.append({
+                    'endpoint': name,
+                    'scale': scale,
+                    'requests': len(latencies),
+                    'errors': errors,
+                    'throughput_rps': round(len(latencies) / seconds, 1),
+                    **{f'p{pct}_ms': round(percentile(latencies, pct) * 1000, 2) for pct in (50, 95, 99)},
+                    'queries_per_request': round(queries / len(latencies), 2),
+                    'peak_rss_mib': round(process_status(server.pid)[0], 1),
+                })
+    finally:
+        os.killpg(server.pid, signal.SIGTERM)
+        server.wait()
+
+    return {
+        'meta': {
+            'commit': git_commit(),
+            'created': datetime.utcnow().isoformat(timespec='seconds'),
+            'database': os.environ['DATABASE_URL'].split(':', 1)[0],
+            'python': platform.python_version(),
+            'concurrency': args.concurrency,
+            'cache': args.cache,
+            'peak_rss_per_endpoint': rss_resets,
+        },
+        'results': results,
+    }
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def regressions(old, new, threshold):
+    """Table rows comparing two runs, and the list of regressions beyond `threshold`"""
+    before = {(r['endpoint'], r['scale']): r for r in old['results']}
+    rows, found = [], []
+    for result in new['results']:
+        key = (result['endpoint'], result['scale'])
+        base = before.get(key)
+        if base is None:
+            continue
+        checks = [
+            ('p95_ms', result['p95_ms'] > base['p95_ms'] * (1 + threshold)
+             and result['p95_ms'] - base['p95_ms'] > LATENCY_FLOOR_MS),
+            ('throughput_rps', result['throughput_rps'] * (1 + threshold) < base['throughput_rps']),
+            ('peak_rss_mib', result['peak_rss_mib'] > base['peak_rss_mib'] * (1 + threshold)
+             and result['peak_rss_mib'] - base['peak_rss_mib'] > RSS_FLOOR_MIB),
+            ('queries_per_request', result['queries_per_request'] - base['queries_per_request'] > QUERY_FLOOR),
+        ]
+        for metric, regressed in checks:
+            change = (result[metric] / base[metric] - 1) * 100 if base[metric] else float('nan')
+            rows.append([*key, metric, base[metric], result[metric], f'{change:+.1f}%', 'REGRESSED' if regressed else ''])
+            if regressed:
+                found.append((*key, metric))
+    return rows, found
+
+def report_comparison(old, new, threshold):
+    rows, found = regressions(old, new, threshold)
+    print(f"{old['meta'].get('commit')} -> {new['meta'].get('commit')}, threshold {threshold:.0%}")
+    print_table(['endpoint', 'scale', 'metric', 'before', 'after', 'change', ''], rows)
+    if found:
+        print('Regressed: ' + ', '.join(f'{endpoint}@{scale} {metric}' for endpoint, scale, metric in found))
+        sys.exit(1)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scales', type=int, nargs='+', default=[1000, 10000, 100000],
+                        help='Transactions of the user each endpoint is driven for.')
+    parser.add_argument('--endpoints', nargs='+', choices=list(ENDPOINTS), default=list(ENDPOINTS))
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=400)
+    parser.add_argument('--cache', action='store_true', help='Keep the response cache on.')
+    parser.add_argument('--output', default='bench_endpoints.json')
+    parser.add_argument('--baseline', help='Earlier output to diff against.')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help='Only diff two earlier outputs.')
+    parser.add_argument('--max-regression', type=float, default=0.15)
+    parser.add_argument('--serve', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--port', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.serve:
+        return serve(args.port)
+    if args.compare:
+        old, new = (json.load(open(path)) for path in args.compare)
+        return report_comparison(old, new, args.max_regression)
+
+    report = run(args)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=1)
+    print_table(
+        ['endpoint', 'scale', 'requests', 'errors', 'req/s', 'p50 ms', 'p95 ms', 'p99 ms', 'queries/req', 'peak RSS MiB'],
+        [[r['endpoint'], r['scale'], r['requests'], r['errors'], r['throughput_rps'], r['p50_ms'], r['p95_ms'],
+          r['p99_ms'], r['queries_per_request'], r['peak_rss_mib']] for r in report['results']]
+    )
+    print(f'Wrote {args.output}')
+    if args.baseline:
+        with open(args.baseline) as f:
+            report_comparison(json.load(f), report, args.max_regression)
+
+if __name__ == '__main__':
+    main()
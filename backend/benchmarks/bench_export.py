@@ -0,0 +1,93 @@
+"""Memory and time of exporting a user's whole history.
+
+    DATABASE_URL=postgresql://... python -m benchmarks.bench_export [--sizes 100000 1000000] [--max-growth 2]
+
+For each size a user with that many transactions is exported as CSV and as
+Parquet by services.export_service, next to what exporting took before:
+paging through the listing and writing the collected rows out at the end,
+which is only run up to `--paged-max` rows as every page costs a sort of
+the user's history. Peak memory is reported both as traced Python
+allocations and as the growth of the process's resident set while the
+export runs, which also covers pyarrow's and libpq's buffers. Exits non-zero if a streamed export's traced
+peak at the largest size is more than `--max-growth` times the smallest's.
+Parquet holds a row group in memory, so below ROW_GROUP_SIZE rows its peak
+rightly grows with the export; its peaks are compared per buffered row.
+"""
+import argparse
+import csv
+import io
+import sys
+from datetime import date
+from benchmarks.common import app, db, describe, reset_schema, seed_user, measure, peak_rss_growth, print_table
+from services import export_service
+from services.transaction_service import MAX_PAGE_SIZE, get_page
+
+# Peaks below this count as this much, so noise in tiny peaks cannot fail a run
+MEMORY_FLOOR = 2**20
+
+def buffered_rows(name, size):
+    """Rows a streamed export of `size` rows holds at once, up to a constant"""
+    return min(size, export_service.ROW_GROUP_SIZE) if name == 'parquet' else 1
+
+def drain(chunks):
+    return sum(len(chunk) for chunk in chunks)
+
+def paged(user_id):
+    """The old way out: page through /api/transactions' query, then write everything"""
+    transactions, cursor = [], None
+    while True:
+        page, cursor = get_page(user_id, date.min, date.max, MAX_PAGE_SIZE, cursor)
+        transactions += page
+        if cursor is None:
+            break
+    out = io.StringIO()
+    writer = csv.DictWriter(out, fieldnames=['id', 'date', 'description', 'amount', 'category', 'merchant'])
+    writer.writeheader()
+    writer.writerows(transactions)
+    return len(out.getvalue())
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100000, 1000000])
+    parser.add_argument('--max-growth', type=float, default=2.0)
+    parser.add_argument('--paged-max', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    exports = [('csv', lambda user_id: drain(export_service.iter_csv(user_id)))]
+    if export_service.parquet_available():
+        exports.append(('parquet', lambda user_id: drain(export_service.iter_parquet(user_id))))
+    exports.append(('paged listing', paged))
+
+    rows = []
+    peaks = {}
+    with app.app_context():
+        reset_schema()
+        for size in sorted(args.sizes):
+            user_id = seed_user(size, seed=size, describe=describe)
+            for name, export in exports:
+                if name == 'paged listing' and size > args.paged_max:
+                    continue
+                seconds, traced = measure(lambda: export(user_id), args.repeat)
+                db.session.remove()
+                resident = peak_rss_growth(lambda: export(user_id))
+                peaks.setdefault(name, []).append((size, traced))
+                rows.append([size, name, f'{seconds * 1000:.0f}', f'{size / seconds:,.0f}',
+                             f'{traced / 2**20:.1f}', f'{resident / 2**20:.1f}'])
+        reset_schema()
+
+    print_table(['rows', 'export', 'median ms', 'rows/s', 'traced peak MiB', 'RSS growth MiB'], rows)
+    growth = {}
+    for name, values in peaks.items():
+        if name == 'paged listing':
+            continue
+        (smallest, low), (largest, high) = values[0], values[-1]
+        growth[name] = (max(high, MEMORY_FLOOR) / max(low, MEMORY_FLOOR)
+                        / (buffered_rows(name, largest) / buffered_rows(name, smallest)))
+    print('Traced peak per buffered row, largest/smallest size: '
+          + ', '.join(f'{name} {ratio:.2f}x' for name, ratio in growth.items()))
+    if any(ratio > args.max_growth for ratio in growth.values()):
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+"""Time and memory of importing a large CSV statement.
+
+    DATABASE_URL=postgresql://... python -m benchmarks.bench_import [--rows 500000] [--baseline-rows 20000]
+
+A statement of `--rows` card transactions is written to a temporary file and
+imported by services.import_service into a fresh account of a user who
+already has `--history` transactions, then imported again to show that every
+row is recognised as a duplicate. Each import is a single run, as a second
+run of the same file would be a different workload; traced memory is
+measured on a separate import into a fresh account. For comparison the first
+`--baseline-rows` rows are imported the way a row-at-a-time importer would:
+a lookup per row for a duplicate, then an ORM insert.
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+from datetime import date, timedelta
+from benchmarks.common import app, db, MERCHANTS, describe, reset_schema, seed_user, print_table
+from database.models import BankAccount, Transaction
+from services import category_service, import_service
+from services.category_service import normalize_merchant
+from services.import_service import parse_csv
+
+def write_statement(path, rows, seed=7):
+    rng = random.Random(seed)
+    today = date.today()
+    with open(path, 'w') as f:
+        f.write('Date,Description,Amount\n')
+        for _ in range(rows):
+            amount = round(rng.uniform(500, 3000), 2) if rng.random() < 0.05 else -round(rng.uniform(1, 250), 2)
+            day = today - timedelta(days=rng.randrange(400))
+            f.write(f'{day.isoformat()},{describe(rng, rng.choice(MERCHANTS))},{amount}\n')
+
+def new_account(user_id):
+    account = BankAccount(user_id=user_id, plaid_account_id=f'bench-import-{time.perf_counter_ns()}',
+                          account_name='Imported', account_type='depository')
+    db.session.add(account)
+    db.session.commit()
+    return account.id
+
+def bulk(user_id, path):
+    account_id = new_account(user_id)
+
+    def run():
+        with open(path, 'rb') as f:
+            counts = import_service.import_statement(user_id, account_id, f, 'csv')
+        db.session.commit()
+        return counts
+    return account_id, run
+
+def row_at_a_time(user_id, path, limit):
+    """One duplicate lookup and one ORM insert per row"""
+    account_id = new_account(user_id)
+    compiled = category_service.matcher(user_id)
+    imported = 0
+    with open(path) as f:
+        for line, day, amount, description in parse_csv(f):
+            if line > limit + 1:
+                break
+            exists = Transaction.query.filter_by(bank_account_id=account_id, date=day, amount=amount,
+                                                 description=description).first()
+            if exists:
+                continue
+            merchant = normalize_merchant(description)
+            db.session.add(Transaction(bank_account_id=account_id, plaid_transaction_id=f'row-{account_id}-{line}',
+                                       amount=amount, date=day, description=description, merchant=merchant,
+                                       category_id=compiled.category(merchant, amount)))
+            imported += 1
+    db.session.commit()
+    return imported
+
+def timed(fn):
+    db.session.remove()
+    started = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - started, result
+
+def traced(fn):
+    db.session.remove()
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=500000)
+    parser.add_argument('--history', type=int, default=100000)
+    parser.add_argument('--baseline-rows', type=int, default=20000)
+    args = parser.parse_args()
+
+    fd, path = tempfile.mkstemp(suffix='.csv')
+    os.close(fd)
+    rows = []
+    try:
+        write_statement(path, args.rows)
+        megabytes = os.path.getsize(path) / 2**20
+        with app.app_context():
+            reset_schema()
+            user_id = seed_user(args.history, describe=describe)
+
+            _, first = bulk(user_id, path)
+            seconds, counts = timed(first)
+            rows.append(['bulk import', args.rows, counts['imported'], f'{seconds:.1f}', f'{args.rows / seconds:,.0f}'])
+            seconds, counts = timed(first)
+            rows.append(['same file again', args.rows, counts['imported'], f'{seconds:.1f}', f'{args.rows / seconds:,.0f}'])
+            seconds, imported = timed(lambda: row_at_a_time(user_id, path, args.baseline_rows))
+            rows.append(['row at a time', args.baseline_rows, imported, f'{seconds:.1f}',
+                         f'{args.baseline_rows / seconds:,.0f}'])
+
+            peak = traced(bulk(user_id, path)[1])
+            reset_schema()
+    finally:
+        os.remove(path)
+
+    print_table(['import', 'rows', 'imported', 'seconds', 'rows/s'], rows)
+    print(f'Statement {megabytes:.1f} MiB; bulk import traced peak {peak / 2**20:.1f} MiB')
+
+if __name__ == '__main__':
+    main()
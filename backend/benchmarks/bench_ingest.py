@@ -0,0 +1,83 @@
+"""Rows/second for ingesting Plaid transactions: per-object ORM adds vs the bulk upsert writer.
+
+    python -m benchmarks.bench_ingest [--sizes 10000 1000000] [--chunk-size 1000]
+
+The per-object path is skipped above --orm-limit rows since it is too slow
+to be worth waiting for.
+"""
+import argparse
+import random
+import time
+from datetime import date, timedelta
+from sqlalchemy.exc import IntegrityError
+from benchmarks.common import app, db, reset_schema, seed_user, print_table, MERCHANTS
+from database.models import BankAccount, Transaction
+from services.ingest_service import upsert_transactions
+
+def fresh_accounts():
+    """Empty schema with one user; returns (user_id, account_ids)"""
+    reset_schema()
+    user_id = seed_user(0)
+    return user_id, [a.id for a in BankAccount.query.filter_by(user_id=user_id).order_by(BankAccount.id)]
+
+def make_rows(account_ids, count, seed=7):
+    rng = random.Random(seed)
+    today = date.today()
+    return [{
+        'bank_account_id': rng.choice(account_ids),
+        'plaid_transaction_id': f'plaid-{i}',
+        'amount': -round(rng.uniform(1, 250), 2),
+        'date': today - timedelta(days=rng.randrange(365)),
+        'description': rng.choice(MERCHANTS),
+        'merchant': None
+    } for i in range(count)]
+
+def legacy_ingest(rows):
+    """One ORM object and session.add per row, as the original Plaid route did"""
+    for row in rows:
+        db.session.add(Transaction(**row))
+
+def timed(fn):
+    started = time.perf_counter()
+    try:
+        fn()
+        db.session.commit()
+        return time.perf_counter() - started, None
+    except IntegrityError:
+        db.session.rollback()
+        return time.perf_counter() - started, 'unique violation, batch rolled back'
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 1000000])
+    parser.add_argument('--chunk-size', type=int, default=1000)
+    parser.add_argument('--orm-limit', type=int, default=100000)
+    args = parser.parse_args()
+
+    results = []
+    with app.app_context():
+        for size in args.sizes:
+            scenarios = []
+            if size <= args.orm_limit:
+                user_id, account_ids = fresh_accounts()
+                rows = make_rows(account_ids, size)
+                scenarios += [('orm, first ingest', lambda: legacy_ingest(rows)),
+                              ('orm, re-ingest', lambda: legacy_ingest(rows))]
+                for name, fn in scenarios:
+                    seconds, error = timed(fn)
+                    results.append([size, name, f'{seconds:.2f}', error or f'{size / seconds:,.0f}'])
+
+            user_id, account_ids = fresh_accounts()
+            rows = make_rows(account_ids, size)
+            changed = [dict(row, amount=row['amount'] - 1) if i % 10 == 0 else row for i, row in enumerate(rows)]
+            for name, batch in [('upsert, first ingest', rows),
+                                ('upsert, re-ingest unchanged', rows),
+                                ('upsert, re-ingest 10% changed', changed)]:
+                seconds, error = timed(lambda: upsert_transactions(user_id, batch, args.chunk_size))
+                results.append([size, name, f'{seconds:.2f}', error or f'{size / seconds:,.0f}'])
+        reset_schema()
+
+    print_table(['rows', 'path', 'seconds', 'rows/s'], results)
+
+if __name__ == '__main__':
+    main()
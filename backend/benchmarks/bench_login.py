@@ -0,0 +1,121 @@
+"""Login throughput, and latency of unrelated endpoints during a login storm.
+
+    python -m benchmarks.bench_login [--clients 16] [--seconds 10] [--workers 2] [--max-pending 16]
+
+Serves the app with werkzeug's threaded server, has `--clients` threads log
+in as fast as they can, and meanwhile times one request at a time to
+/health and /api/summary. Runs once hashing on the request threads (the
+original behaviour) and once through the bounded hashing pool.
+"""
+import argparse
+import http.client
+import json
+import logging
+import statistics
+import threading
+import time
+from werkzeug.serving import make_server
+
+class Storm:
+    def __init__(self, port, clients, seconds, token):
+        self.port = port
+        self.clients = clients
+        self.seconds = seconds
+        self.token = token
+        self.statuses = {}
+        self.probes = {'/health': [], '/api/summary': []}
+        self.lock = threading.Lock()
+
+    def request(self, conn, method, path, body=None, headers=None):
+        conn.request(method, path, body=body, headers=headers or {})
+        response = conn.getresponse()
+        response.read()
+        return response.status
+
+    def login(self, deadline):
+        conn = http.client.HTTPConnection('127.0.0.1', self.port)
+        body = json.dumps({'email': 'bench-login@example.com', 'password': 'correct horse battery staple'})
+        while time.perf_counter() < deadline:
+            status = self.request(conn, 'POST', '/login', body, {'Content-Type': 'application/json'})
+            with self.lock:
+                self.statuses[status] = self.statuses.get(status, 0) + 1
+            if status == 503:
+                time.sleep(0.01)
+        conn.close()
+
+    def probe(self, deadline):
+        conn = http.client.HTTPConnection('127.0.0.1', self.port)
+        headers = {'Authorization': f'Bearer {self.token}'}
+        while time.perf_counter() < deadline:
+            for path, samples in self.probes.items():
+                started = time.perf_counter()
+                self.request(conn, 'GET', path, headers=headers)
+                samples.append(time.perf_counter() - started)
+            time.sleep(0.005)
+        conn.close()
+
+    def run(self):
+        deadline = time.perf_counter() + self.seconds
+        threads = [threading.Thread(target=self.login, args=(deadline,)) for _ in range(self.clients)]
+        threads.append(threading.Thread(target=self.probe, args=(deadline,)))
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--max-pending', type=int, default=16)
+    args = parser.parse_args()
+
+    from flask_jwt_extended import create_access_token
+    from benchmarks.common import app, db, percentile, reset_schema, print_table
+    from database.models import User
+    from services import password_service
+
+    with app.app_context():
+        reset_schema()
+        user = User(email='bench-login@example.com', full_name='Bench User',
+                    hashed_password=password_service.hash_password('correct horse battery staple'))
+        db.session.add(user)
+        db.session.commit()
+        token = create_access_token(identity=user.id)
+        db.session.remove()
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    rows = []
+    # Unbounded inline hashing reproduces the original behaviour
+    scenarios = [('inline', 0, 10 ** 6), ('pool', args.workers, args.max_pending)]
+    for name, workers, max_pending in scenarios:
+        app.config['PASSWORD_HASH_WORKERS'] = workers
+        app.config['PASSWORD_HASH_MAX_PENDING'] = max_pending
+        with app.app_context():
+            # Start the pool (and its processes) before timing anything
+            password_service.get_pool().run(password_service._hash, 'warm-up', app.config['PASSWORD_HASH_METHOD'])
+
+        storm = Storm(server.server_port, args.clients, args.seconds, token)
+        storm.run()
+        rows.append([
+            name, workers, storm.statuses.get(200, 0), f'{storm.statuses.get(200, 0) / args.seconds:.1f}',
+            storm.statuses.get(503, 0),
+            *(f'{fn(samples) * 1000:.1f}' for samples in storm.probes.values()
+              for fn in (statistics.median, lambda s: percentile(s, 99)))
+        ])
+
+    server.shutdown()
+    password_service.shutdown()
+    with app.app_context():
+        reset_schema()
+
+    print(f"method {app.config['PASSWORD_HASH_METHOD']}, {args.clients} login clients for {args.seconds:g}s")
+    print_table(['hashing', 'workers', 'logins', 'logins/s', '503s',
+                 '/health p50 ms', '/health p99 ms', '/api/summary p50 ms', '/api/summary p99 ms'], rows)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""/api/transactions/search latency as the transactions table grows.
+
+    DATABASE_URL=postgresql://... python -m benchmarks.bench_search [--sizes 100000 1000000 2000000] [--max-growth 2]
+
+One user keeps `--user-transactions` rows while other users' rows are added
+until the table holds each of `--sizes` rows. At every size the first page
+of a few typical searches is timed, next to the alternative it replaces:
+downloading the user's past year of transactions and filtering it
+client-side. Fuzzy queries only match when pg_trgm is installed. Exits
+non-zero if any search at the largest size is more than `--max-growth`
+times slower than at the smallest.
+"""
+import argparse
+import sys
+from datetime import date, timedelta
+from sqlalchemy import func, select, text
+from benchmarks.common import app, db, describe, reset_schema, seed_user, measure, print_table
+from database.models import Transaction
+from services.search_service import search, terms, trigram_enabled
+from services.transaction_service import iter_transactions
+
+FILLER_USER_TRANSACTIONS = 200000
+
+def client_side(user_id, query, start_date, end_date):
+    """What the frontend would otherwise do: fetch the year and keep rows containing every word"""
+    words = terms(query)
+    return [
+        transaction for transaction in iter_transactions(user_id, start_date, end_date)
+        if all(word in f"{transaction['description']} {transaction['merchant']}".lower() for word in words)
+    ][:50]
+
+def table_size():
+    return db.session.execute(select(func.count()).select_from(Transaction)).scalar()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100000, 1000000, 2000000])
+    parser.add_argument('--user-transactions', type=int, default=20000)
+    parser.add_argument('--max-growth', type=float, default=2.0)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    today = date.today()
+    year_ago = today - timedelta(days=365)
+    month_ago = today - timedelta(days=30)
+    searches = [
+        ('uber', {}),
+        ('groc sto', {}),
+        ('gas', {'start_date': month_ago, 'min_amount': 50}),
+        ('netflx', {}),
+    ]
+    rows = []
+    medians = {}
+    with app.app_context():
+        reset_schema()
+        user_id = seed_user(args.user_transactions, describe=describe)
+        filler = 0
+        for size in sorted(args.sizes):
+            while table_size() < size:
+                filler += 1
+                seed_user(min(FILLER_USER_TRANSACTIONS, size - table_size()), seed=filler, describe=describe)
+            db.session.execute(text('ANALYZE'))
+            db.session.commit()
+
+            for query, filters in searches:
+                seconds, _ = measure(lambda: search(user_id, query, limit=50, **filters), args.repeat)
+                medians.setdefault(query, []).append(seconds)
+                rows.append([size, 'search', query, f'{seconds * 1000:.1f}'])
+            seconds, _ = measure(lambda: client_side(user_id, 'uber', year_ago, today), args.repeat)
+            rows.append([size, 'client-side', 'uber', f'{seconds * 1000:.1f}'])
+        trigram = trigram_enabled()
+        reset_schema()
+
+    print(f'{args.user_transactions} transactions for the searching user, pg_trgm {"on" if trigram else "off"}')
+    print_table(['table rows', 'implementation', 'query', 'median ms'], rows)
+    growth = {query: timings[-1] / timings[0] for query, timings in medians.items()}
+    print('Largest/smallest size: ' + ', '.join(f'{query} {ratio:.2f}x' for query, ratio in growth.items()))
+    if any(ratio > args.max_growth for ratio in growth.values()):
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+"""Compare the rollup and aggregate-in-SQL summaries with the original load-everything implementation.
+
+    python -m benchmarks.bench_summary [--sizes 10000 100000 1000000]
+"""
+import argparse
+from datetime import date, timedelta
+from benchmarks.common import app, db, reset_schema, seed_user, measure, print_table
+from database.models import BankAccount, Transaction
+from services import rollup_service
+from services.summary_service import summarize, summarize_transactions
+
+def legacy_summary(user_id, start_date, end_date):
+    """The /api/summary implementation this benchmark replaces"""
+    bank_accounts = BankAccount.query.filter_by(user_id=user_id).all()
+    account_ids = [account.id for account in bank_accounts]
+    transactions = Transaction.query.filter(
+        Transaction.bank_account_id.in_(account_ids),
+        Transaction.date.between(start_date, end_date)
+    ).all()
+    income = sum(t.amount for t in transactions if t.amount > 0)
+    expenses = sum(abs(t.amount) for t in transactions if t.amount < 0)
+    return {'income': income, 'expenses': expenses, 'net': income - expenses}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    end_date = date.today()
+    start_date = end_date - timedelta(days=365)
+    rows = []
+    with app.app_context():
+        for size in args.sizes:
+            reset_schema()
+            user_id = seed_user(size)
+            rollup_service.rebuild(user_id)
+            db.session.commit()
+            for name, fn in [
+                ('legacy', lambda: legacy_summary(user_id, start_date, end_date)),
+                ('sql', lambda: summarize_transactions(user_id, start_date, end_date)),
+                ('sql+breakdowns', lambda: summarize_transactions(user_id, start_date, end_date, ['account', 'category'])),
+                ('rollups', lambda: summarize(user_id, start_date, end_date)),
+                ('rollups+breakdowns', lambda: summarize(user_id, start_date, end_date, ['account', 'category'])),
+            ]:
+                seconds, peak = measure(fn, args.repeat)
+                rows.append([size, name, f'{seconds * 1000:.1f}', f'{peak / 1024:.0f}'])
+        reset_schema()
+
+    print_table(['transactions', 'implementation', 'median ms', 'peak KiB'], rows)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""Time-to-first-byte and memory of /api/transactions: original list vs streamed and paginated modes.
+
+    python -m benchmarks.bench_transactions [--sizes 10000 100000]
+
+Each scenario runs in a fresh process so its peak RSS is not polluted by the
+previous one.
+"""
+import argparse
+import multiprocessing
+import resource
+import time
+from flask import jsonify
+
+def legacy_response(user_id, start_date, end_date):
+    """The /api/transactions implementation this benchmark replaces"""
+    from database.models import BankAccount, Transaction
+    bank_accounts = BankAccount.query.filter_by(user_id=user_id).all()
+    account_ids = [account.id for account in bank_accounts]
+    transactions = Transaction.query.filter(
+        Transaction.bank_account_id.in_(account_ids),
+        Transaction.date.between(start_date, end_date)
+    ).order_by(Transaction.date.desc()).all()
+    return jsonify([{
+        'id': t.id,
+        'date': t.date.isoformat(),
+        'description': t.description,
+        'amount': t.amount,
+        'category': t.category_id,
+        'merchant': t.merchant
+    } for t in transactions])
+
+def _run_scenario(scenario, user_id, results):
+    from benchmarks.common import app
+    from flask_jwt_extended import create_access_token
+    from app import get_date_range
+
+    with app.app_context():
+        token = create_access_token(identity=user_id)
+    headers = {'Authorization': f'Bearer {token}'}
+    client = app.test_client()
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    started = time.perf_counter()
+    if scenario == 'legacy':
+        with app.test_request_context():
+            start_date, end_date = get_date_range('year')
+            response = legacy_response(user_id, start_date.date(), end_date.date())
+            chunks = iter(response.response)
+            first = next(chunks)
+            ttfb = time.perf_counter() - started
+            size = len(first) + sum(len(chunk) for chunk in chunks)
+    else:
+        query = {'array': '', 'ndjson': '&format=ndjson', 'page': '&limit=100'}[scenario]
+        response = client.get(f'/api/transactions?time_period=year{query}', headers=headers, buffered=False)
+        chunks = response.iter_encoded()
+        first = next(chunks)
+        ttfb = time.perf_counter() - started
+        size = len(first) + sum(len(chunk) for chunk in chunks)
+        response.close()
+    total = time.perf_counter() - started
+
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    results.put((ttfb, total, size, rss_after, rss_after - rss_before))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000])
+    args = parser.parse_args()
+
+    from benchmarks.common import app, db, reset_schema, seed_user, print_table
+    context = multiprocessing.get_context('spawn')
+    rows = []
+    for size in args.sizes:
+        with app.app_context():
+            reset_schema()
+            user_id = seed_user(size, days=365)
+            db.session.remove()
+        for scenario in ('legacy', 'array', 'ndjson', 'page'):
+            results = context.Queue()
+            process = context.Process(target=_run_scenario, args=(scenario, user_id, results))
+            process.start()
+            ttfb, total, size_bytes, rss, rss_growth = results.get()
+            process.join()
+            rows.append([size, scenario, f'{ttfb * 1000:.1f}', f'{total * 1000:.1f}',
+                         f'{size_bytes / 1024:.0f}', f'{rss / 1024:.1f}', f'{rss_growth / 1024:.1f}'])
+    with app.app_context():
+        reset_schema()
+
+    print_table(['transactions', 'mode', 'ttfb ms', 'total ms', 'body KiB', 'peak RSS MiB', 'RSS growth MiB'], rows)
+
+if __name__ == '__main__':
+    main()
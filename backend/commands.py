@@ -0,0 +1,103 @@
+import time
+import click
+from flask.cli import AppGroup
+from database.models import db, BankAccount
+# sync_service is imported so its job handlers are registered for the worker
+from services import export_service, import_service, job_service, rollup_service, seed_service, sync_service
+
+rollups_cli = AppGroup('rollups', help='Maintain the daily/monthly spend rollup tables.')
+
+@rollups_cli.command('rebuild')
+@click.option('--user-id', type=int, default=None, help='Only rebuild this user (default: everyone).')
+def rebuild_rollups(user_id):
+    """Recompute rollups from the transactions table."""
+    rollup_service.rebuild(user_id)
+    db.session.commit()
+    click.echo(f"Rebuilt rollups for {'user %d' % user_id if user_id else 'all users'}")
+
+jobs_cli = AppGroup('jobs', help='Run background jobs.')
+
+@jobs_cli.command('worker')
+@click.option('--worker-id', default=None, help='Name recorded on leased jobs (default: host:pid).')
+@click.option('--poll-interval', type=float, default=1.0, show_default=True, help='Seconds to sleep when no job is due.')
+@click.option('--burst', is_flag=True, help='Exit once no job is due instead of polling.')
+def run_worker(worker_id, poll_interval, burst):
+    """Process queued jobs. Start as many workers as needed; they never share a job."""
+    worker_id = worker_id or job_service.default_worker_id()
+    click.echo(f'Worker {worker_id} started')
+    processed = job_service.work(worker_id, poll_interval, burst)
+    click.echo(f'Worker {worker_id} processed {processed} job(s)')
+
+export_cli = AppGroup('export', help='Export user data.')
+
+@export_cli.command('transactions')
+@click.option('--user-id', type=int, required=True, help='User whose transactions are exported.')
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'parquet']), default='csv', show_default=True)
+@click.option('--start', type=click.DateTime(['%Y-%m-%d']), default=None, help='First date (YYYY-MM-DD).')
+@click.option('--end', type=click.DateTime(['%Y-%m-%d']), default=None, help='Last date (YYYY-MM-DD).')
+@click.option('--account-id', type=int, multiple=True, help='Only this account; repeat for several.')
+@click.option('--output', type=click.File('wb'), default='-', help='File to write (default: stdout).')
+def export_transactions(user_id, fmt, start, end, account_id, output):
+    """Stream a user's transactions, newest first, as CSV or Parquet."""
+    if fmt == 'parquet' and not export_service.parquet_available():
+        raise click.ClickException('Parquet export needs pyarrow installed')
+    export = export_service.iter_parquet if fmt == 'parquet' else export_service.iter_csv
+    for chunk in export(user_id, start and start.date(), end and end.date(), list(account_id)):
+        output.write(chunk)
+
+import_cli = AppGroup('import', help='Import bank statements.')
+
+@import_cli.command('statement')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--account-id', type=int, required=True, help='Account the statement belongs to.')
+@click.option('--format', 'fmt', type=click.Choice(import_service.FORMATS), default=None,
+              help='Statement format (default: from the file extension).')
+def import_statement(path, account_id, fmt):
+    """Import a CSV or OFX/QFX statement into an account, skipping transactions it already holds."""
+    account = db.session.get(BankAccount, account_id)
+    if account is None:
+        raise click.ClickException(f'Account {account_id} not found')
+    fmt = fmt or import_service.detect_format(path)
+    if fmt is None:
+        raise click.ClickException('Cannot tell the format from the file name; pass --format')
+    with open(path, 'rb') as stream:
+        try:
+            counts = import_service.import_statement(account.user_id, account.id, stream, fmt)
+        except import_service.StatementError as e:
+            raise click.ClickException(str(e))
+    db.session.commit()
+    click.echo(f"Imported {counts['imported']} of {counts['rows']} transaction(s), {counts['duplicates']} already present")
+
+seed_cli = AppGroup('seed', help='Generate synthetic data.')
+
+@seed_cli.command('generate')
+@click.option('--users', type=int, default=100, show_default=True)
+@click.option('--accounts', type=click.IntRange(1, len(seed_service.ACCOUNT_TYPES)), default=3, show_default=True,
+              help='Accounts per user: checking, then credit card, then savings.')
+@click.option('--transactions', type=click.IntRange(0), default=2000, show_default=True, help='Transactions per user.')
+@click.option('--days', type=click.IntRange(1), default=730, show_default=True, help='Days of history.')
+@click.option('--end', type=click.DateTime(['%Y-%m-%d']), default=None, help='Last day of history (default: today).')
+@click.option('--seed', type=int, default=0, show_default=True, help='Same seed and dates, same data.')
+@click.option('--budgets', type=click.IntRange(0), default=3, show_default=True, help='Budgets per user.')
+@click.option('--password', default='demo123', show_default=True, help='Password of every generated user.')
+def generate_seed(users, accounts, transactions, days, end, seed, budgets, password):
+    """Create users with accounts, realistic transaction histories and budgets, bulk loaded."""
+    started = time.perf_counter()
+    try:
+        counts = seed_service.generate(
+            users, accounts, transactions, days, end and end.date(), seed, password, budgets,
+            progress=lambda done: click.echo(f'{done}/{users} users', err=True)
+        )
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    seconds = time.perf_counter() - started
+    click.echo(f"Created {counts['users']} users, {counts['accounts']} accounts, {counts['transactions']} "
+               f"transactions and {counts['budgets']} budgets in {seconds:.1f}s "
+               f"({counts['transactions'] / seconds:,.0f} transactions/s)")
+
+def register_commands(app):
+    app.cli.add_command(rollups_cli)
+    app.cli.add_command(jobs_cli)
+    app.cli.add_command(export_cli)
+    app.cli.add_command(import_cli)
+    app.cli.add_command(seed_cli)
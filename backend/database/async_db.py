@@ -0,0 +1,74 @@
+# backend/database/async_db.py
+"""AsyncSession access for the async read endpoints in asgi.py.
+
+Shares the models and DATABASE_URL with the Flask app, swapping in the
+asyncpg driver on Postgres and aiosqlite on SQLite.
+"""
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+ASYNC_DRIVERS = {'postgresql': 'postgresql+asyncpg', 'sqlite': 'sqlite+aiosqlite'}
+
+_engine = None
+_sessionmaker = None
+_config = None
+# replica Engine from routing.ReplicaSet -> its async engine
+_replica_engines = {}
+
+def async_url(url):
+    """The async-driver equivalent of a synchronous database URL"""
+    url = make_url(url)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f'No async driver configured for {backend!r} databases')
+    return url.set(drivername=ASYNC_DRIVERS[backend])
+
+def _create_engine(config, url):
+    url = async_url(url)
+    options = {}
+    if url.get_backend_name() == 'postgresql':
+        # asyncpg reuses prepared statements, which lets Postgres switch to a
+        # generic plan that ignores the user and date range; plan each query
+        # for its parameters like the psycopg2 path does
+        server_settings = {'plan_cache_mode': 'force_custom_plan'}
+        if config['DATABASE_STATEMENT_TIMEOUT_MS']:
+            server_settings['statement_timeout'] = str(config['DATABASE_STATEMENT_TIMEOUT_MS'])
+        options = {
+            'pool_size': config['ASYNC_POOL_SIZE'],
+            'max_overflow': config['ASYNC_MAX_OVERFLOW'],
+            'pool_timeout': config['DATABASE_POOL_TIMEOUT'],
+            'pool_recycle': config['DATABASE_POOL_RECYCLE'],
+            'pool_pre_ping': config['DATABASE_POOL_PRE_PING'],
+            'connect_args': {'server_settings': server_settings}
+        }
+    return create_async_engine(url, **options)
+
+def init_app(app):
+    """Create the async engine for an app's database (once per process)"""
+    global _engine, _sessionmaker, _config
+    if _engine is not None:
+        return
+    _config = app.config
+    _engine = _create_engine(app.config, app.config['SQLALCHEMY_DATABASE_URI'])
+    _sessionmaker = async_sessionmaker(_engine, expire_on_commit=False)
+
+def session(replica=None):
+    """A new AsyncSession; use as `async with session() as s:`.
+
+    Given one of the app's replica engines, the session reads from that
+    replica through an async engine of its own, created on first use.
+    """
+    if replica is None:
+        return _sessionmaker()
+    if replica not in _replica_engines:
+        _replica_engines[replica] = _create_engine(_config, replica.url)
+    return _sessionmaker(bind=_replica_engines[replica])
+
+async def dispose():
+    """Close pooled connections, e.g. at shutdown or before the event loop changes"""
+    global _engine, _sessionmaker
+    for engine in [_engine, *_replica_engines.values()]:
+        if engine is not None:
+            await engine.dispose()
+    _replica_engines.clear()
+    _engine = _sessionmaker = None
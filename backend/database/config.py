@@ -11,12 +11,91 @@ class Config:
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     SQLALCHEMY_DATABASE_URI = os.getenv(
         'DATABASE_URL',
-        'postgresql://user:password@db:5432/spendapp'
+        'postgresql://postgres:postgres@db:5432/spendapp'
     )
+
+    # Connection pool per engine (the primary and each replica)
+    DATABASE_POOL_SIZE = int(os.getenv('DATABASE_POOL_SIZE', 5))
+    DATABASE_MAX_OVERFLOW = int(os.getenv('DATABASE_MAX_OVERFLOW', 10))
+    DATABASE_POOL_TIMEOUT = float(os.getenv('DATABASE_POOL_TIMEOUT', 30))
+    DATABASE_POOL_RECYCLE = int(os.getenv('DATABASE_POOL_RECYCLE', 1800))
+    DATABASE_POOL_PRE_PING = os.getenv('DATABASE_POOL_PRE_PING', 'true').lower() == 'true'
+    # Postgres cancels any single statement running longer than this; 0 disables
+    DATABASE_STATEMENT_TIMEOUT_MS = int(os.getenv('DATABASE_STATEMENT_TIMEOUT_MS', 0))
+
+    # Comma-separated read replica URLs for the read-only endpoints, and how
+    # long an unreachable replica is skipped
+    DATABASE_REPLICA_URLS = os.getenv('DATABASE_REPLICA_URLS', '')
+    DATABASE_REPLICA_RETRY_SECONDS = float(os.getenv('DATABASE_REPLICA_RETRY_SECONDS', 30))
+    # Replication lag budget: replicas further behind are passed over, and a
+    # user's reads stay on the primary this long after they change their data
+    DATABASE_REPLICA_LAG_SECONDS = float(os.getenv('DATABASE_REPLICA_LAG_SECONDS', 5))
     SECRET_KEY = os.getenv('SECRET_KEY', 'your-secret-key-here')
     
     # Plaid configuration
     PLAID_CLIENT_ID = os.getenv('PLAID_CLIENT_ID')
     PLAID_SECRET = os.getenv('PLAID_SECRET')
     PLAID_ENV = os.getenv('PLAID_ENV', 'sandbox')
+    
+    # Rows per INSERT ... ON CONFLICT statement when ingesting transactions
+    INGEST_CHUNK_SIZE = int(os.getenv('INGEST_CHUNK_SIZE', 1000))
+
+    # Plaid items fetched in parallel during a sync, overall and per institution
+    PLAID_FETCH_CONCURRENCY = int(os.getenv('PLAID_FETCH_CONCURRENCY', 8))
+    PLAID_FETCH_PER_INSTITUTION = int(os.getenv('PLAID_FETCH_PER_INSTITUTION', 2))
+
+    # Plaid HTTP client: pooled connections, timeouts (seconds), retries and
+    # the per-institution circuit breaker
+    PLAID_POOL_MAXSIZE = int(os.getenv('PLAID_POOL_MAXSIZE', 16))
+    PLAID_CONNECT_TIMEOUT = float(os.getenv('PLAID_CONNECT_TIMEOUT', 5))
+    PLAID_READ_TIMEOUT = float(os.getenv('PLAID_READ_TIMEOUT', 30))
+    PLAID_RETRY_ATTEMPTS = int(os.getenv('PLAID_RETRY_ATTEMPTS', 4))
+    PLAID_RETRY_BASE_DELAY = float(os.getenv('PLAID_RETRY_BASE_DELAY', 0.5))
+    PLAID_RETRY_MAX_DELAY = float(os.getenv('PLAID_RETRY_MAX_DELAY', 30))
+    PLAID_BREAKER_THRESHOLD = int(os.getenv('PLAID_BREAKER_THRESHOLD', 5))
+    PLAID_BREAKER_RESET_SECONDS = float(os.getenv('PLAID_BREAKER_RESET_SECONDS', 60))
+
+    # Response cache for /api/summary and /api/transactions: 'memory', 'redis' or 'none'
+    CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'memory')
+    CACHE_URL = os.getenv('CACHE_URL', 'redis://localhost:6379/0')
+    CACHE_TTL_SECONDS = float(os.getenv('CACHE_TTL_SECONDS', 300))
+    CACHE_MAX_ENTRIES = int(os.getenv('CACHE_MAX_ENTRIES', 1024))
+    CACHE_MAX_BYTES = int(os.getenv('CACHE_MAX_BYTES', 64 * 1024 * 1024))
+    CACHE_MAX_ENTRY_BYTES = int(os.getenv('CACHE_MAX_ENTRY_BYTES', 1024 * 1024))
+
+    # Background jobs: attempts before dead-lettering, lease length and retry backoff
+    JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', 5))
+    JOB_LEASE_SECONDS = int(os.getenv('JOB_LEASE_SECONDS', 300))
+    JOB_RETRY_BASE_SECONDS = float(os.getenv('JOB_RETRY_BASE_SECONDS', 5))
+    JOB_RETRY_MAX_SECONDS = float(os.getenv('JOB_RETRY_MAX_SECONDS', 900))
+
+    # Password hashing: werkzeug method (algorithm and cost), worker processes
+    # (0 hashes on the request thread) and how many more hashes may wait before
+    # /login and /register answer 503
+    PASSWORD_HASH_METHOD = os.getenv('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
+    PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', 2))
+    PASSWORD_HASH_MAX_PENDING = int(os.getenv('PASSWORD_HASH_MAX_PENDING', 16))
+
+    # Cached principals (user id, profile, account ids) for authenticated
+    # requests, kept on CACHE_BACKEND
+    IDENTITY_CACHE_TTL_SECONDS = float(os.getenv('IDENTITY_CACHE_TTL_SECONDS', 60))
+    IDENTITY_CACHE_MAX_ENTRIES = int(os.getenv('IDENTITY_CACHE_MAX_ENTRIES', 10000))
+
+    # Fractions of a budget whose crossing during ingestion records an alert
+    BUDGET_ALERT_THRESHOLDS = [
+        float(threshold) for threshold in os.getenv('BUDGET_ALERT_THRESHOLDS', '0.8,1.0').split(',') if threshold
+    ]
+
+    # Connections held by the async read endpoints (asgi.py); requests beyond
+    # these wait on the event loop rather than on a thread each
+    ASYNC_POOL_SIZE = int(os.getenv('ASYNC_POOL_SIZE', 20))
+    ASYNC_MAX_OVERFLOW = int(os.getenv('ASYNC_MAX_OVERFLOW', 10))
+
+    # A request running the same SELECT more often than this is logged as a
+    # likely N+1 query pattern and counted in /metrics; 0 disables the check
+    METRICS_N_PLUS_ONE_THRESHOLD = int(os.getenv('METRICS_N_PLUS_ONE_THRESHOLD', 10))
+
+    # Serve /metrics, /traces and /cache/stats. They are unauthenticated, so only
+    # enable this where they are reachable by the monitoring network alone
+    OPS_ENDPOINTS_ENABLED = os.getenv('OPS_ENDPOINTS_ENABLED', 'false').lower() == 'true'
 
@@ -0,0 +1,82 @@
+# backend/database/dialects.py
+import csv
+import io
+from itertools import islice
+from sqlalchemy import func
+from sqlalchemy.dialects import postgresql, sqlite
+from database.models import db
+
+def is_postgres():
+    return db.engine.dialect.name == 'postgresql'
+
+def upsert(table):
+    """INSERT for the active dialect, supporting on_conflict_do_update/on_conflict_do_nothing"""
+    if is_postgres():
+        return postgresql.insert(table)
+    return sqlite.insert(table)
+
+def month_start(column):
+    """First day of the month containing a date column"""
+    if is_postgres():
+        # Truncate a plain timestamp: date_trunc() on the timestamptz a bare date
+        # is promoted to does a time zone conversion per row
+        return func.date_trunc('month', column.cast(db.DateTime)).cast(db.Date)
+    return func.date(column, 'start of month', type_=db.Date)
+
+COPY_BUFFER_SIZE = 64 * 1024
+BULK_CHUNK_SIZE = 5000
+
+class _CsvStream:
+    """Readable file of rows rendered as CSV, for COPY FROM STDIN"""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.out = io.StringIO()
+        self.writer = csv.writer(self.out, lineterminator='\n')
+        self.pending = b''
+        self.error = None
+
+    def read(self, size=COPY_BUFFER_SIZE):
+        size = size if size > 0 else COPY_BUFFER_SIZE
+        while len(self.pending) < size:
+            try:
+                batch = list(islice(self.rows, 1000))
+            except Exception as e:
+                self.error = e
+                raise
+            if not batch:
+                break
+            self.writer.writerows(batch)
+            self.pending += self.out.getvalue().encode()
+            self.out.seek(0)
+            self.out.truncate()
+        data, self.pending = self.pending[:size], self.pending[size:]
+        return data
+
+def bulk_insert(connection, table, columns, rows):
+    """Insert an iterable of row tuples (values in `columns` order) into a table.
+
+    Postgres gets a single COPY FROM STDIN fed as the rows are produced, other
+    databases multi-row INSERTs of BULK_CHUNK_SIZE rows; either way memory
+    does not grow with the number of rows. On Postgres None and '' both load
+    as NULL. No other statement can run on the connection while the rows are
+    consumed, and an exception raised by `rows` is re-raised as is.
+    """
+    rows = iter(rows)
+    if is_postgres():
+        cursor = connection.connection.dbapi_connection.cursor()
+        stream = _CsvStream(rows)
+        try:
+            cursor.copy_expert(f"COPY {table.name} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)",
+                               stream, COPY_BUFFER_SIZE)
+        except Exception:
+            # The driver reports an error raised while reading as a cancelled COPY
+            if stream.error:
+                raise stream.error from None
+            raise
+        return
+    while True:
+        chunk = [dict(zip(columns, row)) for row in islice(rows, BULK_CHUNK_SIZE)]
+        if not chunk:
+            return
+        connection.execute(table.insert(), chunk)
@@ -1,9 +1,12 @@
 # backend/database/models.py
+import hashlib
 from datetime import datetime
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event, text
 from werkzeug.security import generate_password_hash, check_password_hash
+from database.routing import RoutingSession
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 class User(db.Model):
     __tablename__ = 'users'
@@ -13,7 +16,10 @@ class User(db.Model):
     hashed_password = db.Column(db.String(255))
     full_name = db.Column(db.String(255))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Bumped whenever the user's transactions change; part of every cached response key
+    data_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     bank_accounts = db.relationship('BankAccount', backref='user', lazy=True)
+    plaid_items = db.relationship('PlaidItem', backref='user', lazy=True)
     
     def set_password(self, password):
         self.hashed_password = generate_password_hash(password)
@@ -21,11 +27,25 @@ class User(db.Model):
     def check_password(self, password):
         return check_password_hash(self.hashed_password, password)
 
+class PlaidItem(db.Model):
+    """A linked Plaid Item (one institution login) and its /transactions/sync cursor"""
+    __tablename__ = 'plaid_items'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
+    access_token = db.Column(db.String(255), unique=True, nullable=False)
+    institution_name = db.Column(db.String(255))
+    transactions_cursor = db.Column(db.Text)
+    last_synced_at = db.Column(db.DateTime)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    bank_accounts = db.relationship('BankAccount', backref='plaid_item', lazy=True)
+
 class BankAccount(db.Model):
     __tablename__ = 'bank_accounts'
     
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
+    plaid_item_id = db.Column(db.Integer, db.ForeignKey('plaid_items.id'), index=True)
     plaid_account_id = db.Column(db.String(255), unique=True, nullable=False)
     institution_name = db.Column(db.String(255))
     account_name = db.Column(db.String(255))
@@ -34,6 +54,16 @@ class BankAccount(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     transactions = db.relationship('Transaction', backref='bank_account', lazy=True)
 
+def content_hash(bank_account_id, date, amount, description):
+    """What makes two transactions the same one: account, date, amount and description, whitespace and case aside"""
+    normalized = ' '.join((description or '').lower().split())
+    key = f'{bank_account_id}|{date.isoformat()}|{amount:.2f}|{normalized}'
+    return hashlib.blake2b(key.encode(), digest_size=16).hexdigest()
+
+def _default_content_hash(context):
+    params = context.get_current_parameters()
+    return content_hash(params['bank_account_id'], params['date'], params['amount'], params.get('description'))
+
 class Transaction(db.Model):
     __tablename__ = 'transactions'
     
@@ -44,7 +74,67 @@ class Transaction(db.Model):
     amount = db.Column(db.Float, nullable=False)
     date = db.Column(db.Date, nullable=False)
     description = db.Column(db.String(255))
+    merchant = db.Column(db.String(255))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # User data_version at which the row was inserted / last written
+    created_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    change_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # content_hash() of the row; statement imports skip rows the account already holds.
+    # Writers that may change the hashed columns later (Plaid upserts) set it themselves.
+    content_hash = db.Column(db.String(32), default=_default_content_hash)
+
+# Serves the per-account date-window lookups behind /api/transactions and
+# /api/summary, including the (date DESC, id DESC) keyset ordering
+db.Index(
+    'ix_transactions_bank_account_id_date',
+    Transaction.bank_account_id, Transaction.date.desc(), Transaction.id.desc()
+)
+# Serves /api/transactions/changes?since=<version>
+db.Index('ix_transactions_bank_account_id_change_version', Transaction.bank_account_id, Transaction.change_version)
+# Serves the duplicate check of statement imports
+db.Index('ix_transactions_bank_account_id_content_hash', Transaction.bank_account_id, Transaction.content_hash)
+
+# /api/transactions/search on Postgres: a generated tsvector over description
+# and merchant with a GIN index, plus trigram indexes when pg_trgm is
+# available. With btree_gin the indexes lead with the account, so a lookup
+# only reads the searching user's entries however large the table grows.
+# The column is not mapped, so other databases (which search with LIKE)
+# never see it. Kept in step with migration e6b2d8f4a7c1.
+SEARCH_VECTOR = "to_tsvector('simple', coalesce(description, '') || ' ' || coalesce(merchant, ''))"
+
+@event.listens_for(Transaction.__table__, 'after_create')
+def _create_search_indexes(table, connection, **kw):
+    if connection.dialect.name != 'postgresql':
+        return
+    available = set(connection.execute(text(
+        "SELECT name FROM pg_available_extensions WHERE name IN ('btree_gin', 'pg_trgm')"
+    )).scalars())
+    for extension in sorted(available):
+        connection.execute(text(f'CREATE EXTENSION IF NOT EXISTS {extension}'))
+    account = 'bank_account_id, ' if 'btree_gin' in available else ''
+    connection.execute(text(
+        f'ALTER TABLE transactions ADD COLUMN search_vector tsvector GENERATED ALWAYS AS ({SEARCH_VECTOR}) STORED'
+    ))
+    connection.execute(text(f'CREATE INDEX ix_transactions_search_vector ON transactions USING gin ({account}search_vector)'))
+    if 'pg_trgm' in available:
+        for column in ('description', 'merchant'):
+            connection.execute(text(
+                f'CREATE INDEX ix_transactions_{column}_trgm ON transactions USING gin ({account}{column} gin_trgm_ops)'
+            ))
+
+class TransactionTombstone(db.Model):
+    """Records a deleted transaction so clients syncing by version learn about the removal"""
+    __tablename__ = 'transaction_tombstones'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    transaction_id = db.Column(db.Integer, nullable=False)
+    change_version = db.Column(db.Integer, nullable=False)
+    deleted_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_transaction_tombstones_user_id_change_version', 'user_id', 'change_version'),
+    )
 
 class Category(db.Model):
     __tablename__ = 'categories'
@@ -54,3 +144,128 @@ class Category(db.Model):
     plaid_category_id = db.Column(db.String(255))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     transactions = db.relationship('Transaction', backref='category', lazy=True)
+
+class DailyRollup(db.Model):
+    """Per-day income/expense totals by user, bank account and category.
+
+    Maintained incrementally by services.rollup_service as transactions are
+    ingested. category_id is 0 for uncategorized transactions so that it can
+    take part in the primary key.
+    """
+    __tablename__ = 'daily_rollups'
+    
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    bank_account_id = db.Column(db.Integer, db.ForeignKey('bank_accounts.id'), primary_key=True)
+    category_id = db.Column(db.Integer, primary_key=True, default=0)
+    day = db.Column(db.Date, primary_key=True)
+    income = db.Column(db.Float, nullable=False, default=0)
+    expenses = db.Column(db.Float, nullable=False, default=0)
+    transaction_count = db.Column(db.Integer, nullable=False, default=0)
+
+class MonthlyRollup(db.Model):
+    """Same as DailyRollup but bucketed by the first day of each month"""
+    __tablename__ = 'monthly_rollups'
+    
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    bank_account_id = db.Column(db.Integer, db.ForeignKey('bank_accounts.id'), primary_key=True)
+    category_id = db.Column(db.Integer, primary_key=True, default=0)
+    month = db.Column(db.Date, primary_key=True)
+    income = db.Column(db.Float, nullable=False, default=0)
+    expenses = db.Column(db.Float, nullable=False, default=0)
+    transaction_count = db.Column(db.Integer, nullable=False, default=0)
+
+class Budget(db.Model):
+    """A user's monthly spending limit for one category.
+
+    Spend against it is read from monthly_rollups, which ingestion keeps
+    current, so checking a budget never rescans transactions.
+    """
+    __tablename__ = 'budgets'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    category_id = db.Column(db.Integer, db.ForeignKey('categories.id'), nullable=False)
+    amount = db.Column(db.Float, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'category_id', name='uq_budgets_user_id_category_id'),
+    )
+
+class BudgetAlert(db.Model):
+    """A budget's spend reaching one of BUDGET_ALERT_THRESHOLDS in a month.
+
+    Recorded by ingestion at most once per budget, month and threshold.
+    """
+    __tablename__ = 'budget_alerts'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    budget_id = db.Column(db.Integer, db.ForeignKey('budgets.id', ondelete='CASCADE'), nullable=False)
+    month = db.Column(db.Date, nullable=False)
+    threshold = db.Column(db.Float, nullable=False)
+    spent = db.Column(db.Float, nullable=False)
+    amount = db.Column(db.Float, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('budget_id', 'month', 'threshold', name='uq_budget_alerts_budget_id_month_threshold'),
+        # /api/budgets/alerts?after=<id>
+        db.Index('ix_budget_alerts_user_id_id', 'user_id', 'id'),
+    )
+
+class CategoryRule(db.Model):
+    """A user's rule assigning a category to the transactions it matches.
+
+    kind is 'contains' (a case-insensitive substring of the merchant) or
+    'regex'; a rule without a pattern matches on amount alone. Amount bounds
+    apply to the absolute amount. Lower priorities are tried first, and a
+    user's rules are tried before the built-in ones in services.category_service.
+    """
+    __tablename__ = 'category_rules'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
+    category_id = db.Column(db.Integer, db.ForeignKey('categories.id'), nullable=False)
+    kind = db.Column(db.String(20), nullable=False, default='contains')
+    pattern = db.Column(db.String(255))
+    min_amount = db.Column(db.Float)
+    max_amount = db.Column(db.Float)
+    priority = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class Job(db.Model):
+    """A unit of background work, leased by workers via services.job_service.
+
+    status moves queued -> running -> succeeded, or back to queued with a
+    later run_at after a failure, until max_attempts is spent and the job is
+    dead-lettered as 'dead'.
+    """
+    __tablename__ = 'jobs'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)
+    payload = db.Column(db.JSON, nullable=False, default=dict)
+    dedupe_key = db.Column(db.String(255))
+    status = db.Column(db.String(20), nullable=False, default='queued')
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=5)
+    run_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    locked_by = db.Column(db.String(255))
+    locked_until = db.Column(db.DateTime)
+    last_error = db.Column(db.Text)
+    result = db.Column(db.JSON)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        # Workers scan for the next due job by status and run_at
+        db.Index('ix_jobs_status_run_at', 'status', 'run_at'),
+        # At most one untouched queued job per key, so repeated requests share it
+        db.Index(
+            'ix_jobs_dedupe_key_queued', 'dedupe_key', unique=True,
+            postgresql_where=db.text("status = 'queued' AND attempts = 0"),
+            sqlite_where=db.text("status = 'queued' AND attempts = 0")
+        ),
+    )
@@ -0,0 +1,215 @@
+# backend/database/routing.py
+"""Engine configuration and read-replica routing.
+
+Engines get their pool sizing, pre-ping, recycling and statement timeout
+from Config. When DATABASE_REPLICA_URLS is set, views wrapped in
+@replica_reads send their queries to the replicas in turn. Routing costs no
+queries on the primary:
+- each replica's replication lag is sampled at most every
+  REPLICA_LAG_SAMPLE_SECONDS, and a replica lagging more than
+  DATABASE_REPLICA_LAG_SECONDS is passed over for the next one
+- committing a change to a user's data version keeps that user's reads on
+  the primary for DATABASE_REPLICA_LAG_SECONDS, so right after their own
+  sync or account link they see their change. The marker is kept in this
+  process and, with the Redis cache backend, shared with the other
+  processes (such as the job worker)
+A replica that cannot be reached is skipped for
+DATABASE_REPLICA_RETRY_SECONDS; with no usable replica the request falls
+back to the primary.
+"""
+import logging
+import threading
+import time
+from functools import wraps
+from flask import current_app, has_app_context
+from flask_jwt_extended import get_jwt_identity
+from flask_sqlalchemy.session import Session
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import OperationalError
+
+logger = logging.getLogger(__name__)
+
+REPLICA_LAG_SAMPLE_SECONDS = 1.0
+# Zero while the replica has replayed everything it received, so an idle
+# primary does not look like lag
+_POSTGRES_LAG = text(
+    'SELECT CASE WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 '
+    'ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END'
+)
+
+def engine_options(config, url):
+    """create_engine() keyword arguments for a database URL.
+
+    SQLite keeps the pools Flask-SQLAlchemy and SQLAlchemy pick for it; it
+    has no statement timeout either.
+    """
+    if make_url(url).get_backend_name() == 'sqlite':
+        return {}
+    options = {
+        'pool_size': config['DATABASE_POOL_SIZE'],
+        'max_overflow': config['DATABASE_MAX_OVERFLOW'],
+        'pool_timeout': config['DATABASE_POOL_TIMEOUT'],
+        'pool_recycle': config['DATABASE_POOL_RECYCLE'],
+        'pool_pre_ping': config['DATABASE_POOL_PRE_PING']
+    }
+    if config['DATABASE_STATEMENT_TIMEOUT_MS']:
+        # Applies to every statement on the connection
+        options['connect_args'] = {'options': f"-c statement_timeout={config['DATABASE_STATEMENT_TIMEOUT_MS']}"}
+    return options
+
+class RoutingSession(Session):
+    """Session that reads from the replica picked for the current request, if any.
+
+    Writes (flushes and INSERT/UPDATE/DELETE statements) always go to the primary.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        replica = self.info.get('replica')
+        if replica is not None and bind is None and not self._flushing and not getattr(clause, 'is_dml', False):
+            return replica
+        return super().get_bind(mapper, clause=clause, bind=bind, **kwargs)
+
+class ReplicaSet:
+    """Replica engines handed out round-robin, skipping ones recently found down or lagging"""
+
+    def __init__(self, engines, retry_seconds, lag_seconds, clock=time.monotonic):
+        self.engines = engines
+        self.retry_seconds = retry_seconds
+        self.lag_seconds = lag_seconds
+        self.clock = clock
+        self.down_until = {}
+        # engine -> (lag in seconds, when it was sampled)
+        self.lag_samples = {}
+        # user id -> until when their reads go to the primary
+        self.primary_until = {}
+        self.next = 0
+        self.lock = threading.Lock()
+
+    def candidates(self):
+        """Healthy replicas, starting from the next one in turn"""
+        with self.lock:
+            start = self.next
+            self.next = (self.next + 1) % len(self.engines)
+            now = self.clock()
+            ordered = self.engines[start:] + self.engines[:start]
+            return [engine for engine in ordered if self.down_until.get(engine, 0) <= now]
+
+    def mark_down(self, engine, error):
+        logger.warning('Replica %s unavailable, using others or the primary: %s', engine.url, error)
+        with self.lock:
+            self.down_until[engine] = self.clock() + self.retry_seconds
+
+    def measure_lag(self, engine):
+        """Seconds the replica is behind the primary; replicas other than Postgres standbys count as current"""
+        with engine.connect() as conn:
+            if engine.dialect.name != 'postgresql':
+                return 0.0
+            return float(conn.execute(_POSTGRES_LAG).scalar() or 0)
+
+    def lag(self, engine):
+        """The replica's last sampled lag, sampled again once it is REPLICA_LAG_SAMPLE_SECONDS old"""
+        now = self.clock()
+        sample = self.lag_samples.get(engine)
+        if sample is None or now - sample[1] >= REPLICA_LAG_SAMPLE_SECONDS:
+            sample = self.lag_samples[engine] = (self.measure_lag(engine), now)
+        return sample[0]
+
+    def pin_to_primary(self, user_ids):
+        """Send the users' reads to the primary until replicas within the lag budget have their writes"""
+        with self.lock:
+            now = self.clock()
+            self.primary_until = {user_id: until for user_id, until in self.primary_until.items() if until > now}
+            for user_id in user_ids:
+                self.primary_until[str(user_id)] = now + self.lag_seconds
+        shared = _shared_cache()
+        for user_id in user_ids if shared else ():
+            shared.set(_primary_key(user_id), b'1', ttl=self.lag_seconds)
+
+    def pinned(self, user_id):
+        if self.primary_until.get(str(user_id), 0) > self.clock():
+            return True
+        shared = _shared_cache()
+        return shared is not None and shared.get(_primary_key(user_id)) is not None
+
+    def choose(self, user_id):
+        """A replica current enough for the user, or None for the primary"""
+        if self.pinned(user_id):
+            return None
+        for engine in self.candidates():
+            try:
+                lag = self.lag(engine)
+            except OperationalError as e:
+                self.mark_down(engine, e)
+                continue
+            if lag <= self.lag_seconds:
+                return engine
+            logger.info('Replica %s is %.1fs behind, trying the next one', engine.url, lag)
+        return None
+
+def _primary_key(user_id):
+    return f'primary-until:{user_id}'
+
+def _shared_cache():
+    """The response cache when other processes see it too, else None"""
+    from services import cache
+    shared = cache.get_cache()
+    return shared if shared.backend == 'redis' else None
+
+def wrote_user_data(session, user_id):
+    """Note a change to the user's data; once the session commits, their reads stay on the primary for a while"""
+    session.info.setdefault('written_users', set()).add(user_id)
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _pin_written_users(session):
+    user_ids = session.info.pop('written_users', None)
+    replicas = current_app.extensions.get('db_replicas') if user_ids and has_app_context() else None
+    if replicas:
+        replicas.pin_to_primary(user_ids)
+
+@event.listens_for(RoutingSession, 'after_rollback')
+def _forget_written_users(session):
+    session.info.pop('written_users', None)
+
+def init_app(app):
+    urls = [url.strip() for url in app.config['DATABASE_REPLICA_URLS'].split(',') if url.strip()]
+    app.extensions['db_replicas'] = ReplicaSet(
+        [create_engine(url, **engine_options(app.config, url)) for url in urls],
+        app.config['DATABASE_REPLICA_RETRY_SECONDS'],
+        app.config['DATABASE_REPLICA_LAG_SECONDS']
+    ) if urls else None
+
+def replica_reads(view):
+    """Serve a read-only view from a replica when one is current enough for the user.
+
+    The user is the view's `user_id` argument or the JWT identity. Streamed
+    responses keep reading from the replica until they are closed.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        from database.models import db
+        replicas = current_app.extensions.get('db_replicas')
+        if not replicas:
+            return view(*args, **kwargs)
+
+        replica = replicas.choose(kwargs.get('user_id') or get_jwt_identity())
+        if replica is None:
+            return view(*args, **kwargs)
+
+        session = db.session()
+        session.info['replica'] = replica
+        try:
+            response = current_app.make_response(view(*args, **kwargs))
+        except OperationalError as e:
+            replicas.mark_down(replica, e)
+            session.info.pop('replica', None)
+            session.rollback()
+            return view(*args, **kwargs)
+        if response.is_streamed:
+            response.call_on_close(lambda: session.info.pop('replica', None))
+        else:
+            session.info.pop('replica', None)
+        return response
+    # asgi.py serves the same views from a replica too
+    wrapper.replica_reads = True
+    return wrapper
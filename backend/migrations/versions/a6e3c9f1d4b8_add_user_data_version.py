@@ -0,0 +1,24 @@
+"""Add users.data_version for response cache invalidation
+
+Revision ID: a6e3c9f1d4b8
+Revises: f4a1d8c6b2e9
+Create Date: 2026-10-18 15:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a6e3c9f1d4b8'
+down_revision = 'f4a1d8c6b2e9'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('users', sa.Column('data_version', sa.Integer(), server_default='0', nullable=False))
+
+
+def downgrade():
+    op.drop_column('users', 'data_version')
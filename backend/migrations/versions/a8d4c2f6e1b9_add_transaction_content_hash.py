@@ -0,0 +1,60 @@
+"""Add transaction content hash
+
+Revision ID: a8d4c2f6e1b9
+Revises: f7c3a9e5b2d4
+Create Date: 2026-10-19 09:00:00.000000
+
+"""
+import hashlib
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a8d4c2f6e1b9'
+down_revision = 'f7c3a9e5b2d4'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 10000
+
+
+def content_hash(bank_account_id, date, amount, description):
+    # Frozen copy of database.models.content_hash
+    normalized = ' '.join((description or '').lower().split())
+    key = f'{bank_account_id}|{date.isoformat()}|{amount:.2f}|{normalized}'
+    return hashlib.blake2b(key.encode(), digest_size=16).hexdigest()
+
+
+def upgrade():
+    op.add_column('transactions', sa.Column('content_hash', sa.String(length=32), nullable=True))
+
+    connection = op.get_bind()
+    transactions = sa.table(
+        'transactions',
+        sa.column('id', sa.Integer), sa.column('bank_account_id', sa.Integer), sa.column('date', sa.Date),
+        sa.column('amount', sa.Float), sa.column('description', sa.String), sa.column('content_hash', sa.String)
+    )
+    last_id = 0
+    while True:
+        rows = connection.execute(
+            sa.select(transactions.c.id, transactions.c.bank_account_id, transactions.c.date,
+                      transactions.c.amount, transactions.c.description)
+            .where(transactions.c.id > last_id).order_by(transactions.c.id).limit(BATCH_SIZE)
+        ).all()
+        if not rows:
+            break
+        connection.execute(
+            transactions.update().where(transactions.c.id == sa.bindparam('row_id')),
+            [{'row_id': row.id, 'content_hash': content_hash(row.bank_account_id, row.date, row.amount, row.description)}
+             for row in rows]
+        )
+        last_id = rows[-1].id
+
+    op.create_index('ix_transactions_bank_account_id_content_hash', 'transactions',
+                    ['bank_account_id', 'content_hash'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_transactions_bank_account_id_content_hash', table_name='transactions')
+    op.drop_column('transactions', 'content_hash')
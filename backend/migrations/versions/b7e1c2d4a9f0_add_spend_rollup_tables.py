@@ -0,0 +1,61 @@
+"""Add daily and monthly spend rollup tables
+
+Revision ID: b7e1c2d4a9f0
+Revises: 598fa1f6db59
+Create Date: 2026-10-18 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7e1c2d4a9f0'
+down_revision = '598fa1f6db59'
+branch_labels = None
+depends_on = None
+
+
+def _create_rollup_table(name, period_column):
+    op.create_table(
+        name,
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('bank_account_id', sa.Integer(), nullable=False),
+        sa.Column('category_id', sa.Integer(), nullable=False),
+        sa.Column(period_column, sa.Date(), nullable=False),
+        sa.Column('income', sa.Float(), nullable=False),
+        sa.Column('expenses', sa.Float(), nullable=False),
+        sa.Column('transaction_count', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+        sa.ForeignKeyConstraint(['bank_account_id'], ['bank_accounts.id'], ),
+        sa.PrimaryKeyConstraint('user_id', 'bank_account_id', 'category_id', period_column)
+    )
+
+
+def upgrade():
+    _create_rollup_table('daily_rollups', 'day')
+    _create_rollup_table('monthly_rollups', 'month')
+
+    # Backfill from existing transactions; `flask rollups rebuild` does the same at any time
+    op.execute("""
+        INSERT INTO daily_rollups (user_id, bank_account_id, category_id, day, income, expenses, transaction_count)
+        SELECT ba.user_id, t.bank_account_id, COALESCE(t.category_id, 0), CAST(t.date AS DATE),
+               COALESCE(SUM(CASE WHEN t.amount > 0 THEN t.amount ELSE 0 END), 0),
+               COALESCE(SUM(CASE WHEN t.amount < 0 THEN -t.amount ELSE 0 END), 0),
+               COUNT(t.id)
+        FROM transactions t
+        JOIN bank_accounts ba ON t.bank_account_id = ba.id
+        GROUP BY ba.user_id, t.bank_account_id, COALESCE(t.category_id, 0), CAST(t.date AS DATE)
+    """)
+    op.execute("""
+        INSERT INTO monthly_rollups (user_id, bank_account_id, category_id, month, income, expenses, transaction_count)
+        SELECT user_id, bank_account_id, category_id, CAST(date_trunc('month', day) AS DATE),
+               SUM(income), SUM(expenses), SUM(transaction_count)
+        FROM daily_rollups
+        GROUP BY user_id, bank_account_id, category_id, CAST(date_trunc('month', day) AS DATE)
+    """)
+
+
+def downgrade():
+    op.drop_table('monthly_rollups')
+    op.drop_table('daily_rollups')
@@ -0,0 +1,47 @@
+"""Add transaction change versions and tombstones
+
+Revision ID: b8d2f4e6a1c3
+Revises: a6e3c9f1d4b8
+Create Date: 2026-10-18 16:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b8d2f4e6a1c3'
+down_revision = 'a6e3c9f1d4b8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('transactions', sa.Column('created_version', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('transactions', sa.Column('change_version', sa.Integer(), server_default='0', nullable=False))
+    op.create_index(
+        'ix_transactions_bank_account_id_change_version', 'transactions',
+        ['bank_account_id', 'change_version'], unique=False
+    )
+    op.create_table(
+        'transaction_tombstones',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('transaction_id', sa.Integer(), nullable=False),
+        sa.Column('change_version', sa.Integer(), nullable=False),
+        sa.Column('deleted_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(
+        'ix_transaction_tombstones_user_id_change_version', 'transaction_tombstones',
+        ['user_id', 'change_version'], unique=False
+    )
+
+
+def downgrade():
+    op.drop_index('ix_transaction_tombstones_user_id_change_version', table_name='transaction_tombstones')
+    op.drop_table('transaction_tombstones')
+    op.drop_index('ix_transactions_bank_account_id_change_version', table_name='transactions')
+    op.drop_column('transactions', 'change_version')
+    op.drop_column('transactions', 'created_version')
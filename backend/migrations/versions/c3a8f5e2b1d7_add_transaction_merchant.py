@@ -0,0 +1,36 @@
+"""Widen transactions.merchant and make it nullable
+
+Revision ID: c3a8f5e2b1d7
+Revises: b7e1c2d4a9f0
+Create Date: 2026-10-18 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3a8f5e2b1d7'
+down_revision = 'b7e1c2d4a9f0'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # The baseline already has the column as VARCHAR(100) NOT NULL; Plaid often
+    # has no merchant name for a transaction
+    op.alter_column('transactions', 'merchant',
+               existing_type=sa.VARCHAR(length=100),
+               type_=sa.String(length=255),
+               existing_nullable=False,
+               nullable=True)
+
+
+def downgrade():
+    op.execute("UPDATE transactions SET merchant = '' WHERE merchant IS NULL")
+    op.alter_column('transactions', 'merchant',
+               existing_type=sa.String(length=255),
+               type_=sa.VARCHAR(length=100),
+               existing_nullable=True,
+               nullable=False,
+               postgresql_using='left(merchant, 100)')
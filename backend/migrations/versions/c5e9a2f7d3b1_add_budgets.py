@@ -0,0 +1,53 @@
+"""Add budgets and budget alerts
+
+Revision ID: c5e9a2f7d3b1
+Revises: b8d2f4e6a1c3
+Create Date: 2026-10-18 18:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c5e9a2f7d3b1'
+down_revision = 'b8d2f4e6a1c3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'budgets',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('category_id', sa.Integer(), nullable=False),
+        sa.Column('amount', sa.Float(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['category_id'], ['categories.id'], ),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('user_id', 'category_id', name='uq_budgets_user_id_category_id')
+    )
+    op.create_table(
+        'budget_alerts',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('budget_id', sa.Integer(), nullable=False),
+        sa.Column('month', sa.Date(), nullable=False),
+        sa.Column('threshold', sa.Float(), nullable=False),
+        sa.Column('spent', sa.Float(), nullable=False),
+        sa.Column('amount', sa.Float(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['budget_id'], ['budgets.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('budget_id', 'month', 'threshold', name='uq_budget_alerts_budget_id_month_threshold')
+    )
+    op.create_index('ix_budget_alerts_user_id_id', 'budget_alerts', ['user_id', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_budget_alerts_user_id_id', table_name='budget_alerts')
+    op.drop_table('budget_alerts')
+    op.drop_table('budgets')
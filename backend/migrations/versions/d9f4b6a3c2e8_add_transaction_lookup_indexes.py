@@ -0,0 +1,31 @@
+"""Add indexes for the per-user transaction lookup path
+
+Revision ID: d9f4b6a3c2e8
+Revises: c3a8f5e2b1d7
+Create Date: 2026-10-18 11:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd9f4b6a3c2e8'
+down_revision = 'c3a8f5e2b1d7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_bank_accounts_user_id', 'bank_accounts', ['user_id'], unique=False)
+    op.create_index(
+        'ix_transactions_bank_account_id_date',
+        'transactions',
+        ['bank_account_id', sa.text('date DESC'), sa.text('id DESC')],
+        unique=False
+    )
+
+
+def downgrade():
+    op.drop_index('ix_transactions_bank_account_id_date', table_name='transactions')
+    op.drop_index('ix_bank_accounts_user_id', table_name='bank_accounts')
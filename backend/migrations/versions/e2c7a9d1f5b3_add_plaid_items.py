@@ -0,0 +1,44 @@
+"""Add plaid_items with per-item transactions sync cursor
+
+Revision ID: e2c7a9d1f5b3
+Revises: d9f4b6a3c2e8
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e2c7a9d1f5b3'
+down_revision = 'd9f4b6a3c2e8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'plaid_items',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('access_token', sa.String(length=255), nullable=False),
+        sa.Column('institution_name', sa.String(length=255), nullable=True),
+        sa.Column('transactions_cursor', sa.Text(), nullable=True),
+        sa.Column('last_synced_at', sa.DateTime(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('access_token')
+    )
+    op.create_index('ix_plaid_items_user_id', 'plaid_items', ['user_id'], unique=False)
+    op.add_column('bank_accounts', sa.Column('plaid_item_id', sa.Integer(), nullable=True))
+    op.create_foreign_key('bank_accounts_plaid_item_id_fkey', 'bank_accounts', 'plaid_items', ['plaid_item_id'], ['id'])
+    op.create_index('ix_bank_accounts_plaid_item_id', 'bank_accounts', ['plaid_item_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_bank_accounts_plaid_item_id', table_name='bank_accounts')
+    op.drop_constraint('bank_accounts_plaid_item_id_fkey', 'bank_accounts', type_='foreignkey')
+    op.drop_column('bank_accounts', 'plaid_item_id')
+    op.drop_index('ix_plaid_items_user_id', table_name='plaid_items')
+    op.drop_table('plaid_items')
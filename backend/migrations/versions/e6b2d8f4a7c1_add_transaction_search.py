@@ -0,0 +1,47 @@
+"""Add transaction search vector and trigram indexes
+
+Revision ID: e6b2d8f4a7c1
+Revises: c5e9a2f7d3b1
+Create Date: 2026-10-18 20:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e6b2d8f4a7c1'
+down_revision = 'c5e9a2f7d3b1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Postgres only; other databases search descriptions with LIKE
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    # Trigram matching needs pg_trgm and account-scoped GIN indexes need
+    # btree_gin; both ship with contrib, which not every server has
+    available = set(op.get_bind().execute(sa.text(
+        "SELECT name FROM pg_available_extensions WHERE name IN ('btree_gin', 'pg_trgm')"
+    )).scalars())
+    for extension in sorted(available):
+        op.execute(f'CREATE EXTENSION IF NOT EXISTS {extension}')
+    account = 'bank_account_id, ' if 'btree_gin' in available else ''
+    op.execute(
+        "ALTER TABLE transactions ADD COLUMN search_vector tsvector GENERATED ALWAYS AS "
+        "(to_tsvector('simple', coalesce(description, '') || ' ' || coalesce(merchant, ''))) STORED"
+    )
+    op.execute(f'CREATE INDEX ix_transactions_search_vector ON transactions USING gin ({account}search_vector)')
+    if 'pg_trgm' in available:
+        op.execute(f'CREATE INDEX ix_transactions_description_trgm ON transactions USING gin ({account}description gin_trgm_ops)')
+        op.execute(f'CREATE INDEX ix_transactions_merchant_trgm ON transactions USING gin ({account}merchant gin_trgm_ops)')
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.execute('DROP INDEX IF EXISTS ix_transactions_merchant_trgm')
+    op.execute('DROP INDEX IF EXISTS ix_transactions_description_trgm')
+    op.execute('DROP INDEX IF EXISTS ix_transactions_search_vector')
+    op.execute('ALTER TABLE transactions DROP COLUMN search_vector')
@@ -0,0 +1,41 @@
+"""Add category rules
+
+Revision ID: f7c3a9e5b2d4
+Revises: e6b2d8f4a7c1
+Create Date: 2026-10-18 22:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f7c3a9e5b2d4'
+down_revision = 'e6b2d8f4a7c1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'category_rules',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('category_id', sa.Integer(), nullable=False),
+        sa.Column('kind', sa.String(length=20), nullable=False),
+        sa.Column('pattern', sa.String(length=255), nullable=True),
+        sa.Column('min_amount', sa.Float(), nullable=True),
+        sa.Column('max_amount', sa.Float(), nullable=True),
+        sa.Column('priority', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['category_id'], ['categories.id'], ),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_category_rules_user_id'), 'category_rules', ['user_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_category_rules_user_id'), table_name='category_rules')
+    op.drop_table('category_rules')
@@ -0,0 +1,234 @@
+"""The cached read endpoints, written once for the Flask app and for asgi.py.
+
+GET /api/me, /api/transactions and /api/summary are each a generator here
+that does the request parsing, cache keys, ETags and error responses itself
+and yields the steps that wait on something: a database read (Query), a
+cache call (CacheCall) or the streamed transaction listing (Stream). The
+driver sends back each step's result, or throws its exception in.
+
+run() performs the steps inline on db.session, for the Flask views in
+app.py. arun() awaits them on an AsyncSession for the async server in
+asgi.py, with cache calls on a worker thread when the cache is Redis. Both
+servers therefore run the same code for these endpoints and give the same
+answers.
+"""
+from datetime import datetime
+from flask import Response, g, request, jsonify, stream_with_context
+from database.models import db
+from services import cache, identity_service
+from services.summary_service import summarize
+from services.transaction_service import (
+    DEFAULT_PAGE_SIZE, aiter_json_array, aiter_ndjson, aiter_transaction_batches, get_page,
+    iter_json_array, iter_ndjson, iter_transactions
+)
+
+def get_date_range(time_period):
+    now = datetime.utcnow()
+    if time_period == 'month':
+        start_date = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    elif time_period == 'ytd':
+        start_date = now.replace(month=1, day=1, hour=0, minute=0, second=0, microsecond=0)
+    elif time_period == 'year':
+        start_date = now.replace(year=now.year - 1, hour=0, minute=0, second=0, microsecond=0)
+    else:
+        start_date = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    return start_date, now
+
+def response_cache_key(user_id, endpoint, start_date, end_date):
+    """Cache key for this request's response, or None if the user does not exist"""
+    return versioned_cache_key(user_id, cache.data_version(user_id), endpoint, start_date, end_date)
+
+def versioned_cache_key(user_id, version, endpoint, start_date, end_date):
+    """response_cache_key() for a data version the caller has already read"""
+    g.data_version = version
+    if version is None:
+        return None
+    params = dict(request.args.items(), start=start_date.isoformat(), end=end_date.isoformat())
+    return cache.response_key(user_id, version, endpoint, params)
+
+def revalidatable(response, key):
+    """Tag a response with its ETag and the data version it reflects"""
+    if key:
+        response.set_etag(cache.etag(key))
+        response.headers['Cache-Control'] = 'private, no-cache'
+        response.headers['X-Data-Version'] = str(g.data_version)
+    return response
+
+def cached_response(key, mimetype):
+    """304 if the client already holds this response, the cached body if there is one, else None"""
+    if not key:
+        return None
+    if request.if_none_match.contains(cache.etag(key)):
+        return revalidatable(Response(status=304), key)
+    body = cache.get_cache().get(key)
+    if body is None:
+        return None
+    return revalidatable(Response(body, mimetype=mimetype, headers={'X-Cache': 'HIT'}), key)
+
+def page_params():
+    """(limit, cursor) for a keyset-paginated request; raises ValueError on a bad limit"""
+    try:
+        limit = int(request.args.get('limit', DEFAULT_PAGE_SIZE))
+    except ValueError:
+        raise ValueError('limit must be an integer')
+    return limit, request.args.get('cursor')
+
+class Query:
+    """A read on the request's session: `fn(session)`"""
+
+    def __init__(self, fn):
+        self.fn = fn
+
+    def run(self):
+        return self.fn(db.session)
+
+    async def arun(self, session):
+        return await session.run_sync(self.fn)
+
+class CacheCall:
+    """A call into the response or identity cache, a network round trip with Redis"""
+
+    def __init__(self, fn, *args):
+        self.fn = fn
+        self.args = args
+
+    def run(self):
+        return self.fn(*self.args)
+
+    async def arun(self, session):
+        return await cache.off_loop(self.fn, *self.args)
+
+class Stream:
+    """The user's transactions in a date range as a streamed response, cached under `key` once complete"""
+
+    def __init__(self, user_id, start_date, end_date, ndjson, key):
+        self.user_id = user_id
+        self.start_date = start_date
+        self.end_date = end_date
+        self.ndjson = ndjson
+        self.key = key
+
+    def response(self, body=None):
+        mimetype = 'application/x-ndjson' if self.ndjson else 'application/json'
+        return Response(body, mimetype=mimetype, headers={'X-Cache': 'MISS'})
+
+    def run(self):
+        transactions = iter_transactions(self.user_id, self.start_date, self.end_date)
+        body = iter_ndjson(transactions) if self.ndjson else iter_json_array(transactions)
+        if self.key:
+            body = cache.store_stream(self.key, body)
+        return self.response(stream_with_context(body))
+
+    async def arun(self, session):
+        batches = aiter_transaction_batches(session, self.user_id, self.start_date, self.end_date)
+        body = aiter_ndjson(batches) if self.ndjson else aiter_json_array(batches)
+        if self.key:
+            body = cache.astore_stream(self.key, body)
+        response = self.response()
+        # Sent by asgi.py while the session is still open
+        response.async_body = body
+        return response
+
+def run(view):
+    """A view's response, with its steps run inline"""
+    send, value = view.send, None
+    while True:
+        try:
+            step = send(value)
+        except StopIteration as done:
+            return done.value
+        try:
+            send, value = view.send, step.run()
+        except Exception as e:
+            send, value = view.throw, e
+
+async def arun(view, session):
+    """A view's response, with its steps awaited against an AsyncSession"""
+    send, value = view.send, None
+    while True:
+        try:
+            step = send(value)
+        except StopIteration as done:
+            return done.value
+        try:
+            send, value = view.send, await step.arun(session)
+        except Exception as e:
+            send, value = view.throw, e
+
+def current_user(user_id):
+    user = yield CacheCall(identity_service.cached_principal, user_id)
+    if user is None:
+        user = yield Query(lambda session: identity_service.load_principal(user_id, session))
+        if user is not None:
+            yield CacheCall(identity_service.remember, user)
+
+    if not user:
+        return jsonify({'detail': 'User not found'}), 404
+
+    return jsonify({
+        'id': user['id'],
+        'email': user['email'],
+        'full_name': user['full_name']
+    })
+
+def transactions(user_id):
+    time_period = request.args.get('time_period', 'month')
+    start_date, end_date = get_date_range(time_period)
+    start_date, end_date = start_date.date(), end_date.date()
+    ndjson = request.args.get('format') == 'ndjson'
+    mimetype = 'application/x-ndjson' if ndjson else 'application/json'
+
+    # Responses only change when ingestion bumps the user's data version,
+    # so a matching If-None-Match or a cached body skips the query entirely
+    version = yield Query(lambda session: cache.data_version(user_id, session=session))
+    key = versioned_cache_key(user_id, version, 'transactions', start_date, end_date)
+    hit = yield CacheCall(cached_response, key, mimetype)
+    if hit:
+        return hit
+
+    # Keyset pagination: ?limit=N[&cursor=...]
+    if 'limit' in request.args or 'cursor' in request.args:
+        try:
+            limit, cursor = page_params()
+            transactions, next_cursor = yield Query(
+                lambda session: get_page(user_id, start_date, end_date, limit, cursor, session=session)
+            )
+        except ValueError as e:
+            return jsonify({'detail': str(e)}), 400
+        response = jsonify({'transactions': transactions, 'next_cursor': next_cursor})
+        if key:
+            yield CacheCall(cache.store, key, response.get_data())
+        response.headers['X-Cache'] = 'MISS'
+        return revalidatable(response, key)
+
+    # Otherwise stream the whole window, as NDJSON or as a plain JSON array
+    response = yield Stream(user_id, start_date, end_date, ndjson, key)
+    return revalidatable(response, key)
+
+def summary(user_id):
+    time_period = request.args.get('time_period', 'month')
+    start_date, end_date = get_date_range(time_period)
+    breakdowns = [b for b in request.args.get('breakdown', '').split(',') if b]
+
+    version = yield Query(lambda session: cache.data_version(user_id, session=session))
+    key = versioned_cache_key(user_id, version, 'summary', start_date.date(), end_date.date())
+    hit = yield CacheCall(cached_response, key, 'application/json')
+    if hit:
+        return hit
+
+    try:
+        summary = yield Query(
+            lambda session: summarize(user_id, start_date.date(), end_date.date(), breakdowns, session=session)
+        )
+    except ValueError as e:
+        return jsonify({'detail': str(e)}), 400
+
+    summary['period'] = {
+        'start': start_date.isoformat(),
+        'end': end_date.isoformat()
+    }
+    response = jsonify(summary)
+    if key:
+        yield CacheCall(cache.store, key, response.get_data())
+    response.headers['X-Cache'] = 'MISS'
+    return revalidatable(response, key)
@@ -1,6 +1,7 @@
 from flask import Blueprint, request, jsonify
-from werkzeug.security import generate_password_hash, check_password_hash
 from database.models import db, User
+from services import identity_service, password_service
+from services.password_service import HashingBusy
 from datetime import datetime, timedelta
 import jwt
 import os
@@ -34,7 +35,7 @@ def register():
             return jsonify({"detail": "Email already registered"}), 400
 
         # Create new user
-        hashed_password = generate_password_hash(password)
+        hashed_password = password_service.hash_password(password)
         new_user = User(
             email=email,
             hashed_password=hashed_password,
@@ -45,6 +46,10 @@ def register():
 
         return jsonify({"message": "User created successfully", "email": email}), 201
 
+    except HashingBusy:
+        # Answered with a 503 by the app's error handler
+        db.session.rollback()
+        raise
     except Exception as e:
         db.session.rollback()
         return jsonify({"detail": str(e)}), 500
@@ -60,8 +65,15 @@ def login():
             return jsonify({"detail": "Email and password are required"}), 400
 
         user = User.query.filter_by(email=email).first()
-        if not user or not check_password_hash(user.hashed_password, password):
+        if not user:
+            return jsonify({"detail": "Incorrect email or password"}), 401
+
+        valid, upgraded = password_service.verify_password(user.hashed_password, password)
+        if not valid:
             return jsonify({"detail": "Incorrect email or password"}), 401
+        if upgraded:
+            user.hashed_password = upgraded
+            db.session.commit()
 
         access_token = create_access_token(data={"sub": user.email})
         return jsonify({
@@ -74,7 +86,10 @@ def login():
             }
         })
 
+    except HashingBusy:
+        raise
     except Exception as e:
+        db.session.rollback()
         return jsonify({"detail": str(e)}), 500
 
 @router.route('/me', methods=['GET'])
@@ -93,14 +108,14 @@ def read_users_me():
         except jwt.JWTError:
             return jsonify({"detail": "Invalid token"}), 401
 
-        user = User.query.filter_by(email=email).first()
+        user = identity_service.principal_for_email(email)
         if not user:
             return jsonify({"detail": "User not found"}), 404
 
         return jsonify({
-            "id": user.id,
-            "email": user.email,
-            "full_name": user.full_name
+            "id": user["id"],
+            "email": user["email"],
+            "full_name": user["full_name"]
         })
 
     except Exception as e:
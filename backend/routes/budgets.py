@@ -0,0 +1,94 @@
+from datetime import date
+from flask import Blueprint, request, jsonify
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from sqlalchemy.exc import IntegrityError
+from database.models import db, Budget, Category
+from services import budget_service
+
+bp = Blueprint('budgets', __name__)
+
+def _amount(data):
+    """The budget amount from a request body, or None if it is missing or not positive"""
+    try:
+        amount = float(data.get('amount'))
+    except (TypeError, ValueError):
+        return None
+    return amount if amount > 0 else None
+
+def _own_budget(budget_id):
+    budget = db.session.get(Budget, budget_id)
+    if budget is None or budget.user_id != get_jwt_identity():
+        return None
+    return budget
+
+@bp.route('/api/budgets', methods=['GET'])
+@jwt_required()
+def list_budgets():
+    # ?month=YYYY-MM for a past or future month; defaults to this one
+    month = None
+    if 'month' in request.args:
+        try:
+            month = date.fromisoformat(request.args['month'] + '-01')
+        except ValueError:
+            return jsonify({'detail': 'month must look like YYYY-MM'}), 400
+    return jsonify(budget_service.status(get_jwt_identity(), month))
+
+@bp.route('/api/budgets', methods=['POST'])
+@jwt_required()
+def create_budget():
+    user_id = get_jwt_identity()
+    data = request.get_json(silent=True) or {}
+    amount = _amount(data)
+    if amount is None:
+        return jsonify({'detail': 'amount must be a positive number'}), 400
+    category = db.session.get(Category, data.get('category_id')) if isinstance(data.get('category_id'), int) else None
+    if category is None:
+        return jsonify({'detail': 'Category not found'}), 400
+
+    budget = Budget(user_id=user_id, category_id=category.id, amount=amount)
+    db.session.add(budget)
+    try:
+        db.session.flush()
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({'detail': 'A budget for this category already exists'}), 409
+    # Spend already this month may be past a threshold
+    budget_service.check(budget)
+    db.session.commit()
+    return jsonify(budget_service.status(user_id, budget_id=budget.id)[0]), 201
+
+@bp.route('/api/budgets/<int:budget_id>', methods=['PUT'])
+@jwt_required()
+def update_budget(budget_id):
+    budget = _own_budget(budget_id)
+    if budget is None:
+        return jsonify({'detail': 'Budget not found'}), 404
+    amount = _amount(request.get_json(silent=True) or {})
+    if amount is None:
+        return jsonify({'detail': 'amount must be a positive number'}), 400
+
+    budget.amount = amount
+    db.session.flush()
+    budget_service.check(budget)
+    db.session.commit()
+    return jsonify(budget_service.status(budget.user_id, budget_id=budget.id)[0])
+
+@bp.route('/api/budgets/<int:budget_id>', methods=['DELETE'])
+@jwt_required()
+def delete_budget(budget_id):
+    budget = _own_budget(budget_id)
+    if budget is None:
+        return jsonify({'detail': 'Budget not found'}), 404
+    budget_service.remove(budget)
+    db.session.commit()
+    return '', 204
+
+@bp.route('/api/budgets/alerts', methods=['GET'])
+@jwt_required()
+def list_alerts():
+    # ?after=<id> returns only alerts newer than the last one the client saw
+    try:
+        after = int(request.args.get('after', 0))
+    except ValueError:
+        return jsonify({'detail': 'after must be an integer'}), 400
+    return jsonify(budget_service.alerts(get_jwt_identity(), after))
@@ -0,0 +1,43 @@
+from datetime import date
+from flask import Blueprint, Response, request, jsonify, stream_with_context
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from database import routing
+from services import export_service, identity_service
+
+bp = Blueprint('export', __name__)
+
+FORMATS = {
+    'csv': ('text/csv', export_service.iter_csv),
+    'parquet': ('application/vnd.apache.parquet', export_service.iter_parquet),
+}
+
+@bp.route('/api/export', methods=['GET'])
+@jwt_required()
+@routing.replica_reads
+def export_transactions():
+    user_id = get_jwt_identity()
+    # ?format=csv|parquet, ?start/?end are ISO dates, ?account_id may repeat
+    fmt = request.args.get('format', 'csv')
+    if fmt not in FORMATS:
+        return jsonify({'detail': f"format must be one of {', '.join(FORMATS)}"}), 400
+    if fmt == 'parquet' and not export_service.parquet_available():
+        return jsonify({'detail': 'Parquet export is not available on this server'}), 501
+    try:
+        start_date = date.fromisoformat(request.args['start']) if 'start' in request.args else None
+        end_date = date.fromisoformat(request.args['end']) if 'end' in request.args else None
+    except ValueError:
+        return jsonify({'detail': 'start and end must be dates (YYYY-MM-DD)'}), 400
+    try:
+        account_ids = [int(account_id) for account_id in request.args.getlist('account_id')]
+    except ValueError:
+        return jsonify({'detail': 'account_id must be an integer'}), 400
+    if account_ids:
+        principal = identity_service.get_principal(user_id)
+        if principal is None or not set(account_ids) <= set(principal['account_ids']):
+            return jsonify({'detail': 'Account not found'}), 404
+
+    mimetype, export = FORMATS[fmt]
+    body = export(user_id, start_date, end_date, account_ids)
+    return Response(stream_with_context(body), mimetype=mimetype, headers={
+        'Content-Disposition': f'attachment; filename="transactions.{fmt}"'
+    })
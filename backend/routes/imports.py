@@ -0,0 +1,33 @@
+from flask import Blueprint, request, jsonify
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from database.models import db, BankAccount
+from services import import_service
+from services.import_service import StatementError
+
+bp = Blueprint('imports', __name__)
+
+@bp.route('/api/imports', methods=['POST'])
+@jwt_required()
+def import_statement():
+    # multipart/form-data: file, account_id, and format when the file name does not tell
+    user_id = get_jwt_identity()
+    upload = request.files.get('file')
+    if upload is None:
+        return jsonify({'detail': 'file is required'}), 400
+    fmt = request.form.get('format') or import_service.detect_format(upload.filename)
+    if fmt not in import_service.FORMATS:
+        return jsonify({'detail': f"format must be one of {', '.join(import_service.FORMATS)}"}), 400
+    try:
+        account = db.session.get(BankAccount, int(request.form.get('account_id', '')))
+    except ValueError:
+        return jsonify({'detail': 'account_id must be an integer'}), 400
+    if account is None or account.user_id != user_id:
+        return jsonify({'detail': 'Account not found'}), 404
+
+    try:
+        counts = import_service.import_statement(user_id, account.id, upload.stream, fmt)
+    except StatementError as e:
+        db.session.rollback()
+        return jsonify({'detail': str(e)}), 400
+    db.session.commit()
+    return jsonify(counts), 201
@@ -1,12 +1,41 @@
-from flask import Blueprint, jsonify
+from functools import wraps
+from flask import Blueprint, Response, current_app, jsonify, request
 from database.models import db
+from services import cache, identity_service, metrics
 
 bp = Blueprint('main', __name__)
 
+def ops_endpoint(view):
+    """Serve an unauthenticated operational view only when OPS_ENDPOINTS_ENABLED is set"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not current_app.config['OPS_ENDPOINTS_ENABLED']:
+            return jsonify({'detail': 'Not found'}), 404
+        return view(*args, **kwargs)
+    return wrapper
+
 @bp.route('/health')
 def health_check():
     return jsonify({"status": "healthy"})
 
+@bp.route('/metrics')
+@ops_endpoint
+def prometheus_metrics():
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+@bp.route('/traces')
+@ops_endpoint
+def traces():
+    """Recent outbound calls, each linked to the request or job that made it; ?trace_id= narrows to one"""
+    return jsonify({'spans': metrics.recent_spans(request.args.get('trace_id'))})
+
+@bp.route('/cache/stats')
+@ops_endpoint
+def cache_stats():
+    stats = cache.get_cache().stats()
+    stats['identity'] = identity_service.stats()
+    return jsonify(stats)
+
 @bp.route('/init-db')
 def init_db():
     db.create_all()
@@ -1,7 +1,9 @@
 from flask import Blueprint, request, jsonify
+from flask_jwt_extended import get_jwt_identity, jwt_required
 from services.plaid_service import PlaidService
-from database.models import db, User, BankAccount, Transaction
-from datetime import datetime
+from services import identity_service, job_service, sync_service
+from database.models import db, BankAccount, PlaidItem, Job
+from database.routing import replica_reads
 
 plaid_bp = Blueprint('plaid', __name__)
 plaid_service = PlaidService()
@@ -28,65 +30,64 @@ def exchange_token():
         
         if not public_token or not user_id:
             return jsonify({"error": "public_token and user_id are required"}), 400
+        if isinstance(user_id, bool) or not str(user_id).isdigit():
+            return jsonify({"error": "user_id must be an integer"}), 400
+        user_id = int(user_id)
         
-        # Exchange public token for access token
-        access_token = plaid_service.exchange_public_token(public_token)
-        
-        # Get account information
-        accounts = plaid_service.get_accounts(access_token)
-        
-        # Store bank account information
-        user = User.query.get(user_id)
-        if not user:
+        if not identity_service.get_principal(user_id):
             return jsonify({"error": "User not found"}), 404
         
-        for account in accounts:
-            bank_account = BankAccount(
-                user_id=user_id,
-                plaid_account_id=account['account_id'],
-                institution_name=account.get('institution_name', 'Unknown'),
-                account_name=account.get('name', 'Unknown'),
-                account_type=account.get('type', 'Unknown'),
-                balance=account.get('balances', {}).get('current', 0)
-            )
-            db.session.add(bank_account)
-        
+        # Public tokens are short-lived, so exchange now; accounts and the
+        # first transaction sync are fetched by a background job
+        access_token = plaid_service.exchange_public_token(public_token)
+        item = PlaidItem(user_id=user_id, access_token=access_token)
+        db.session.add(item)
+        db.session.flush()
+        job = sync_service.enqueue_link(item)
         db.session.commit()
-        return jsonify({"message": "Bank accounts added successfully"})
+        return jsonify({
+            "message": "Bank accounts are being linked",
+            "item_id": item.id,
+            "job_id": job.id
+        }), 202, {"Location": f"/jobs/{job.id}"}
     except Exception as e:
         db.session.rollback()
         return jsonify({"error": str(e)}), 500
 
-@plaid_bp.route('/transactions/<user_id>', methods=['GET'])
+@plaid_bp.route('/transactions/<int:user_id>', methods=['GET'])
 def get_user_transactions(user_id):
     try:
-        # Get user's bank accounts
-        bank_accounts = BankAccount.query.filter_by(user_id=user_id).all()
-        if not bank_accounts:
+        if not PlaidItem.query.filter_by(user_id=user_id).first():
             return jsonify({"error": "No bank accounts found for user"}), 404
         
-        all_transactions = []
-        for account in bank_accounts:
-            transactions = plaid_service.get_transactions(account.plaid_account_id)
-            for transaction in transactions:
-                # Store transaction in database
-                db_transaction = Transaction(
-                    bank_account_id=account.id,
-                    plaid_transaction_id=transaction['transaction_id'],
-                    amount=transaction['amount'],
-                    date=datetime.strptime(transaction['date'], '%Y-%m-%d').date(),
-                    description=transaction.get('name', '')
-                )
-                db.session.add(db_transaction)
-                all_transactions.append(transaction)
-        
+        # A worker pulls what changed since each item's stored sync cursor;
+        # poll the job for the outcome
+        job = sync_service.enqueue_sync(user_id)
         db.session.commit()
-        return jsonify({"transactions": all_transactions})
+        return jsonify({"job_id": job.id, "status": job.status}), 202, {"Location": f"/jobs/{job.id}"}
     except Exception as e:
         db.session.rollback()
         return jsonify({"error": str(e)}), 500
 
-@plaid_bp.route('/accounts/<user_id>', methods=['GET'])
+def _job_owner(job):
+    """The user a job works for: named in its payload, or the owner of the item it links"""
+    payload = job.payload or {}
+    if 'user_id' in payload:
+        return payload['user_id']
+    item = db.session.get(PlaidItem, payload['item_id']) if 'item_id' in payload else None
+    return item.user_id if item else None
+
+@plaid_bp.route('/jobs/<int:job_id>', methods=['GET'])
+@jwt_required()
+def get_job(job_id):
+    job = db.session.get(Job, job_id)
+    # Someone else's job is reported as missing, so ids cannot be probed
+    if not job or _job_owner(job) != get_jwt_identity():
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job_service.serialize(job))
+
+@plaid_bp.route('/accounts/<int:user_id>', methods=['GET'])
+@replica_reads
 def get_user_accounts(user_id):
     try:
         bank_accounts = BankAccount.query.filter_by(user_id=user_id).all()
@@ -0,0 +1,179 @@
+import re
+from flask import Blueprint, request, jsonify
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from database.models import db, Category, CategoryRule
+from services import category_service
+
+bp = Blueprint('rules', __name__)
+
+# Regex rules run against every merchant a user syncs; keep them short and
+# free of nested quantifiers such as (a+)+, which backtrack exponentially.
+# The rule is read off the pattern string: a group may not be repeated more
+# than once (*, +, {2,}, ...) if it contains something repeated more than once.
+MAX_REGEX_LENGTH = 100
+_BRACES = re.compile(r'\{(\d*)(,?)(\d*)\}')
+
+def _repeat_at(pattern, i):
+    """(end, whether it allows more than one repeat) for a quantifier at pattern[i], or None"""
+    c = pattern[i:i + 1]
+    if c in ('*', '+'):
+        end, many = i + 1, True
+    elif c == '?':
+        end, many = i + 1, False
+    elif c == '{':
+        braces = _BRACES.match(pattern, i)
+        if not braces or not (braces[1] or braces[2]):
+            # A literal brace
+            return None
+        upper = braces[3] if braces[2] else braces[1]
+        end, many = braces.end(), not upper or int(upper) > 1
+    else:
+        return None
+    # Lazy and possessive forms repeat the same way
+    if pattern[end:end + 1] in ('?', '+'):
+        end += 1
+    return end, many
+
+def _class_end(pattern, i):
+    """Index just past the character class that opens at pattern[i]"""
+    i += 1
+    if pattern.startswith('^', i):
+        i += 1
+    if pattern.startswith(']', i):
+        i += 1
+    while pattern[i] != ']':
+        i += 2 if pattern[i] == '\\' else 1
+    return i + 1
+
+def _nested_quantifier(pattern):
+    """Whether a valid pattern repeats a group that contains a repeat, e.g. (a+)+ or (x(b*))*"""
+    # Per open group: whether it contains a repeat
+    groups = [False]
+    i = 0
+    while i < len(pattern):
+        c = pattern[i]
+        repeats = False
+        if c == '\\':
+            i += 2
+        elif c == '[':
+            i = _class_end(pattern, i)
+        elif c == '(':
+            groups.append(False)
+            # The ? of (?:...), (?P<name>...) and the like is not a quantifier
+            i += 2 if pattern.startswith('(?', i) else 1
+            continue
+        elif c == ')':
+            repeats = groups.pop()
+            i += 1
+        else:
+            i += 1
+        repeat = _repeat_at(pattern, i)
+        if repeat:
+            i, many = repeat
+            if many and repeats:
+                return True
+            repeats = repeats or many
+        groups[-1] = groups[-1] or repeats
+    return False
+
+def _regex_error(pattern):
+    """Why a regex rule pattern is refused, or None"""
+    if len(pattern) > MAX_REGEX_LENGTH:
+        return f'Regex must be at most {MAX_REGEX_LENGTH} characters'
+    try:
+        re.compile(pattern)
+    except re.error as e:
+        return f'Invalid regex: {e}'
+    if _nested_quantifier(pattern):
+        return 'Regex must not nest quantifiers, e.g. (a+)+'
+    return None
+
+def _rule_fields(data):
+    """(column values, None) for a valid rule in a request body, or (None, error message)"""
+    kind = data.get('kind', 'contains')
+    if kind not in category_service.KINDS:
+        return None, f"kind must be one of {', '.join(category_service.KINDS)}"
+    pattern = data.get('pattern') or None
+    if pattern is not None and not isinstance(pattern, str):
+        return None, 'pattern must be a string'
+    if kind == 'regex' and pattern:
+        error = _regex_error(pattern)
+        if error:
+            return None, error
+
+    bounds = {}
+    for name in ('min_amount', 'max_amount'):
+        value = data.get(name)
+        if value is not None and (isinstance(value, bool) or not isinstance(value, (int, float)) or value < 0):
+            return None, f'{name} must be a non-negative number'
+        bounds[name] = value
+    if pattern is None and bounds['min_amount'] is None and bounds['max_amount'] is None:
+        return None, 'A rule needs a pattern or an amount range'
+    if None not in bounds.values() and bounds['min_amount'] > bounds['max_amount']:
+        return None, 'min_amount must not exceed max_amount'
+
+    priority = data.get('priority', 0)
+    if isinstance(priority, bool) or not isinstance(priority, int):
+        return None, 'priority must be an integer'
+    category = db.session.get(Category, data.get('category_id')) if isinstance(data.get('category_id'), int) else None
+    if category is None:
+        return None, 'Category not found'
+    return {'category_id': category.id, 'kind': kind, 'pattern': pattern, 'priority': priority, **bounds}, None
+
+def _own_rule(rule_id):
+    rule = db.session.get(CategoryRule, rule_id)
+    if rule is None or rule.user_id != get_jwt_identity():
+        return None
+    return rule
+
+def _changed(user_id, body, status=200):
+    """Queue re-applying the rules to the user's history and respond with the job"""
+    job = category_service.enqueue_recategorize(user_id)
+    db.session.commit()
+    return jsonify(dict(body, job_id=job.id)), status
+
+@bp.route('/api/rules', methods=['GET'])
+@jwt_required()
+def list_rules():
+    rules = CategoryRule.query.filter_by(user_id=get_jwt_identity()).order_by(CategoryRule.priority, CategoryRule.id)
+    return jsonify([category_service.serialize(rule) for rule in rules])
+
+@bp.route('/api/rules', methods=['POST'])
+@jwt_required()
+def create_rule():
+    fields, error = _rule_fields(request.get_json(silent=True) or {})
+    if error:
+        return jsonify({'detail': error}), 400
+    rule = CategoryRule(user_id=get_jwt_identity(), **fields)
+    db.session.add(rule)
+    db.session.flush()
+    return _changed(rule.user_id, category_service.serialize(rule), 201)
+
+@bp.route('/api/rules/<int:rule_id>', methods=['PUT'])
+@jwt_required()
+def update_rule(rule_id):
+    rule = _own_rule(rule_id)
+    if rule is None:
+        return jsonify({'detail': 'Rule not found'}), 404
+    fields, error = _rule_fields(request.get_json(silent=True) or {})
+    if error:
+        return jsonify({'detail': error}), 400
+    for name, value in fields.items():
+        setattr(rule, name, value)
+    db.session.flush()
+    return _changed(rule.user_id, category_service.serialize(rule))
+
+@bp.route('/api/rules/<int:rule_id>', methods=['DELETE'])
+@jwt_required()
+def delete_rule(rule_id):
+    rule = _own_rule(rule_id)
+    if rule is None:
+        return jsonify({'detail': 'Rule not found'}), 404
+    db.session.delete(rule)
+    return _changed(rule.user_id, {})
+
+@bp.route('/api/rules/apply', methods=['POST'])
+@jwt_required()
+def apply_rules():
+    # Rules are re-applied after every change; this re-runs it on demand
+    return _changed(get_jwt_identity(), {}, 202)
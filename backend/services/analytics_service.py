@@ -0,0 +1,152 @@
+"""Spend broken down by category, merchant, account and month in one statement.
+
+On Postgres the breakdowns are the GROUPING SETS of a single aggregate over
+the user's transactions, so the table is scanned once however many
+dimensions are asked for. SQLite has no GROUPING SETS and gets the same rows
+from a UNION ALL of one GROUP BY per dimension. The aggregate only groups
+transaction columns; category and account names are joined to the few
+grouped rows afterwards rather than to every transaction. Top-N limits are
+applied in SQL with ROW_NUMBER(), so only the rows that are returned leave
+the database.
+"""
+from sqlalchemy import case, cast, func, literal, null, or_, select, tuple_, union_all
+from database.models import db, BankAccount, Category, Transaction
+from database.dialects import is_postgres, month_start
+
+DIMENSIONS = ('category', 'merchant', 'account', 'month')
+# Dimensions ranked by spend and cut to `top`; months are a trend and are all returned in order
+RANKED = ('category', 'merchant', 'account')
+
+def _check_dimensions(dimensions):
+    unknown = set(dimensions) - set(DIMENSIONS)
+    if unknown:
+        raise ValueError(f"Unknown dimension(s): {', '.join(sorted(unknown))}")
+
+def _columns():
+    """Grouping column per dimension"""
+    return {
+        'category': Transaction.category_id.label('category_id'),
+        'merchant': Transaction.merchant.label('merchant'),
+        'account': Transaction.bank_account_id.label('account_id'),
+        'month': month_start(Transaction.date).label('month')
+    }
+
+def _measures():
+    return [
+        func.coalesce(func.sum(case((Transaction.amount > 0, Transaction.amount), else_=0)), 0).label('income'),
+        func.coalesce(func.sum(case((Transaction.amount < 0, -Transaction.amount), else_=0)), 0).label('expenses'),
+        func.count(Transaction.id).label('count')
+    ]
+
+def _source(stmt, user_id, start_date, end_date):
+    return stmt.select_from(Transaction).where(
+        Transaction.bank_account_id.in_(select(BankAccount.id).where(BankAccount.user_id == user_id)),
+        Transaction.date.between(start_date, end_date)
+    )
+
+def _keys(columns, grouped):
+    """Every dimension's column, NULL for dimensions not in `grouped`"""
+    return [
+        columns[name] if name in grouped else cast(null(), columns[name].type).label(columns[name].name)
+        for name in DIMENSIONS
+    ]
+
+def _grouping_sets(user_id, start_date, end_date, dimensions):
+    """One aggregate whose grouping sets are the dimensions plus the grand total"""
+    columns = _columns()
+    if not dimensions:
+        stmt = select(literal('total').label('dimension'), *_keys(columns, ()), *_measures())
+        return _source(stmt, user_id, start_date, end_date)
+
+    # GROUPING(a, b, ...) is a bitmask with a bit set for each argument that is
+    # not in the row's grouping set, the last argument being the lowest bit;
+    # a row grouped by one dimension has every bit set but that one's
+    all_bits = 2 ** len(dimensions) - 1
+    grouping = func.grouping(*[columns[name] for name in dimensions])
+    dimension = case(
+        *[(grouping == all_bits - 2 ** (len(dimensions) - 1 - i), name) for i, name in enumerate(dimensions)],
+        else_='total'
+    ).label('dimension')
+    sets = [tuple_(columns[name]) for name in dimensions] + [tuple_()]
+    stmt = select(dimension, *_keys(columns, dimensions), *_measures())
+    return _source(stmt, user_id, start_date, end_date).group_by(func.grouping_sets(*sets))
+
+def _union(user_id, start_date, end_date, dimensions):
+    """_grouping_sets() for databases without GROUPING SETS"""
+    columns = _columns()
+    parts = []
+    for name in list(dimensions) + ['total']:
+        stmt = select(literal(name).label('dimension'), *_keys(columns, [name]), *_measures())
+        stmt = _source(stmt, user_id, start_date, end_date)
+        parts.append(stmt.group_by(columns[name]) if name in columns else stmt)
+    return union_all(*parts)
+
+def _ranked(stmt, top):
+    """Keep the `top` highest-spend rows of each ranked dimension"""
+    grouped = stmt.subquery('grouped')
+    rank = func.row_number().over(
+        partition_by=grouped.c.dimension,
+        order_by=(grouped.c.expenses.desc(), grouped.c.count.desc())
+    ).label('rank')
+    ranked = select(grouped, rank).subquery('ranked')
+    return select(ranked).where(or_(ranked.c.dimension.not_in(RANKED), ranked.c.rank <= top))
+
+def _named(stmt):
+    """Add category and account names to the grouped rows"""
+    grouped = stmt.subquery('named')
+    return (
+        select(grouped, Category.name.label('category_name'), BankAccount.account_name)
+        .outerjoin(Category, grouped.c.category_id == Category.id)
+        .outerjoin(BankAccount, grouped.c.account_id == BankAccount.id)
+    )
+
+def _totals(income=0.0, expenses=0.0, count=0):
+    return {
+        'income': float(income),
+        'expenses': float(expenses),
+        'net': float(income) - float(expenses),
+        'count': int(count)
+    }
+
+def _bucket(row, **fields):
+    return {**fields, **_totals(row.income, row.expenses, row.count)}
+
+def analyze(user_id, start_date, end_date, dimensions=DIMENSIONS, top=None, session=None):
+    """Totals and per-dimension spend for a user's transactions between two dates.
+
+    Returns {'totals': {...}, 'by_<dimension>': [...]} with income, expenses,
+    net and count in every bucket. Category, merchant and account buckets
+    are sorted by expenses, highest first, and cut to `top` when it is
+    given; months are returned oldest first. Transactions without a
+    category or merchant are grouped under None.
+    """
+    _check_dimensions(dimensions)
+    dimensions = [name for name in DIMENSIONS if name in dimensions]
+    if top is not None and top < 1:
+        raise ValueError('top must be a positive integer')
+
+    build = _grouping_sets if is_postgres() else _union
+    stmt = build(user_id, start_date, end_date, dimensions)
+    if top is not None and any(name in RANKED for name in dimensions):
+        stmt = _ranked(stmt, top)
+
+    result = {'totals': _totals()}
+    result.update({f'by_{name}': [] for name in dimensions})
+    for row in (session or db.session).execute(_named(stmt)):
+        if row.dimension == 'total':
+            result['totals'] = _bucket(row)
+        elif row.dimension == 'category':
+            result['by_category'].append(_bucket(row, category_id=row.category_id, category=row.category_name))
+        elif row.dimension == 'merchant':
+            result['by_merchant'].append(_bucket(row, merchant=row.merchant))
+        elif row.dimension == 'account':
+            result['by_account'].append(_bucket(row, account_id=row.account_id, account_name=row.account_name))
+        else:
+            result['by_month'].append(_bucket(row, month=row.month.isoformat()))
+
+    for name in RANKED:
+        if name in dimensions:
+            result[f'by_{name}'].sort(key=lambda bucket: (-bucket['expenses'], -bucket['count']))
+    if 'month' in dimensions:
+        result['by_month'].sort(key=lambda bucket: bucket['month'])
+    return result
@@ -0,0 +1,161 @@
+"""Monthly category budgets, checked against the rollups ingestion maintains.
+
+A budget's month-to-date spend is the sum of its category's monthly_rollups
+rows for that month, one per bank account, so status() costs the same
+however many transactions the month holds. Ingestion calls evaluate() with
+the rollup deltas it just applied; any budget whose current-month spend has
+reached one of BUDGET_ALERT_THRESHOLDS gets a BudgetAlert, recorded once per
+budget, month and threshold, in the same transaction as the spend itself.
+"""
+import calendar
+import logging
+from datetime import date
+from flask import current_app
+from sqlalchemy import delete, func, select
+from database.models import db, Budget, BudgetAlert, Category, MonthlyRollup
+from database.dialects import upsert
+
+logger = logging.getLogger(__name__)
+
+def _spend(user_id, month):
+    """Expenses per category for one of a user's months, from the rollups"""
+    return (
+        select(MonthlyRollup.category_id, func.sum(MonthlyRollup.expenses).label('spent'))
+        .where(MonthlyRollup.user_id == user_id, MonthlyRollup.month == month)
+        .group_by(MonthlyRollup.category_id)
+        .subquery('spend')
+    )
+
+def _projected(spent, month, today):
+    """Spend by the end of `month` if the rest of it goes like the days so far"""
+    if month > today:
+        return 0.0
+    if (month.year, month.month) < (today.year, today.month):
+        return spent
+    days = calendar.monthrange(month.year, month.month)[1]
+    return spent * days / today.day
+
+def serialize(row, month, today):
+    spent = float(row.spent or 0)
+    return {
+        'id': row.id,
+        'category_id': row.category_id,
+        'category': row.category,
+        'amount': row.amount,
+        'spent': spent,
+        'remaining': row.amount - spent,
+        'projected': round(_projected(spent, month, today), 2),
+        'used': round(spent / row.amount, 4) if row.amount else None
+    }
+
+def status(user_id, month=None, today=None, budget_id=None):
+    """Every budget of a user (or just `budget_id`) with its spent, remaining and projected figures.
+
+    `month` is the first day of the month and defaults to the current one.
+    One statement joins the budgets to their categories' rollup totals.
+    """
+    today = today or date.today()
+    month = month or today.replace(day=1)
+    spend = _spend(user_id, month)
+    stmt = (
+        select(Budget.id, Budget.category_id, Budget.amount, Category.name.label('category'), spend.c.spent)
+        .join(Category, Budget.category_id == Category.id)
+        .outerjoin(spend, spend.c.category_id == Budget.category_id)
+        .where(Budget.user_id == user_id)
+        .order_by(Category.name, Budget.id)
+    )
+    if budget_id is not None:
+        stmt = stmt.where(Budget.id == budget_id)
+    return [serialize(row, month, today) for row in db.session.execute(stmt)]
+
+def remove(budget):
+    """Delete a budget and its alerts. The caller commits."""
+    db.session.execute(delete(BudgetAlert).where(BudgetAlert.budget_id == budget.id))
+    db.session.delete(budget)
+
+def _record(user_id, month, rows):
+    """Insert an alert for every threshold each (budget_id, amount, spent) row has reached in `month`.
+
+    Thresholds already alerted for that budget and month are skipped by the
+    unique constraint. Returns the new alerts as dicts.
+    """
+    values = [
+        {
+            'user_id': user_id,
+            'budget_id': row.budget_id,
+            'month': month,
+            'threshold': threshold,
+            'spent': float(row.spent),
+            'amount': row.amount
+        }
+        for row in rows
+        for threshold in current_app.config['BUDGET_ALERT_THRESHOLDS']
+        if row.amount > 0 and row.spent is not None and row.spent >= threshold * row.amount
+    ]
+    if not values:
+        return []
+    created = db.session.execute(
+        upsert(BudgetAlert.__table__).values(values)
+        .on_conflict_do_nothing(index_elements=['budget_id', 'month', 'threshold'])
+        .returning(BudgetAlert.id, BudgetAlert.budget_id, BudgetAlert.threshold, BudgetAlert.spent, BudgetAlert.amount)
+    ).all()
+    for alert in created:
+        logger.info('Budget %s reached %d%% (%.2f of %.2f)',
+                    alert.budget_id, alert.threshold * 100, alert.spent, alert.amount)
+    return [alert._asdict() for alert in created]
+
+def evaluate(user_id, deltas, today=None):
+    """Record alerts for budgets whose current-month spend went up in an ingest.
+
+    `deltas` are the rollup deltas the ingest applied (rollup_service.collect()).
+    Only categories whose expenses grew this month are looked at, so a sync
+    of older history or of income alone costs nothing. The caller commits.
+    """
+    month = (today or date.today()).replace(day=1)
+    _, monthly = deltas
+    categories = {
+        category_id
+        for (_, category_id, bucket), (_, expenses, _) in monthly.items()
+        if bucket == month and expenses > 0
+    }
+    if not categories:
+        return []
+    return _check(user_id, month, Budget.category_id.in_(categories))
+
+def check(budget, today=None):
+    """evaluate() for one budget, e.g. after it is created or lowered mid-month"""
+    return _check(budget.user_id, (today or date.today()).replace(day=1), Budget.id == budget.id)
+
+def _check(user_id, month, condition):
+    spend = _spend(user_id, month)
+    rows = db.session.execute(
+        select(Budget.id.label('budget_id'), Budget.amount, spend.c.spent)
+        .join(spend, spend.c.category_id == Budget.category_id)
+        .where(Budget.user_id == user_id, condition)
+    ).all()
+    return _record(user_id, month, rows)
+
+def alerts(user_id, after=0, limit=100):
+    """A user's alerts with ids above `after`, oldest first"""
+    rows = db.session.execute(
+        select(BudgetAlert, Category.name.label('category'))
+        .join(Budget, BudgetAlert.budget_id == Budget.id)
+        .join(Category, Budget.category_id == Category.id)
+        .where(BudgetAlert.user_id == user_id, BudgetAlert.id > after)
+        .order_by(BudgetAlert.id)
+        .limit(limit)
+    ).all()
+    return [{
+        'id': alert.id,
+        'budget_id': alert.budget_id,
+        'category': category,
+        'month': alert.month.isoformat(),
+        'threshold': alert.threshold,
+        'spent': alert.spent,
+        'amount': alert.amount,
+        'created_at': alert.created_at.isoformat() if alert.created_at else None
+    } for alert, category in rows]
+
+def evaluate_all(user_id, today=None):
+    """evaluate() for every budget of a user, e.g. after their transactions were recategorized"""
+    return _check(user_id, (today or date.today()).replace(day=1), Budget.user_id == user_id)
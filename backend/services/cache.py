@@ -0,0 +1,299 @@
+import asyncio
+import hashlib
+import logging
+import socket
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlencode, urlparse
+from flask import current_app
+from sqlalchemy import select
+from database.models import db, User
+
+logger = logging.getLogger(__name__)
+
+class MemoryCache:
+    """In-process LRU cache of byte strings with a TTL and entry/byte bounds.
+
+    Least recently used entries are evicted once either bound is exceeded;
+    expired entries are dropped when they are next looked up.
+    """
+    backend = 'memory'
+
+    def __init__(self, ttl, max_entries, max_bytes, clock=time.monotonic):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.clock = clock
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = self.misses = self.evictions = self.expirations = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[1] <= self.clock():
+                self._remove(key)
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value, ttl=None):
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+            self.entries[key] = (value, self.clock() + (self.ttl if ttl is None else ttl))
+            self.size += len(value)
+            while self.entries and (len(self.entries) > self.max_entries or self.size > self.max_bytes):
+                self._remove(next(iter(self.entries)))
+                self.evictions += 1
+
+    def delete(self, key):
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+
+    def _remove(self, key):
+        value, _ = self.entries.pop(key)
+        self.size -= len(value)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def stats(self):
+        with self.lock:
+            return {
+                'backend': self.backend,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'entries': len(self.entries),
+                'bytes': self.size
+            }
+
+class RedisError(Exception):
+    pass
+
+class RedisCache:
+    """Cache backed by any server speaking the Redis protocol (RESP).
+
+    Entries expire server-side after the TTL and eviction follows the
+    server's maxmemory policy. Each thread keeps one connection. If the
+    server cannot be reached, lookups count as misses and writes are
+    skipped, so a cache outage never fails a request.
+    """
+    backend = 'redis'
+
+    def __init__(self, url, ttl, timeout=0.5):
+        parsed = urlparse(url)
+        self.address = (parsed.hostname or 'localhost', parsed.port or 6379)
+        self.db = int(parsed.path.lstrip('/') or 0)
+        self.ttl = ttl
+        self.timeout = timeout
+        self.local = threading.local()
+        self.hits = self.misses = self.errors = 0
+        self.lock = threading.Lock()
+
+    def _connection(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            sock = socket.create_connection(self.address, timeout=self.timeout)
+            conn = self.local.conn = (sock, sock.makefile('rb'))
+            if self.db:
+                self._send(conn, 'SELECT', self.db)
+        return conn
+
+    def _send(self, conn, *args):
+        sock, reader = conn
+        parts = [f'*{len(args)}\r\n'.encode()]
+        for arg in args:
+            data = arg if isinstance(arg, bytes) else str(arg).encode()
+            parts.append(b'$%d\r\n%s\r\n' % (len(data), data))
+        sock.sendall(b''.join(parts))
+        return self._read(reader)
+
+    def _read(self, reader):
+        line = reader.readline()
+        if not line:
+            raise ConnectionError('Connection closed by cache server')
+        kind, rest = line[:1], line[1:-2]
+        if kind == b'+':
+            return rest.decode()
+        if kind == b'-':
+            raise RedisError(rest.decode())
+        if kind == b':':
+            return int(rest)
+        if kind == b'$':
+            length = int(rest)
+            return None if length < 0 else reader.read(length + 2)[:-2]
+        if kind == b'*':
+            length = int(rest)
+            return None if length < 0 else [self._read(reader) for _ in range(length)]
+        raise RedisError(f'Unexpected reply {line!r}')
+
+    def command(self, *args):
+        try:
+            return self._send(self._connection(), *args)
+        except OSError:
+            # Drop the broken connection; the next call reconnects
+            conn = getattr(self.local, 'conn', None)
+            if conn:
+                conn[0].close()
+            self.local.conn = None
+            raise
+
+    def _safely(self, *args):
+        try:
+            return self.command(*args)
+        except (OSError, RedisError) as e:
+            with self.lock:
+                self.errors += 1
+            logger.warning('Cache server command %s failed: %s', args[0], e)
+            return None
+
+    def get(self, key):
+        value = self._safely('GET', key)
+        with self.lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def set(self, key, value, ttl=None):
+        self._safely('SET', key, value, 'PX', int((self.ttl if ttl is None else ttl) * 1000))
+
+    def delete(self, key):
+        self._safely('DEL', key)
+
+    def clear(self):
+        self._safely('FLUSHDB')
+
+    def stats(self):
+        info = self._safely('INFO', 'stats')
+        server = dict(
+            line.split(':', 1) for line in (info or b'').decode().splitlines() if ':' in line
+        )
+        with self.lock:
+            return {
+                'backend': self.backend,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': int(server.get('evicted_keys', 0)),
+                'expirations': int(server.get('expired_keys', 0)),
+                'errors': self.errors
+            }
+
+class NullCache:
+    """Caching switched off: every lookup misses"""
+    backend = 'none'
+
+    def __init__(self):
+        self.misses = 0
+
+    def get(self, key):
+        self.misses += 1
+        return None
+
+    def set(self, key, value, ttl=None):
+        pass
+
+    def delete(self, key):
+        pass
+
+    def clear(self):
+        pass
+
+    def stats(self):
+        return {'backend': self.backend, 'hits': 0, 'misses': self.misses, 'evictions': 0, 'expirations': 0}
+
+def create(config, ttl=None, max_entries=None):
+    """A cache for CACHE_BACKEND; `ttl` and `max_entries` override the response cache's bounds"""
+    backend = config['CACHE_BACKEND']
+    ttl = config['CACHE_TTL_SECONDS'] if ttl is None else ttl
+    if backend == 'memory':
+        max_entries = config['CACHE_MAX_ENTRIES'] if max_entries is None else max_entries
+        return MemoryCache(ttl, max_entries, config['CACHE_MAX_BYTES'])
+    if backend == 'redis':
+        return RedisCache(config['CACHE_URL'], ttl)
+    if backend == 'none':
+        return NullCache()
+    raise ValueError(f'Unknown CACHE_BACKEND {backend!r}')
+
+def init_app(app):
+    app.extensions['response_cache'] = create(app.config)
+
+def get_cache():
+    return current_app.extensions['response_cache']
+
+def data_version(user_id, session=None):
+    """The user's current data version, or None if there is no such user"""
+    return (session or db.session).execute(select(User.data_version).where(User.id == user_id)).scalar()
+
+def response_key(user_id, version, endpoint, params):
+    """Cache key for one user's view of an endpoint.
+
+    The data version is part of the key, so bumping it on ingest makes every
+    older entry for the user unreachable; those age out through TTL and LRU.
+    """
+    return f'resp:{user_id}:{version}:{endpoint}:{urlencode(sorted(params.items()))}'
+
+def etag(key):
+    """Strong validator for the response identified by a response_key().
+
+    The key already pins the user's data version and every request
+    parameter, so equal keys mean an identical response.
+    """
+    return hashlib.sha256(key.encode()).hexdigest()[:32]
+
+def store(key, body):
+    """Cache a response body unless it is larger than CACHE_MAX_ENTRY_BYTES"""
+    if len(body) <= current_app.config['CACHE_MAX_ENTRY_BYTES']:
+        get_cache().set(key, body)
+
+def store_stream(key, chunks):
+    """Pass a streamed response body through, caching it once complete if it is small enough"""
+    limit = current_app.config['CACHE_MAX_ENTRY_BYTES']
+    body, size = [], 0
+    for chunk in chunks:
+        if body is not None:
+            data = chunk.encode() if isinstance(chunk, str) else chunk
+            size += len(data)
+            if size <= limit:
+                body.append(data)
+            else:
+                body = None
+        yield chunk
+    if body is not None:
+        get_cache().set(key, b''.join(body))
+
+async def off_loop(func, *args):
+    """Call `func` from async code: on a worker thread when the cache is a server, inline when it is in-process"""
+    if get_cache().backend == 'redis':
+        return await asyncio.to_thread(func, *args)
+    return func(*args)
+
+async def astore_stream(key, chunks):
+    """store_stream() for an async response body"""
+    limit = current_app.config['CACHE_MAX_ENTRY_BYTES']
+    body, size = [], 0
+    async for chunk in chunks:
+        if body is not None:
+            data = chunk.encode() if isinstance(chunk, str) else chunk
+            size += len(data)
+            if size <= limit:
+                body.append(data)
+            else:
+                body = None
+        yield chunk
+    if body is not None:
+        await off_loop(get_cache().set, key, b''.join(body))
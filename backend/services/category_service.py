@@ -0,0 +1,378 @@
+"""Merchant normalization and rule-based categorization.
+
+A user's CategoryRules and the built-in rules are compiled into one Matcher:
+every 'contains' pattern goes into a single Aho-Corasick automaton, so a
+merchant is scanned once however many substring rules there are, and regex
+rules are compiled once. The rules matching a merchant are memoized per
+normalized merchant, so a sync batch or a history with thousands of rows
+from the same few merchants costs one scan per merchant. Matchers are cached
+per user until their rules change.
+
+Ingestion calls categorize() on each batch before writing it. After a rule
+change, recategorize() re-derives a user's whole history in a few
+statements: the Matcher runs over the user's distinct merchants, and one
+UPDATE joins the transactions to the resulting merchant -> category map.
+"""
+import logging
+import re
+import threading
+from collections import OrderedDict, deque, namedtuple
+from flask import current_app
+from sqlalchemy import Column, Float, Index, Integer, MetaData, String, Table, case, func, or_, select, update
+from database.models import db, BankAccount, Category, CategoryRule, Transaction
+from services import budget_service, job_service, rollup_service
+from services.ingest_service import bump_data_version, lock_user
+
+logger = logging.getLogger(__name__)
+
+KINDS = ('contains', 'regex')
+MATCHER_CACHE_SIZE = 256
+# Distinct merchants whose matching rules a Matcher remembers
+MATCHER_MEMO_SIZE = 4096
+RECATEGORIZE_USER = 'recategorize_user'
+
+# (category, kind, pattern), tried in order after a user's own rules; more
+# specific patterns come before the ones they contain
+BUILTIN_RULES = [
+    ('Food & Dining', 'contains', 'uber eats'),
+    ('Food & Dining', 'contains', 'doordash'),
+    ('Food & Dining', 'contains', 'grubhub'),
+    ('Food & Dining', 'contains', 'starbucks'),
+    ('Food & Dining', 'contains', 'mcdonald'),
+    ('Food & Dining', 'contains', 'restaurant'),
+    ('Food & Dining', 'contains', 'cafe'),
+    ('Food & Dining', 'contains', 'coffee'),
+    ('Food & Dining', 'contains', 'grocery'),
+    ('Food & Dining', 'contains', 'whole foods'),
+    ('Food & Dining', 'contains', 'trader joe'),
+    ('Transportation', 'contains', 'uber'),
+    ('Transportation', 'contains', 'lyft'),
+    ('Transportation', 'contains', 'gas station'),
+    ('Transportation', 'contains', 'shell'),
+    ('Transportation', 'contains', 'chevron'),
+    ('Transportation', 'contains', 'exxon'),
+    ('Transportation', 'contains', 'parking'),
+    ('Transportation', 'regex', r'\b(metro|transit)\b'),
+    ('Shopping', 'contains', 'amazon'),
+    ('Shopping', 'contains', 'walmart'),
+    ('Shopping', 'contains', 'target'),
+    ('Shopping', 'contains', 'costco'),
+    ('Shopping', 'contains', 'best buy'),
+    ('Bills & Utilities', 'contains', 'comcast'),
+    ('Bills & Utilities', 'contains', 'verizon'),
+    ('Bills & Utilities', 'contains', 'at&t'),
+    ('Bills & Utilities', 'contains', 'insurance'),
+    ('Bills & Utilities', 'regex', r'\b(electric|utilit(y|ies)|water)\b'),
+    ('Entertainment', 'contains', 'netflix'),
+    ('Entertainment', 'contains', 'spotify'),
+    ('Entertainment', 'contains', 'hulu'),
+    ('Entertainment', 'contains', 'steam'),
+    ('Entertainment', 'regex', r'\b(cinema|theat(er|re))\b'),
+    ('Healthcare', 'contains', 'pharmacy'),
+    ('Healthcare', 'contains', 'walgreens'),
+    ('Healthcare', 'contains', 'cvs'),
+    ('Healthcare', 'regex', r'\b(clinic|hospital|dental)\b'),
+    ('Travel', 'contains', 'airline'),
+    ('Travel', 'contains', 'airbnb'),
+    ('Travel', 'contains', 'expedia'),
+    ('Travel', 'contains', 'hotel'),
+    ('Education', 'contains', 'tuition'),
+    ('Education', 'contains', 'coursera'),
+    ('Education', 'contains', 'udemy'),
+    ('Income', 'regex', r'\b(payroll|salary|direct dep(osit)?)\b'),
+]
+
+# Card processor prefixes, e.g. 'SQ *BLUE BOTTLE', 'POS DEBIT NETFLIX'
+_PROCESSOR_PREFIX = re.compile(r'^(?:(?:sq|tst|sp|pp|paypal|pos|ach|checkcard)\b[\s*]*(?:debit|purchase)?[\s*]*)+', re.I)
+# Where a merchant name ends: store numbers, reference codes, '*' or '#' separators
+_NAME_END = re.compile(r'[*#]|\s\S*\d')
+_DOMAIN = re.compile(r'^www\.|\.(?:com|net|org)\b.*$', re.I)
+
+def normalize_merchant(description):
+    """A merchant name from a raw description: 'SQ *BLUE BOTTLE #0412 OAKLAND CA' -> 'Blue Bottle'"""
+    name = _PROCESSOR_PREFIX.sub('', (description or '').strip())
+    end = _NAME_END.search(name)
+    name = _DOMAIN.sub('', name[:end.start()] if end else name)
+    name = ' '.join(name.split())
+    return name.title() if name and not name.isdigit() else None
+
+class Automaton:
+    """Aho-Corasick automaton finding every pattern that occurs in a text in one pass"""
+
+    def __init__(self, patterns):
+        self.goto = [{}]
+        self.output = [set()]
+        for index, pattern in enumerate(patterns):
+            state = 0
+            for char in pattern:
+                if char not in self.goto[state]:
+                    self.goto.append({})
+                    self.output.append(set())
+                    self.goto[state][char] = len(self.goto) - 1
+                state = self.goto[state][char]
+            self.output[state].add(index)
+
+        # Breadth-first, each state's failure link is the longest proper
+        # suffix of its path that is also a path from the root
+        self.fail = [0] * len(self.goto)
+        queue = deque(self.goto[0].values())  # depth 1 fails to the root
+        while queue:
+            state = queue.popleft()
+            for char, child in self.goto[state].items():
+                queue.append(child)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[child] = self.goto[fallback].get(char, 0)
+                self.output[child] |= self.output[self.fail[child]]
+
+    def find(self, text):
+        """Indexes of the patterns occurring in `text`"""
+        found = set()
+        state = 0
+        goto, fail, output = self.goto, self.fail, self.output
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if output[state]:
+                found |= output[state]
+        return found
+
+Rule = namedtuple('Rule', 'category_id kind pattern min_amount max_amount')
+
+class Matcher:
+    """Rules compiled for matching, tried in the order given"""
+
+    def __init__(self, rules):
+        self.rules = rules
+        substrings = [i for i, rule in enumerate(rules) if rule.kind == 'contains' and rule.pattern]
+        self.automaton = Automaton([rules[i].pattern.lower() for i in substrings])
+        self.substrings = substrings
+        self.regexes = {
+            i: re.compile(rule.pattern, re.I)
+            for i, rule in enumerate(rules) if rule.kind == 'regex' and rule.pattern
+        }
+        # Least recently used merchants are forgotten first; a cached Matcher is shared between threads
+        self.memo = OrderedDict()
+        self.lock = threading.Lock()
+
+    def candidates(self, merchant):
+        """Indexes of the rules whose pattern matches a merchant, in rule order; amounts are not checked"""
+        key = (merchant or '').lower()
+        with self.lock:
+            found = self.memo.get(key)
+            if found is not None:
+                self.memo.move_to_end(key)
+                return found
+        contained = {self.substrings[i] for i in self.automaton.find(key)}
+        found = tuple(
+            i for i, rule in enumerate(self.rules)
+            if i in contained or (i in self.regexes and self.regexes[i].search(key)) or not rule.pattern
+        )
+        with self.lock:
+            self.memo[key] = found
+            while len(self.memo) > MATCHER_MEMO_SIZE:
+                self.memo.popitem(last=False)
+        return found
+
+    def category(self, merchant, amount):
+        """Category id of the first rule matching a merchant and amount, or None"""
+        amount = abs(amount or 0)
+        for i in self.candidates(merchant):
+            if in_range(self.rules[i], amount):
+                return self.rules[i].category_id
+        return None
+
+def in_range(rule, amount):
+    return (rule.min_amount is None or amount >= rule.min_amount) and (rule.max_amount is None or amount <= rule.max_amount)
+
+# Guards the per-process matcher cache, which request and sync threads share
+matchers_lock = threading.Lock()
+
+def init_app(app):
+    app.extensions['category_matchers'] = OrderedDict()
+
+def _builtin_rules():
+    """BUILTIN_RULES with category ids, creating any category that does not exist yet.
+
+    Also returns whether any category was created.
+    """
+    names = list(dict.fromkeys(name for name, _, _ in BUILTIN_RULES))
+    ids = dict(db.session.execute(
+        select(Category.name, func.min(Category.id)).where(Category.name.in_(names)).group_by(Category.name)
+    ).all())
+    created = False
+    for name in names:
+        if name not in ids:
+            category = Category(name=name)
+            db.session.add(category)
+            db.session.flush()
+            ids[name] = category.id
+            created = True
+    return [Rule(ids[name], kind, pattern, None, None) for name, kind, pattern in BUILTIN_RULES], created
+
+def matcher(user_id):
+    """The compiled Matcher for a user's rules followed by the built-in ones.
+
+    Cached per process; a cheap fingerprint query notices when the user's
+    rules were added, changed or removed.
+    """
+    fingerprint = tuple(db.session.execute(
+        select(func.count(CategoryRule.id), func.max(CategoryRule.id), func.max(CategoryRule.updated_at))
+        .where(CategoryRule.user_id == user_id)
+    ).one())
+    matchers = current_app.extensions['category_matchers']
+    with matchers_lock:
+        cached = matchers.get(user_id)
+        if cached and cached[0] == fingerprint:
+            matchers.move_to_end(user_id)
+            return cached[1]
+
+    rules = [
+        Rule(rule.category_id, rule.kind, rule.pattern, rule.min_amount, rule.max_amount)
+        for rule in db.session.execute(
+            select(CategoryRule).where(CategoryRule.user_id == user_id)
+            .order_by(CategoryRule.priority, CategoryRule.id)
+        ).scalars()
+    ]
+    builtin, created = _builtin_rules()
+    compiled = Matcher(rules + builtin)
+    if created:
+        # The new categories are not committed yet; a rollback would leave the cache pointing at nothing
+        return compiled
+    with matchers_lock:
+        matchers[user_id] = (fingerprint, compiled)
+        while len(matchers) > MATCHER_CACHE_SIZE:
+            matchers.popitem(last=False)
+    return compiled
+
+def categorize(user_id, rows):
+    """Fill in `merchant` (when missing) and `category_id` on a batch of transaction rows.
+
+    `rows` are dicts of Transaction column values, as passed to
+    ingest_service.upsert_transactions(); they are updated in place.
+    """
+    compiled = matcher(user_id)
+    for row in rows:
+        row['merchant'] = row.get('merchant') or normalize_merchant(row.get('description'))
+        row['category_id'] = compiled.category(row['merchant'], row['amount'])
+    return rows
+
+def _merchant_key(transactions):
+    """What a transaction's category is derived from: its merchant, or its description when it has none"""
+    return (
+        func.coalesce(transactions.c.merchant, ''),
+        case((transactions.c.merchant.is_(None), func.coalesce(transactions.c.description, '')), else_='')
+    )
+
+def _category_map(compiled, keys):
+    """Rows of the merchant -> category map for distinct (merchant, description) keys.
+
+    A key gets one row per candidate rule up to the first without amount
+    bounds, which catches every amount the earlier ones leave; `rank` keeps
+    their order.
+    """
+    rows = []
+    for merchant, description in keys:
+        name = merchant or normalize_merchant(description)
+        for rank, i in enumerate(compiled.candidates(name)):
+            rule = compiled.rules[i]
+            rows.append({
+                'merchant': merchant, 'description': description, 'rank': rank,
+                'min_amount': rule.min_amount, 'max_amount': rule.max_amount, 'category_id': rule.category_id
+            })
+            if rule.min_amount is None and rule.max_amount is None:
+                break
+    return rows
+
+def recategorize(user_id):
+    """Re-derive the category of every transaction of a user from the current rules.
+
+    If any category changed, the changed rows get a new change_version,
+    the user's data version is bumped, rollups are rebuilt and budgets
+    checked for alerts; otherwise cached responses stay valid. Returns the
+    number of transactions whose category changed. The caller commits.
+    """
+    # Taken first: the user's row lock orders this against concurrent ingests,
+    # so the version the changed rows are stamped with is the one bumped to below
+    version = lock_user(user_id)
+    compiled = matcher(user_id)
+    transactions = Transaction.__table__.alias('t')
+    user_accounts = select(BankAccount.id).where(BankAccount.user_id == user_id)
+    merchant, description = _merchant_key(transactions)
+    keys = db.session.execute(
+        select(merchant, description).where(transactions.c.bank_account_id.in_(user_accounts)).distinct()
+    ).all()
+
+    # Lives for this transaction only; on Postgres it is dropped at commit at the latest
+    connection = db.session.connection()
+    category_map = Table(
+        'category_map', MetaData(),
+        Column('merchant', String, nullable=False),
+        Column('description', String, nullable=False),
+        Column('rank', Integer, nullable=False),
+        Column('min_amount', Float),
+        Column('max_amount', Float),
+        Column('category_id', Integer, nullable=False),
+        Index('ix_category_map_key', 'merchant', 'description', 'rank'),
+        prefixes=['TEMPORARY'],
+        postgresql_on_commit='DROP'
+    )
+    category_map.create(connection)
+    rows = _category_map(compiled, keys)
+    if rows:
+        connection.execute(category_map.insert(), rows)
+
+    amount = func.abs(transactions.c.amount)
+    new_category = (
+        select(category_map.c.category_id)
+        .where(
+            category_map.c.merchant == merchant,
+            category_map.c.description == description,
+            or_(category_map.c.min_amount.is_(None), amount >= category_map.c.min_amount),
+            or_(category_map.c.max_amount.is_(None), amount <= category_map.c.max_amount)
+        )
+        .order_by(category_map.c.rank)
+        .limit(1)
+        .scalar_subquery()
+    )
+    derived = (
+        select(transactions.c.id, transactions.c.category_id.label('old'), new_category.label('new'))
+        .where(transactions.c.bank_account_id.in_(user_accounts))
+        .subquery('derived')
+    )
+    changed = connection.execute(
+        update(Transaction)
+        .where(Transaction.id == derived.c.id, derived.c.new.is_distinct_from(derived.c.old))
+        .values(category_id=derived.c.new, change_version=version)
+    ).rowcount
+    category_map.drop(connection)
+
+    if changed:
+        bump_data_version(user_id)
+        rollup_service.rebuild(user_id)
+        budget_service.evaluate_all(user_id)
+    logger.info('Recategorized %d transaction(s) of user %s', changed, user_id)
+    return changed
+
+def enqueue_recategorize(user_id):
+    return job_service.enqueue(RECATEGORIZE_USER, {'user_id': int(user_id)}, dedupe_key=f'{RECATEGORIZE_USER}:{user_id}')
+
+@job_service.handler(RECATEGORIZE_USER)
+def recategorize_job(payload):
+    """Re-apply the rules to a user's history after they changed"""
+    updated = recategorize(payload['user_id'])
+    db.session.commit()
+    return {'updated': updated}
+
+def serialize(rule):
+    return {
+        'id': rule.id,
+        'category_id': rule.category_id,
+        'kind': rule.kind,
+        'pattern': rule.pattern,
+        'min_amount': rule.min_amount,
+        'max_amount': rule.max_amount,
+        'priority': rule.priority
+    }
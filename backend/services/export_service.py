@@ -0,0 +1,223 @@
+"""Streaming exports of a user's transaction history as CSV or Parquet.
+
+Both formats are produced as an iterator of byte chunks, so a response or a
+file receives the export as it is read and memory stays flat however many
+rows it holds. On Postgres, CSV is written by the server itself with
+COPY ... TO STDOUT: a thread runs the COPY into a bounded queue that the
+iterator drains, so the database never gets more than EXPORT_QUEUE_DEPTH
+chunks ahead of the client. Elsewhere rows are read through a server-side
+cursor and written with the csv module.
+
+Parquet needs pyarrow. Rows are read `row_group_size` at a time and each
+batch is written as one row group and handed out right away, so memory is
+bounded by the row group size.
+"""
+import csv
+import io
+import queue
+import threading
+from sqlalchemy import select
+from database.models import db, BankAccount, Category, Transaction
+from database.dialects import is_postgres
+
+COLUMNS = ('id', 'date', 'account', 'description', 'merchant', 'category', 'amount')
+EXPORT_CHUNK_SIZE = 64 * 1024
+EXPORT_QUEUE_DEPTH = 8
+ROW_GROUP_SIZE = 50000
+CSV_BATCH_SIZE = 1000
+
+def export_query(user_id, start_date=None, end_date=None, account_ids=None):
+    """A user's transactions with the exported columns, newest first"""
+    stmt = (
+        select(
+            Transaction.id,
+            Transaction.date,
+            BankAccount.account_name.label('account'),
+            Transaction.description,
+            Transaction.merchant,
+            Category.name.label('category'),
+            Transaction.amount
+        )
+        .join(BankAccount, Transaction.bank_account_id == BankAccount.id)
+        .outerjoin(Category, Transaction.category_id == Category.id)
+        .where(BankAccount.user_id == user_id)
+        .order_by(Transaction.date.desc(), Transaction.id.desc())
+    )
+    if start_date is not None:
+        stmt = stmt.where(Transaction.date >= start_date)
+    if end_date is not None:
+        stmt = stmt.where(Transaction.date <= end_date)
+    if account_ids:
+        stmt = stmt.where(Transaction.bank_account_id.in_(account_ids))
+    return stmt
+
+class _Cancelled(Exception):
+    """Raised inside the COPY when the reader went away, which aborts it"""
+
+class _Pipe:
+    """File-like target for COPY TO that hands its output to another thread in chunks"""
+
+    def __init__(self, chunk_size, depth):
+        self.queue = queue.Queue(depth)
+        self.cancelled = threading.Event()
+        self.chunk_size = chunk_size
+        self.buffer = []
+        self.size = 0
+
+    def put(self, item):
+        # Poll so a reader that stopped draining cannot leave the writer blocked forever
+        while not self.cancelled.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+        raise _Cancelled()
+
+    def write(self, data):
+        self.buffer.append(data)
+        self.size += len(data)
+        if self.size >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        if self.buffer:
+            chunk, self.buffer, self.size = b''.join(self.buffer), [], 0
+            self.put(chunk)
+
+def _copy_sql(connection, stmt):
+    """COPY ... TO STDOUT statement for a select, with its parameters inlined by the driver"""
+    compiled = stmt.compile(dialect=connection.dialect, compile_kwargs={'render_postcompile': True})
+    cursor = connection.connection.dbapi_connection.cursor()
+    query = cursor.mogrify(str(compiled), compiled.params).decode()
+    return f'COPY ({query}) TO STDOUT WITH (FORMAT csv, HEADER true)'
+
+def _iter_copy(connection, stmt):
+    """Bytes of COPY TO STDOUT for a select, produced by a thread on the same connection.
+
+    A COPY that did not run to the end, because the reader went away or it
+    failed, leaves its connection mid-protocol; the connection is then
+    invalidated so the pool discards it rather than handing it out again,
+    and the session rolled back. `connection` is the session's.
+    """
+    sql = _copy_sql(connection, stmt)
+    cursor = connection.connection.dbapi_connection.cursor()
+    pipe = _Pipe(EXPORT_CHUNK_SIZE, EXPORT_QUEUE_DEPTH)
+    done = object()
+
+    def copy():
+        try:
+            cursor.copy_expert(sql, pipe)
+            pipe.flush()
+            pipe.put(done)
+        except _Cancelled:
+            pass
+        except Exception as e:
+            try:
+                pipe.put(e)
+            except _Cancelled:
+                pass
+
+    thread = threading.Thread(target=copy, name='export-copy', daemon=True)
+    thread.start()
+    finished = False
+    try:
+        while True:
+            item = pipe.queue.get()
+            if item is done:
+                finished = True
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        pipe.cancelled.set()
+        thread.join()
+        if not finished:
+            connection.invalidate()
+            # The session's transaction died with the connection
+            db.session.rollback()
+
+def _iter_rows(stmt, batch_size):
+    """Lists of up to `batch_size` rows, read through a server-side cursor"""
+    result = db.session.execute(stmt.execution_options(yield_per=batch_size))
+    yield from result.partitions()
+
+def _number(value):
+    """A float as Postgres prints it in CSV: 2000 rather than 2000.0"""
+    return int(value) if value is not None and value.is_integer() else value
+
+def _iter_csv_rows(stmt):
+    out = io.StringIO()
+    writer = csv.writer(out, lineterminator='\n')
+    writer.writerow(COLUMNS)
+    for rows in _iter_rows(stmt, CSV_BATCH_SIZE):
+        writer.writerows(
+            (row.id, row.date.isoformat(), row.account, row.description, row.merchant, row.category, _number(row.amount))
+            for row in rows
+        )
+        if out.tell() >= EXPORT_CHUNK_SIZE:
+            yield out.getvalue().encode()
+            out.seek(0)
+            out.truncate()
+    if out.tell():
+        yield out.getvalue().encode()
+
+def iter_csv(user_id, start_date=None, end_date=None, account_ids=None):
+    """The user's transactions as CSV with a header row, in byte chunks"""
+    stmt = export_query(user_id, start_date, end_date, account_ids)
+    if is_postgres():
+        return _iter_copy(db.session.connection(), stmt)
+    return _iter_csv_rows(stmt)
+
+class _Chunks(io.RawIOBase):
+    """Write-only stream keeping what was written since the last take()"""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def take(self):
+        data, self.chunks = b''.join(self.chunks), []
+        return data
+
+def parquet_available():
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+def iter_parquet(user_id, start_date=None, end_date=None, account_ids=None, row_group_size=ROW_GROUP_SIZE):
+    """The user's transactions as a Parquet file, one row group per `row_group_size` rows, in byte chunks"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([
+        ('id', pa.int64()),
+        ('date', pa.date32()),
+        ('account', pa.string()),
+        ('description', pa.string()),
+        ('merchant', pa.string()),
+        ('category', pa.string()),
+        ('amount', pa.float64()),
+    ])
+    stmt = export_query(user_id, start_date, end_date, account_ids)
+    sink = _Chunks()
+    writer = pq.ParquetWriter(sink, schema)
+    for rows in _iter_rows(stmt, row_group_size):
+        writer.write_table(pa.Table.from_pydict(dict(zip(COLUMNS, zip(*rows))), schema=schema))
+        yield sink.take()
+    writer.close()
+    yield sink.take()
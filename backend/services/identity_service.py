@@ -0,0 +1,112 @@
+"""Cached principals: who a verified token identity is, without a query per request.
+
+A principal is the user's id, profile and bank account ids. It is loaded
+from the database once and then served from a cache on CACHE_BACKEND for up
+to IDENTITY_CACHE_TTL_SECONDS. Code that changes a profile or links or
+unlinks accounts calls invalidate(). With the in-process backend an
+invalidation only reaches the process that makes it, so other processes
+pick the change up when their entry expires; with Redis it is immediate.
+"""
+import json
+from flask import current_app
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+from database.models import db, BankAccount, User
+from services import cache
+
+def init_app(app):
+    app.extensions['identity_cache'] = cache.create(
+        app.config,
+        ttl=app.config['IDENTITY_CACHE_TTL_SECONDS'],
+        max_entries=app.config['IDENTITY_CACHE_MAX_ENTRIES']
+    )
+
+def _cache():
+    return current_app.extensions['identity_cache']
+
+def _key(user_id):
+    return f'principal:{user_id}'
+
+def _email_key(email):
+    return f'principal-email:{email}'
+
+def load_principal(user_id, session):
+    """The principal straight from the database, in one query, or None"""
+    rows = session.execute(
+        select(User.id, User.email, User.full_name, BankAccount.id.label('account_id'))
+        .outerjoin(BankAccount, BankAccount.user_id == User.id)
+        .where(User.id == user_id)
+        .order_by(BankAccount.id)
+    ).all()
+    if not rows:
+        return None
+    return {
+        'id': rows[0].id,
+        'email': rows[0].email,
+        'full_name': rows[0].full_name,
+        'account_ids': [row.account_id for row in rows if row.account_id is not None]
+    }
+
+def cached_principal(user_id):
+    """The principal for a user id if the cache holds it, else None"""
+    body = _cache().get(_key(user_id))
+    return json.loads(body) if body is not None else None
+
+def remember(principal):
+    """Cache a principal read with load_principal()"""
+    _cache().set(_key(principal['id']), json.dumps(principal).encode())
+
+def get_principal(user_id, session=None):
+    """The principal for a user id, or None if there is no such user.
+
+    Unknown ids are not cached, so a user created afterwards is found at once.
+    """
+    principal = cached_principal(user_id)
+    if principal is None:
+        principal = load_principal(user_id, session or db.session)
+        if principal is not None:
+            remember(principal)
+    return principal
+
+def principal_for_email(email):
+    """The principal for a token that identifies its user by email, or None"""
+    user_id = _cache().get(_email_key(email))
+    if user_id is not None:
+        principal = get_principal(int(user_id))
+        if principal is not None and principal['email'] == email:
+            return principal
+        # The email moved to another user, or the user is gone
+        _cache().delete(_email_key(email))
+
+    user_id = db.session.execute(select(User.id).where(User.email == email)).scalar()
+    if user_id is None:
+        return None
+    _cache().set(_email_key(email), str(user_id).encode())
+    return get_principal(user_id)
+
+def invalidate(user_id):
+    """Forget a user's principal after their profile or linked accounts change"""
+    _cache().delete(_key(user_id))
+
+def invalidate_on_commit(user_id):
+    """invalidate() once the current transaction commits.
+
+    Invalidating any earlier would let a concurrent request cache the
+    pre-commit state again.
+    """
+    db.session.info.setdefault('stale_principals', set()).add(user_id)
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_committed(session):
+    for user_id in session.info.pop('stale_principals', ()):
+        invalidate(user_id)
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_rolled_back(session):
+    session.info.pop('stale_principals', None)
+
+def stats():
+    stats = _cache().stats()
+    lookups = stats['hits'] + stats['misses']
+    stats['hit_ratio'] = round(stats['hits'] / lookups, 4) if lookups else None
+    return stats
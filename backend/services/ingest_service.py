@@ -0,0 +1,146 @@
+from types import SimpleNamespace
+from sqlalchemy import delete, insert, select, update
+from database import routing
+from database.models import db, BankAccount, Transaction, TransactionTombstone, User
+from database.dialects import upsert
+from services import budget_service, rollup_service
+
+DEFAULT_CHUNK_SIZE = 1000
+ROLLUP_FIELDS = ('bank_account_id', 'category_id', 'date', 'amount')
+
+def _rollup_row(row, current):
+    """Rollup fields of a row after the write; columns it does not set keep their stored value"""
+    return SimpleNamespace(**{
+        name: row[name] if name in row else getattr(current, name, None)
+        for name in ROLLUP_FIELDS
+    })
+
+def _changed(existing, row):
+    return any(getattr(existing, name) != value for name, value in row.items())
+
+def _upsert_chunk(rows):
+    """INSERT ... ON CONFLICT (plaid_transaction_id) DO UPDATE for the columns present in the rows.
+
+    created_version is only set on insert.
+    """
+    table = Transaction.__table__
+    stmt = upsert(table)
+    columns = [name for name in rows[0] if name not in ('plaid_transaction_id', 'created_version')]
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.plaid_transaction_id],
+        set_={name: stmt.excluded[name] for name in columns}
+    )
+    db.session.execute(stmt, rows)
+
+def bump_data_version(user_id):
+    """Mark a user's transactions as changed and return the new version.
+
+    Rows written in this transaction are stamped with the returned version.
+    The UPDATE locks the user's row until commit, so concurrent ingests for
+    one user commit their versions in order. Bumping also retires cached
+    responses and ETags built from the old data, and keeps the user's reads
+    on the primary until replicas have the change.
+    """
+    routing.wrote_user_data(db.session(), user_id)
+    return db.session.execute(
+        update(User).where(User.id == user_id)
+        .values(data_version=User.data_version + 1)
+        .returning(User.data_version)
+    ).scalar_one()
+
+def lock_user(user_id):
+    """Lock a user's row until commit, as bump_data_version() does, without bumping.
+
+    Returns the version the next bump in this transaction will give, for
+    writes that stamp rows first and bump only if any changed.
+    """
+    return db.session.execute(
+        select(User.data_version).where(User.id == user_id).with_for_update()
+    ).scalar_one() + 1
+
+def upsert_transactions(user_id, rows, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Idempotently write transaction rows keyed by plaid_transaction_id.
+
+    `rows` are dicts of Transaction column values; every row must carry the
+    same keys. Each chunk costs one lookup of the rows already stored plus one
+    multi-row INSERT ... ON CONFLICT DO UPDATE covering only new or changed
+    rows, so re-ingesting a window that was already stored writes nothing.
+    Rollups are adjusted by the difference, accumulated over all chunks and
+    written once, and budgets whose spend this month went up are checked
+    for alerts. The caller commits.
+
+    Returns {'inserted': n, 'updated': n, 'unchanged': n}.
+    """
+    # Later occurrences of the same id win, and a statement may only touch a row once
+    rows = list({row['plaid_transaction_id']: row for row in rows}.values())
+    counts = {'inserted': 0, 'updated': 0, 'unchanged': 0}
+    if not rows:
+        return counts
+
+    compared = [name for name in rows[0] if name != 'plaid_transaction_id']
+    rollup_columns = [getattr(Transaction, name) for name in ROLLUP_FIELDS]
+    deltas = version = None
+    for i in range(0, len(rows), chunk_size):
+        chunk = rows[i:i + chunk_size]
+        existing = {
+            row.plaid_transaction_id: row
+            for row in db.session.execute(
+                select(Transaction.plaid_transaction_id, *rollup_columns,
+                       *[getattr(Transaction, name) for name in compared if name not in ROLLUP_FIELDS])
+                .where(Transaction.plaid_transaction_id.in_([row['plaid_transaction_id'] for row in chunk]))
+            )
+        }
+
+        writes, old_rows, new_rows = [], [], []
+        for row in chunk:
+            current = existing.get(row['plaid_transaction_id'])
+            if current is None:
+                counts['inserted'] += 1
+            elif _changed(current, {name: row[name] for name in compared}):
+                counts['updated'] += 1
+                old_rows.append(current)
+            else:
+                counts['unchanged'] += 1
+                continue
+            writes.append(row)
+            new_rows.append(_rollup_row(row, current))
+
+        if writes:
+            version = version or bump_data_version(user_id)
+            _upsert_chunk([dict(row, created_version=version, change_version=version) for row in writes])
+            deltas = rollup_service.collect(old_rows, -1, deltas)
+            deltas = rollup_service.collect(new_rows, 1, deltas)
+    if deltas:
+        rollup_service.apply(user_id, deltas)
+        budget_service.evaluate(user_id, deltas)
+    return counts
+
+def delete_transactions(user_id, plaid_transaction_ids, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Delete a user's transactions by Plaid id. Returns the number deleted.
+
+    Rollups are adjusted and a tombstone per row records the deletion for
+    /api/transactions/changes.
+    """
+    plaid_transaction_ids = list(plaid_transaction_ids)
+    user_accounts = select(BankAccount.id).where(BankAccount.user_id == user_id)
+    deleted, deltas, tombstones = 0, None, []
+    for i in range(0, len(plaid_transaction_ids), chunk_size):
+        removed = db.session.execute(
+            delete(Transaction)
+            .where(
+                Transaction.plaid_transaction_id.in_(plaid_transaction_ids[i:i + chunk_size]),
+                Transaction.bank_account_id.in_(user_accounts)
+            )
+            .returning(Transaction.id, *[getattr(Transaction, name) for name in ROLLUP_FIELDS])
+        ).all()
+        deltas = rollup_service.collect(removed, -1, deltas)
+        tombstones += [row.id for row in removed]
+        deleted += len(removed)
+    if deleted:
+        rollup_service.apply(user_id, deltas)
+        version = bump_data_version(user_id)
+        db.session.execute(insert(TransactionTombstone), [
+            {'user_id': user_id, 'transaction_id': transaction_id, 'change_version': version}
+            for transaction_id in tombstones
+        ])
+    return deleted
@@ -0,0 +1,199 @@
+import logging
+import os
+import random
+import socket
+import time
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import and_, or_, select, update
+from database.models import db, Job
+from database.dialects import upsert
+from services import metrics
+
+logger = logging.getLogger(__name__)
+
+QUEUED = 'queued'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+DEAD = 'dead'
+
+HANDLERS = {}
+
+def handler(kind):
+    """Register a function as the handler for jobs of `kind`.
+
+    Handlers receive the job payload, run inside the worker's app context and
+    return a JSON-serialisable result. Raising marks the attempt as failed.
+    """
+    def register(func):
+        HANDLERS[kind] = func
+        return func
+    return register
+
+def enqueue(kind, payload, dedupe_key=None, max_attempts=None):
+    """Queue a job and return it.
+
+    If a job with the same dedupe_key is still queued and has not been tried
+    yet, that job is returned instead of creating another one. The caller
+    commits.
+    """
+    values = {
+        'kind': kind,
+        'payload': payload,
+        'dedupe_key': dedupe_key,
+        'status': QUEUED,
+        'attempts': 0,
+        'max_attempts': max_attempts or current_app.config['JOB_MAX_ATTEMPTS'],
+        'run_at': datetime.utcnow(),
+        'created_at': datetime.utcnow()
+    }
+    if dedupe_key is None:
+        job = Job(**values)
+        db.session.add(job)
+        db.session.flush()
+        return job
+
+    stmt = upsert(Job.__table__).values(**values).on_conflict_do_nothing(
+        index_elements=[Job.dedupe_key],
+        index_where=and_(Job.status == QUEUED, Job.attempts == 0)
+    ).returning(Job.id)
+    job_id = db.session.execute(stmt).scalar()
+    if job_id is None:
+        job_id = db.session.execute(
+            select(Job.id).where(Job.dedupe_key == dedupe_key, Job.status == QUEUED, Job.attempts == 0)
+        ).scalar_one()
+    return db.session.get(Job, job_id)
+
+def claim(worker_id, lease_seconds=None):
+    """Lease the next due job for `worker_id`, or return None.
+
+    The candidate row is locked with SELECT ... FOR UPDATE SKIP LOCKED, so
+    concurrent workers each get a different job without waiting on each
+    other. Jobs whose lease expired (a worker died mid-run) are due again,
+    unless that was their last attempt: those are dead-lettered instead, so
+    a job that keeps killing its worker is not retried forever. The claim is
+    committed before the job runs.
+    """
+    now = datetime.utcnow()
+    lease_seconds = lease_seconds or current_app.config['JOB_LEASE_SECONDS']
+    expired = and_(Job.status == RUNNING, Job.locked_until < now)
+    abandoned = db.session.execute(
+        update(Job)
+        .where(expired, Job.attempts >= Job.max_attempts)
+        .values(status=DEAD, finished_at=now, locked_by=None, locked_until=None,
+                last_error='Lease expired during the final attempt')
+    ).rowcount
+    if abandoned:
+        logger.error('Dead-lettered %d job(s) whose final attempt never finished', abandoned)
+
+    job_id = db.session.execute(
+        select(Job.id)
+        .where(or_(
+            and_(Job.status == QUEUED, Job.run_at <= now),
+            and_(expired, Job.attempts < Job.max_attempts)
+        ))
+        .order_by(Job.run_at, Job.id)
+        .limit(1)
+        .with_for_update(skip_locked=True)
+    ).scalar()
+    if job_id is None:
+        db.session.commit()
+        return None
+
+    db.session.execute(
+        update(Job)
+        .where(Job.id == job_id)
+        .values(
+            status=RUNNING,
+            attempts=Job.attempts + 1,
+            locked_by=worker_id,
+            locked_until=now + timedelta(seconds=lease_seconds)
+        )
+    )
+    db.session.commit()
+    return db.session.get(Job, job_id, populate_existing=True)
+
+def backoff(attempts):
+    """Seconds to wait before retrying after `attempts` failed attempts: exponential, capped, jittered"""
+    config = current_app.config
+    delay = min(config['JOB_RETRY_MAX_SECONDS'], config['JOB_RETRY_BASE_SECONDS'] * 2 ** (attempts - 1))
+    return delay * random.uniform(0.5, 1.0)
+
+def _finish(job_id, worker_id, **values):
+    """Record a job's outcome if `worker_id` still holds its lease; returns the job"""
+    finished = db.session.execute(
+        update(Job)
+        .where(Job.id == job_id, Job.locked_by == worker_id)
+        .values(locked_by=None, locked_until=None, **values)
+    ).rowcount
+    db.session.commit()
+    if not finished:
+        logger.warning('Job %s: the lease of %s ran out and another worker took over; outcome not recorded',
+                       job_id, worker_id)
+    return db.session.get(Job, job_id, populate_existing=True)
+
+def run(job):
+    """Run a claimed job and record the outcome.
+
+    The outcome is only written while the claiming worker still holds the
+    lease. A worker that overran its lease leaves the job to whichever
+    worker reclaimed it.
+    """
+    job_id, kind, payload = job.id, job.kind, job.payload
+    worker_id, attempts, max_attempts = job.locked_by, job.attempts, job.max_attempts
+    try:
+        func = HANDLERS.get(kind)
+        if func is None:
+            raise LookupError(f'No handler registered for job kind {kind!r}')
+        with metrics.trace('job', f'{kind}:{job_id}'):
+            result = func(payload)
+    except Exception as e:
+        db.session.rollback()
+        error = f'{type(e).__name__}: {e}'
+        if attempts >= max_attempts:
+            logger.error('Job %s (%s) failed for good after %d attempt(s): %s', job_id, kind, attempts, e)
+            return _finish(job_id, worker_id, status=DEAD, last_error=error, finished_at=datetime.utcnow())
+        run_at = datetime.utcnow() + timedelta(seconds=backoff(attempts))
+        logger.warning('Job %s (%s) failed on attempt %d, retrying at %s: %s', job_id, kind, attempts, run_at, e)
+        return _finish(job_id, worker_id, status=QUEUED, last_error=error, run_at=run_at)
+
+    return _finish(job_id, worker_id, status=SUCCEEDED, result=result, last_error=None,
+                   finished_at=datetime.utcnow())
+
+def run_next(worker_id):
+    """Claim and run one job. Returns the job, or None when nothing is due."""
+    job = claim(worker_id)
+    return run(job) if job else None
+
+def default_worker_id():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+def work(worker_id=None, poll_interval=1.0, burst=False):
+    """Process jobs until interrupted; with burst=True, stop once nothing is due.
+
+    Any number of workers can run this side by side, in one or many processes.
+    """
+    worker_id = worker_id or default_worker_id()
+    processed = 0
+    while True:
+        job = run_next(worker_id)
+        if job is not None:
+            processed += 1
+            continue
+        if burst:
+            return processed
+        time.sleep(poll_interval)
+
+def serialize(job):
+    return {
+        'id': job.id,
+        'kind': job.kind,
+        'status': job.status,
+        'attempts': job.attempts,
+        'max_attempts': job.max_attempts,
+        'run_at': job.run_at.isoformat(),
+        'last_error': job.last_error,
+        'result': job.result,
+        'created_at': job.created_at.isoformat() if job.created_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None
+    }
@@ -0,0 +1,310 @@
+"""Request, SQL and Plaid metrics, exposed in Prometheus text format at /metrics.
+
+Every request records its latency, the SQL statements it ran and the time
+they took, and the time it waited on Plaid. These are labelled with the
+matched route rather than the raw path so label cardinality stays bounded.
+Any statement run outside a request (a job, a CLI command) still counts
+towards the per-statement histogram. A request that runs the same SELECT
+more than METRICS_N_PLUS_ONE_THRESHOLD times (an N+1 pattern) is logged and
+counted.
+
+Each request and background job also opens a trace. Outbound Plaid calls
+made on its behalf, including from worker threads running traced()
+functions, are kept as spans carrying its id; the most recent are served at
+/traces.
+
+Metrics live in this process. Under a multi-process server every worker
+reports only its own requests.
+"""
+import logging
+import re
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100, 200, 500)
+UNMATCHED_ROUTE = '<unmatched>'
+SPAN_BUFFER_SIZE = 2000
+
+class Counter:
+    """Monotonic count per combination of label values"""
+    kind = 'counter'
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels[label]) for label in self.labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self.values.get(tuple(str(labels[label]) for label in self.labels), 0)
+
+    def samples(self):
+        with self.lock:
+            return [(self.name, key, (), value) for key, value in sorted(self.values.items())]
+
+class Histogram:
+    """Observations counted into fixed upper-bound buckets, with their sum"""
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        # label values -> [count per bucket (the last one unbounded), sum]
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels[label]) for label in self.labels)
+        with self.lock:
+            entry = self.values.get(key)
+            if entry is None:
+                entry = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][bisect_left(self.buckets, value)] += 1
+            entry[1] += value
+
+    def count(self, **labels):
+        entry = self.values.get(tuple(str(labels[label]) for label in self.labels))
+        return sum(entry[0]) if entry else 0
+
+    def sum(self, **labels):
+        entry = self.values.get(tuple(str(labels[label]) for label in self.labels))
+        return entry[1] if entry else 0.0
+
+    def samples(self):
+        with self.lock:
+            values = sorted((key, list(counts), total) for key, (counts, total) in self.values.items())
+        samples = []
+        for key, counts, total in values:
+            cumulative = 0
+            for bound, count in zip((*self.buckets, '+Inf'), counts):
+                cumulative += count
+                samples.append((f'{self.name}_bucket', key, (('le', _number(bound)),), cumulative))
+            samples.append((f'{self.name}_sum', key, (), total))
+            samples.append((f'{self.name}_count', key, (), cumulative))
+        return samples
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def counter(self, name, help, labels=()):
+        return self._add(Counter(name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        return self._add(Histogram(name, help, labels, buckets))
+
+    def _add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            for name, key, extra, value in metric.samples():
+                pairs = [*zip(metric.labels, key), *extra]
+                labels = ','.join(f'{label}="{_escape(value)}"' for label, value in pairs)
+                lines.append(f'{name}{{{labels}}} {_number(value)}' if labels else f'{name} {_number(value)}')
+        return '\n'.join(lines) + '\n'
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _number(value):
+    if isinstance(value, str):
+        return value
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+REGISTRY = Registry()
+REQUEST_DURATION = REGISTRY.histogram(
+    'spendapp_http_request_duration_seconds', 'Time to serve a request, including a streamed body.',
+    ('method', 'route', 'status'))
+REQUEST_STATEMENTS = REGISTRY.histogram(
+    'spendapp_http_request_db_statements', 'SQL statements run by a request.',
+    ('method', 'route'), COUNT_BUCKETS)
+REQUEST_DB_TIME = REGISTRY.histogram(
+    'spendapp_http_request_db_seconds', 'Time a request spent waiting on SQL statements.', ('method', 'route'))
+STATEMENT_DURATION = REGISTRY.histogram(
+    'spendapp_db_statement_duration_seconds', 'Time to execute one SQL statement, in or out of a request.')
+REQUEST_PLAID_TIME = REGISTRY.histogram(
+    'spendapp_http_request_plaid_seconds', 'Time a request spent waiting on Plaid, for requests that called it.',
+    ('method', 'route'))
+N_PLUS_ONE = REGISTRY.counter(
+    'spendapp_n_plus_one_total', 'Requests that ran the same SELECT more times than the N+1 threshold.',
+    ('method', 'route'))
+
+# A run of bind parameters, e.g. an expanded IN list: `?, ?, ?` or `%(id_1)s, %(id_2)s`
+_PARAMETERS = re.compile(r'(?:\?|%\(\w+\)s|%s|\$\d+)(?:\s*,\s*(?:\?|%\(\w+\)s|%s|\$\d+))*')
+_WHITESPACE = re.compile(r'\s+')
+
+def statement_shape(statement):
+    """The statement with runs of parameters collapsed, so every IN list size looks the same"""
+    return _PARAMETERS.sub('?', _WHITESPACE.sub(' ', statement).strip())
+
+class Trace:
+    """An inbound request or background job, and the Plaid calls made on its behalf"""
+
+    def __init__(self, kind, name, trace_id=None):
+        self.id = trace_id or uuid.uuid4().hex
+        self.kind = kind
+        self.name = name
+        self.plaid_calls = 0
+        self.plaid_seconds = 0.0
+        self.lock = threading.Lock()
+
+    def record_plaid_call(self, seconds):
+        # Calls for one trace can run on several threads at once
+        with self.lock:
+            self.plaid_calls += 1
+            self.plaid_seconds += seconds
+
+_current_trace = ContextVar('trace', default=None)
+_spans = deque(maxlen=SPAN_BUFFER_SIZE)
+
+def current_trace():
+    return _current_trace.get()
+
+@contextmanager
+def trace(kind, name):
+    """Run the block as a new trace, e.g. `with trace('job', 'sync_user:42'):`"""
+    token = _current_trace.set(Trace(kind, name))
+    try:
+        yield _current_trace.get()
+    finally:
+        _current_trace.reset(token)
+
+def traced(func):
+    """`func` made to run in the current trace wherever it is called, e.g. on a worker thread"""
+    parent = _current_trace.get()
+
+    def run(*args, **kwargs):
+        token = _current_trace.set(parent)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _current_trace.reset(token)
+    return run
+
+def record_span(name, started, seconds, **attributes):
+    """Keep a finished outbound call, linked to the current trace if there is one"""
+    parent = _current_trace.get()
+    _spans.append({
+        'trace_id': parent.id if parent else None,
+        'parent': f'{parent.kind} {parent.name}' if parent else None,
+        'span_id': uuid.uuid4().hex[:16],
+        'name': name,
+        'start': datetime.fromtimestamp(started, timezone.utc).isoformat(),
+        'duration_ms': round(seconds * 1000, 3),
+        **attributes
+    })
+
+def recent_spans(trace_id=None):
+    """Finished spans, oldest first, optionally only those of one trace"""
+    return [span for span in list(_spans) if trace_id is None or span['trace_id'] == trace_id]
+
+class RequestStats:
+    """What one request has done so far"""
+
+    def __init__(self, trace):
+        self.started = time.perf_counter()
+        self.statements = 0
+        self.db_seconds = 0.0
+        self.selects = {}
+        self.status = None
+        self.trace = trace
+        self.trace_token = _current_trace.set(trace)
+
+def start_request():
+    """Begin recording the current request; views served outside Flask's dispatch call this themselves.
+
+    The request's trace id is taken from an X-Request-ID header when the
+    client sends a reasonable one.
+    """
+    request_id = request.headers.get('X-Request-ID', '')
+    route = request.url_rule.rule if request.url_rule else UNMATCHED_ROUTE
+    request_trace = Trace('request', f'{request.method} {route}',
+                          request_id if 0 < len(request_id) <= 64 and request_id.isprintable() else None)
+    g.request_metrics = RequestStats(request_trace)
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context.metrics_started = time.perf_counter()
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - context.metrics_started
+    STATEMENT_DURATION.observe(elapsed)
+    stats = g.get('request_metrics') if has_request_context() else None
+    if stats is None:
+        return
+    stats.statements += 1
+    stats.db_seconds += elapsed
+    # Batched writes legitimately repeat one statement; N+1 is a read pattern
+    if not executemany and statement.lstrip()[:6].upper() == 'SELECT':
+        stats.selects[statement] = stats.selects.get(statement, 0) + 1
+
+def _after_request(response):
+    stats = g.get('request_metrics')
+    if stats is not None:
+        stats.status = response.status_code
+        response.headers.setdefault('X-Request-ID', stats.trace.id)
+    return response
+
+def _teardown_request(error):
+    stats = g.pop('request_metrics', None)
+    if stats is None:
+        return
+    method = request.method
+    route = request.url_rule.rule if request.url_rule else UNMATCHED_ROUTE
+    status = stats.status if error is None and stats.status else 500
+    REQUEST_DURATION.observe(time.perf_counter() - stats.started, method=method, route=route, status=status)
+    REQUEST_STATEMENTS.observe(stats.statements, method=method, route=route)
+    REQUEST_DB_TIME.observe(stats.db_seconds, method=method, route=route)
+    if stats.trace.plaid_calls:
+        REQUEST_PLAID_TIME.observe(stats.trace.plaid_seconds, method=method, route=route)
+    # A streamed response can finish after the thread has moved on
+    if _current_trace.get() is stats.trace:
+        _current_trace.reset(stats.trace_token)
+
+    threshold = current_app.config['METRICS_N_PLUS_ONE_THRESHOLD']
+    if not threshold or sum(stats.selects.values()) <= threshold:
+        return
+    repeated = {}
+    for statement, count in stats.selects.items():
+        shape = statement_shape(statement)
+        repeated[shape] = repeated.get(shape, 0) + count
+    shape, count = max(repeated.items(), key=lambda item: item[1], default=(None, 0))
+    if count > threshold:
+        N_PLUS_ONE.inc(method=method, route=route)
+        logger.warning('Possible N+1 in %s %s: one SELECT ran %d times: %.300s', method, route, count, shape)
+
+def render():
+    return REGISTRY.render()
+
+def init_app(app):
+    app.before_request(start_request)
+    app.after_request(_after_request)
+    app.teardown_request(_teardown_request)
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
@@ -0,0 +1,141 @@
+"""Password hashing off the request thread.
+
+Hashes are computed in a small process pool so a burst of logins cannot
+take every CPU away from the rest of the web worker. At most
+PASSWORD_HASH_WORKERS hashes run at once and PASSWORD_HASH_MAX_PENDING more
+may wait for a worker; anything beyond that is rejected immediately with
+HashingBusy rather than queued without bound.
+
+The algorithm and cost come from PASSWORD_HASH_METHOD, in werkzeug's method
+syntax. Stored hashes made with other parameters still verify, and are
+replaced with one using the configured method on the next successful login.
+"""
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from flask import current_app
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, check_password_hash, generate_password_hash
+
+logger = logging.getLogger(__name__)
+
+class HashingBusy(Exception):
+    """Every worker is busy and the pending queue is full"""
+
+    def __init__(self, retry_after=1):
+        super().__init__('Too many password checks in progress')
+        self.retry_after = retry_after
+
+def canonical_method(method):
+    """Spell out werkzeug's defaults, e.g. 'scrypt' -> 'scrypt:32768:8:1'.
+
+    This is the prefix werkzeug writes in front of the salt, so it can be
+    compared with the one of a stored hash.
+    """
+    name, *args = method.split(':')
+    if name == 'scrypt':
+        n, r, p = map(int, args) if args else (2 ** 15, 8, 1)
+        return f'scrypt:{n}:{r}:{p}'
+    if name == 'pbkdf2':
+        hash_name = args[0] if args else 'sha256'
+        iterations = int(args[1]) if len(args) > 1 else DEFAULT_PBKDF2_ITERATIONS
+        return f'pbkdf2:{hash_name}:{iterations}'
+    raise ValueError(f'Unsupported PASSWORD_HASH_METHOD {method!r}')
+
+def needs_rehash(stored, method):
+    """Whether a stored hash was made with parameters other than `method`"""
+    return stored.split('$', 1)[0] != canonical_method(method)
+
+def _hash(password, method):
+    return generate_password_hash(password, method=method)
+
+def _verify(stored, password, method):
+    """Check a password and, if the stored hash is outdated, compute its replacement.
+
+    Both happen in the same worker call so an upgrade costs no extra round trip.
+    """
+    if not check_password_hash(stored, password):
+        return False, None
+    if needs_rehash(stored, method):
+        return True, generate_password_hash(password, method=method)
+    return True, None
+
+class HashingPool:
+    """A process pool with a hard cap on queued work.
+
+    `workers` set to 0 hashes on the calling thread instead, still subject to
+    the same cap.
+    """
+
+    def __init__(self, workers, max_pending):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.slots = threading.BoundedSemaphore(max(workers, 1) + max_pending)
+        self.executor = None
+        if workers:
+            # Spawned workers only import this module, and do not inherit the
+            # web process's threads, sockets or database connections
+            self.executor = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn'))
+
+    def run(self, func, *args):
+        if not self.slots.acquire(blocking=False):
+            raise HashingBusy()
+        try:
+            if self.executor is None:
+                return func(*args)
+            return self.executor.submit(func, *args).result()
+        finally:
+            self.slots.release()
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(cancel_futures=True)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    """The process-wide pool, rebuilt if its configured size has changed"""
+    global _pool
+    workers = current_app.config['PASSWORD_HASH_WORKERS']
+    max_pending = current_app.config['PASSWORD_HASH_MAX_PENDING']
+    with _pool_lock:
+        if _pool is None or (_pool.workers, _pool.max_pending) != (workers, max_pending):
+            if _pool is not None:
+                _pool.shutdown()
+            _pool = HashingPool(workers, max_pending)
+        return _pool
+
+def shutdown():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown()
+        _pool = None
+
+def _run(func, *args):
+    global _pool
+    pool = get_pool()
+    try:
+        return pool.run(func, *args)
+    except BrokenProcessPool:
+        # A worker died (e.g. killed by the OOM killer); start afresh next time
+        logger.exception('Password hashing pool broke, restarting it')
+        with _pool_lock:
+            if _pool is pool:
+                pool.shutdown()
+                _pool = None
+        raise
+
+def hash_password(password):
+    """Hash a new password with the configured method"""
+    return _run(_hash, password, current_app.config['PASSWORD_HASH_METHOD'])
+
+def verify_password(stored, password):
+    """Check `password` against a stored hash.
+
+    Returns (valid, upgraded) where `upgraded` is a fresh hash with the
+    configured method when the stored one is outdated, else None.
+    """
+    return _run(_verify, stored, password, current_app.config['PASSWORD_HASH_METHOD'])
@@ -0,0 +1,256 @@
+import json
+import logging
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+import urllib3
+from plaid import ApiClient, ApiException, Configuration, rest
+from database.config import Config
+from services import metrics
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+RATE_LIMIT_HEADERS = ('Retry-After', 'RateLimit-Reset', 'X-RateLimit-Reset')
+
+BYTE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+CALL_DURATION = metrics.REGISTRY.histogram(
+    'spendapp_plaid_request_duration_seconds', 'Time for one HTTP request to Plaid, retries counted separately.',
+    ('operation', 'institution'))
+CALL_ERRORS = metrics.REGISTRY.counter(
+    'spendapp_plaid_errors_total', 'Plaid requests that failed, by HTTP status or exception.',
+    ('operation', 'institution', 'error'))
+RATE_LIMITED = metrics.REGISTRY.counter(
+    'spendapp_plaid_rate_limited_total', 'Plaid requests answered with 429.', ('operation', 'institution'))
+RESPONSE_BYTES = metrics.REGISTRY.histogram(
+    'spendapp_plaid_response_bytes', 'Size of Plaid response bodies.', ('operation', 'institution'), BYTE_BUCKETS)
+
+_clients = {}
+_breakers = {}
+_lock = threading.Lock()
+# Size of the response body the current thread last received
+_received = threading.local()
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling Plaid while an institution's circuit is open"""
+
+    def __init__(self, institution, retry_in):
+        super().__init__(f'Plaid calls for {institution} are paused for {retry_in:.0f}s after repeated failures')
+        self.institution = institution
+        self.retry_in = retry_in
+
+def shared_api_client(host, client_id=None, secret=None):
+    """One ApiClient, and so one urllib3 connection pool, per Plaid host and credentials.
+
+    Every PlaidService pointing at the same host reuses the pooled keep-alive
+    connections instead of paying a TCP/TLS handshake per instance. urllib3's
+    own retries are disabled; call() decides what to retry.
+    """
+    key = (host, client_id, secret)
+    with _lock:
+        if key not in _clients:
+            configuration = Configuration(
+                host=host,
+                api_key={"clientId": client_id, "secret": secret}
+            )
+            configuration.connection_pool_maxsize = Config.PLAID_POOL_MAXSIZE
+            configuration.retries = False
+            client = ApiClient(configuration)
+            client.rest_client = MeasuredRESTClient(configuration)
+            _clients[key] = client
+        return _clients[key]
+
+class MeasuredRESTClient(rest.RESTClientObject):
+    """Notes the size of every response body, including errors, for call()'s metrics"""
+
+    def request(self, *args, **kwargs):
+        try:
+            response = super().request(*args, **kwargs)
+        except ApiException as e:
+            _received.size = len(e.body or b'')
+            raise
+        if isinstance(response, rest.RESTResponse):
+            _received.size = len(response.data)
+        else:
+            # Unread (_preload_content=False): only the declared length is known
+            length = response.headers.get('Content-Length')
+            _received.size = int(length) if length and length.isdigit() else None
+        return response
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker.
+
+    After `failure_threshold` failures in a row the circuit opens and calls
+    fail fast for `reset_timeout` seconds. Then one trial call is let through
+    (half-open): success closes the circuit, failure opens it again.
+    """
+
+    def __init__(self, failure_threshold, reset_timeout, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+        self.lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        return 'half-open' if self.clock() - self.opened_at >= self.reset_timeout else 'open'
+
+    def before_call(self, name):
+        with self.lock:
+            state = self.state
+            if state == 'closed':
+                return
+            if state == 'half-open' and not self.trial_running:
+                self.trial_running = True
+                return
+            raise CircuitOpenError(name, max(0.0, self.opened_at + self.reset_timeout - self.clock()))
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_running = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.trial_running or self.failures >= self.failure_threshold:
+                self.opened_at = self.clock()
+            self.trial_running = False
+
+def breaker_for(institution):
+    with _lock:
+        if institution not in _breakers:
+            _breakers[institution] = CircuitBreaker(
+                Config.PLAID_BREAKER_THRESHOLD, Config.PLAID_BREAKER_RESET_SECONDS
+            )
+        return _breakers[institution]
+
+def reset_breakers():
+    with _lock:
+        _breakers.clear()
+
+def _header_delay(headers):
+    """Seconds the server asked us to wait, from Retry-After or rate-limit reset headers"""
+    for name in RATE_LIMIT_HEADERS:
+        value = headers.get(name) if headers else None
+        if value is None:
+            continue
+        try:
+            seconds = float(value)
+        except ValueError:
+            try:
+                seconds = (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds()
+            except (TypeError, ValueError):
+                continue
+        # Some servers send an epoch timestamp for the reset time
+        if seconds > 10 ** 9:
+            seconds -= time.time()
+        return max(0.0, seconds)
+    return None
+
+def _error_type(error):
+    try:
+        return json.loads(error.body).get('error_type')
+    except (TypeError, ValueError, AttributeError):
+        return None
+
+def _is_transient(error):
+    """Errors worth retrying and counting against an institution's circuit"""
+    if isinstance(error, ApiException):
+        return error.status in RETRY_STATUSES
+    return isinstance(error, urllib3.exceptions.HTTPError)
+
+def _is_institution_failure(error):
+    if isinstance(error, ApiException):
+        return error.status >= 500 or _error_type(error) == 'INSTITUTION_ERROR'
+    return isinstance(error, urllib3.exceptions.HTTPError)
+
+def backoff(attempt, base_delay, max_delay):
+    """Full-jitter exponential backoff for the nth retry (1-based)"""
+    return random.uniform(0, min(max_delay, base_delay * 2 ** (attempt - 1)))
+
+def _attempt(func, args, kwargs, labels, attempt):
+    """One request to Plaid, measured and kept as a span of the current trace"""
+    _received.size = None
+    wall_clock, started = time.time(), time.perf_counter()
+    outcome = 'ok'
+    try:
+        return func(*args, **kwargs)
+    except Exception as e:
+        outcome = e.status if isinstance(e, ApiException) else type(e).__name__
+        CALL_ERRORS.inc(error=outcome, **labels)
+        if outcome == 429:
+            RATE_LIMITED.inc(**labels)
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        size = _received.size
+        CALL_DURATION.observe(elapsed, **labels)
+        if size is not None:
+            RESPONSE_BYTES.observe(size, **labels)
+        metrics.record_span(f"plaid.{labels['operation']}", wall_clock, elapsed, institution=labels['institution'],
+                            attempt=attempt, outcome=outcome, response_bytes=size)
+
+def call(func, *args, institution=None, idempotent=True, attempts=None, sleep=time.sleep, **kwargs):
+    """Call a PlaidApi method with timeouts, retries and the institution's circuit breaker.
+
+    429s are always retried since Plaid did not process the request; 5xx
+    responses, timeouts and connection resets only for idempotent calls.
+    The wait honours Retry-After/rate-limit headers, otherwise it is a
+    jittered exponential backoff. A rate limit asking for longer than
+    PLAID_RETRY_MAX_DELAY is not waited out.
+
+    Every attempt is measured per operation (the PlaidApi method, e.g.
+    transactions_sync) and institution. The whole call, waits included,
+    counts towards the current request's or job's time spent on Plaid.
+    """
+    attempts = attempts or Config.PLAID_RETRY_ATTEMPTS
+    kwargs.setdefault('_request_timeout', (Config.PLAID_CONNECT_TIMEOUT, Config.PLAID_READ_TIMEOUT))
+    breaker = breaker_for(institution) if institution else None
+    labels = {'operation': getattr(func, '__name__', str(func)), 'institution': institution or 'unknown'}
+    parent = metrics.current_trace()
+    started = time.perf_counter()
+
+    try:
+        for attempt in range(1, attempts + 1):
+            if breaker:
+                try:
+                    breaker.before_call(institution)
+                except CircuitOpenError:
+                    CALL_ERRORS.inc(error='circuit_open', **labels)
+                    raise
+            try:
+                result = _attempt(func, args, kwargs, labels, attempt)
+            except Exception as e:
+                if breaker:
+                    if _is_institution_failure(e):
+                        breaker.record_failure()
+                    else:
+                        breaker.record_success()
+                rate_limited = isinstance(e, ApiException) and e.status == 429
+                if attempt == attempts or not _is_transient(e) or not (idempotent or rate_limited):
+                    raise
+                delay = _header_delay(getattr(e, 'headers', None)) if rate_limited else None
+                if delay is None:
+                    delay = backoff(attempt, Config.PLAID_RETRY_BASE_DELAY, Config.PLAID_RETRY_MAX_DELAY)
+                elif delay > Config.PLAID_RETRY_MAX_DELAY:
+                    raise
+                logger.warning('Plaid %s failed (%s), retry %d/%d in %.2fs',
+                               labels['operation'], e, attempt, attempts - 1, delay)
+                sleep(delay)
+            else:
+                if breaker:
+                    breaker.record_success()
+                return result
+    finally:
+        if parent is not None:
+            parent.record_plaid_call(time.perf_counter() - started)
@@ -4,22 +4,29 @@ from plaid.model.item_public_token_exchange_request import ItemPublicTokenExchan
 from plaid.model.products import Products
 from plaid.model.transactions_get_request import TransactionsGetRequest
 from plaid.model.transactions_get_request_options import TransactionsGetRequestOptions
+from plaid.model.transactions_sync_request import TransactionsSyncRequest
 from datetime import datetime, timedelta
-from plaid import Configuration, ApiClient
+from plaid import Environment
+import json
+import logging
 import os
 from dotenv import load_dotenv
+from services import plaid_client
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+PLAID_HOSTS = {
+    "sandbox": Environment.Sandbox,
+    "production": Environment.Production,
+}
 
 class PlaidService:
-    def __init__(self):
-        load_dotenv()
-        configuration = Configuration(
-            host="https://sandbox.plaid.com",  # Change to "https://development.plaid.com" for development
-            api_key={
-                "clientId": os.getenv("PLAID_CLIENT_ID"),
-                "secret": os.getenv("PLAID_SECRET"),
-            }
-        )
-        api_client = ApiClient(configuration)
+    def __init__(self, host: str = None):
+        # PLAID_HOST overrides the environment, e.g. to point at a local fake server
+        host = host or os.getenv("PLAID_HOST") or PLAID_HOSTS.get(os.getenv("PLAID_ENV", "sandbox"), Environment.Sandbox)
+        api_client = plaid_client.shared_api_client(host, os.getenv("PLAID_CLIENT_ID"), os.getenv("PLAID_SECRET"))
         self.client = plaid_api.PlaidApi(api_client)
 
     def create_sandbox_link_token(self, user_id: str):
@@ -32,20 +39,21 @@ class PlaidService:
                 "country_codes": ["US"],
                 "language": "en"
             }
-            response = self.client.link_token_create(request)
+            response = plaid_client.call(self.client.link_token_create, request)
             return response["link_token"]
         except Exception as e:
-            print(f"Error creating link token: {str(e)}")
+            logger.error("Error creating link token: %s", e)
             raise
 
     def exchange_public_token(self, public_token: str):
         """Exchange public token for access token"""
         try:
             exchange_request = ItemPublicTokenExchangeRequest(public_token=public_token)
-            exchange_response = self.client.item_public_token_exchange(exchange_request)
+            # A public token can only be exchanged once, so only rate limits are retried
+            exchange_response = plaid_client.call(self.client.item_public_token_exchange, exchange_request, idempotent=False)
             return exchange_response["access_token"]
         except Exception as e:
-            print(f"Error exchanging public token: {str(e)}")
+            logger.error("Error exchanging public token: %s", e)
             raise
 
     def get_transactions(self, access_token: str, start_date: datetime = None, end_date: datetime = None):
@@ -68,28 +76,47 @@ class PlaidService:
                 options=options
             )
 
-            response = self.client.transactions_get(request)
+            response = plaid_client.call(self.client.transactions_get, request)
             return response["transactions"]
         except Exception as e:
-            print(f"Error getting transactions: {str(e)}")
+            logger.error("Error getting transactions: %s", e)
+            raise
+
+    def sync_transactions(self, access_token: str, cursor: str = None, count: int = 500, institution: str = None):
+        """Fetch one page of /transactions/sync deltas.
+
+        Returns (page, size) where page is the decoded JSON body (added,
+        modified, removed, next_cursor, has_more) and size is its length in bytes.
+        """
+        try:
+            request = TransactionsSyncRequest(access_token=access_token, count=count)
+            if cursor:
+                request.cursor = cursor
+            response = plaid_client.call(
+                self.client.transactions_sync, request, institution=institution, _preload_content=False
+            )
+            body = response.data
+            return json.loads(body), len(body)
+        except Exception as e:
+            logger.error("Error syncing transactions: %s", e)
             raise
 
-    def get_accounts(self, access_token: str):
+    def get_accounts(self, access_token: str, institution: str = None):
         """Get accounts for a given access token"""
         try:
-            response = self.client.accounts_get({"access_token": access_token})
+            response = plaid_client.call(self.client.accounts_get, {"access_token": access_token}, institution=institution)
             return response["accounts"]
         except Exception as e:
-            print(f"Error getting accounts: {str(e)}")
+            logger.error("Error getting accounts: %s", e)
             raise
 
     def get_balance(self, access_token: str):
         """Get account balances for a given access token"""
         try:
-            response = self.client.accounts_balance_get({"access_token": access_token})
+            response = plaid_client.call(self.client.accounts_balance_get, {"access_token": access_token})
             return response["accounts"]
         except Exception as e:
-            print(f"Error getting balances: {str(e)}")
+            logger.error("Error getting balances: %s", e)
             raise
 
 
@@ -0,0 +1,134 @@
+from collections import defaultdict
+from sqlalchemy import case, delete, func, insert, select
+from database.models import db, BankAccount, Transaction, DailyRollup, MonthlyRollup
+from database.dialects import upsert, month_start
+
+UNCATEGORIZED = 0
+
+def _empty():
+    return defaultdict(lambda: [0.0, 0.0, 0]), defaultdict(lambda: [0.0, 0.0, 0])
+
+def collect(rows, sign=1, deltas=None):
+    """Fold transaction-like rows into per-(account, category, day) and per-month deltas.
+
+    Pass the result back in as `deltas` to keep accumulating, then write it
+    once with apply().
+    """
+    daily, monthly = deltas or _empty()
+    for row in rows:
+        key = (row.bank_account_id, row.category_id or UNCATEGORIZED)
+        for bucket in (daily[key + (row.date,)], monthly[key + (row.date.replace(day=1),)]):
+            if row.amount > 0:
+                bucket[0] += sign * row.amount
+            elif row.amount < 0:
+                bucket[1] += sign * -row.amount
+            bucket[2] += sign
+    return daily, monthly
+
+def collect_totals(rows, deltas=None):
+    """collect() for rows already summed per account, category and day.
+
+    `rows` expose bank_account_id, category_id, date, income, expenses and
+    transaction_count, e.g. the result of a GROUP BY over new transactions.
+    """
+    daily, monthly = deltas or _empty()
+    for row in rows:
+        key = (row.bank_account_id, row.category_id or UNCATEGORIZED)
+        for bucket in (daily[key + (row.date,)], monthly[key + (row.date.replace(day=1),)]):
+            bucket[0] += row.income
+            bucket[1] += row.expenses
+            bucket[2] += row.transaction_count
+    return daily, monthly
+
+def _upsert(model, period_column, user_id, deltas):
+    if not deltas:
+        return
+    table = model.__table__
+    stmt = upsert(table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.user_id, table.c.bank_account_id, table.c.category_id, table.c[period_column]],
+        set_={
+            'income': table.c.income + stmt.excluded.income,
+            'expenses': table.c.expenses + stmt.excluded.expenses,
+            'transaction_count': table.c.transaction_count + stmt.excluded.transaction_count,
+        }
+    )
+    db.session.execute(stmt, [{
+        'user_id': user_id,
+        'bank_account_id': bank_account_id,
+        'category_id': category_id,
+        period_column: period,
+        'income': income,
+        'expenses': expenses,
+        'transaction_count': count
+    } for (bank_account_id, category_id, period), (income, expenses, count) in deltas.items()])
+
+def apply(user_id, deltas):
+    """Write accumulated deltas to a user's rollups on the current session"""
+    daily, monthly = deltas
+    _upsert(DailyRollup, 'day', user_id, daily)
+    _upsert(MonthlyRollup, 'month', user_id, monthly)
+    if any(count < 0 for _, _, count in daily.values()):
+        # Drop buckets whose last transaction was just removed
+        for model in (DailyRollup, MonthlyRollup):
+            db.session.execute(delete(model).where(model.user_id == user_id, model.transaction_count <= 0))
+
+def record(user_id, rows, sign=1):
+    """Add (sign=1) or remove (sign=-1) transactions from a user's rollups.
+
+    `rows` are Transaction objects or anything exposing bank_account_id,
+    category_id, date and amount. The upserts run on the current session, so
+    they commit or roll back together with the rows being ingested.
+    """
+    apply(user_id, collect(rows, sign))
+
+def rebuild(user_id=None, user_ids=None):
+    """Recompute rollups from the transactions table for one user, a list of users, or everyone"""
+    if user_id is not None:
+        user_ids = [user_id]
+    for model in (DailyRollup, MonthlyRollup):
+        stmt = delete(model)
+        if user_ids is not None:
+            stmt = stmt.where(model.user_id.in_(user_ids))
+        db.session.execute(stmt)
+
+    daily = (
+        select(
+            BankAccount.user_id,
+            Transaction.bank_account_id,
+            func.coalesce(Transaction.category_id, UNCATEGORIZED),
+            Transaction.date,
+            func.coalesce(func.sum(case((Transaction.amount > 0, Transaction.amount), else_=0)), 0),
+            func.coalesce(func.sum(case((Transaction.amount < 0, -Transaction.amount), else_=0)), 0),
+            func.count(Transaction.id)
+        )
+        .join(BankAccount, Transaction.bank_account_id == BankAccount.id)
+        .group_by(BankAccount.user_id, Transaction.bank_account_id,
+                  func.coalesce(Transaction.category_id, UNCATEGORIZED), Transaction.date)
+    )
+    if user_ids is not None:
+        daily = daily.where(BankAccount.user_id.in_(user_ids))
+    db.session.execute(insert(DailyRollup).from_select(
+        ['user_id', 'bank_account_id', 'category_id', 'day', 'income', 'expenses', 'transaction_count'],
+        daily
+    ))
+
+    month = month_start(DailyRollup.day)
+    monthly = (
+        select(
+            DailyRollup.user_id,
+            DailyRollup.bank_account_id,
+            DailyRollup.category_id,
+            month,
+            func.sum(DailyRollup.income),
+            func.sum(DailyRollup.expenses),
+            func.sum(DailyRollup.transaction_count)
+        )
+        .group_by(DailyRollup.user_id, DailyRollup.bank_account_id, DailyRollup.category_id, month)
+    )
+    if user_ids is not None:
+        monthly = monthly.where(DailyRollup.user_id.in_(user_ids))
+    db.session.execute(insert(MonthlyRollup).from_select(
+        ['user_id', 'bank_account_id', 'category_id', 'month', 'income', 'expenses', 'transaction_count'],
+        monthly
+    ))
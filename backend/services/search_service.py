@@ -0,0 +1,139 @@
+"""Ranked search over a user's transaction descriptions and merchants.
+
+Every word of the query must match part of a transaction's description or
+merchant. On Postgres results are ranked by full-text rank over
+search_vector, a generated tsvector, and matched through its GIN index or,
+when pg_trgm is installed, through trigram GIN indexes on the two columns.
+With btree_gin those indexes lead with the account, so a search reads the
+user's index entries only and costs the same however many other users'
+transactions the table holds.
+
+When nothing matches and pg_trgm is installed, transactions whose
+description or merchant is close to the query (typos, missing letters) are
+returned instead, ranked by word similarity. Databases without full-text
+search fall back to substring matching with results newest first.
+
+Results are ordered by (score DESC, date DESC, id DESC) and paged with a
+keyset cursor over those values, so a page costs the same however deep into
+the results it is.
+"""
+import base64
+import re
+from datetime import date
+from flask import current_app
+from sqlalchemy import Double, and_, cast, func, literal, literal_column, or_, text, tuple_
+from database.models import db, Transaction
+from database.dialects import is_postgres
+from services import identity_service
+from services.transaction_service import DEFAULT_PAGE_SIZE, _user_rows, serialize
+
+MAX_LIMIT = 200
+
+def terms(query):
+    """Lower-cased words of a search query"""
+    return re.findall(r'[^\W_]+', query.lower())
+
+def encode_cursor(row, fuzzy):
+    """Opaque keyset cursor pointing just after `row` in (score, date, id) descending order"""
+    raw = f"{row.score!r}:{row.date.isoformat()}:{row.id}:{int(fuzzy)}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    """(score, date, id, fuzzy) of the row a cursor points after"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        score, day, transaction_id, fuzzy = raw.split(':')
+        return float(score), date.fromisoformat(day), int(transaction_id), fuzzy == '1'
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError('Invalid cursor')
+
+def trigram_enabled():
+    """Whether pg_trgm is installed, checked once per app"""
+    if 'search_trigram' not in current_app.extensions:
+        current_app.extensions['search_trigram'] = is_postgres() and bool(db.session.execute(
+            text("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+        ).scalar())
+    return current_app.extensions['search_trigram']
+
+def _match(words, fuzzy):
+    """(match condition, score) for the active database"""
+    columns = (Transaction.description, Transaction.merchant)
+    if not is_postgres():
+        lowered = [func.lower(column) for column in columns]
+        condition = and_(*[or_(*[column.contains(word, autoescape=True) for column in lowered]) for word in words])
+        return condition, literal(0.0, Double)
+
+    phrase = literal(' '.join(words))
+    similarity = func.greatest(*[func.coalesce(func.word_similarity(phrase, column), 0) for column in columns])
+    if fuzzy:
+        # Word similarity above pg_trgm's threshold, served by the trigram indexes
+        condition = or_(*[phrase.op('<%', is_comparison=True)(column) for column in columns])
+        return condition, cast(similarity, Double)
+
+    vector = literal_column('transactions.search_vector')
+    prefixes = func.to_tsquery('simple', ' & '.join(f'{word}:*' for word in words))
+    if trigram_enabled():
+        # A GIN prefix lookup reads the entries of every account, so words are
+        # matched as substrings through the trigram indexes, which only read
+        # the user's. Words are letters and digits, so they need no escaping.
+        condition = and_(*[or_(*[column.ilike(f'%{word}%') for column in columns]) for word in words])
+        score = func.ts_rank(vector, prefixes) + similarity
+    else:
+        condition = vector.op('@@', is_comparison=True)(prefixes)
+        score = func.ts_rank(vector, prefixes)
+    # Double precision so the score survives the round trip through a cursor exactly
+    return condition, cast(score, Double)
+
+def _page(session, user_id, account_ids, words, fuzzy, filters, limit, after):
+    condition, score = _match(words, fuzzy)
+    score = score.label('score')
+    stmt = (
+        _user_rows(user_id)
+        .add_columns(score)
+        .where(Transaction.bank_account_id.in_(account_ids), condition, *filters)
+        .order_by(score.desc(), Transaction.date.desc(), Transaction.id.desc())
+    )
+    if after:
+        stmt = stmt.where(tuple_(score.element, Transaction.date, Transaction.id) < tuple_(*after))
+    return session.execute(stmt.limit(limit + 1)).all()
+
+def search(user_id, query, start_date=None, end_date=None, min_amount=None, max_amount=None,
+           limit=DEFAULT_PAGE_SIZE, cursor=None, session=None):
+    """One page of a user's transactions matching `query`, best match first, plus the next page's cursor.
+
+    Amount bounds apply to the absolute amount, so they filter expenses and
+    income alike. Every result carries its `score`; on databases without
+    full-text search it is 0 and results are newest first. Raises ValueError
+    for a query with no words or a bad cursor.
+    """
+    words = terms(query or '')
+    if not words:
+        raise ValueError('q must contain at least one word')
+    limit = max(1, min(limit, MAX_LIMIT))
+    after, fuzzy = None, False
+    if cursor:
+        *after, fuzzy = decode_cursor(cursor)
+
+    session = session or db.session
+    # Account ids as literals let the planner use the account-scoped indexes
+    principal = identity_service.get_principal(user_id, session)
+    if principal is None or not principal['account_ids']:
+        return [], None
+    account_ids = principal['account_ids']
+
+    filters = []
+    if start_date is not None:
+        filters.append(Transaction.date >= start_date)
+    if end_date is not None:
+        filters.append(Transaction.date <= end_date)
+    if min_amount is not None:
+        filters.append(func.abs(Transaction.amount) >= min_amount)
+    if max_amount is not None:
+        filters.append(func.abs(Transaction.amount) <= max_amount)
+
+    rows = _page(session, user_id, account_ids, words, fuzzy, filters, limit, after)
+    if not rows and not cursor and trigram_enabled():
+        fuzzy = True
+        rows = _page(session, user_id, account_ids, words, fuzzy, filters, limit, after)
+    next_cursor = encode_cursor(rows[limit - 1], fuzzy) if len(rows) > limit else None
+    return [dict(serialize(row), score=round(row.score, 4)) for row in rows[:limit]], next_cursor
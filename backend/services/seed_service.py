@@ -0,0 +1,266 @@
+"""Synthetic users, accounts and transactions for benchmark and demo databases.
+
+Every user gets a salary, rent and bills that recur on fixed days, a few
+subscriptions, and discretionary spending spread over the period. Each user
+has their own taste in merchants, home city and spending level. Amounts are
+log-normal around each merchant's typical ticket. Shopping and travel rise
+around the holidays and in summer, dining and entertainment at weekends,
+and utility bills in winter and summer. Descriptions look like card
+statement lines, and categories are the ones the built-in rules would give.
+
+Output is deterministic: a user's rows depend only on the seed, the user's
+position and the date range, never on how many users are generated or on
+what the database already holds (apart from ids). Users and accounts are
+inserted a chunk at a time. Transactions stream into the database with
+COPY on Postgres, so generating millions of rows takes a few minutes and
+flat memory.
+"""
+import math
+import random
+from bisect import bisect
+from collections import namedtuple
+from datetime import date, datetime, timedelta
+from itertools import accumulate
+from sqlalchemy import func, insert, select
+from database.models import db, BankAccount, Budget, Category, Transaction, User, content_hash
+from database.dialects import bulk_insert
+from services import password_service, rollup_service
+
+USER_CHUNK_SIZE = 500
+ACCOUNT_TYPES = ('checking', 'credit', 'savings')
+CITIES = ('SEATTLE WA', 'PORTLAND OR', 'AUSTIN TX', 'DENVER CO', 'BOSTON MA', 'CHICAGO IL', 'ATLANTA GA',
+          'PHOENIX AZ', 'MINNEAPOLIS MN', 'SAN DIEGO CA')
+TRAVEL_SHARE = 0.08
+CARD_SHARE = 0.75
+
+Merchant = namedtuple('Merchant', 'description name category median spread weight')
+
+# Discretionary spending; `weight` is how often a typical user shops there
+MERCHANTS = [
+    Merchant('STARBUCKS STORE', 'Starbucks', 'Food & Dining', 6.5, 0.3, 10),
+    Merchant('WHOLE FOODS MARKET', 'Whole Foods Market', 'Food & Dining', 62, 0.5, 5),
+    Merchant('TRADER JOE S', 'Trader Joe S', 'Food & Dining', 48, 0.5, 6),
+    Merchant('SAFEWAY GROCERY', 'Safeway Grocery', 'Food & Dining', 55, 0.6, 6),
+    Merchant('DOORDASH', 'Doordash', 'Food & Dining', 31, 0.4, 4),
+    Merchant('MCDONALD S', 'Mcdonald S', 'Food & Dining', 11, 0.4, 4),
+    Merchant('BLUE DOOR CAFE', 'Blue Door Cafe', 'Food & Dining', 18, 0.4, 3),
+    Merchant('UBER TRIP', 'Uber Trip', 'Transportation', 19, 0.5, 5),
+    Merchant('LYFT RIDE', 'Lyft Ride', 'Transportation', 17, 0.5, 2),
+    Merchant('SHELL OIL', 'Shell Oil', 'Transportation', 44, 0.3, 4),
+    Merchant('CHEVRON', 'Chevron', 'Transportation', 47, 0.3, 3),
+    Merchant('CITY PARKING', 'City Parking', 'Transportation', 9, 0.5, 2),
+    Merchant('AMAZON MKTPLACE', 'Amazon Mktplace', 'Shopping', 34, 0.8, 8),
+    Merchant('TARGET', 'Target', 'Shopping', 52, 0.6, 5),
+    Merchant('WALMART SUPERCENTER', 'Walmart Supercenter', 'Shopping', 58, 0.6, 4),
+    Merchant('COSTCO WHSE', 'Costco Whse', 'Shopping', 140, 0.5, 2),
+    Merchant('BEST BUY', 'Best Buy', 'Shopping', 175, 0.8, 0.6),
+    Merchant('CVS PHARMACY', 'Cvs Pharmacy', 'Healthcare', 21, 0.6, 3),
+    Merchant('WALGREENS', 'Walgreens', 'Healthcare', 18, 0.6, 2),
+    Merchant('SMILE DENTAL CLINIC', 'Smile Dental Clinic', 'Healthcare', 160, 0.5, 0.3),
+    Merchant('AMC THEATER', 'Amc Theater', 'Entertainment', 27, 0.3, 1.5),
+    Merchant('STEAM PURCHASE', 'Steam Purchase', 'Entertainment', 24, 0.6, 1),
+    Merchant('DELTA AIRLINES', 'Delta Airlines', 'Travel', 380, 0.5, 0.4),
+    Merchant('AIRBNB', 'Airbnb', 'Travel', 420, 0.6, 0.3),
+    Merchant('MARRIOTT HOTEL', 'Marriott Hotel', 'Travel', 210, 0.4, 0.3),
+    Merchant('UDEMY', 'Udemy', 'Education', 16, 0.4, 0.3),
+    Merchant('CORNER MARKET', 'Corner Market', None, 12, 0.6, 3),
+    Merchant('VENMO PAYMENT', 'Venmo Payment', None, 40, 0.9, 2),
+]
+
+# Monthly bills: (description, name, category, median, chance a user has it, day of month)
+BILLS = [
+    ('CITY ELECTRIC UTILITY', 'City Electric Utility', 'Bills & Utilities', 95, 1.0, 12),
+    ('VERIZON WIRELESS', 'Verizon Wireless', 'Bills & Utilities', 85, 0.7, 18),
+    ('COMCAST XFINITY', 'Comcast Xfinity', 'Bills & Utilities', 70, 0.8, 22),
+    ('STATE FARM INSURANCE', 'State Farm Insurance', 'Bills & Utilities', 125, 0.9, 3),
+    ('NETFLIX.COM', 'Netflix', 'Entertainment', 15.49, 0.6, 7),
+    ('SPOTIFY USA', 'Spotify Usa', 'Entertainment', 10.99, 0.5, 14),
+    ('HULU', 'Hulu', 'Entertainment', 7.99, 0.3, 25),
+]
+# Utility bills follow heating and cooling
+UTILITY_SEASON = {1: 1.4, 2: 1.3, 7: 1.35, 8: 1.4, 12: 1.3}
+# Relative frequency of a category's spending by month, and on Saturdays and Sundays
+SEASONALITY = {
+    'Shopping': {11: 1.5, 12: 1.9, 1: 0.8},
+    'Travel': {6: 1.8, 7: 2.0, 8: 1.6, 12: 1.5},
+    'Food & Dining': {12: 1.2},
+}
+WEEKEND = {'Food & Dining': 1.4, 'Entertainment': 1.8, 'Shopping': 1.3}
+
+TRANSACTION_COLUMNS = ('bank_account_id', 'plaid_transaction_id', 'amount', 'date', 'description', 'merchant',
+                       'category_id', 'content_hash', 'created_version', 'change_version', 'created_at')
+
+def _pick(rng, items, cumulative):
+    return items[bisect(cumulative, rng.random() * cumulative[-1])]
+
+def _category_ids():
+    """Ids of the categories the generated rows use, creating any that do not exist yet"""
+    names = {m.category for m in MERCHANTS if m.category} | {bill[2] for bill in BILLS} | {'Income'}
+    ids = dict(db.session.execute(
+        select(Category.name, func.min(Category.id)).where(Category.name.in_(names)).group_by(Category.name)
+    ).all())
+    for name in names - ids.keys():
+        category = Category(name=name)
+        db.session.add(category)
+        db.session.flush()
+        ids[name] = category.id
+    return ids
+
+def _day_weights(days):
+    """Cumulative weights over `days` for each merchant category's spending"""
+    weights = {}
+    for category in {m.category for m in MERCHANTS}:
+        season, weekend = SEASONALITY.get(category, {}), WEEKEND.get(category, 1)
+        weights[category] = list(accumulate(
+            season.get(day.month, 1) * (weekend if day.weekday() >= 5 else 1) for day in days
+        ))
+    return weights
+
+class _Generator:
+    """Transaction rows for one run; see the module docstring"""
+
+    def __init__(self, seed, transactions, start, end, category_ids):
+        self.seed = seed
+        self.transactions = transactions
+        self.days = [start + timedelta(days=n) for n in range((end - start).days + 1)]
+        self.day_weights = _day_weights(self.days)
+        self.category_ids = category_ids
+        self.created_at = datetime.utcnow()
+
+    def rng(self, index):
+        return random.Random(f'{self.seed}-{index}')
+
+    def profile(self, index):
+        """Per-user traits, drawn before anything else from the user's stream"""
+        rng = self.rng(index)
+        return rng, {
+            'salary': round(rng.lognormvariate(math.log(2400), 0.35), 2),
+            'level': rng.lognormvariate(0, 0.3),
+            'city': rng.choice(CITIES),
+            'tastes': [m.weight * rng.lognormvariate(0, 0.8) for m in MERCHANTS],
+            'stores': [rng.randrange(100, 10000) for _ in MERCHANTS],
+            'bills': [bill for bill in BILLS if rng.random() < bill[4]],
+        }
+
+    def _row(self, account_id, number, amount, day, description, name, category):
+        category_id = self.category_ids[category] if category else None
+        return (account_id, f'seed-{self.seed}-{account_id}-{number}', amount, day, description, name, category_id,
+                content_hash(account_id, day, amount, description), 0, 0, self.created_at)
+
+    def _recurring(self, rng, traits, checking, card, savings):
+        """(account, amount, day, description, name, category) for salary, rent, bills and interest"""
+        rent = round(traits['salary'] * 0.8 / 5) * 5
+        for day in self.days:
+            if day.weekday() == 4 and (day - self.days[0]).days // 7 % 2 == 0:
+                yield checking, traits['salary'], day, 'ACME CORP PAYROLL', 'Acme Corp Payroll', 'Income'
+            if day.day == 1:
+                yield checking, -rent, day, 'RENT PAYMENT', 'Rent Payment', None
+                if savings:
+                    yield savings, round(rng.uniform(0.5, 12), 2), day, 'INTEREST PAYMENT', 'Interest Payment', None
+            for description, name, category, median, _, due in traits['bills']:
+                if day.day == due:
+                    amount = median
+                    if category == 'Bills & Utilities' and 'UTILITY' in description:
+                        amount = median * UTILITY_SEASON.get(day.month, 1) * rng.lognormvariate(0, 0.15)
+                    account = card if category == 'Entertainment' else checking
+                    yield account, -round(amount, 2), day, description, name, category
+
+    def rows(self, index, account_ids):
+        """Exactly `transactions` rows for the user at `index` with the given accounts"""
+        rng, traits = self.profile(index)
+        by_type = dict(zip(ACCOUNT_TYPES, account_ids))
+        checking = by_type['checking']
+        card, savings = by_type.get('credit', checking), by_type.get('savings')
+
+        recurring = list(self._recurring(rng, traits, checking, card, savings))
+        if len(recurring) > self.transactions:
+            recurring = rng.sample(recurring, self.transactions)
+        number = 0
+        for account, amount, day, description, name, category in recurring:
+            number += 1
+            yield self._row(account, number, amount, day, description, name, category)
+
+        indexes, tastes = range(len(MERCHANTS)), list(accumulate(traits['tastes']))
+        for _ in range(self.transactions - len(recurring)):
+            i = _pick(rng, indexes, tastes)
+            merchant = MERCHANTS[i]
+            day = _pick(rng, self.days, self.day_weights[merchant.category])
+            city = rng.choice(CITIES) if rng.random() < TRAVEL_SHARE else traits['city']
+            amount = max(0.5, merchant.median * traits['level'] * rng.lognormvariate(0, merchant.spread))
+            account = card if rng.random() < CARD_SHARE else checking
+            number += 1
+            yield self._row(account, number, -round(amount, 2), day,
+                            f"{merchant.description} #{traits['stores'][i]} {city}", merchant.name, merchant.category)
+
+    def budgets(self, index, user_id, count):
+        """Monthly budgets for the user's `count` biggest discretionary categories, a little above typical spend"""
+        _, traits = self.profile(index)
+        # Expected monthly spend per category: purchases a month times each merchant's share and ticket
+        per_month = self.transactions * 30 / len(self.days) * traits['level'] / sum(traits['tastes'])
+        expected = {}
+        for merchant, taste in zip(MERCHANTS, traits['tastes']):
+            if merchant.category:
+                expected[merchant.category] = expected.get(merchant.category, 0) + per_month * taste * merchant.median
+        top = sorted(expected, key=expected.get, reverse=True)[:count]
+        return [{'user_id': user_id, 'category_id': self.category_ids[category],
+                 'amount': max(10, round(expected[category] * 1.1, -1)),
+                 'created_at': self.created_at} for category in top]
+
+def email(seed, index):
+    return f'seed{seed}-user{index}@example.com'
+
+def generate(users, accounts=3, transactions=2000, days=730, end=None, seed=0, password='demo123', budgets=3,
+             progress=None):
+    """Create `users` users with `accounts` accounts each and `transactions` transactions per user.
+
+    Transactions fall in the `days` days up to `end` (default today);
+    accounts are checking, then a credit card, then savings. Users get
+    `budgets` budgets and their rollups are rebuilt. Commits every
+    USER_CHUNK_SIZE users and calls progress(users_done) after each chunk.
+    Raises ValueError when this seed's users already exist.
+
+    Returns {'users': n, 'accounts': n, 'transactions': n, 'budgets': n}.
+    """
+    if not 1 <= accounts <= len(ACCOUNT_TYPES):
+        raise ValueError(f'accounts must be between 1 and {len(ACCOUNT_TYPES)}')
+    if db.session.execute(select(User.id).where(User.email == email(seed, 0))).first():
+        raise ValueError(f'Users for seed {seed} already exist')
+    end = end or date.today()
+    generator = _Generator(seed, transactions, end - timedelta(days=days - 1), end, _category_ids())
+    hashed = password_service.hash_password(password)
+    counts = {'users': 0, 'accounts': 0, 'transactions': 0, 'budgets': 0}
+
+    for first in range(0, users, USER_CHUNK_SIZE):
+        indexes = range(first, min(first + USER_CHUNK_SIZE, users))
+        user_ids = db.session.execute(
+            insert(User).returning(User.id, sort_by_parameter_order=True),
+            [{'email': email(seed, i), 'full_name': f'Seed User {i}', 'hashed_password': hashed,
+              'created_at': generator.created_at} for i in indexes]
+        ).scalars().all()
+        account_ids = db.session.execute(
+            insert(BankAccount).returning(BankAccount.id, sort_by_parameter_order=True),
+            [{'user_id': user_id, 'plaid_account_id': f'seed-{seed}-{i}-{n}', 'institution_name': 'Seed Bank',
+              'account_name': f'{kind.title()} {n + 1}', 'account_type': kind, 'balance': 0,
+              'created_at': generator.created_at}
+             for i, user_id in zip(indexes, user_ids) for n, kind in enumerate(ACCOUNT_TYPES[:accounts])]
+        ).scalars().all()
+        budget_rows = [row for i, user_id in zip(indexes, user_ids)
+                       for row in generator.budgets(i, user_id, budgets)]
+        if budget_rows:
+            db.session.execute(insert(Budget), budget_rows)
+
+        rows = (
+            row for n, i in enumerate(indexes)
+            for row in generator.rows(i, account_ids[n * accounts:(n + 1) * accounts])
+        )
+        bulk_insert(db.session.connection(), Transaction.__table__, TRANSACTION_COLUMNS, rows)
+        rollup_service.rebuild(user_ids=user_ids)
+        db.session.commit()
+
+        counts['users'] += len(user_ids)
+        counts['accounts'] += len(account_ids)
+        counts['transactions'] += len(user_ids) * transactions
+        counts['budgets'] += len(budget_rows)
+        if progress:
+            progress(counts['users'])
+    return counts
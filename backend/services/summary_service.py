@@ -0,0 +1,154 @@
+from datetime import timedelta
+from sqlalchemy import and_, case, func, or_, select, union_all
+from database.models import db, BankAccount, Category, Transaction, DailyRollup, MonthlyRollup
+
+BREAKDOWNS = ('account', 'category')
+
+def _totals(income=0.0, expenses=0.0, count=0):
+    return {
+        'income': float(income),
+        'expenses': float(expenses),
+        'net': float(income) - float(expenses),
+        'count': int(count)
+    }
+
+def _add(bucket, row):
+    bucket['income'] += float(row.income)
+    bucket['expenses'] += float(row.expenses)
+    bucket['net'] = bucket['income'] - bucket['expenses']
+    bucket['count'] += int(row.count)
+
+def _check_breakdowns(breakdowns):
+    unknown = set(breakdowns) - set(BREAKDOWNS)
+    if unknown:
+        raise ValueError(f"Unknown breakdown(s): {', '.join(sorted(unknown))}")
+
+def _fold(stmt, account_id, category_id, breakdowns, accounts_joined=False, session=None):
+    """Run an aggregate statement, grouping by the requested dimensions, and fold its rows.
+
+    `stmt` must select income, expenses and count columns from a FROM clause
+    that can be joined to bank_accounts/categories on `account_id` and
+    `category_id`. The grouped rows are constant-size, so folding them in
+    Python is cheap.
+    """
+    session = session or db.session
+    if not breakdowns:
+        row = session.execute(stmt).one()
+        return _totals(row.income, row.expenses, row.count)
+
+    group_by = []
+    if 'account' in breakdowns:
+        if not accounts_joined:
+            stmt = stmt.join(BankAccount, account_id == BankAccount.id)
+        group_by += [BankAccount.id.label('account_id'), BankAccount.account_name]
+    if 'category' in breakdowns:
+        stmt = stmt.outerjoin(Category, category_id == Category.id)
+        group_by += [category_id.label('category_id'), Category.name.label('category_name')]
+    stmt = stmt.add_columns(*group_by).group_by(*group_by)
+
+    summary = _totals()
+    by_account = {}
+    by_category = {}
+    for row in session.execute(stmt):
+        _add(summary, row)
+        if 'account' in breakdowns:
+            bucket = by_account.setdefault(row.account_id, {
+                'account_id': row.account_id,
+                'account_name': row.account_name,
+                **_totals()
+            })
+            _add(bucket, row)
+        if 'category' in breakdowns:
+            # Rollups store uncategorized rows under category 0
+            category = row.category_id or None
+            bucket = by_category.setdefault(category, {
+                'category_id': category,
+                'category': row.category_name,
+                **_totals()
+            })
+            _add(bucket, row)
+
+    if 'account' in breakdowns:
+        summary['by_account'] = [by_account[key] for key in sorted(by_account)]
+    if 'category' in breakdowns:
+        summary['by_category'] = [by_category[key] for key in sorted(by_category, key=lambda k: (k is None, k or 0))]
+    return summary
+
+def _next_month(day):
+    return (day.replace(day=1) + timedelta(days=32)).replace(day=1)
+
+def _split_window(start_date, end_date):
+    """Split [start_date, end_date] into whole months plus leading/trailing days.
+
+    Returns (first_month, end_month) as a half-open range of month starts;
+    every day in the window outside that range is read from daily rollups.
+    """
+    first_month = start_date if start_date.day == 1 else _next_month(start_date)
+    end_month = _next_month(end_date) if (end_date + timedelta(days=1)).day == 1 else end_date.replace(day=1)
+    if first_month >= end_month:
+        return None, None
+    return first_month, end_month
+
+def summarize(user_id, start_date, end_date, breakdowns=(), session=None):
+    """Income, expenses, net and count for a user between two dates, read from the rollup tables.
+
+    Whole months inside the window come from monthly_rollups and the remaining
+    days from daily_rollups, so the cost depends on the length of the window
+    rather than on how many transactions it contains. `session` defaults to
+    the app's db.session; the async endpoints pass their own.
+    """
+    _check_breakdowns(breakdowns)
+
+    def part(model, condition):
+        return select(
+            model.bank_account_id.label('account_id'),
+            model.category_id.label('category_id'),
+            model.income.label('income'),
+            model.expenses.label('expenses'),
+            model.transaction_count.label('transaction_count')
+        ).where(model.user_id == user_id, condition)
+
+    first_month, end_month = _split_window(start_date, end_date)
+    if first_month is None:
+        rollups = part(DailyRollup, DailyRollup.day.between(start_date, end_date))
+    else:
+        rollups = union_all(
+            part(MonthlyRollup, and_(MonthlyRollup.month >= first_month, MonthlyRollup.month < end_month)),
+            part(DailyRollup, or_(
+                and_(DailyRollup.day >= start_date, DailyRollup.day < first_month),
+                and_(DailyRollup.day >= end_month, DailyRollup.day <= end_date)
+            ))
+        )
+    rollups = rollups.subquery('rollups')
+
+    stmt = select(
+        func.coalesce(func.sum(rollups.c.income), 0).label('income'),
+        func.coalesce(func.sum(rollups.c.expenses), 0).label('expenses'),
+        func.coalesce(func.sum(rollups.c.transaction_count), 0).label('count'),
+    ).select_from(rollups)
+    return _fold(stmt, rollups.c.account_id, rollups.c.category_id, breakdowns, session=session)
+
+def summarize_transactions(user_id, start_date, end_date, breakdowns=()):
+    """Same as summarize() but aggregated directly from the transactions table.
+
+    Everything is computed by a single joined SUM(CASE ...) statement; used
+    when rollups cannot be trusted and to verify them.
+    """
+    _check_breakdowns(breakdowns)
+
+    income = func.coalesce(func.sum(case((Transaction.amount > 0, Transaction.amount), else_=0)), 0)
+    expenses = func.coalesce(func.sum(case((Transaction.amount < 0, -Transaction.amount), else_=0)), 0)
+    stmt = (
+        select(
+            income.label('income'),
+            expenses.label('expenses'),
+            func.count(Transaction.id).label('count')
+        )
+        .select_from(Transaction)
+        .join(BankAccount, Transaction.bank_account_id == BankAccount.id)
+        .where(
+            BankAccount.user_id == user_id,
+            Transaction.date.between(start_date, end_date)
+        )
+    )
+    return _fold(stmt, Transaction.bank_account_id, Transaction.category_id, breakdowns, accounts_joined=True)
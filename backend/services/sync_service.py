@@ -0,0 +1,296 @@
+import json
+import logging
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from itertools import chain, zip_longest
+from flask import current_app
+from plaid import ApiException
+from database.models import db, BankAccount, PlaidItem, content_hash
+from services import category_service, identity_service, job_service, metrics
+from services.ingest_service import DEFAULT_CHUNK_SIZE, bump_data_version, upsert_transactions, delete_transactions
+from services.plaid_service import PlaidService
+
+logger = logging.getLogger(__name__)
+
+MUTATION_DURING_PAGINATION = 'TRANSACTIONS_SYNC_MUTATION_DURING_PAGINATION'
+MAX_PAGINATION_RESTARTS = 3
+PAGE_SIZE = 500
+FETCH_CONCURRENCY = 8
+FETCH_PER_INSTITUTION = 2
+# Times a sync re-fetches an item another worker synced while it was fetching
+MAX_CURSOR_RACES = 3
+
+LINK_ITEM = 'link_item'
+SYNC_USER = 'sync_user'
+
+_plaid_service = None
+
+def get_plaid_service():
+    """The PlaidService shared by background jobs, created on first use"""
+    global _plaid_service
+    if _plaid_service is None:
+        _plaid_service = PlaidService()
+    return _plaid_service
+
+def _error_code(error):
+    try:
+        return json.loads(error.body).get('error_code')
+    except (TypeError, ValueError, AttributeError):
+        return None
+
+def fetch_updates(plaid_service, access_token, cursor=None, page_size=PAGE_SIZE, institution=None):
+    """Page through /transactions/sync from `cursor` until has_more is false.
+
+    Nothing is written here. If Plaid reports that the data changed while we
+    were paginating, the whole run restarts from the original cursor, as
+    Plaid requires. Because the stored cursor only moves once a complete run
+    has been applied, an interrupted sync simply resumes from it next time.
+    """
+    for _ in range(MAX_PAGINATION_RESTARTS + 1):
+        batch = {'added': [], 'modified': [], 'removed': [], 'next_cursor': cursor, 'pages': 0, 'bytes': 0}
+        try:
+            while True:
+                page, size = plaid_service.sync_transactions(
+                    access_token, batch['next_cursor'], page_size, institution=institution
+                )
+                batch['added'] += page['added']
+                batch['modified'] += page['modified']
+                batch['removed'] += page['removed']
+                batch['next_cursor'] = page['next_cursor']
+                batch['pages'] += 1
+                batch['bytes'] += size
+                if not page['has_more']:
+                    return batch
+        except ApiException as e:
+            if _error_code(e) != MUTATION_DURING_PAGINATION:
+                raise
+            logger.info('Transactions changed during pagination, restarting sync from the stored cursor')
+    raise RuntimeError('Plaid transactions kept changing during pagination')
+
+def _transaction_fields(data, bank_account_id):
+    """Map a Plaid transaction onto Transaction columns"""
+    fields = {
+        'bank_account_id': bank_account_id,
+        'plaid_transaction_id': data['transaction_id'],
+        'amount': data['amount'],
+        'date': datetime.strptime(data['date'], '%Y-%m-%d').date(),
+        'description': data.get('name', ''),
+        'merchant': data.get('merchant_name')
+    }
+    # Set here rather than by the column default so a modified row's hash is updated too
+    fields['content_hash'] = content_hash(bank_account_id, fields['date'], fields['amount'], fields['description'])
+    return fields
+
+def apply_updates(item, batch, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Apply a fetched batch to the database and advance the item's cursor.
+
+    Added and modified rows are categorized by the user's rules, then
+    bulk-upserted by plaid_transaction_id, and removed rows deleted, with
+    rollups adjusted by the difference. The caller commits, so the data and
+    the cursor move together.
+    """
+    accounts = {
+        account.plaid_account_id: account.id
+        for account in BankAccount.query.filter_by(user_id=item.user_id)
+    }
+    rows, skipped = [], 0
+    for data in batch['added'] + batch['modified']:
+        bank_account_id = accounts.get(data['account_id'])
+        if bank_account_id is None:
+            skipped += 1
+            continue
+        rows.append(_transaction_fields(data, bank_account_id))
+
+    category_service.categorize(item.user_id, rows)
+    counts = upsert_transactions(item.user_id, rows, chunk_size)
+    counts['deleted'] = delete_transactions(
+        item.user_id, [data['transaction_id'] for data in batch['removed']], chunk_size
+    )
+    counts['skipped'] = skipped
+
+    item.transactions_cursor = batch['next_cursor']
+    item.last_synced_at = datetime.utcnow()
+    return counts
+
+def _institution(item):
+    if item.institution_name:
+        return item.institution_name
+    return next((account.institution_name for account in item.bank_accounts), None) or 'unknown'
+
+def fetch_all(plaid_service, items, max_workers=FETCH_CONCURRENCY, per_institution=FETCH_PER_INSTITUTION):
+    """Run fetch_updates for several items at once.
+
+    At most `max_workers` items are fetched in parallel, and at most
+    `per_institution` of them against the same institution. Work is queued
+    round-robin across institutions so a user with many items at one bank does
+    not hold every worker waiting on that bank's limit.
+
+    Returns {item_id: batch or the exception raised while fetching it}. No
+    ORM objects are touched off the calling thread. Plaid calls made by the
+    fetches join the caller's trace.
+    """
+    return _fetch(plaid_service, _fetch_entries(items), max_workers, per_institution)
+
+def _fetch_entries(items):
+    """(institution, item id, access token, cursor) per item: everything a fetch needs from the database"""
+    return [(_institution(item), item.id, item.access_token, item.transactions_cursor) for item in items]
+
+def _fetch(plaid_service, entries, max_workers, per_institution):
+    by_institution = defaultdict(list)
+    for institution, *entry in entries:
+        by_institution[institution].append(tuple(entry))
+    limits = {name: threading.BoundedSemaphore(per_institution) for name in by_institution}
+    rounds = zip_longest(*[[(name, *job) for job in jobs] for name, jobs in by_institution.items()])
+    queue = [entry for entry in chain.from_iterable(rounds) if entry]
+    if not queue:
+        return {}
+
+    def fetch(entry):
+        institution, item_id, access_token, cursor = entry
+        with limits[institution]:
+            try:
+                return item_id, fetch_updates(plaid_service, access_token, cursor, institution=institution)
+            except Exception as e:
+                logger.warning('Fetching Plaid item %s failed: %s', item_id, e)
+                return item_id, e
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(queue)))) as pool:
+        return dict(pool.map(metrics.traced(fetch), queue))
+
+def _stats(item, batch, counts):
+    stats = {
+        'item_id': item.id,
+        'added': len(batch['added']),
+        'modified': len(batch['modified']),
+        'removed': len(batch['removed']),
+        'pages': batch['pages'],
+        'bytes': batch['bytes'],
+        **counts
+    }
+    logger.info('Synced Plaid item %(item_id)s: %(added)d added, %(modified)d modified, '
+                '%(removed)d removed in %(pages)d page(s), %(bytes)d bytes; '
+                '%(inserted)d inserted, %(updated)d updated, %(unchanged)d unchanged', stats)
+    return stats
+
+def sync_item(plaid_service, item):
+    """Fetch and apply everything that changed for one Plaid item since its stored cursor"""
+    batch = fetch_updates(plaid_service, item.access_token, item.transactions_cursor)
+    counts = apply_updates(item, batch, current_app.config['INGEST_CHUNK_SIZE'])
+    db.session.commit()
+    return _stats(item, batch, counts)
+
+def sync_items(plaid_service, items):
+    """Sync several Plaid items: fetch them concurrently, then apply every result in one short transaction.
+
+    No transaction is open and no row locked while Plaid is called, however
+    long its retries take. The items are then locked and each one is only
+    applied if its cursor is still the one fetched from; one that another
+    worker synced meanwhile is fetched again from its new cursor, up to
+    MAX_CURSOR_RACES times. An item whose fetch failed is reported with an
+    'error' and keeps its cursor, so the next sync retries it; the others
+    are still applied.
+    """
+    config = current_app.config
+    order = [item.id for item in items]
+    entries = _fetch_entries(items)
+    results = {}
+    for _ in range(MAX_CURSOR_RACES):
+        db.session.commit()
+        fetched = _fetch(plaid_service, entries, config['PLAID_FETCH_CONCURRENCY'], config['PLAID_FETCH_PER_INSTITUTION'])
+        cursors = {item_id: cursor for _, item_id, _, cursor in entries}
+        moved = []
+        for item in (PlaidItem.query.filter(PlaidItem.id.in_(cursors)).order_by(PlaidItem.id)
+                     .with_for_update().populate_existing()):
+            batch = fetched[item.id]
+            if item.transactions_cursor != cursors[item.id]:
+                moved.append(item)
+            elif isinstance(batch, Exception):
+                results[item.id] = {'item_id': item.id, 'error': str(batch)}
+            else:
+                results[item.id] = _stats(item, batch, apply_updates(item, batch, config['INGEST_CHUNK_SIZE']))
+        if not moved:
+            db.session.commit()
+            break
+        logger.info('Plaid item(s) %s were synced by another worker meanwhile; fetching again',
+                    [item.id for item in moved])
+        entries = _fetch_entries(moved)
+    else:
+        db.session.commit()
+        for item_id in cursors:
+            results.setdefault(item_id, {'item_id': item_id, 'error': 'Kept being synced by another worker'})
+    return [results[item_id] for item_id in order if item_id in results]
+
+def totals(results):
+    """Aggregate per-item sync results into the response/job result shape"""
+    synced = [r for r in results if 'error' not in r]
+    return {
+        'added': sum(r['added'] for r in synced),
+        'modified': sum(r['modified'] for r in synced),
+        'removed': sum(r['removed'] for r in synced),
+        'bytes': sum(r['bytes'] for r in synced),
+        'errors': len(results) - len(synced),
+        'items': results
+    }
+
+def link_accounts(plaid_service, item, accounts=None):
+    """Store the accounts behind a Plaid item that are not stored yet.
+
+    `accounts` are the item's accounts as already fetched from Plaid, if
+    they were. Adding any bumps the user's data version, which keeps their
+    reads on the primary until replicas have the new accounts.
+    """
+    known = {account.plaid_account_id for account in item.bank_accounts}
+    added = False
+    for account in plaid_service.get_accounts(item.access_token) if accounts is None else accounts:
+        if account['account_id'] in known:
+            continue
+        added = True
+        db.session.add(BankAccount(
+            user_id=item.user_id,
+            plaid_item=item,
+            plaid_account_id=account['account_id'],
+            institution_name=account.get('institution_name', 'Unknown'),
+            account_name=account.get('name', 'Unknown'),
+            account_type=str(account.get('type', 'Unknown')),
+            balance=account.get('balances', {}).get('current', 0)
+        ))
+    if added:
+        bump_data_version(item.user_id)
+        identity_service.invalidate_on_commit(item.user_id)
+
+def enqueue_link(item):
+    return job_service.enqueue(LINK_ITEM, {'item_id': item.id}, dedupe_key=f'{LINK_ITEM}:{item.id}')
+
+def enqueue_sync(user_id):
+    return job_service.enqueue(SYNC_USER, {'user_id': int(user_id)}, dedupe_key=f'{SYNC_USER}:{user_id}')
+
+# Both jobs call Plaid with no transaction open, then lock the items they
+# write for a short transaction. Two workers syncing the same item never
+# apply overlapping batches: the second finds the cursor moved and fetches
+# again from it.
+
+@job_service.handler(LINK_ITEM)
+def link_item_job(payload):
+    """Fetch a newly linked item's accounts, then run its first sync"""
+    item = db.session.get(PlaidItem, payload['item_id'])
+    access_token = item.access_token
+    db.session.commit()
+    accounts = get_plaid_service().get_accounts(access_token)
+    item = PlaidItem.query.filter_by(id=payload['item_id']).with_for_update().populate_existing().one()
+    link_accounts(get_plaid_service(), item, accounts)
+    db.session.commit()
+    result = totals(sync_items(get_plaid_service(), [item]))
+    if result['errors']:
+        raise RuntimeError(result['items'][0]['error'])
+    return result
+
+@job_service.handler(SYNC_USER)
+def sync_user_job(payload):
+    """Sync every Plaid item a user has linked"""
+    items = PlaidItem.query.filter_by(user_id=payload['user_id']).order_by(PlaidItem.id).all()
+    result = totals(sync_items(get_plaid_service(), items))
+    if items and result['errors'] == len(items):
+        raise RuntimeError('Fetching transactions from Plaid failed for every item')
+    return result
@@ -0,0 +1,152 @@
+import base64
+import json
+from datetime import date
+from sqlalchemy import select, tuple_
+from database.models import db, BankAccount, Category, Transaction, TransactionTombstone
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+STREAM_BATCH_SIZE = 500
+MAX_CHANGES = 5000
+
+def encode_cursor(row):
+    """Opaque keyset cursor pointing just after `row` in (date DESC, id DESC) order"""
+    raw = f"{row.date.isoformat()}:{row.id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        day, transaction_id = raw.split(':')
+        return date.fromisoformat(day), int(transaction_id)
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError('Invalid cursor')
+
+def _user_rows(user_id):
+    """A user's transactions with the serialized columns, joined through bank_accounts"""
+    return (
+        select(
+            Transaction.id,
+            Transaction.date,
+            Transaction.description,
+            Transaction.amount,
+            Category.name.label('category'),
+            Transaction.merchant
+        )
+        .join(BankAccount, Transaction.bank_account_id == BankAccount.id)
+        .outerjoin(Category, Transaction.category_id == Category.id)
+        .where(BankAccount.user_id == user_id)
+    )
+
+def listing_query(user_id, start_date, end_date):
+    """Newest-first transactions for a user, joined through bank_accounts in one statement"""
+    return (
+        _user_rows(user_id)
+        .where(Transaction.date.between(start_date, end_date))
+        .order_by(Transaction.date.desc(), Transaction.id.desc())
+    )
+
+def serialize(row):
+    return {
+        'id': row.id,
+        'date': row.date.isoformat(),
+        'description': row.description,
+        'amount': row.amount,
+        'category': row.category,
+        'merchant': row.merchant
+    }
+
+def get_page(user_id, start_date, end_date, limit=DEFAULT_PAGE_SIZE, cursor=None, session=None):
+    """One keyset page of transactions plus the cursor for the next page (None on the last page)"""
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    stmt = listing_query(user_id, start_date, end_date)
+    if cursor:
+        stmt = stmt.where(tuple_(Transaction.date, Transaction.id) < tuple_(*decode_cursor(cursor)))
+    rows = (session or db.session).execute(stmt.limit(limit + 1)).all()
+    next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return [serialize(row) for row in rows[:limit]], next_cursor
+
+def changes_since(user_id, since, limit=MAX_CHANGES):
+    """Transactions added, modified and removed after data version `since`.
+
+    Returns None when more than `limit` rows changed, in which case
+    reloading the full listing is cheaper for the client than the delta.
+    """
+    rows = db.session.execute(
+        _user_rows(user_id)
+        .add_columns(Transaction.created_version)
+        .where(Transaction.change_version > since)
+        .order_by(Transaction.change_version, Transaction.id)
+        .limit(limit + 1)
+    ).all()
+    removed = db.session.execute(
+        select(TransactionTombstone.transaction_id)
+        .where(TransactionTombstone.user_id == user_id, TransactionTombstone.change_version > since)
+        .order_by(TransactionTombstone.change_version, TransactionTombstone.transaction_id)
+        .limit(limit + 1)
+    ).scalars().all()
+    if len(rows) > limit or len(removed) > limit:
+        return None
+    return {
+        'added': [serialize(row) for row in rows if row.created_version > since],
+        'modified': [serialize(row) for row in rows if row.created_version <= since],
+        'removed': removed
+    }
+
+def iter_transactions(user_id, start_date, end_date, batch_size=STREAM_BATCH_SIZE):
+    """Yield serialized transactions as they are fetched.
+
+    yield_per streams results through a server-side cursor on Postgres, so
+    only `batch_size` rows are held in memory at a time.
+    """
+    stmt = listing_query(user_id, start_date, end_date).execution_options(yield_per=batch_size)
+    for row in db.session.execute(stmt):
+        yield serialize(row)
+
+def _chunked(pieces, size=STREAM_BATCH_SIZE):
+    """Join small string pieces so each response chunk carries many rows"""
+    buffer = []
+    for piece in pieces:
+        buffer.append(piece)
+        if len(buffer) >= size:
+            yield ''.join(buffer)
+            buffer = []
+    if buffer:
+        yield ''.join(buffer)
+
+def iter_json_array(transactions):
+    """Encode an iterable of serialized transactions as a streamed JSON array"""
+    def pieces():
+        yield '['
+        for i, transaction in enumerate(transactions):
+            yield (',' if i else '') + json.dumps(transaction)
+        yield ']'
+    return _chunked(pieces())
+
+def iter_ndjson(transactions):
+    return _chunked(json.dumps(transaction) + '\n' for transaction in transactions)
+
+async def aiter_transaction_batches(session, user_id, start_date, end_date, batch_size=STREAM_BATCH_SIZE):
+    """iter_transactions() for an AsyncSession, yielding lists of up to `batch_size` serialized rows.
+
+    Working a batch at a time keeps the per-row cost of async iteration,
+    and of switching into the database driver, out of the loop.
+    """
+    stmt = listing_query(user_id, start_date, end_date).execution_options(yield_per=batch_size)
+    result = await session.stream(stmt)
+    async for rows in result.partitions():
+        yield [serialize(row) for row in rows]
+
+async def aiter_json_array(batches):
+    """iter_json_array() for batches from aiter_transaction_batches(), one chunk per batch"""
+    yield '['
+    first = True
+    async for batch in batches:
+        if batch:
+            yield ('' if first else ',') + ','.join(json.dumps(transaction) for transaction in batch)
+            first = False
+    yield ']'
+
+async def aiter_ndjson(batches):
+    async for batch in batches:
+        yield ''.join(json.dumps(transaction) + '\n' for transaction in batch)
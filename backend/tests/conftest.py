@@ -0,0 +1,18 @@
+import os
+
+# Point the app at a throwaway database before any test module imports it.
+# Set TEST_DATABASE_URL to run the suite against a real Postgres instance.
+os.environ['DATABASE_URL'] = os.getenv('TEST_DATABASE_URL', 'sqlite://')
+
+# Tests talk to local fake Plaid servers, never the real API
+os.environ.setdefault('PLAID_CLIENT_ID', 'test-client-id')
+os.environ.setdefault('PLAID_SECRET', 'test-secret')
+
+# Keep Plaid retry backoff short so retried fake-server errors do not slow the suite
+os.environ.setdefault('PLAID_RETRY_BASE_DELAY', '0.01')
+
+# Cheap password hashes; the tests exercise the pool, not the hash cost
+os.environ.setdefault('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:1000')
+
+# The suite exercises the operational endpoints
+os.environ.setdefault('OPS_ENDPOINTS_ENABLED', 'true')
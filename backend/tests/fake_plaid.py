@@ -0,0 +1,120 @@
+import json
+import socket
+import struct
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+class FakePlaidServer:
+    """A local stand-in for the Plaid API that replays recorded responses.
+
+    `responses` maps an endpoint path to {token: {cursor: [response, ...]}}
+    where token is the request's access_token (or public_token) and the
+    cursor key is '' for an initial sync or a request without one. Each request consumes the
+    first queued response for its key; the last one is repeated once the
+    queue runs dry. A response is either a JSON body,
+    {"status": 429, "body": {...}, "headers": {...}} for an error, or
+    {"reset": true} to drop the connection without answering.
+
+    `latency` delays every response by that many seconds, or by
+    latency[access_token] when it is a dict. `max_in_flight` records the
+    highest number of requests served at the same time and `connections`
+    how many client connections were opened; the server speaks HTTP/1.1 so
+    clients can keep connections alive.
+    """
+
+    def __init__(self, responses, latency=0):
+        self.responses = responses
+        self.latency = latency
+        self.requests = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.connections = 0
+        self.lock = threading.Lock()
+        handler = type('Handler', (_Handler,), {'fake': self})
+        self.httpd = _Server(('127.0.0.1', 0), handler)
+        self.url = f'http://127.0.0.1:{self.httpd.server_port}'
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @classmethod
+    def from_fixture(cls, path):
+        with open(path) as f:
+            return cls(json.load(f))
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def delay(self, body):
+        if isinstance(self.latency, dict):
+            return self.latency.get(body.get('access_token'), 0)
+        return self.latency
+
+    def serve(self, path, body):
+        with self.lock:
+            self.requests.append((path, body))
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            time.sleep(self.delay(body))
+            return self.respond(path, body)
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+    def respond(self, path, body):
+        token = body.get('access_token') or body.get('public_token')
+        with self.lock:
+            queue = self.responses.get(path, {}).get(token, {}).get(body.get('cursor') or '')
+            if not queue:
+                return 400, {'error_code': 'INVALID_INPUT', 'error_message': f'no recorded response for {path}'}, {}
+            response = queue.pop(0) if len(queue) > 1 else queue[0]
+        if response.get('reset'):
+            return None, None, {}
+        if 'status' in response:
+            return response['status'], response['body'], response.get('headers', {})
+        return 200, response, {}
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Connections reset on purpose, or dropped by a client that timed out, are expected
+        if not isinstance(sys.exc_info()[1], OSError):
+            super().handle_error(request, client_address)
+
+class _Handler(BaseHTTPRequestHandler):
+    fake = None
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        super().setup()
+        with self.fake.lock:
+            self.fake.connections += 1
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        body = json.loads(self.rfile.read(length) or b'{}')
+        status, payload, headers = self.fake.serve(self.path, body)
+        if status is None:
+            # SO_LINGER 0 makes close() send a TCP RST
+            self.connection.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack('ii', 1, 0))
+            self.connection.close()
+            self.close_connection = True
+            return
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in headers.items():
+            self.send_header(name, str(value))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
@@ -0,0 +1,86 @@
+import socketserver
+import threading
+import time
+
+class FakeRedisServer:
+    """A local stand-in for Redis speaking just enough RESP for the response cache.
+
+    Supports PING, SELECT, GET, SET (with EX/PX), DEL, FLUSHDB and INFO.
+    Expired keys are dropped, and counted, when they are next read.
+    """
+
+    def __init__(self):
+        self.data = {}
+        self.expired_keys = 0
+        self.commands = []
+        self.lock = threading.Lock()
+        handler = type('Handler', (_Handler,), {'fake': self})
+        self.server = socketserver.ThreadingTCPServer(('127.0.0.1', 0), handler)
+        self.server.daemon_threads = True
+        self.url = f'redis://127.0.0.1:{self.server.server_address[1]}/0'
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def execute(self, name, *args):
+        with self.lock:
+            self.commands.append(name)
+            if name == 'PING':
+                return 'PONG'
+            if name in ('SELECT', 'FLUSHDB'):
+                if name == 'FLUSHDB':
+                    self.data.clear()
+                return 'OK'
+            if name == 'GET':
+                value, expires = self.data.get(args[0], (None, None))
+                if expires is not None and expires <= time.monotonic():
+                    del self.data[args[0]]
+                    self.expired_keys += 1
+                    return None
+                return value
+            if name == 'SET':
+                expires = None
+                options = [a.upper() for a in args[2:]]
+                if b'PX' in options:
+                    expires = time.monotonic() + int(args[3 + options.index(b'PX')]) / 1000
+                elif b'EX' in options:
+                    expires = time.monotonic() + int(args[3 + options.index(b'EX')])
+                self.data[args[0]] = (args[1], expires)
+                return 'OK'
+            if name == 'DEL':
+                return sum(self.data.pop(key, None) is not None for key in args)
+            if name == 'INFO':
+                return f'# Stats\r\nexpired_keys:{self.expired_keys}\r\nevicted_keys:0\r\n'.encode()
+            return Exception(f'ERR unknown command {name}')
+
+class _Handler(socketserver.StreamRequestHandler):
+    fake = None
+
+    def handle(self):
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            args = []
+            for _ in range(int(line[1:-2])):
+                length = int(self.rfile.readline()[1:-2])
+                args.append(self.rfile.read(length + 2)[:-2])
+            reply = self.fake.execute(args[0].decode().upper(), *args[1:])
+            self.wfile.write(_encode(reply))
+
+def _encode(reply):
+    if reply is None:
+        return b'$-1\r\n'
+    if isinstance(reply, Exception):
+        return f'-{reply}\r\n'.encode()
+    if isinstance(reply, int):
+        return f':{reply}\r\n'.encode()
+    if isinstance(reply, str):
+        return f'+{reply}\r\n'.encode()
+    return b'$%d\r\n%s\r\n' % (len(reply), reply)
@@ -0,0 +1,76 @@
+import unittest
+from datetime import date
+from itertools import count
+from flask_jwt_extended import create_access_token
+from app import app
+from database.models import db, User, BankAccount, Transaction, Category
+from services import cache, category_service, identity_service, plaid_client
+
+_ids = count(1)
+
+class DatabaseTestCase(unittest.TestCase):
+    """Creates a fresh schema for every test and offers small seeding helpers"""
+
+    def setUp(self):
+        self.app = app
+        self.client = app.test_client()
+        self.ctx = app.app_context()
+        self.ctx.push()
+        db.drop_all()
+        db.create_all()
+        plaid_client.reset_breakers()
+        # Ids restart with every schema, so cached responses must not leak between tests
+        cache.init_app(self.app)
+        identity_service.init_app(self.app)
+        category_service.init_app(self.app)
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
+
+    def make_user(self, email=None):
+        user = User(
+            email=email or f'user{next(_ids)}@example.com',
+            full_name='Test User',
+            hashed_password='x'
+        )
+        db.session.add(user)
+        db.session.commit()
+        return user
+
+    def make_account(self, user, name='Checking', institution='Test Bank'):
+        account = BankAccount(
+            user_id=user.id,
+            plaid_account_id=f'acc-{next(_ids)}',
+            institution_name=institution,
+            account_name=name,
+            account_type='depository',
+            balance=0
+        )
+        db.session.add(account)
+        db.session.commit()
+        return account
+
+    def make_category(self, name):
+        category = Category(name=name)
+        db.session.add(category)
+        db.session.commit()
+        return category
+
+    def add_transaction(self, account, amount, on=None, category=None, description='Test', **fields):
+        fields.setdefault('plaid_transaction_id', f'txn-{next(_ids)}')
+        transaction = Transaction(
+            bank_account_id=account.id,
+            amount=amount,
+            date=on or date.today(),
+            description=description,
+            category_id=category.id if category else None,
+            **fields
+        )
+        db.session.add(transaction)
+        db.session.commit()
+        return transaction
+
+    def auth_headers(self, user):
+        return {'Authorization': f'Bearer {create_access_token(identity=user.id)}'}
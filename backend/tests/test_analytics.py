@@ -0,0 +1,111 @@
+import unittest
+from datetime import date, timedelta
+from sqlalchemy import event
+from helpers import DatabaseTestCase
+from database.models import db
+from services.analytics_service import analyze
+from services.summary_service import summarize_transactions
+
+class TestAnalyticsService(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = self.make_user()
+        self.checking = self.make_account(self.user, 'Checking')
+        self.card = self.make_account(self.user, 'Card')
+        self.food = self.make_category('Food & Dining')
+        self.travel = self.make_category('Travel')
+        self.today = date.today()
+        self.last_month = (self.today.replace(day=1) - timedelta(days=1)).replace(day=1)
+
+        self.add_transaction(self.checking, 2000, self.today, description='Paycheck')
+        self.add_transaction(self.checking, -30, self.today, self.food, merchant='Cafe')
+        self.add_transaction(self.card, -20, self.today, self.food, merchant='Cafe')
+        self.add_transaction(self.card, -45, self.last_month, self.food, merchant='Grocer')
+        self.add_transaction(self.card, -300, self.last_month, self.travel, merchant='Airline')
+        # Outside the window and owned by another user
+        self.add_transaction(self.checking, -500, self.today - timedelta(days=400), self.travel)
+        self.add_transaction(self.make_account(self.make_user()), -999, self.today, self.food, merchant='Cafe')
+        self.start = self.last_month
+
+    def test_breakdowns(self):
+        result = analyze(self.user.id, self.start, self.today)
+        self.assertEqual(result['totals'], {'income': 2000.0, 'expenses': 395.0, 'net': 1605.0, 'count': 5})
+
+        self.assertEqual(
+            [(c['category'], c['expenses'], c['count']) for c in result['by_category']],
+            [('Travel', 300.0, 1), ('Food & Dining', 95.0, 3), (None, 0.0, 1)]
+        )
+        self.assertEqual(result['by_category'][0]['category_id'], self.travel.id)
+        self.assertEqual(
+            [(m['merchant'], m['expenses']) for m in result['by_merchant']],
+            [('Airline', 300.0), ('Cafe', 50.0), ('Grocer', 45.0), (None, 0.0)]
+        )
+        self.assertEqual(
+            [(a['account_name'], a['net']) for a in result['by_account']],
+            [('Card', -365.0), ('Checking', 1970.0)]
+        )
+        self.assertEqual(
+            [(m['month'], m['expenses']) for m in result['by_month']],
+            [(self.last_month.isoformat(), 345.0), (self.today.replace(day=1).isoformat(), 50.0)]
+        )
+
+    def test_totals_match_summary(self):
+        start = self.today - timedelta(days=450)
+        totals = analyze(self.user.id, start, self.today, ['account'])['totals']
+        self.assertEqual(totals, summarize_transactions(self.user.id, start, self.today))
+
+    def test_top_limits_ranked_dimensions_only(self):
+        result = analyze(self.user.id, self.start, self.today, top=1)
+        self.assertEqual([c['category'] for c in result['by_category']], ['Travel'])
+        self.assertEqual([m['merchant'] for m in result['by_merchant']], ['Airline'])
+        self.assertEqual([a['account_name'] for a in result['by_account']], ['Card'])
+        self.assertEqual(len(result['by_month']), 2)
+        self.assertEqual(result['totals']['count'], 5)
+
+    def test_selected_dimensions(self):
+        result = analyze(self.user.id, self.start, self.today, ['merchant'], top=2)
+        self.assertEqual(set(result), {'totals', 'by_merchant'})
+        self.assertEqual(len(result['by_merchant']), 2)
+        self.assertEqual(analyze(self.user.id, self.start, self.today, []), {
+            'totals': {'income': 2000.0, 'expenses': 395.0, 'net': 1605.0, 'count': 5}
+        })
+
+        empty = analyze(self.user.id, self.today + timedelta(days=1), self.today + timedelta(days=2))
+        self.assertEqual(empty['totals']['count'], 0)
+        self.assertEqual(empty['by_category'], [])
+
+        with self.assertRaises(ValueError):
+            analyze(self.user.id, self.start, self.today, ['payee'])
+        with self.assertRaises(ValueError):
+            analyze(self.user.id, self.start, self.today, top=0)
+
+    def test_single_statement(self):
+        user_id = self.user.id
+        statements = []
+        listener = lambda *args: statements.append(args[2])
+        event.listen(db.engine, 'before_cursor_execute', listener)
+        try:
+            analyze(user_id, self.start, self.today, top=3)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', listener)
+        self.assertEqual(len(statements), 1)
+
+    def test_endpoint(self):
+        headers = self.auth_headers(self.user)
+        response = self.client.get('/api/analytics?time_period=month&dimensions=category,month&top=5', headers=headers)
+        self.assertEqual(response.status_code, 200)
+        data = response.get_json()
+        self.assertEqual(data['totals']['expenses'], 50.0)
+        self.assertEqual(set(data), {'totals', 'by_category', 'by_month', 'period'})
+        self.assertEqual(response.headers['X-Cache'], 'MISS')
+        self.assertEqual(self.client.get(
+            '/api/analytics?time_period=month&dimensions=category,month&top=5', headers=headers
+        ).headers['X-Cache'], 'HIT')
+
+        for query in ('dimensions=payee', 'top=abc', 'top=-1'):
+            response = self.client.get(f'/api/analytics?{query}', headers=headers)
+            self.assertEqual(response.status_code, 400, query)
+        self.assertEqual(self.client.get('/api/analytics').status_code, 401)
+
+if __name__ == '__main__':
+    unittest.main()
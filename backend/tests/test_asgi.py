@@ -0,0 +1,153 @@
+import asyncio
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from datetime import date
+from sqlalchemy import create_engine, insert
+from helpers import DatabaseTestCase
+from fake_redis import FakeRedisServer
+from database import async_db
+from database.models import db, BankAccount, Transaction, User
+from database.routing import ReplicaSet
+from services import metrics
+from services.cache import RedisCache
+from services.ingest_service import upsert_transactions
+
+class TestAsyncReadEndpoints(DatabaseTestCase):
+    """The async handlers in asgi.py answer exactly like the Flask views"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.loop = asyncio.new_event_loop()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.loop.run_until_complete(async_db.dispose())
+        cls.loop.close()
+
+    def setUp(self):
+        super().setUp()
+        if db.engine.url.get_backend_name() == 'sqlite' and db.engine.url.database in (None, '', ':memory:'):
+            self.skipTest('An async connection cannot see the in-memory SQLite database; set TEST_DATABASE_URL')
+        from asgi import application
+        self.application = application
+        self.user = self.make_user()
+        self.headers = self.auth_headers(self.user)
+        self.account = self.make_account(self.user)
+        upsert_transactions(self.user.id, [{
+            'bank_account_id': self.account.id,
+            'plaid_transaction_id': f'p-{i}',
+            'amount': amount,
+            'date': date.today(),
+            'description': f'p-{i}',
+            'merchant': None
+        } for i, amount in enumerate([-10.0, 25.0, -3.5])])
+        db.session.commit()
+
+    def asgi_get(self, path, headers=None):
+        path, _, query = path.partition('?')
+        scope = {
+            'type': 'http', 'method': 'GET', 'path': path, 'query_string': query.encode(),
+            'http_version': '1.1', 'scheme': 'http', 'root_path': '',
+            'headers': [(k.lower().encode(), v.encode()) for k, v in (headers or {}).items()]
+        }
+        messages = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+        async def send(message):
+            messages.append(message)
+
+        self.loop.run_until_complete(self.application(scope, receive, send))
+        start = messages[0]
+        body = b''.join(m.get('body', b'') for m in messages[1:])
+        return start['status'], {k.decode(): v.decode() for k, v in start['headers']}, body
+
+    def compare(self, path, **headers):
+        headers = {**self.headers, **headers}
+        status, response_headers, body = self.asgi_get(path, headers)
+        expected = self.client.get(path, headers=headers)
+        self.assertEqual(status, expected.status_code, path)
+        self.assertEqual(body, expected.get_data(), path)
+        self.assertEqual(response_headers.get('etag'), expected.headers.get('ETag'), path)
+        return status, response_headers, body
+
+    def test_responses_match_the_flask_views(self):
+        for path in ('/api/me', '/api/summary', '/api/summary?breakdown=account,category',
+                     '/api/transactions', '/api/transactions?format=ndjson', '/api/transactions?limit=2'):
+            self.app.extensions['response_cache'].clear()
+            self.compare(path)
+        _, _, body = self.compare('/api/transactions?limit=2')
+        self.assertEqual(len(json.loads(body)['transactions']), 2)
+
+    def test_conditional_get_and_cache(self):
+        _, headers, _ = self.asgi_get('/api/summary', self.headers)
+        self.assertEqual(headers['x-cache'], 'MISS')
+        status, headers, body = self.asgi_get('/api/summary', {**self.headers, 'If-None-Match': headers['etag']})
+        self.assertEqual((status, body), (304, b''))
+        _, headers, _ = self.asgi_get('/api/summary', self.headers)
+        self.assertEqual(headers['x-cache'], 'HIT')
+
+    def test_redis_cache_is_called_off_the_loop(self):
+        with FakeRedisServer() as server:
+            threads = []
+            for name in ('response_cache', 'identity_cache'):
+                redis = self.app.extensions[name] = RedisCache(server.url, ttl=60)
+                redis.command = lambda *args, command=redis.command: threads.append(threading.current_thread()) or command(*args)
+            for path in ('/api/summary', '/api/transactions', '/api/transactions?limit=2'):
+                self.assertEqual(self.asgi_get(path, self.headers)[1]['x-cache'], 'MISS')
+                self.assertEqual(self.asgi_get(path, self.headers)[1]['x-cache'], 'HIT')
+            for _ in range(2):
+                self.assertEqual(self.asgi_get('/api/me', self.headers)[0], 200)
+        # Three responses and one principal
+        self.assertEqual(server.commands.count('SET'), 4)
+        self.assertNotIn(threading.current_thread(), threads)
+
+    def test_errors_use_the_app_handlers(self):
+        self.assertEqual(self.asgi_get('/api/summary')[0], 401)
+        status, _, body = self.asgi_get('/api/summary?breakdown=nope', self.headers)
+        self.assertEqual(status, 400)
+        self.assertIn(b'Unknown breakdown', body)
+        self.assertEqual(self.asgi_get('/api/transactions?limit=x', self.headers)[0], 400)
+
+    def test_replica_reads_match_the_flask_views(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        replica = create_engine('sqlite:///' + os.path.join(tmp, 'replica.db'))
+        self.addCleanup(replica.dispose)
+        db.metadata.create_all(replica)
+        with replica.begin() as conn:
+            conn.execute(insert(User).values(id=self.user.id, email=self.user.email, data_version=self.user.data_version))
+            conn.execute(insert(BankAccount).values(
+                id=self.account.id, user_id=self.user.id, plaid_account_id='acc', institution_name='Bank',
+                account_name='Replica', account_type='depository', balance=0
+            ))
+            conn.execute(insert(Transaction).values(
+                bank_account_id=self.account.id, plaid_transaction_id='r-1', amount=-7.0,
+                date=date.today(), description='replica row'
+            ))
+        self.app.extensions['db_replicas'] = ReplicaSet([replica], retry_seconds=30, lag_seconds=5)
+        self.addCleanup(self.app.extensions.__setitem__, 'db_replicas', None)
+
+        for path in ('/api/transactions', '/api/transactions?limit=2'):
+            self.app.extensions['response_cache'].clear()
+            _, _, body = self.compare(path)
+            self.assertIn(b'replica row', body, path)
+
+    def test_other_routes_go_to_flask(self):
+        status, _, body = self.asgi_get('/health')
+        self.assertEqual((status, json.loads(body)), (200, {'status': 'healthy'}))
+
+    def test_requests_are_measured(self):
+        requests = metrics.REQUEST_DURATION.count(method='GET', route='/api/summary', status=200)
+        statements = metrics.REQUEST_STATEMENTS.sum(method='GET', route='/api/summary')
+        self.assertEqual(self.asgi_get('/api/summary', self.headers)[0], 200)
+        self.assertEqual(metrics.REQUEST_DURATION.count(method='GET', route='/api/summary', status=200), requests + 1)
+        self.assertGreater(metrics.REQUEST_STATEMENTS.sum(method='GET', route='/api/summary'), statements)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,133 @@
+import unittest
+from datetime import date, timedelta
+from itertools import count
+from sqlalchemy import event
+from helpers import DatabaseTestCase
+from database.models import db, Budget, BudgetAlert
+from services import budget_service
+from services.ingest_service import upsert_transactions
+
+_ids = count()
+
+class TestBudgets(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = self.make_user()
+        self.checking = self.make_account(self.user, 'Checking')
+        self.card = self.make_account(self.user, 'Card')
+        self.food = self.make_category('Food & Dining')
+        self.travel = self.make_category('Travel')
+        self.today = date.today()
+        self.month = self.today.replace(day=1)
+        self.headers = self.auth_headers(self.user)
+
+    def ingest(self, amount, category, account=None, on=None):
+        upsert_transactions(self.user.id, [{
+            'bank_account_id': (account or self.checking).id,
+            'plaid_transaction_id': f'b-{next(_ids)}',
+            'amount': amount,
+            'date': on or self.today,
+            'description': 'Purchase',
+            'merchant': None,
+            'category_id': category.id
+        }])
+        db.session.commit()
+
+    def make_budget(self, category, amount):
+        budget = Budget(user_id=self.user.id, category_id=category.id, amount=amount)
+        db.session.add(budget)
+        db.session.commit()
+        return budget
+
+    def alerts(self):
+        return sorted((alert.budget_id, alert.threshold) for alert in BudgetAlert.query.all())
+
+    def test_status_reads_rollups(self):
+        food = self.make_budget(self.food, 200)
+        self.make_budget(self.travel, 500)
+        self.ingest(-60, self.food)
+        self.ingest(-40, self.food, self.card)
+        self.ingest(25, self.food)  # refunds are income, not negative spend
+        self.ingest(-70, self.food, on=self.month - timedelta(days=1))
+
+        user_id = self.user.id
+        statements = []
+        listener = lambda *args: statements.append(args[2])
+        event.listen(db.engine, 'before_cursor_execute', listener)
+        try:
+            budgets = budget_service.status(user_id, today=self.month + timedelta(days=9))
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', listener)
+        self.assertEqual(len(statements), 1)
+        self.assertNotIn('transactions', statements[0])
+
+        by_category = {b['category']: b for b in budgets}
+        self.assertEqual(by_category['Food & Dining']['id'], food.id)
+        self.assertEqual(by_category['Food & Dining']['spent'], 100.0)
+        self.assertEqual(by_category['Food & Dining']['remaining'], 100.0)
+        self.assertEqual(by_category['Food & Dining']['used'], 0.5)
+        days = ((self.month + timedelta(days=32)).replace(day=1) - self.month).days
+        self.assertEqual(by_category['Food & Dining']['projected'], round(100.0 * days / 10, 2))
+        self.assertEqual(by_category['Travel']['spent'], 0.0)
+
+        last_month = (self.month - timedelta(days=1)).replace(day=1)
+        past = {b['category']: b for b in budget_service.status(user_id, last_month)}
+        self.assertEqual(past['Food & Dining']['projected'], 70.0)
+
+    def test_alerts_recorded_once_per_threshold_at_ingest(self):
+        food = self.make_budget(self.food, 100)
+        self.make_budget(self.travel, 100)
+        self.ingest(-50, self.food)
+        self.assertEqual(self.alerts(), [])
+
+        self.ingest(-35, self.food, self.card)
+        self.assertEqual(self.alerts(), [(food.id, 0.8)])
+        self.ingest(-5, self.food)
+        self.assertEqual(self.alerts(), [(food.id, 0.8)])
+        self.ingest(-15, self.food)
+        self.assertEqual(self.alerts(), [(food.id, 0.8), (food.id, 1.0)])
+        self.assertEqual(BudgetAlert.query.filter_by(threshold=1.0).one().spent, 105.0)
+
+    def test_history_and_income_do_not_alert(self):
+        self.make_budget(self.food, 10)
+        self.ingest(-500, self.food, on=self.month - timedelta(days=1))
+        self.ingest(500, self.food)
+        self.assertEqual(self.alerts(), [])
+
+    def test_endpoints(self):
+        self.ingest(-90, self.food)
+        response = self.client.post('/api/budgets', json={'category_id': self.food.id, 'amount': 100},
+                                    headers=self.headers)
+        self.assertEqual(response.status_code, 201)
+        budget = response.get_json()
+        self.assertEqual((budget['category'], budget['spent']), ('Food & Dining', 90.0))
+        # Spend before the budget existed already crossed 80%
+        alerts = self.client.get('/api/budgets/alerts', headers=self.headers).get_json()
+        self.assertEqual([(a['budget_id'], a['threshold']) for a in alerts], [(budget['id'], 0.8)])
+
+        response = self.client.post('/api/budgets', json={'category_id': self.food.id, 'amount': 50},
+                                    headers=self.headers)
+        self.assertEqual(response.status_code, 409)
+        for body in ({'category_id': self.travel.id, 'amount': -1}, {'category_id': 9999, 'amount': 5}, {}):
+            self.assertEqual(self.client.post('/api/budgets', json=body, headers=self.headers).status_code, 400)
+
+        response = self.client.put(f"/api/budgets/{budget['id']}", json={'amount': 80}, headers=self.headers)
+        self.assertEqual(response.get_json()['remaining'], -10.0)
+        alerts = self.client.get(f"/api/budgets/alerts?after={alerts[0]['id']}", headers=self.headers).get_json()
+        self.assertEqual([a['threshold'] for a in alerts], [1.0])
+
+        listed = self.client.get('/api/budgets', headers=self.headers).get_json()
+        self.assertEqual([b['id'] for b in listed], [budget['id']])
+        self.assertEqual(self.client.get('/api/budgets?month=2020-13', headers=self.headers).status_code, 400)
+
+        other = self.auth_headers(self.make_user())
+        self.assertEqual(self.client.put(f"/api/budgets/{budget['id']}", json={'amount': 1}, headers=other).status_code, 404)
+        self.assertEqual(self.client.delete(f"/api/budgets/{budget['id']}", headers=other).status_code, 404)
+        self.assertEqual(self.client.get('/api/budgets', headers=other).get_json(), [])
+
+        self.assertEqual(self.client.delete(f"/api/budgets/{budget['id']}", headers=self.headers).status_code, 204)
+        self.assertEqual(Budget.query.count(), 0)
+        self.assertEqual(BudgetAlert.query.count(), 0)
+
+if __name__ == '__main__':
+    unittest.main()
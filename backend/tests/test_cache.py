@@ -0,0 +1,177 @@
+import json
+import unittest
+from datetime import date
+from unittest.mock import patch
+from helpers import DatabaseTestCase
+from fake_redis import FakeRedisServer
+from database.models import db, User
+from services.cache import MemoryCache, RedisCache
+from services.ingest_service import upsert_transactions, delete_transactions
+
+class TestMemoryCache(unittest.TestCase):
+    def setUp(self):
+        self.now = 0.0
+        self.cache = MemoryCache(ttl=10, max_entries=3, max_bytes=100, clock=lambda: self.now)
+
+    def test_hits_and_misses(self):
+        self.assertIsNone(self.cache.get('a'))
+        self.cache.set('a', b'1')
+        self.assertEqual(self.cache.get('a'), b'1')
+        stats = self.cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['entries'], stats['bytes']), (1, 1, 1, 1))
+
+    def test_evicts_least_recently_used_entry(self):
+        for key in 'abc':
+            self.cache.set(key, b'x')
+        self.cache.get('a')
+        self.cache.set('d', b'x')
+        self.assertIsNone(self.cache.get('b'))
+        self.assertEqual([self.cache.get(key) for key in 'acd'], [b'x'] * 3)
+        self.assertEqual(self.cache.stats()['evictions'], 1)
+
+    def test_evicts_to_stay_under_byte_bound(self):
+        self.cache.set('a', b'x' * 60)
+        self.cache.set('b', b'x' * 30)
+        self.cache.set('c', b'x' * 20)
+        self.assertEqual(self.cache.stats()['bytes'], 50)
+        self.assertIsNone(self.cache.get('a'))
+        self.assertEqual(self.cache.stats()['evictions'], 1)
+
+    def test_entries_expire_after_ttl(self):
+        self.cache.set('a', b'1')
+        self.now = 9.9
+        self.assertEqual(self.cache.get('a'), b'1')
+        self.now = 10
+        self.assertIsNone(self.cache.get('a'))
+        stats = self.cache.stats()
+        self.assertEqual((stats['expirations'], stats['entries'], stats['bytes']), (1, 0, 0))
+
+class TestRedisCache(unittest.TestCase):
+    def setUp(self):
+        self.server = FakeRedisServer().__enter__()
+        self.cache = RedisCache(self.server.url, ttl=0.2)
+
+    def tearDown(self):
+        self.server.__exit__()
+
+    def test_round_trip_and_ttl(self):
+        self.assertIsNone(self.cache.get('k'))
+        self.cache.set('k', b'{"a": 1}\r\n')
+        self.assertEqual(self.cache.get('k'), b'{"a": 1}\r\n')
+        self.server.data[b'k'] = (b'v', 0)
+        self.assertIsNone(self.cache.get('k'))
+        stats = self.cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['expirations']), (1, 2, 1))
+
+    def test_reuses_one_connection(self):
+        for _ in range(5):
+            self.cache.set('k', b'v')
+            self.cache.get('k')
+        self.assertEqual(self.server.commands.count('SELECT'), 0)
+        self.assertEqual(len(self.server.commands), 10)
+
+    def test_outage_degrades_to_misses(self):
+        self.cache.set('k', b'v')
+        self.server.__exit__()
+        sock, reader = self.cache.local.conn
+        reader.close()
+        sock.close()
+        self.assertIsNone(self.cache.get('k'))
+        self.cache.set('k', b'v')
+        self.assertEqual(self.cache.stats()['errors'], 3)
+
+class TestResponseCache(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = self.make_user()
+        self.headers = self.auth_headers(self.user)
+        self.account = self.make_account(self.user)
+        self.ingest([('p-1', -10.0), ('p-2', 25.0)])
+
+    def ingest(self, rows):
+        upsert_transactions(self.user.id, [{
+            'bank_account_id': self.account.id,
+            'plaid_transaction_id': plaid_id,
+            'amount': amount,
+            'date': date.today(),
+            'description': plaid_id,
+            'merchant': None
+        } for plaid_id, amount in rows])
+        db.session.commit()
+
+    def get(self, path):
+        return self.client.get(path, headers=self.headers)
+
+    def test_summary_is_served_from_cache_until_ingest(self):
+        first = self.get('/api/summary?time_period=month')
+        second = self.get('/api/summary?time_period=month')
+        self.assertEqual((first.headers['X-Cache'], second.headers['X-Cache']), ('MISS', 'HIT'))
+        self.assertEqual(first.get_json(), second.get_json())
+        # Different parameters are cached separately
+        self.assertEqual(self.get('/api/summary?time_period=month&breakdown=account').headers['X-Cache'], 'MISS')
+
+        self.ingest([('p-3', -5.0)])
+        third = self.get('/api/summary?time_period=month')
+        self.assertEqual(third.headers['X-Cache'], 'MISS')
+        self.assertEqual(third.get_json()['count'], 3)
+
+    def test_streamed_and_paginated_transactions(self):
+        first = self.get('/api/transactions?time_period=month')
+        body = first.get_data()
+        second = self.get('/api/transactions?time_period=month')
+        self.assertEqual((first.headers['X-Cache'], second.headers['X-Cache']), ('MISS', 'HIT'))
+        self.assertEqual(second.get_data(), body)
+        self.assertEqual(len(json.loads(body)), 2)
+
+        self.get('/api/transactions?time_period=month&limit=1')
+        page = self.get('/api/transactions?time_period=month&limit=1')
+        self.assertEqual(page.headers['X-Cache'], 'HIT')
+        self.assertEqual(len(page.get_json()['transactions']), 1)
+
+        delete_transactions(self.user.id, ['p-1'])
+        db.session.commit()
+        fresh = self.get('/api/transactions?time_period=month')
+        self.assertEqual(fresh.headers['X-Cache'], 'MISS')
+        self.assertEqual([row['description'] for row in fresh.get_json()], ['p-2'])
+
+    def test_unchanged_reingest_keeps_cache(self):
+        self.get('/api/summary')
+        version = db.session.get(User, self.user.id).data_version
+        self.ingest([('p-1', -10.0)])
+        self.assertEqual(db.session.get(User, self.user.id).data_version, version)
+        self.assertEqual(self.get('/api/summary').headers['X-Cache'], 'HIT')
+
+    def test_oversized_responses_are_not_cached(self):
+        self.app.config['CACHE_MAX_ENTRY_BYTES'], previous = 10, self.app.config['CACHE_MAX_ENTRY_BYTES']
+        try:
+            self.get('/api/transactions')
+            self.assertEqual(self.get('/api/transactions').headers['X-Cache'], 'MISS')
+        finally:
+            self.app.config['CACHE_MAX_ENTRY_BYTES'] = previous
+
+    def test_users_do_not_share_entries(self):
+        self.get('/api/summary')
+        other = self.make_user()
+        response = self.client.get('/api/summary', headers=self.auth_headers(other))
+        self.assertEqual(response.headers['X-Cache'], 'MISS')
+        self.assertEqual(response.get_json()['count'], 0)
+
+    def test_stats_endpoint(self):
+        self.get('/api/summary')
+        self.get('/api/summary')
+        stats = self.client.get('/cache/stats').get_json()
+        self.assertEqual((stats['backend'], stats['hits'], stats['misses']), ('memory', 1, 1))
+        with patch.dict(self.app.config, OPS_ENDPOINTS_ENABLED=False):
+            self.assertEqual(self.client.get('/cache/stats').status_code, 404)
+
+    def test_redis_backend(self):
+        with FakeRedisServer() as server:
+            self.app.extensions['response_cache'] = RedisCache(server.url, ttl=60)
+            first = self.get('/api/summary')
+            second = self.get('/api/summary')
+            self.assertEqual((first.headers['X-Cache'], second.headers['X-Cache']), ('MISS', 'HIT'))
+            self.assertEqual(first.get_json(), second.get_json())
+            self.assertEqual(len(server.data), 1)
+
+if __name__ == '__main__':
+    unittest.main()
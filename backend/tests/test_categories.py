@@ -0,0 +1,198 @@
+import unittest
+from datetime import date
+from unittest.mock import patch
+from helpers import DatabaseTestCase
+from database.models import db, Budget, BudgetAlert, Category, CategoryRule, Transaction, User
+from services import category_service, job_service
+from services.category_service import Automaton, Matcher, Rule, normalize_merchant
+
+class TestMatching(unittest.TestCase):
+    def test_normalize_merchant(self):
+        for description, merchant in [
+            ('SQ *BLUE BOTTLE #0412 OAKLAND CA', 'Blue Bottle'),
+            ('POS DEBIT NETFLIX.COM 866-579-7172', 'Netflix'),
+            ('UBER *TRIP HELP.UBER.COM', 'Uber'),
+            ('TRADER JOE S #552', 'Trader Joe S'),
+            ('  whole   foods market ', 'Whole Foods Market'),
+            ('#1234', None),
+            ('', None),
+            (None, None),
+        ]:
+            self.assertEqual(normalize_merchant(description), merchant, description)
+
+    def test_automaton_finds_overlapping_patterns(self):
+        automaton = Automaton(['he', 'she', 'his', 'hers', 'uber eats', 'uber'])
+        self.assertEqual(automaton.find('ushers'), {0, 1, 3})
+        self.assertEqual(automaton.find('uber eats order'), {4, 5})
+        self.assertEqual(automaton.find('lyft'), set())
+
+    def test_first_matching_rule_wins(self):
+        matcher = Matcher([
+            Rule(1, 'contains', 'uber', 100, None),
+            Rule(2, 'regex', r'^uber\b', None, None),
+            Rule(3, 'contains', 'uber eats', None, None),
+            Rule(4, 'contains', None, None, 5),
+        ])
+        self.assertEqual(matcher.category('Uber', -150), 1)
+        self.assertEqual(matcher.category('Uber', -12), 2)
+        self.assertEqual(matcher.category('Uber Eats', -12), 2)
+        self.assertIsNone(matcher.category('Ubereats', -12))
+        self.assertEqual(matcher.category('Corner Store', -3), 4)
+        self.assertIsNone(matcher.category('Corner Store', -30))
+
+    def test_candidates_are_memoized(self):
+        matcher = Matcher([Rule(1, 'contains', 'uber', None, None)])
+        self.assertEqual(matcher.candidates('UBER'), (0,))
+        self.assertIn('uber', matcher.memo)
+        matcher.memo['uber'] = ()
+        self.assertEqual(matcher.candidates('Uber'), ())
+
+    def test_memo_is_bounded(self):
+        matcher = Matcher([Rule(1, 'contains', 'uber', None, None)])
+        with patch.object(category_service, 'MATCHER_MEMO_SIZE', 2):
+            for merchant in ('uber', 'lyft', 'uber', 'lime'):
+                matcher.candidates(merchant)
+        self.assertEqual(list(matcher.memo), ['uber', 'lime'])
+
+class TestCategorize(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = self.make_user()
+        self.account = self.make_account(self.user)
+        self.groceries = self.make_category('Groceries')
+
+    def make_rule(self, pattern, category, kind='contains', **fields):
+        rule = CategoryRule(user_id=self.user.id, category_id=category.id, kind=kind, pattern=pattern, **fields)
+        db.session.add(rule)
+        db.session.commit()
+        return rule
+
+    def category_name(self, category_id):
+        return db.session.get(Category, category_id).name if category_id else None
+
+    def test_categorize_fills_merchant_and_category(self):
+        self.make_rule('trader joe', self.groceries)
+        rows = category_service.categorize(self.user.id, [
+            {'description': 'TRADER JOE S #552 PORTLAND OR', 'merchant': None, 'amount': -40},
+            {'description': 'UBER *TRIP', 'merchant': 'Uber', 'amount': -12},
+            {'description': 'DIRECT DEPOSIT ACME CORP', 'merchant': None, 'amount': 2000},
+            {'description': 'CHECK 1042', 'merchant': None, 'amount': -75},
+        ])
+        self.assertEqual([row['merchant'] for row in rows], ['Trader Joe S', 'Uber', 'Direct Deposit Acme Corp', 'Check'])
+        # The user's rule comes before the built-in 'trader joe' one
+        self.assertEqual([self.category_name(row['category_id']) for row in rows],
+                         ['Groceries', 'Transportation', 'Income', None])
+
+    def test_matcher_cached_until_rules_change(self):
+        category_service.matcher(self.user.id)
+        db.session.commit()
+        first = category_service.matcher(self.user.id)
+        self.assertIs(category_service.matcher(self.user.id), first)
+        rule = self.make_rule('lyft', self.groceries)
+        second = category_service.matcher(self.user.id)
+        self.assertIsNot(second, first)
+        self.assertIs(category_service.matcher(self.user.id), second)
+        rule.pattern = 'lime'
+        db.session.commit()
+        self.assertIsNot(category_service.matcher(self.user.id), second)
+
+    def test_matcher_not_cached_over_uncommitted_categories(self):
+        category_service.matcher(self.user.id)
+        db.session.rollback()
+        compiled = category_service.matcher(self.user.id)
+        uber = compiled.category('Uber', -10)
+        self.assertEqual(db.session.get(Category, uber).name, 'Transportation')
+
+    def test_recategorize(self):
+        today = date.today()
+        coffee = self.add_transaction(self.account, -4.5, today, description='SQ *BLUE BOTTLE #0412 OAKLAND CA')
+        big = self.add_transaction(self.account, -95, today, description='Purchase', merchant='Corner Market')
+        small = self.add_transaction(self.account, -8, today, description='Purchase', merchant='Corner Market')
+        other = self.add_transaction(self.make_account(self.make_user()), -95, today, merchant='Corner Market')
+        budget = Budget(user_id=self.user.id, category_id=self.groceries.id, amount=100)
+        db.session.add(budget)
+        db.session.commit()
+        version = self.user.data_version
+
+        self.make_rule('corner', self.groceries, min_amount=50)
+        self.make_rule('blue bottle', self.groceries)
+        self.assertEqual(category_service.recategorize(self.user.id), 2)
+        db.session.commit()
+
+        self.assertEqual(self.category_name(db.session.get(Transaction, coffee.id).category_id), 'Groceries')
+        self.assertEqual(self.category_name(db.session.get(Transaction, big.id).category_id), 'Groceries')
+        self.assertIsNone(db.session.get(Transaction, small.id).category_id)
+        self.assertIsNone(db.session.get(Transaction, other.id).category_id)
+        new_version = db.session.get(User, self.user.id).data_version
+        self.assertEqual(new_version, version + 1)
+        self.assertEqual(db.session.get(Transaction, big.id).change_version, new_version)
+        self.assertEqual(db.session.get(Transaction, small.id).change_version, 0)
+        self.assertEqual([(alert.budget_id, alert.threshold) for alert in BudgetAlert.query.all()], [(budget.id, 0.8)])
+        response = self.client.get('/api/budgets', headers=self.auth_headers(self.user))
+        self.assertEqual(response.get_json()[0]['spent'], 99.5)
+
+        # Nothing left to change, so cached responses stay valid
+        self.assertEqual(category_service.recategorize(self.user.id), 0)
+        db.session.commit()
+        self.assertEqual(db.session.get(User, self.user.id).data_version, new_version)
+
+class TestRulesEndpoint(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = self.make_user()
+        self.headers = self.auth_headers(self.user)
+        self.groceries = self.make_category('Groceries')
+        account = self.make_account(self.user)
+        self.transaction = self.add_transaction(account, -40, description='Purchase', merchant='Corner Market')
+
+    def test_create_update_delete(self):
+        response = self.client.post('/api/rules', headers=self.headers,
+                                    json={'category_id': self.groceries.id, 'pattern': 'corner'})
+        self.assertEqual(response.status_code, 201, response.get_json())
+        rule = response.get_json()
+        self.assertEqual((rule['kind'], rule['pattern'], rule['priority']), ('contains', 'corner', 0))
+        job = job_service.run_next('test-worker')
+        self.assertEqual((job.id, job.status, job.result), (rule['job_id'], 'succeeded', {'updated': 1}))
+        self.assertEqual(db.session.get(Transaction, self.transaction.id).category_id, self.groceries.id)
+
+        response = self.client.put(f"/api/rules/{rule['id']}", headers=self.headers,
+                                   json={'category_id': self.groceries.id, 'pattern': 'corner', 'max_amount': 10})
+        self.assertEqual(response.status_code, 200, response.get_json())
+        self.assertEqual(job_service.run_next('test-worker').result, {'updated': 1})
+        self.assertIsNone(db.session.get(Transaction, self.transaction.id).category_id)
+        self.assertEqual(len(self.client.get('/api/rules', headers=self.headers).get_json()), 1)
+
+        other = self.auth_headers(self.make_user())
+        self.assertEqual(self.client.delete(f"/api/rules/{rule['id']}", headers=other).status_code, 404)
+        self.assertEqual(self.client.delete(f"/api/rules/{rule['id']}", headers=self.headers).status_code, 200)
+        self.assertEqual(self.client.get('/api/rules', headers=self.headers).get_json(), [])
+
+    def test_apply(self):
+        response = self.client.post('/api/rules/apply', headers=self.headers)
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(job_service.run_next('test-worker').id, response.get_json()['job_id'])
+
+    def test_validation(self):
+        for body in [
+            {'pattern': 'corner'},
+            {'category_id': 999999, 'pattern': 'corner'},
+            {'category_id': self.groceries.id},
+            {'category_id': self.groceries.id, 'pattern': 'corner', 'kind': 'glob'},
+            {'category_id': self.groceries.id, 'pattern': '(unclosed', 'kind': 'regex'},
+            {'category_id': self.groceries.id, 'pattern': r'^(\w+\s?)*$', 'kind': 'regex'},
+            {'category_id': self.groceries.id, 'pattern': r'(?:sq (\w{2,}))+', 'kind': 'regex'},
+            {'category_id': self.groceries.id, 'pattern': 'uber|' * 30, 'kind': 'regex'},
+            {'category_id': self.groceries.id, 'min_amount': 50, 'max_amount': 10},
+            {'category_id': self.groceries.id, 'min_amount': 'ten'},
+            {'category_id': self.groceries.id, 'pattern': 'corner', 'priority': 'high'},
+        ]:
+            response = self.client.post('/api/rules', headers=self.headers, json=body)
+            self.assertEqual(response.status_code, 400, body)
+            self.assertIn('detail', response.get_json())
+        for pattern in (r'^(uber|lyft)\b', r'^(?:sq|tst) \*[a-z(+]+\d{1,3}', r'(\w+)?-(ab)+'):
+            response = self.client.post('/api/rules', headers=self.headers,
+                                        json={'category_id': self.groceries.id, 'pattern': pattern, 'kind': 'regex'})
+            self.assertEqual(response.status_code, 201, pattern)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,117 @@
+import unittest
+from datetime import date
+from sqlalchemy import event
+from helpers import DatabaseTestCase
+from database.models import db, Transaction
+from services.ingest_service import upsert_transactions, delete_transactions
+from services.transaction_service import changes_since
+
+class ChangeTrackingTestCase(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = self.make_user()
+        self.headers = self.auth_headers(self.user)
+        self.account = self.make_account(self.user)
+        self.ingest([('p-1', -10.0), ('p-2', 25.0)])
+
+    def ingest(self, rows):
+        upsert_transactions(self.user.id, [{
+            'bank_account_id': self.account.id,
+            'plaid_transaction_id': plaid_id,
+            'amount': amount,
+            'date': date.today(),
+            'description': plaid_id,
+            'merchant': None
+        } for plaid_id, amount in rows])
+        db.session.commit()
+
+    def get(self, path, **headers):
+        return self.client.get(path, headers={**self.headers, **headers})
+
+class TestConditionalGet(ChangeTrackingTestCase):
+    def count_statements(self, fn):
+        statements = []
+        listener = lambda *args: statements.append(args[2])
+        event.listen(db.engine, 'before_cursor_execute', listener)
+        try:
+            result = fn()
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', listener)
+        return result, statements
+
+    def test_not_modified_until_data_changes(self):
+        for path in ('/api/transactions?time_period=month', '/api/summary?time_period=month'):
+            first = self.get(path)
+            etag = first.headers['ETag']
+            self.assertEqual(first.headers['X-Data-Version'], '1')
+
+            # Only the data version is read to answer a revalidation
+            second, statements = self.count_statements(lambda: self.get(path, **{'If-None-Match': etag}))
+            self.assertEqual(second.status_code, 304)
+            self.assertEqual(second.get_data(), b'')
+            self.assertEqual(second.headers['ETag'], etag)
+            self.assertEqual(len(statements), 1)
+
+        self.ingest([('p-3', -5.0)])
+        third = self.get('/api/summary?time_period=month', **{'If-None-Match': etag})
+        self.assertEqual(third.status_code, 200)
+        self.assertNotEqual(third.headers['ETag'], etag)
+
+    def test_etag_differs_per_representation(self):
+        etags = {
+            self.get(path).headers['ETag']
+            for path in ('/api/transactions', '/api/transactions?format=ndjson',
+                         '/api/transactions?limit=1', '/api/summary', '/api/summary?breakdown=account')
+        }
+        self.assertEqual(len(etags), 5)
+
+    def test_etag_is_per_user(self):
+        etag = self.get('/api/summary').headers['ETag']
+        other = self.make_user()
+        response = self.client.get('/api/summary', headers={
+            **self.auth_headers(other), 'If-None-Match': etag
+        })
+        self.assertEqual(response.status_code, 200)
+
+class TestChangesSince(ChangeTrackingTestCase):
+    def test_reports_added_modified_and_removed(self):
+        version = self.get('/api/transactions/changes?since=0').get_json()['version']
+        removed_id = Transaction.query.filter_by(plaid_transaction_id='p-2').one().id
+
+        self.ingest([('p-1', -12.0), ('p-3', -5.0), ('p-2', 25.0)])
+        delete_transactions(self.user.id, ['p-2'])
+        db.session.commit()
+
+        body = self.get(f'/api/transactions/changes?since={version}').get_json()
+        self.assertEqual((body['version'], body['reset']), (3, False))
+        self.assertEqual([row['description'] for row in body['added']], ['p-3'])
+        self.assertEqual([(row['description'], row['amount']) for row in body['modified']], [('p-1', -12.0)])
+        self.assertEqual(body['removed'], [removed_id])
+
+        # Caught up: nothing more to send
+        body = self.get(f"/api/transactions/changes?since={body['version']}").get_json()
+        self.assertEqual((body['added'], body['modified'], body['removed']), ([], [], []))
+
+    def test_unchanged_reingest_reports_nothing(self):
+        self.ingest([('p-1', -10.0), ('p-2', 25.0)])
+        body = self.get('/api/transactions/changes?since=1').get_json()
+        self.assertEqual((body['version'], body['added'], body['modified']), (1, [], []))
+
+    def test_requests_a_reload_when_the_delta_is_not_useful(self):
+        self.assertTrue(self.get('/api/transactions/changes?since=0').get_json()['reset'])
+        self.ingest([(f'p-{i}', -1.0) for i in range(3, 6)])
+        self.assertIsNone(changes_since(self.user.id, 1, limit=2))
+        self.assertEqual(len(changes_since(self.user.id, 1, limit=3)['added']), 3)
+
+    def test_changes_are_per_user(self):
+        other = self.make_user()
+        body = self.client.get('/api/transactions/changes?since=0', headers=self.auth_headers(other)).get_json()
+        self.assertEqual(body['version'], 0)
+        self.assertEqual(changes_since(other.id, 0), {'added': [], 'modified': [], 'removed': []})
+
+    def test_invalid_since(self):
+        for since in ('', 'abc', '-1'):
+            self.assertEqual(self.get(f'/api/transactions/changes?since={since}').status_code, 400)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+import csv
+import io
+import unittest
+from unittest.mock import patch
+from datetime import date
+from helpers import DatabaseTestCase
+from database.dialects import is_postgres
+from database.models import db
+from services import export_service
+
+HEADER = ['id', 'date', 'account', 'description', 'merchant', 'category', 'amount']
+
+class TestExport(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = self.make_user()
+        self.checking = self.make_account(self.user, 'Checking')
+        self.card = self.make_account(self.user, 'Card')
+        food = self.make_category('Food & Dining')
+        self.add_transaction(self.checking, -12.5, date(2026, 3, 14), food, 'LUNCH, "THE SPOT"', merchant='The Spot')
+        self.add_transaction(self.card, -40, date(2026, 4, 2), description='UBER TRIP')
+        self.add_transaction(self.checking, 2000, date(2026, 5, 1), description='PAYROLL')
+        self.other_account = self.make_account(self.make_user())
+        self.add_transaction(self.other_account, -5, date(2026, 4, 1), description='NOT MINE')
+        self.headers = self.auth_headers(self.user)
+
+    def get(self, query=''):
+        return self.client.get(f'/api/export?{query}', headers=self.headers)
+
+    def rows(self, body):
+        return list(csv.reader(io.StringIO(body.decode())))
+
+    def test_csv(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'text/csv')
+        self.assertIn('attachment', response.headers['Content-Disposition'])
+        rows = self.rows(response.get_data())
+        self.assertEqual(rows[0], HEADER)
+        self.assertEqual([row[1:] for row in rows[1:]], [
+            ['2026-05-01', 'Checking', 'PAYROLL', '', '', '2000'],
+            ['2026-04-02', 'Card', 'UBER TRIP', '', '', '-40'],
+            ['2026-03-14', 'Checking', 'LUNCH, "THE SPOT"', 'The Spot', 'Food & Dining', '-12.5'],
+        ])
+
+    def test_filters(self):
+        rows = self.rows(self.get('start=2026-04-01&end=2026-04-30').get_data())
+        self.assertEqual([row[3] for row in rows[1:]], ['UBER TRIP'])
+        rows = self.rows(self.get(f'account_id={self.checking.id}&start=2026-04-01').get_data())
+        self.assertEqual([row[3] for row in rows[1:]], ['PAYROLL'])
+        rows = self.rows(self.get(f'account_id={self.checking.id}&account_id={self.card.id}').get_data())
+        self.assertEqual(len(rows), 4)
+
+    def test_streams_in_chunks(self):
+        for i in range(300):
+            self.add_transaction(self.card, -1, date(2026, 1, 1), description=f'COFFEE {i} ' + 'x' * 200)
+        with patch.object(export_service, 'EXPORT_CHUNK_SIZE', 4096), patch.object(export_service, 'CSV_BATCH_SIZE', 10):
+            chunks = list(export_service.iter_csv(self.user.id))
+        self.assertGreater(len(chunks), 10)
+        self.assertEqual(len(self.rows(b''.join(chunks))), 304)
+
+    def test_abandoned_export_releases_the_connection(self):
+        for i in range(300):
+            self.add_transaction(self.card, -1, date(2026, 1, 1), description='x' * 200)
+        chunks = export_service.iter_csv(self.user.id)
+        next(chunks)
+        chunks.close()
+        self.assertEqual(len(self.rows(self.get().get_data())), 304)
+
+    def test_abandoned_copy_discards_its_connection(self):
+        if not is_postgres():
+            self.skipTest('Only the Postgres export runs a COPY')
+        for i in range(300):
+            self.add_transaction(self.card, -1, date(2026, 1, 1), description='x' * 200)
+        raw = db.session.connection().connection.dbapi_connection
+        with patch.object(export_service, 'EXPORT_CHUNK_SIZE', 4096), patch.object(export_service, 'EXPORT_QUEUE_DEPTH', 1):
+            chunks = export_service.iter_csv(self.user.id)
+            next(chunks)
+            chunks.close()
+        # Closed rather than returned to the pool mid-COPY
+        self.assertTrue(raw.closed)
+        self.assertEqual(len(self.rows(self.get().get_data())), 304)
+
+    def test_parquet(self):
+        if not export_service.parquet_available():
+            self.skipTest('pyarrow is not installed')
+        import pyarrow.parquet as pq
+        chunks = list(export_service.iter_parquet(self.user.id, row_group_size=2))
+        parquet = pq.ParquetFile(io.BytesIO(b''.join(chunks)))
+        self.assertEqual(parquet.metadata.num_row_groups, 2)
+        table = parquet.read()
+        self.assertEqual(table.column_names, HEADER)
+        self.assertEqual(table.column('date').to_pylist(), [date(2026, 5, 1), date(2026, 4, 2), date(2026, 3, 14)])
+        self.assertEqual(table.column('amount').to_pylist(), [2000, -40, -12.5])
+
+        response = self.get('format=parquet&start=2026-04-01')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(pq.read_table(io.BytesIO(response.get_data())).column('description').to_pylist(),
+                         ['PAYROLL', 'UBER TRIP'])
+
+    def test_bad_requests(self):
+        for query, status in [('format=xlsx', 400), ('start=March', 400), ('account_id=x', 400),
+                              ('account_id=999999', 404), (f'account_id={self.other_account.id}', 404)]:
+            response = self.get(query)
+            self.assertEqual(response.status_code, status, query)
+            self.assertIn('detail', response.get_json())
+
+    def test_cli(self):
+        result = self.app.test_cli_runner().invoke(args=[
+            'export', 'transactions', '--user-id', str(self.user.id), '--end', '2026-04-30'
+        ])
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertEqual([row[3] for row in self.rows(result.stdout_bytes)[1:]], ['UBER TRIP', 'LUNCH, "THE SPOT"'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+import unittest
+from sqlalchemy import event
+from helpers import DatabaseTestCase
+from database.models import db, PlaidItem
+from routes.auth import create_access_token
+from services import identity_service
+from services.sync_service import link_accounts
+
+class FakePlaid:
+    def __init__(self, *account_ids):
+        self.account_ids = account_ids
+
+    def get_accounts(self, access_token):
+        return [{'account_id': account_id, 'name': account_id, 'type': 'depository'} for account_id in self.account_ids]
+
+class TestIdentityCache(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = self.make_user()
+        self.account = self.make_account(self.user)
+
+    def count_statements(self, fn):
+        statements = []
+        listener = lambda *args: statements.append(args[2])
+        event.listen(db.engine, 'before_cursor_execute', listener)
+        try:
+            result = fn()
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', listener)
+        return result, statements
+
+    def test_me_needs_no_queries_once_cached(self):
+        headers = self.auth_headers(self.user)
+        first, statements = self.count_statements(lambda: self.client.get('/api/me', headers=headers))
+        self.assertEqual(len(statements), 1)
+        for _ in range(3):
+            response, statements = self.count_statements(lambda: self.client.get('/api/me', headers=headers))
+            self.assertEqual(statements, [])
+            self.assertEqual(response.get_json(), first.get_json())
+        self.assertEqual(first.get_json()['email'], self.user.email)
+
+        stats = self.client.get('/cache/stats').get_json()['identity']
+        self.assertEqual((stats['hits'], stats['misses'], stats['hit_ratio']), (3, 1, 0.75))
+
+    def test_token_by_email_needs_no_queries_once_cached(self):
+        headers = {'Authorization': f"Bearer {create_access_token({'sub': self.user.email})}"}
+        self.client.get('/me', headers=headers)
+        response, statements = self.count_statements(lambda: self.client.get('/me', headers=headers))
+        self.assertEqual(statements, [])
+        self.assertEqual(response.get_json()['id'], self.user.id)
+
+    def test_principal_lists_accounts_and_unknown_users_are_not_cached(self):
+        self.assertEqual(identity_service.get_principal(self.user.id)['account_ids'], [self.account.id])
+        other = self.make_user()
+        self.assertEqual(identity_service.get_principal(other.id)['account_ids'], [])
+        self.assertIsNone(identity_service.get_principal(other.id + 1))
+        self.assertIsNone(identity_service.principal_for_email('nobody@example.com'))
+
+        later = self.make_user()
+        self.assertEqual(identity_service.get_principal(later.id)['id'], later.id)
+        self.assertEqual(identity_service.principal_for_email(later.email)['id'], later.id)
+
+    def test_linking_accounts_invalidates_on_commit(self):
+        self.assertEqual(len(identity_service.get_principal(self.user.id)['account_ids']), 1)
+        item = PlaidItem(user_id=self.user.id, access_token='access-1')
+        db.session.add(item)
+
+        link_accounts(FakePlaid('acc-a'), item)
+        db.session.rollback()
+        self.assertEqual(len(identity_service.get_principal(self.user.id)['account_ids']), 1)
+
+        item = PlaidItem(user_id=self.user.id, access_token='access-1')
+        db.session.add(item)
+        link_accounts(FakePlaid('acc-a', 'acc-b'), item)
+        db.session.flush()
+        # Still the committed state until the link commits
+        self.assertEqual(len(identity_service.get_principal(self.user.id)['account_ids']), 1)
+        db.session.commit()
+        self.assertEqual(len(identity_service.get_principal(self.user.id)['account_ids']), 3)
+
+    def test_deleted_user_is_not_served_from_the_email_mapping(self):
+        email = self.user.email
+        identity_service.principal_for_email(email)
+        identity_service.invalidate(self.user.id)
+        db.session.delete(self.account)
+        db.session.delete(self.user)
+        db.session.commit()
+        self.assertIsNone(identity_service.principal_for_email(email))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,167 @@
+import io
+import os
+import unittest
+from datetime import date
+from unittest.mock import patch
+from helpers import DatabaseTestCase
+from database.models import db, Category, DailyRollup, Transaction, User, content_hash
+from services import import_service, rollup_service
+from services.import_service import StatementError, parse_csv, parse_ofx
+
+FIXTURE = os.path.join(os.path.dirname(__file__), 'fixtures', 'statement.ofx')
+
+STATEMENT = '''Date,Description,Amount
+2026-03-01,STARBUCKS STORE 1042,-5.25
+2026-03-01,STARBUCKS STORE 1042,-5.25
+03/02/2026,"UBER *TRIP, HELP.UBER.COM","-1,023.50"
+
+2026-03-04,PAYROLL ACME CORP,$2500
+'''
+
+class TestParsing(unittest.TestCase):
+    def test_csv_amount_column(self):
+        rows = list(parse_csv(io.StringIO(STATEMENT)))
+        self.assertEqual(rows, [
+            (2, date(2026, 3, 1), -5.25, 'STARBUCKS STORE 1042'),
+            (3, date(2026, 3, 1), -5.25, 'STARBUCKS STORE 1042'),
+            (4, date(2026, 3, 2), -1023.5, 'UBER *TRIP, HELP.UBER.COM'),
+            (6, date(2026, 3, 4), 2500, 'PAYROLL ACME CORP'),
+        ])
+
+    def test_csv_debit_and_credit_columns(self):
+        statement = 'Posted Date,Payee,Debit,Credit\n3/5/26,GROCERY,(12.00),\n3/6/26,REFUND,,4.50\n'
+        self.assertEqual([row[1:] for row in parse_csv(io.StringIO(statement))], [
+            (date(2026, 3, 5), -12.0, 'GROCERY'),
+            (date(2026, 3, 6), 4.5, 'REFUND'),
+        ])
+
+    def test_csv_errors_name_the_line(self):
+        for statement, message in [
+            ('', 'empty'),
+            ('When,What\n2026-03-01,X\n', 'header'),
+            ('Date,Description,Amount\n2026-03-01,X,1\nyesterday,X,1\n', 'Line 3'),
+            ('Date,Description,Amount\n2026-03-01,X,lots\n', 'Line 2'),
+            ('Date,Description,Amount\n2026-03-01,X\n', 'Line 2'),
+        ]:
+            with self.assertRaisesRegex(StatementError, message):
+                list(parse_csv(io.StringIO(statement)))
+
+    def test_ofx(self):
+        with open(FIXTURE) as f:
+            expected = [
+                (1, date(2026, 3, 3), -23.5, 'UBER *TRIP HELP.UBER.COM'),
+                (2, date(2026, 3, 5), -64.12, 'TRADER JOE&S #552'),
+                (3, date(2026, 3, 15), 2500.0, 'PAYROLL ACME CORP'),
+            ]
+            self.assertEqual(list(parse_ofx(f)), expected)
+            # Tags split across reads are put back together
+            f.seek(0)
+            with patch.object(import_service, 'READ_SIZE', 7):
+                self.assertEqual(list(parse_ofx(f)), expected)
+
+    def test_ofx_xml(self):
+        statement = ('<?xml version="1.0"?><OFX><BANKTRANLIST><STMTTRN><TRNTYPE>DEBIT</TRNTYPE>'
+                     '<DTPOSTED>20260302</DTPOSTED><TRNAMT>-9.99</TRNAMT><NAME>NETFLIX.COM</NAME>'
+                     '</STMTTRN></BANKTRANLIST></OFX>')
+        self.assertEqual(list(parse_ofx(io.StringIO(statement))), [(1, date(2026, 3, 2), -9.99, 'NETFLIX.COM')])
+        with self.assertRaisesRegex(StatementError, 'Transaction 1'):
+            list(parse_ofx(io.StringIO('<OFX><STMTTRN><TRNAMT>-1</STMTTRN></OFX>')))
+
+class TestImport(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = self.make_user()
+        self.account = self.make_account(self.user)
+
+    def run_import(self, statement, fmt='csv'):
+        counts = import_service.import_statement(self.user.id, self.account.id, io.BytesIO(statement.encode()), fmt)
+        db.session.commit()
+        return counts
+
+    def rollup_totals(self):
+        return sorted((r.day, r.category_id, round(r.income, 2), round(r.expenses, 2), r.transaction_count)
+                      for r in DailyRollup.query.all())
+
+    def test_import_and_reimport(self):
+        self.assertEqual(self.run_import(STATEMENT), {'rows': 4, 'imported': 4, 'duplicates': 0})
+        uber = Transaction.query.filter_by(amount=-1023.5).one()
+        self.assertEqual((uber.merchant, db.session.get(Category, uber.category_id).name), ('Uber', 'Transportation'))
+        self.assertEqual(uber.content_hash, content_hash(self.account.id, uber.date, uber.amount, uber.description))
+        self.assertEqual(uber.change_version, self.user.data_version)
+
+        incremental = self.rollup_totals()
+        rollup_service.rebuild(self.user.id)
+        db.session.commit()
+        self.assertEqual(incremental, self.rollup_totals())
+
+        # The same statement again imports nothing and leaves the data version alone
+        version = db.session.get(User, self.user.id).data_version
+        self.assertEqual(self.run_import(STATEMENT), {'rows': 4, 'imported': 0, 'duplicates': 4})
+        self.assertEqual(db.session.get(User, self.user.id).data_version, version)
+
+        # Plus one new row
+        statement = STATEMENT + '2026-03-05,LYFT RIDE,-14\n'
+        self.assertEqual(self.run_import(statement), {'rows': 5, 'imported': 1, 'duplicates': 4})
+        self.assertEqual(Transaction.query.count(), 5)
+
+    def test_duplicates_of_stored_rows(self):
+        # Already stored from an earlier statement, with different whitespace and case
+        self.add_transaction(self.account, -5.25, date(2026, 3, 1), description='Starbucks  Store 1042')
+        counts = self.run_import(STATEMENT)
+        self.assertEqual((counts['imported'], counts['duplicates']), (3, 1))
+        self.assertEqual(Transaction.query.filter_by(amount=-5.25).count(), 2)
+
+    def test_other_accounts_rows_are_not_duplicates(self):
+        other = self.make_account(self.user, 'Savings')
+        self.add_transaction(other, -5.25, date(2026, 3, 1), description='STARBUCKS STORE 1042')
+        self.assertEqual(self.run_import(STATEMENT)['imported'], 4)
+
+    def test_ofx_import(self):
+        with open(FIXTURE, 'rb') as f:
+            counts = import_service.import_statement(self.user.id, self.account.id, f, 'ofx')
+        self.assertEqual(counts, {'rows': 3, 'imported': 3, 'duplicates': 0})
+
+    def test_bad_row_imports_nothing(self):
+        with self.assertRaisesRegex(StatementError, 'Line 3'):
+            self.run_import('Date,Description,Amount\n2026-03-01,X,1\n2026-03-02,X,??\n')
+        db.session.rollback()
+        self.assertEqual(Transaction.query.count(), 0)
+        self.assertEqual(self.run_import(STATEMENT)['imported'], 4)
+
+class TestImportEndpoint(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = self.make_user()
+        self.account = self.make_account(self.user)
+        self.headers = self.auth_headers(self.user)
+
+    def post(self, data, filename='statement.csv', account=None):
+        return self.client.post('/api/imports', headers=self.headers, content_type='multipart/form-data', data={
+            'account_id': str((account or self.account).id),
+            'file': (io.BytesIO(data.encode()), filename)
+        })
+
+    def test_upload(self):
+        response = self.post(STATEMENT)
+        self.assertEqual(response.status_code, 201, response.get_json())
+        self.assertEqual(response.get_json(), {'rows': 4, 'imported': 4, 'duplicates': 0})
+        with open(FIXTURE) as f:
+            response = self.post(f.read(), 'march.QFX')
+        self.assertEqual(response.get_json()['imported'], 3)
+
+    def test_bad_requests(self):
+        self.assertEqual(self.post(STATEMENT, 'statement.xlsx').status_code, 400)
+        response = self.post('Date,Description,Amount\n2026-03-01,X,lots\n')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Line 2', response.get_json()['detail'])
+        other = self.make_account(self.make_user())
+        self.assertEqual(self.post(STATEMENT, account=other).status_code, 404)
+        self.assertEqual(Transaction.query.count(), 0)
+
+    def test_cli(self):
+        result = self.app.test_cli_runner().invoke(args=['import', 'statement', FIXTURE, '--account-id', str(self.account.id)])
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn('Imported 3 of 3', result.output)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+import unittest
+from datetime import date
+from helpers import DatabaseTestCase
+from database.models import db, Transaction, DailyRollup
+from services import rollup_service
+from services.ingest_service import upsert_transactions, delete_transactions
+
+class TestTransactionUpsert(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = self.make_user()
+        self.account = self.make_account(self.user)
+
+    def rows(self, count, amount=-10.0):
+        return [{
+            'bank_account_id': self.account.id,
+            'plaid_transaction_id': f'p-{i}',
+            'amount': amount - i,
+            'date': date(2026, 10, 1 + i % 28),
+            'description': f'Row {i}',
+            'merchant': None
+        } for i in range(count)]
+
+    def rollups(self):
+        return sorted((r.day, round(r.expenses, 2), r.transaction_count) for r in DailyRollup.query.all())
+
+    def assertRollupsConsistent(self):
+        incremental = self.rollups()
+        rollup_service.rebuild(self.user.id)
+        db.session.commit()
+        self.assertEqual(incremental, self.rollups())
+
+    def test_insert_then_idempotent_reingest(self):
+        counts = upsert_transactions(self.user.id, self.rows(7), chunk_size=3)
+        db.session.commit()
+        self.assertEqual(counts, {'inserted': 7, 'updated': 0, 'unchanged': 0})
+
+        counts = upsert_transactions(self.user.id, self.rows(7), chunk_size=3)
+        db.session.commit()
+        self.assertEqual(counts, {'inserted': 0, 'updated': 0, 'unchanged': 7})
+        self.assertEqual(Transaction.query.count(), 7)
+        self.assertRollupsConsistent()
+
+    def test_updates_only_changed_rows(self):
+        upsert_transactions(self.user.id, self.rows(5))
+        rows = self.rows(6)
+        rows[2]['amount'] = -99.0
+        rows[4]['description'] = 'Renamed'
+        counts = upsert_transactions(self.user.id, rows, chunk_size=2)
+        db.session.commit()
+        self.assertEqual(counts, {'inserted': 1, 'updated': 2, 'unchanged': 3})
+        self.assertEqual(Transaction.query.filter_by(plaid_transaction_id='p-2').one().amount, -99.0)
+        self.assertRollupsConsistent()
+
+    def test_duplicate_ids_in_one_batch(self):
+        rows = self.rows(2) + [dict(self.rows(1)[0], amount=-1.0)]
+        counts = upsert_transactions(self.user.id, rows)
+        db.session.commit()
+        self.assertEqual(counts['inserted'], 2)
+        self.assertEqual(Transaction.query.filter_by(plaid_transaction_id='p-0').one().amount, -1.0)
+
+    def test_keeps_columns_not_supplied(self):
+        food = self.make_category('Food & Dining')
+        upsert_transactions(self.user.id, self.rows(1))
+        Transaction.query.one().category_id = food.id
+        rollup_service.rebuild(self.user.id)
+        db.session.commit()
+        upsert_transactions(self.user.id, self.rows(1, amount=-20.0))
+        db.session.commit()
+        self.assertEqual(Transaction.query.one().category_id, food.id)
+        self.assertEqual(DailyRollup.query.one().category_id, food.id)
+        self.assertRollupsConsistent()
+
+    def test_delete_is_scoped_to_user(self):
+        upsert_transactions(self.user.id, self.rows(3))
+        other = self.make_user()
+        self.add_transaction(self.make_account(other), -5, plaid_transaction_id='other')
+        db.session.commit()
+        self.assertEqual(delete_transactions(self.user.id, ['p-0', 'other']), 1)
+        self.assertEqual(delete_transactions(self.user.id, []), 0)
+        db.session.commit()
+        self.assertEqual(Transaction.query.count(), 3)
+        self.assertRollupsConsistent()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,207 @@
+import threading
+import unittest
+from datetime import datetime, timedelta
+from unittest.mock import MagicMock, patch
+from helpers import DatabaseTestCase
+from fake_plaid import FakePlaidServer
+from database.models import db, BankAccount, Job, PlaidItem, Transaction
+from database.dialects import is_postgres
+from services import job_service, sync_service
+from services.plaid_service import PlaidService
+
+class TestJobQueue(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.calls = []
+        patcher = patch.dict(job_service.HANDLERS, {
+            'echo': lambda payload: self.calls.append(payload) or {'echo': payload},
+            'boom': self.boom
+        })
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def boom(self, payload):
+        raise RuntimeError('upstream unavailable')
+
+    def enqueue(self, kind, payload=None, **kwargs):
+        job = job_service.enqueue(kind, payload or {}, **kwargs)
+        db.session.commit()
+        return job
+
+    def test_runs_job_and_records_result(self):
+        job_id = self.enqueue('echo', {'n': 1}).id
+        job = job_service.run_next('w1')
+        self.assertEqual((job.id, job.status, job.attempts), (job_id, 'succeeded', 1))
+        self.assertEqual(job.result, {'echo': {'n': 1}})
+        self.assertIsNotNone(job.finished_at)
+        self.assertIsNone(job_service.run_next('w1'))
+
+    def test_dedupes_untried_queued_jobs(self):
+        first = self.enqueue('echo', dedupe_key='sync:1').id
+        self.assertEqual(self.enqueue('echo', dedupe_key='sync:1').id, first)
+        self.assertNotEqual(self.enqueue('echo', dedupe_key='sync:2').id, first)
+
+        # Once picked up, a new request queues a fresh job
+        job_service.claim('w1')
+        self.assertNotEqual(self.enqueue('echo', dedupe_key='sync:1').id, first)
+
+    def test_retries_with_backoff_then_dead_letters(self):
+        job_id = self.enqueue('boom', max_attempts=3).id
+        base = self.app.config['JOB_RETRY_BASE_SECONDS']
+
+        for attempt in (1, 2):
+            before = datetime.utcnow()
+            job = job_service.run_next('w1')
+            self.assertEqual((job.status, job.attempts), ('queued', attempt))
+            self.assertIn('upstream unavailable', job.last_error)
+            delay = (job.run_at - before).total_seconds()
+            self.assertGreaterEqual(delay, base * 2 ** (attempt - 1) * 0.5 - 1)
+            self.assertLessEqual(delay, base * 2 ** (attempt - 1) + 1)
+            # Not due until the backoff has passed
+            self.assertIsNone(job_service.run_next('w1'))
+            job.run_at = datetime.utcnow() - timedelta(seconds=1)
+            db.session.commit()
+
+        job = job_service.run_next('w1')
+        self.assertEqual((job.id, job.status, job.attempts), (job_id, 'dead', 3))
+        self.assertIsNotNone(job.finished_at)
+        self.assertIsNone(job_service.run_next('w1'))
+
+    def test_backoff_is_capped(self):
+        self.app.config['JOB_RETRY_MAX_SECONDS'], previous = 60, self.app.config['JOB_RETRY_MAX_SECONDS']
+        try:
+            self.assertLessEqual(job_service.backoff(20), 60)
+        finally:
+            self.app.config['JOB_RETRY_MAX_SECONDS'] = previous
+
+    def test_expired_lease_is_reclaimed(self):
+        job_id = self.enqueue('echo').id
+        job_service.claim('crashed-worker')
+        self.assertIsNone(job_service.claim('w2'))
+
+        db.session.get(Job, job_id).locked_until = datetime.utcnow() - timedelta(seconds=1)
+        db.session.commit()
+        job = job_service.claim('w2')
+        self.assertEqual((job.id, job.locked_by, job.attempts), (job_id, 'w2', 2))
+
+    def test_expired_final_attempt_is_dead_lettered(self):
+        job_id = self.enqueue('echo', max_attempts=1).id
+        job_service.claim('crashed-worker')
+        db.session.get(Job, job_id).locked_until = datetime.utcnow() - timedelta(seconds=1)
+        db.session.commit()
+
+        self.assertIsNone(job_service.claim('w2'))
+        job = db.session.get(Job, job_id, populate_existing=True)
+        self.assertEqual((job.status, job.attempts, job.locked_by), (job_service.DEAD, 1, None))
+        self.assertIsNotNone(job.finished_at)
+
+    def test_overrun_worker_does_not_overwrite_the_new_owner(self):
+        job_id = self.enqueue('echo', {'n': 1}).id
+        stale = job_service.claim('slow-worker')
+        # As held by the first worker's own session
+        db.session.expunge(stale)
+        db.session.get(Job, job_id).locked_until = datetime.utcnow() - timedelta(seconds=1)
+        db.session.commit()
+        job_service.claim('w2')
+
+        with self.assertLogs('services.job_service', 'WARNING'):
+            job = job_service.run(stale)
+        self.assertEqual((job.status, job.locked_by, job.attempts), (job_service.RUNNING, 'w2', 2))
+
+    def test_unknown_kind_fails(self):
+        self.enqueue('nope')
+        job = job_service.run_next('w1')
+        self.assertEqual(job.status, 'queued')
+        self.assertIn('No handler', job.last_error)
+
+    def test_status_endpoint(self):
+        user, other = self.make_user(), self.make_user()
+        job_id = self.enqueue('echo', {'user_id': user.id}).id
+        body = self.client.get(f'/jobs/{job_id}', headers=self.auth_headers(user)).get_json()
+        self.assertEqual((body['id'], body['kind'], body['status']), (job_id, 'echo', 'queued'))
+        self.assertEqual(self.client.get('/jobs/999999', headers=self.auth_headers(user)).status_code, 404)
+        # Only the job's own user may read it
+        self.assertEqual(self.client.get(f'/jobs/{job_id}').status_code, 401)
+        self.assertEqual(self.client.get(f'/jobs/{job_id}', headers=self.auth_headers(other)).status_code, 404)
+
+    def test_concurrent_workers_never_share_a_job(self):
+        if not is_postgres():
+            self.skipTest('SQLite has no row locks; workers need Postgres for SKIP LOCKED')
+        job_ids = [self.enqueue('echo', {'n': i}).id for i in range(40)]
+        claimed = []
+        lock = threading.Lock()
+
+        def worker(name):
+            with self.app.app_context():
+                while True:
+                    job = job_service.claim(name)
+                    if job is None:
+                        break
+                    with lock:
+                        claimed.append(job.id)
+                db.session.remove()
+
+        threads = [threading.Thread(target=worker, args=(f'w{i}',)) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sorted(claimed), job_ids)
+
+class TestPlaidJobs(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = self.make_user()
+        page = {
+            'added': [{'transaction_id': 'txn-1', 'account_id': 'acc-1', 'amount': -3.0,
+                       'date': '2026-10-01', 'name': 'Coffee', 'merchant_name': None}],
+            'modified': [], 'removed': [], 'next_cursor': 'done', 'has_more': False
+        }
+        self.server = FakePlaidServer({'/transactions/sync': {'access-1': {'': [page]}}}).__enter__()
+        self.plaid = PlaidService(host=self.server.url)
+        self.plaid.get_accounts = MagicMock(return_value=[
+            {'account_id': 'acc-1', 'name': 'Checking', 'type': 'depository', 'balances': {'current': 12.5}}
+        ])
+
+    def tearDown(self):
+        self.server.__exit__()
+        super().tearDown()
+
+    def test_exchange_token_links_accounts_in_the_background(self):
+        route_plaid = MagicMock()
+        route_plaid.exchange_public_token.return_value = 'access-1'
+        with patch('routes.plaid_routes.plaid_service', route_plaid):
+            response = self.client.post('/exchange-token', json={'public_token': 'public-1', 'user_id': self.user.id})
+        self.assertEqual(response.status_code, 202, response.get_json())
+        self.assertEqual(BankAccount.query.count(), 0)
+
+        with patch('services.sync_service.get_plaid_service', return_value=self.plaid):
+            self.assertEqual(job_service.work('w1', burst=True), 1)
+        job = self.client.get(response.headers['Location'], headers=self.auth_headers(self.user)).get_json()
+        self.assertEqual((job['kind'], job['status'], job['result']['added']), ('link_item', 'succeeded', 1))
+        self.assertEqual([a.plaid_account_id for a in BankAccount.query.all()], ['acc-1'])
+        self.assertEqual(Transaction.query.count(), 1)
+        self.assertEqual(PlaidItem.query.one().transactions_cursor, 'done')
+
+        # A retried link job does not duplicate accounts
+        sync_service.link_accounts(self.plaid, PlaidItem.query.one())
+        self.assertEqual(BankAccount.query.count(), 1)
+
+    def test_repeated_sync_requests_share_one_job(self):
+        db.session.add(PlaidItem(user_id=self.user.id, access_token='access-1'))
+        db.session.commit()
+        first = self.client.get(f'/transactions/{self.user.id}').get_json()['job_id']
+        second = self.client.get(f'/transactions/{self.user.id}').get_json()['job_id']
+        self.assertEqual(first, second)
+        self.assertEqual(Job.query.count(), 1)
+
+    def test_non_integer_user_ids_are_rejected(self):
+        self.assertEqual(self.client.get('/transactions/abc').status_code, 404)
+        self.assertEqual(self.client.get('/accounts/abc').status_code, 404)
+        for user_id in ('abc', '1.5', [1], True):
+            response = self.client.post('/exchange-token', json={'public_token': 'public-1', 'user_id': user_id})
+            self.assertEqual(response.status_code, 400, user_id)
+        self.assertEqual(Job.query.count(), 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+import re
+import unittest
+from unittest.mock import patch
+from sqlalchemy import select
+from helpers import DatabaseTestCase
+from database.models import db, User
+from services import metrics
+
+class TestRegistry(unittest.TestCase):
+    def test_render(self):
+        registry = metrics.Registry()
+        requests = registry.counter('test_requests_total', 'Requests.', ('route',))
+        latency = registry.histogram('test_latency_seconds', 'Latency.', ('route',), buckets=(0.1, 1))
+        requests.inc(route='/a')
+        requests.inc(2, route='/b"')
+        for value in (0.05, 0.1, 0.5, 3):
+            latency.observe(value, route='/a')
+
+        self.assertEqual(registry.render().splitlines(), [
+            '# HELP test_requests_total Requests.',
+            '# TYPE test_requests_total counter',
+            'test_requests_total{route="/a"} 1',
+            'test_requests_total{route="/b\\""} 2',
+            '# HELP test_latency_seconds Latency.',
+            '# TYPE test_latency_seconds histogram',
+            'test_latency_seconds_bucket{route="/a",le="0.1"} 2',
+            'test_latency_seconds_bucket{route="/a",le="1"} 3',
+            'test_latency_seconds_bucket{route="/a",le="+Inf"} 4',
+            'test_latency_seconds_sum{route="/a"} 3.65',
+            'test_latency_seconds_count{route="/a"} 4',
+        ])
+
+    def test_statement_shape(self):
+        self.assertEqual(metrics.statement_shape('SELECT a\n  FROM t WHERE id IN (?, ?, ?) AND b = ?'),
+                         'SELECT a FROM t WHERE id IN (?) AND b = ?')
+        self.assertEqual(metrics.statement_shape('SELECT a FROM t WHERE id IN (%(id_1_1)s, %(id_1_2)s)'),
+                         metrics.statement_shape('SELECT a FROM t WHERE id IN (%(id_1_1)s)'))
+
+class TestRequestMetrics(DatabaseTestCase):
+    def test_request_latency_and_statements(self):
+        user = self.make_user()
+        requests = metrics.REQUEST_DURATION.count(method='GET', route='/api/me', status=200)
+        statements = metrics.REQUEST_STATEMENTS.sum(method='GET', route='/api/me')
+        response = self.client.get('/api/me', headers={**self.auth_headers(user), 'X-Request-ID': 'abc-123'})
+        self.assertEqual((response.status_code, response.headers['X-Request-ID']), (200, 'abc-123'))
+        self.assertEqual(metrics.REQUEST_DURATION.count(method='GET', route='/api/me', status=200), requests + 1)
+        self.assertGreater(metrics.REQUEST_STATEMENTS.sum(method='GET', route='/api/me'), statements)
+        self.client.get('/no-such-page')
+
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.content_type.startswith('text/plain; version=0.0.4'))
+        body = response.get_data(as_text=True)
+        self.assertIn('# TYPE spendapp_http_request_duration_seconds histogram', body)
+        self.assertRegex(body, r'spendapp_http_request_duration_seconds_count\{method="GET",route="/api/me",status="200"\} \d+')
+        self.assertIn('route="<unmatched>",status="404"', body)
+        self.assertTrue(re.search(r'spendapp_db_statement_duration_seconds_count \d+', body))
+        self.assertEqual(self.client.get('/traces?trace_id=abc-123').get_json(), {'spans': []})
+
+    def test_endpoints_off_unless_enabled(self):
+        with patch.dict(self.app.config, OPS_ENDPOINTS_ENABLED=False):
+            self.assertEqual(self.client.get('/metrics').status_code, 404)
+            self.assertEqual(self.client.get('/traces').status_code, 404)
+
+    def test_n_plus_one(self):
+        users = [self.make_user() for _ in range(12)]
+        flagged = metrics.N_PLUS_ONE.value(method='GET', route='/api/me')
+        with self.assertLogs('services.metrics', 'WARNING') as logs:
+            with self.app.test_request_context('/api/me'):
+                metrics.start_request()
+                for user in users:
+                    db.session.execute(select(User.email).where(User.id == user.id)).scalar_one()
+        self.assertIn('ran 12 times', logs.output[0])
+        self.assertEqual(metrics.N_PLUS_ONE.value(method='GET', route='/api/me'), flagged + 1)
+
+        # One query for all of them is fine, as are repeats within the threshold
+        with self.app.test_request_context('/api/me'):
+            metrics.start_request()
+            db.session.execute(select(User.email).where(User.id.in_([u.id for u in users]))).all()
+            for user in users[:10]:
+                db.session.execute(select(User.email).where(User.id == user.id)).scalar_one()
+        self.assertEqual(metrics.N_PLUS_ONE.value(method='GET', route='/api/me'), flagged + 1)
+
+if __name__ == '__main__':
+    unittest.main()
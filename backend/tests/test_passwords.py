@@ -0,0 +1,115 @@
+import threading
+import unittest
+from unittest.mock import patch
+from werkzeug.security import generate_password_hash
+from helpers import DatabaseTestCase
+from database.models import db, User
+from services import password_service
+from services.password_service import HashingBusy, HashingPool, canonical_method, needs_rehash
+
+class TestHashingPool(unittest.TestCase):
+    def test_rejects_work_beyond_the_queue_limit(self):
+        pool = HashingPool(workers=0, max_pending=1)
+        started, release = threading.Semaphore(0), threading.Event()
+
+        def slow():
+            started.release()
+            release.wait()
+            return 'done'
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(pool.run(slow))) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+            started.acquire()
+        with self.assertRaises(HashingBusy):
+            pool.run(slow)
+
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, ['done', 'done'])
+        # Slots are given back once work finishes
+        self.assertEqual(pool.run(lambda: 'again'), 'again')
+
+    def test_hashes_in_worker_processes(self):
+        pool = HashingPool(workers=2, max_pending=0)
+        try:
+            stored = pool.run(password_service._hash, 'secret', 'pbkdf2:sha256:1000')
+            self.assertEqual(pool.run(password_service._verify, stored, 'secret', 'pbkdf2:sha256:1000'), (True, None))
+            self.assertEqual(pool.run(password_service._verify, stored, 'wrong', 'pbkdf2:sha256:1000'), (False, None))
+        finally:
+            pool.shutdown()
+
+    def test_method_comparison(self):
+        self.assertEqual(canonical_method('scrypt'), 'scrypt:32768:8:1')
+        self.assertEqual(canonical_method('pbkdf2:sha512'), 'pbkdf2:sha512:1000000')
+        stored = generate_password_hash('secret', method='pbkdf2:sha256:1000')
+        self.assertFalse(needs_rehash(stored, 'pbkdf2:sha256:1000'))
+        self.assertTrue(needs_rehash(stored, 'pbkdf2:sha256:2000'))
+        self.assertTrue(needs_rehash(stored, 'scrypt'))
+        with self.assertRaises(ValueError):
+            canonical_method('md5')
+
+class TestPasswordRoutes(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.post('/register', json={'email': 'a@example.com', 'password': 'secret', 'fullName': 'A'})
+        self.user = User.query.filter_by(email='a@example.com').one()
+
+    def login(self, password='secret'):
+        return self.client.post('/login', json={'email': 'a@example.com', 'password': password})
+
+    def token(self, password='secret'):
+        return self.client.post('/token', data={'username': 'a@example.com', 'password': password})
+
+    def stored_hash(self):
+        db.session.expire_all()
+        return db.session.get(User, self.user.id).hashed_password
+
+    def test_register_and_login(self):
+        self.assertTrue(self.stored_hash().startswith('pbkdf2:sha256:1000$'))
+        self.assertEqual(self.login().status_code, 200)
+        self.assertEqual(self.login('wrong').status_code, 401)
+        self.assertEqual(self.token().status_code, 200)
+        self.assertEqual(self.token('wrong').status_code, 401)
+
+    def test_outdated_hash_is_upgraded_on_login(self):
+        with patch.dict(self.app.config, PASSWORD_HASH_METHOD='pbkdf2:sha256:2000'):
+            self.assertEqual(self.login('wrong').status_code, 401)
+            self.assertTrue(self.stored_hash().startswith('pbkdf2:sha256:1000$'))
+
+            self.assertEqual(self.login().status_code, 200)
+            upgraded = self.stored_hash()
+            self.assertTrue(upgraded.startswith('pbkdf2:sha256:2000$'))
+
+            # Already current: left alone
+            self.assertEqual(self.token().status_code, 200)
+            self.assertEqual(self.stored_hash(), upgraded)
+
+    def test_saturated_pool_answers_503(self):
+        with patch.dict(self.app.config, PASSWORD_HASH_WORKERS=1, PASSWORD_HASH_MAX_PENDING=1):
+            pool = password_service.get_pool()
+            for _ in range(2):
+                pool.slots.acquire()
+            try:
+                for response in (
+                    self.login(),
+                    self.token(),
+                    self.client.post('/register', json={'email': 'b@example.com', 'password': 'secret'})
+                ):
+                    self.assertEqual(response.status_code, 503)
+                    self.assertEqual(response.headers['Retry-After'], '1')
+                    self.assertIn('detail', response.get_json())
+            finally:
+                for _ in range(2):
+                    pool.slots.release()
+            self.assertEqual(self.login().status_code, 200)
+        self.assertIsNone(User.query.filter_by(email='b@example.com').first())
+
+    @classmethod
+    def tearDownClass(cls):
+        password_service.shutdown()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,180 @@
+import time
+import unittest
+from unittest.mock import patch
+import urllib3
+from plaid import ApiException
+from fake_plaid import FakePlaidServer
+from app import app
+from database.config import Config
+from services import metrics, plaid_client
+from services.plaid_client import CircuitBreaker, CircuitOpenError
+from services.plaid_service import PlaidService
+
+OK = {'added': [], 'modified': [], 'removed': [], 'next_cursor': 'c1', 'has_more': False}
+SERVER_ERROR = {'status': 500, 'body': {'error_type': 'API_ERROR', 'error_code': 'INTERNAL_SERVER_ERROR'}}
+LOGIN_REQUIRED = {'status': 400, 'body': {'error_type': 'ITEM_ERROR', 'error_code': 'ITEM_LOGIN_REQUIRED'}}
+
+def rate_limited(retry_after):
+    return {'status': 429, 'body': {'error_type': 'RATE_LIMIT_EXCEEDED'}, 'headers': {'Retry-After': retry_after}}
+
+class TestPlaidClient(unittest.TestCase):
+    def setUp(self):
+        plaid_client.reset_breakers()
+        self.server = FakePlaidServer({'/transactions/sync': {}, '/item/public_token/exchange': {}}).__enter__()
+        self.plaid = PlaidService(host=self.server.url)
+
+    def tearDown(self):
+        self.server.__exit__()
+
+    def script(self, *responses, token='access-1'):
+        self.server.responses['/transactions/sync'][token] = {'': list(responses)}
+
+    def sync(self, token='access-1', institution=None):
+        return self.plaid.sync_transactions(token, institution=institution)[0]
+
+    def test_connections_are_pooled_across_calls_and_instances(self):
+        self.script(OK)
+        for _ in range(10):
+            self.sync()
+        PlaidService(host=self.server.url).sync_transactions('access-1')
+        self.assertEqual(len(self.server.requests), 11)
+        self.assertEqual(self.server.connections, 1)
+
+    def test_honours_retry_after_on_429(self):
+        self.script(rate_limited('0.3'), OK)
+        started = time.perf_counter()
+        self.assertEqual(self.sync()['next_cursor'], 'c1')
+        self.assertGreaterEqual(time.perf_counter() - started, 0.3)
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_attempts_are_measured_and_traced(self):
+        self.script(rate_limited('0'), OK)
+        labels = {'operation': 'transactions_sync', 'institution': 'Bank A'}
+        before = (plaid_client.CALL_DURATION.count(**labels), plaid_client.RESPONSE_BYTES.count(**labels),
+                  plaid_client.RATE_LIMITED.value(**labels), plaid_client.CALL_ERRORS.value(error=429, **labels))
+        with metrics.trace('job', 'sync_user:1') as trace:
+            self.sync(institution='Bank A')
+        after = (plaid_client.CALL_DURATION.count(**labels), plaid_client.RESPONSE_BYTES.count(**labels),
+                 plaid_client.RATE_LIMITED.value(**labels), plaid_client.CALL_ERRORS.value(error=429, **labels))
+        self.assertEqual([b - a for a, b in zip(before, after)], [2, 2, 1, 1])
+        self.assertGreater(plaid_client.RESPONSE_BYTES.sum(**labels), 0)
+
+        spans = metrics.recent_spans(trace.id)
+        self.assertEqual([(s['name'], s['attempt'], s['outcome'], s['parent']) for s in spans], [
+            ('plaid.transactions_sync', 1, 429, 'job sync_user:1'),
+            ('plaid.transactions_sync', 2, 'ok', 'job sync_user:1'),
+        ])
+        self.assertTrue(all(s['institution'] == 'Bank A' and s['response_bytes'] > 0 for s in spans))
+        self.assertEqual(trace.plaid_calls, 1)
+        self.assertGreaterEqual(trace.plaid_seconds, sum(s['duration_ms'] for s in spans) / 1000)
+
+    def test_request_time_waiting_on_plaid(self):
+        self.script(OK)
+        waited = metrics.REQUEST_PLAID_TIME.count(method='GET', route='/api/me')
+        outer = metrics.current_trace()
+        with app.test_request_context('/api/me', headers={'X-Request-ID': 'req-42'}):
+            metrics.start_request()
+            self.sync()
+        self.assertEqual(metrics.REQUEST_PLAID_TIME.count(method='GET', route='/api/me'), waited + 1)
+        self.assertEqual([s['parent'] for s in metrics.recent_spans('req-42')], ['request GET /api/me'])
+        self.assertIs(metrics.current_trace(), outer)
+
+    def test_gives_up_when_rate_limit_wait_is_too_long(self):
+        self.script(rate_limited('3600'), OK)
+        with self.assertRaises(ApiException) as raised:
+            self.sync()
+        self.assertEqual(raised.exception.status, 429)
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_retries_server_errors_and_resets(self):
+        self.script(SERVER_ERROR, {'reset': True}, OK)
+        self.assertEqual(self.sync()['next_cursor'], 'c1')
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_gives_up_after_configured_attempts(self):
+        self.script(SERVER_ERROR)
+        with patch.object(Config, 'PLAID_RETRY_ATTEMPTS', 3), self.assertRaises(ApiException):
+            self.sync()
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_client_errors_are_not_retried(self):
+        self.script(LOGIN_REQUIRED, OK)
+        with self.assertRaises(ApiException):
+            self.sync()
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_read_timeout(self):
+        self.script(OK)
+        self.server.latency = 0.5
+        with patch.object(Config, 'PLAID_READ_TIMEOUT', 0.1), patch.object(Config, 'PLAID_RETRY_ATTEMPTS', 2):
+            started = time.perf_counter()
+            with self.assertRaises(urllib3.exceptions.HTTPError):
+                self.sync()
+        self.assertLess(time.perf_counter() - started, 0.5)
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_token_exchange_only_retries_rate_limits(self):
+        exchange = self.server.responses['/item/public_token/exchange']
+        exchange['public-1'] = {'': [rate_limited('0'), {'access_token': 'access-1', 'item_id': 'i1', 'request_id': 'r'}]}
+        self.assertEqual(self.plaid.exchange_public_token('public-1'), 'access-1')
+
+        exchange['public-2'] = {'': [SERVER_ERROR, {'access_token': 'access-2', 'item_id': 'i2', 'request_id': 'r'}]}
+        with self.assertRaises(ApiException):
+            self.plaid.exchange_public_token('public-2')
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_circuit_opens_per_institution(self):
+        self.script(SERVER_ERROR, token='flaky')
+        self.script(OK, token='healthy')
+        with patch.object(Config, 'PLAID_BREAKER_THRESHOLD', 2), patch.object(Config, 'PLAID_RETRY_ATTEMPTS', 1):
+            for _ in range(2):
+                with self.assertRaises(ApiException):
+                    self.sync('flaky', institution='Flaky Bank')
+            with self.assertRaises(CircuitOpenError):
+                self.sync('flaky', institution='Flaky Bank')
+            self.assertEqual(len(self.server.requests), 2)
+            self.assertEqual(self.sync('healthy', institution='Healthy Bank')['next_cursor'], 'c1')
+
+    def test_rate_limits_and_item_errors_do_not_trip_the_circuit(self):
+        self.script(LOGIN_REQUIRED, token='locked')
+        with patch.object(Config, 'PLAID_BREAKER_THRESHOLD', 1):
+            for _ in range(3):
+                with self.assertRaises(ApiException):
+                    self.sync('locked', institution='Bank')
+        self.assertEqual(plaid_client.breaker_for('Bank').state, 'closed')
+
+class TestCircuitBreaker(unittest.TestCase):
+    def setUp(self):
+        self.now = 0.0
+        self.breaker = CircuitBreaker(failure_threshold=2, reset_timeout=10, clock=lambda: self.now)
+
+    def test_opens_after_consecutive_failures(self):
+        self.breaker.record_failure()
+        self.breaker.record_success()
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, 'closed')
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, 'open')
+        with self.assertRaises(CircuitOpenError) as raised:
+            self.breaker.before_call('Bank')
+        self.assertEqual(raised.exception.retry_in, 10)
+
+    def test_half_open_lets_one_trial_through(self):
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        self.now = 10
+        self.breaker.before_call('Bank')
+        with self.assertRaises(CircuitOpenError):
+            self.breaker.before_call('Bank')
+
+        # A failed trial opens the circuit again for a full period
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, 'open')
+        self.now = 20
+        self.breaker.before_call('Bank')
+        self.breaker.record_success()
+        self.assertEqual(self.breaker.state, 'closed')
+        self.breaker.before_call('Bank')
+
+if __name__ == '__main__':
+    unittest.main()
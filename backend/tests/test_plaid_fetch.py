@@ -0,0 +1,141 @@
+import time
+import unittest
+from unittest.mock import patch
+from helpers import DatabaseTestCase
+from fake_plaid import FakePlaidServer
+from database.models import db, PlaidItem, Transaction
+from services import job_service, metrics, sync_service
+from services.plaid_service import PlaidService
+
+def sync_page(token):
+    return {
+        'added': [{
+            'transaction_id': f'{token}-txn', 'account_id': f'{token}-acc', 'amount': -10.0,
+            'date': '2026-10-01', 'name': 'Coffee', 'merchant_name': None
+        }],
+        'modified': [],
+        'removed': [],
+        'next_cursor': f'{token}-done',
+        'has_more': False
+    }
+
+class TestConcurrentFetch(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = self.make_user()
+        self.server = None
+
+    def tearDown(self):
+        if self.server:
+            self.server.__exit__()
+        super().tearDown()
+
+    def start_server(self, tokens, latency=0):
+        responses = {'/transactions/sync': {token: {'': [sync_page(token)]} for token in tokens}}
+        self.server = FakePlaidServer(responses, latency).__enter__()
+        self.plaid = PlaidService(host=self.server.url)
+        return self.server
+
+    def sync_via_job(self):
+        """Request a sync, run the queued job and return (job status, seconds the job took)"""
+        response = self.client.get(f'/transactions/{self.user.id}')
+        self.assertEqual(response.status_code, 202, response.get_json())
+        started = time.perf_counter()
+        with patch('services.sync_service.get_plaid_service', return_value=self.plaid):
+            job_service.run_next('test-worker')
+        elapsed = time.perf_counter() - started
+        job = self.client.get(f"/jobs/{response.get_json()['job_id']}", headers=self.auth_headers(self.user))
+        return job.get_json(), elapsed
+
+    def make_item(self, token, institution):
+        item = PlaidItem(user_id=self.user.id, access_token=token, institution_name=institution)
+        db.session.add(item)
+        db.session.commit()
+        account = self.make_account(self.user, institution=institution)
+        account.plaid_account_id = f'{token}-acc'
+        account.plaid_item_id = item.id
+        db.session.commit()
+        return item
+
+    def test_wall_time_follows_slowest_item(self):
+        latency = {'slow': 0.4, 'fast-1': 0.2, 'fast-2': 0.2, 'fast-3': 0.2}
+        self.start_server(latency, latency)
+        for i, token in enumerate(latency):
+            self.make_item(token, f'Bank {i}')
+
+        job, elapsed = self.sync_via_job()
+        self.assertEqual(job['status'], 'succeeded', job)
+        self.assertEqual((job['result']['added'], job['result']['errors']), (4, 0))
+        self.assertEqual(Transaction.query.count(), 4)
+        self.assertEqual(self.server.max_in_flight, 4)
+        self.assertGreaterEqual(elapsed, 0.4)
+        # Sequential fetching would take at least the sum, 1.0s
+        self.assertLess(elapsed, 0.8)
+
+    def test_per_institution_cap(self):
+        tokens = [f'chase-{i}' for i in range(4)] + ['amex-0']
+        self.start_server(tokens, latency=0.1)
+        items = [self.make_item(token, token.split('-')[0]) for token in tokens]
+
+        fetched = sync_service.fetch_all(self.plaid, items[:4], max_workers=8, per_institution=2)
+        self.assertEqual(self.server.max_in_flight, 2)
+        self.assertEqual(sorted(fetched), sorted(item.id for item in items[:4]))
+
+        # The other institution is not held back by the first one's limit
+        self.server.max_in_flight = 0
+        sync_service.fetch_all(self.plaid, items, max_workers=8, per_institution=2)
+        self.assertEqual(self.server.max_in_flight, 3)
+
+    def test_global_cap(self):
+        tokens = [f'bank{i}' for i in range(6)]
+        self.start_server(tokens, latency=0.1)
+        items = [self.make_item(token, token) for token in tokens]
+        fetched = sync_service.fetch_all(self.plaid, items, max_workers=3, per_institution=2)
+        self.assertEqual(self.server.max_in_flight, 3)
+        self.assertTrue(all(batch['next_cursor'].endswith('-done') for batch in fetched.values()))
+
+    def test_failed_item_does_not_block_the_others(self):
+        self.start_server(['good', 'broken'])
+        self.server.responses['/transactions/sync']['broken'][''] = [
+            {'status': 400, 'body': {'error_code': 'ITEM_LOGIN_REQUIRED'}}
+        ]
+        good = self.make_item('good', 'Bank A')
+        broken = self.make_item('broken', 'Bank B')
+
+        job, _ = self.sync_via_job()
+        self.assertEqual(job['status'], 'succeeded', job)
+        body = job['result']
+        self.assertEqual((body['added'], body['errors']), (1, 1))
+        self.assertIn('error', next(r for r in body['items'] if r['item_id'] == broken.id))
+        self.assertEqual(db.session.get(PlaidItem, good.id).transactions_cursor, 'good-done')
+        self.assertIsNone(db.session.get(PlaidItem, broken.id).transactions_cursor)
+        self.assertEqual([t.plaid_transaction_id for t in Transaction.query.all()], ['good-txn'])
+
+    def test_job_traces_its_concurrent_plaid_calls(self):
+        self.start_server(['good', 'broken'], latency=0.05)
+        self.server.responses['/transactions/sync']['broken'][''] = [
+            {'status': 400, 'body': {'error_code': 'ITEM_LOGIN_REQUIRED'}}
+        ]
+        self.make_item('good', 'Bank A')
+        self.make_item('broken', 'Bank B')
+
+        earlier = len(metrics.recent_spans())
+        job, _ = self.sync_via_job()
+        spans = metrics.recent_spans()[earlier:]
+        self.assertTrue(all(s['parent'] == f"job sync_user:{job['id']}" for s in spans))
+        self.assertEqual(sorted((s['institution'], s['outcome']) for s in spans), [('Bank A', 'ok'), ('Bank B', 400)])
+        self.assertEqual(len({s['trace_id'] for s in spans}), 1)
+
+    def test_all_items_failing_fails_the_job(self):
+        self.start_server(['broken'])
+        self.server.responses['/transactions/sync']['broken'][''] = [
+            {'status': 500, 'body': {'error_code': 'INTERNAL_SERVER_ERROR'}}
+        ]
+        self.make_item('broken', 'Bank A')
+        job, _ = self.sync_via_job()
+        # Retried later with backoff
+        self.assertEqual((job['status'], job['attempts']), ('queued', 1))
+        self.assertIn('failed for every item', job['last_error'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,111 @@
+import os
+import unittest
+from unittest.mock import patch
+from sqlalchemy import update
+from helpers import DatabaseTestCase
+from fake_plaid import FakePlaidServer
+from database.models import db, PlaidItem, Transaction, DailyRollup
+from services import job_service, rollup_service, sync_service
+from services.plaid_service import PlaidService
+
+FIXTURE = os.path.join(os.path.dirname(__file__), 'fixtures', 'plaid_sync_pages.json')
+
+class TestPlaidSync(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.server = FakePlaidServer.from_fixture(FIXTURE).__enter__()
+        self.plaid = PlaidService(host=self.server.url)
+        self.user = self.make_user()
+        self.item = self.make_item(self.user, 'access-sandbox-checking', 'acc-checking')
+
+    def tearDown(self):
+        self.server.__exit__()
+        super().tearDown()
+
+    def make_item(self, user, access_token, plaid_account_id):
+        item = PlaidItem(user_id=user.id, access_token=access_token)
+        db.session.add(item)
+        db.session.commit()
+        account = self.make_account(user)
+        account.plaid_account_id = plaid_account_id
+        account.plaid_item_id = item.id
+        db.session.commit()
+        return item
+
+    def rollup_totals(self):
+        return sorted((r.day, round(r.income, 2), round(r.expenses, 2), r.transaction_count)
+                      for r in DailyRollup.query.all())
+
+    def assertRollupsConsistent(self):
+        incremental = self.rollup_totals()
+        rollup_service.rebuild()
+        db.session.commit()
+        self.assertEqual(incremental, self.rollup_totals())
+
+    def test_initial_then_incremental_sync(self):
+        response = self.client.get(f'/transactions/{self.user.id}')
+        self.assertEqual(response.status_code, 202, response.get_json())
+        with patch('services.sync_service.get_plaid_service', return_value=self.plaid):
+            job_service.run_next('test-worker')
+        job = self.client.get(response.headers['Location'], headers=self.auth_headers(self.user)).get_json()
+        self.assertEqual(job['status'], 'succeeded', job)
+        stats = job['result']['items'][0]
+        self.assertEqual((stats['added'], stats['skipped'], stats['pages']), (4, 1, 2))
+        self.assertGreater(stats['bytes'], 0)
+        self.assertEqual(db.session.get(PlaidItem, self.item.id).transactions_cursor, 'cursor-initial-done')
+        self.assertEqual(Transaction.query.count(), 3)
+        self.assertEqual(Transaction.query.filter_by(plaid_transaction_id='txn-2').one().merchant, 'Uber')
+        self.assertRollupsConsistent()
+
+        stats = sync_service.sync_item(self.plaid, db.session.get(PlaidItem, self.item.id))
+        self.assertEqual((stats['added'], stats['modified'], stats['removed'], stats['pages']), (1, 1, 1, 1))
+        self.assertEqual(self.server.requests[-1][1]['cursor'], 'cursor-initial-done')
+        self.assertEqual(
+            sorted(t.plaid_transaction_id for t in Transaction.query.all()),
+            ['txn-2', 'txn-3', 'txn-5']
+        )
+        self.assertEqual(Transaction.query.filter_by(plaid_transaction_id='txn-2').one().amount, -27.5)
+        self.assertRollupsConsistent()
+
+        # Nothing changed upstream: a refresh transfers one empty page
+        stats = sync_service.sync_item(self.plaid, db.session.get(PlaidItem, self.item.id))
+        self.assertEqual((stats['added'], stats['modified'], stats['removed'], stats['pages']), (0, 0, 0, 1))
+
+    def test_item_synced_meanwhile_is_fetched_again(self):
+        engine, fetch_updates, item_id = db.engine, sync_service.fetch_updates, self.item.id
+
+        def other_worker_first(*args, **kwargs):
+            batch = fetch_updates(*args, **kwargs)
+            if len(self.server.requests) == 2:
+                # Another worker applies the initial sync while this one is fetching
+                with engine.begin() as conn:
+                    conn.execute(update(PlaidItem).where(PlaidItem.id == item_id)
+                                 .values(transactions_cursor='cursor-initial-done'))
+            return batch
+
+        with patch('services.sync_service.fetch_updates', other_worker_first):
+            [stats] = sync_service.sync_items(self.plaid, [db.session.get(PlaidItem, self.item.id)])
+        self.assertEqual([body.get('cursor') for _, body in self.server.requests],
+                         [None, 'cursor-page-1', 'cursor-initial-done'])
+        self.assertEqual((stats['added'], stats['modified'], stats['removed']), (1, 1, 1))
+        self.assertNotEqual(db.session.get(PlaidItem, self.item.id).transactions_cursor, 'cursor-initial-done')
+
+    def test_restarts_when_data_changes_during_pagination(self):
+        item = self.make_item(self.user, 'access-sandbox-mutating', 'acc-mutating')
+        stats = sync_service.sync_item(self.plaid, item)
+        self.assertEqual(stats['added'], 1)
+        self.assertEqual([t.description for t in Transaction.query.all()], ['Fresh'])
+        self.assertEqual(item.transactions_cursor, 'mut-done')
+
+    def test_failed_sync_keeps_cursor(self):
+        self.server.responses['/transactions/sync']['access-sandbox-checking']['cursor-page-1'] = [
+            {'status': 400, 'body': {'error_code': 'ITEM_LOGIN_REQUIRED'}}
+        ]
+        with self.assertRaises(Exception):
+            sync_service.sync_item(self.plaid, self.item)
+        db.session.rollback()
+        self.assertIsNone(db.session.get(PlaidItem, self.item.id).transactions_cursor)
+        self.assertEqual(Transaction.query.count(), 0)
+
+if __name__ == '__main__':
+    unittest.main()
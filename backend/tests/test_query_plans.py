@@ -0,0 +1,78 @@
+import unittest
+from datetime import date, timedelta
+from sqlalchemy import text
+from helpers import DatabaseTestCase
+from database.models import db
+from database.dialects import is_postgres
+from services import rollup_service
+from services.summary_service import summarize, summarize_transactions
+from services.transaction_service import get_page
+
+HOT_TABLES = ('transactions', 'bank_accounts', 'daily_rollups', 'monthly_rollups')
+
+class TestHotQueryPlans(DatabaseTestCase):
+    """Fails if the per-user lookup queries can only be answered by full table scans.
+
+    On Postgres sequential scans are disabled for the session, so the planner
+    still picks one only when no usable index exists.
+    """
+
+    def setUp(self):
+        super().setUp()
+        today = date.today()
+        for _ in range(3):
+            user = self.make_user()
+            for name in ('Checking', 'Savings'):
+                account = self.make_account(user, name)
+                for i in range(30):
+                    self.add_transaction(account, -i, today - timedelta(days=i * 7))
+        self.user_id = user.id
+        rollup_service.rebuild()
+        db.session.commit()
+        if is_postgres():
+            db.session.execute(text('ANALYZE'))
+            db.session.execute(text('SET enable_seqscan = off'))
+
+    def capture(self, fn):
+        """Compile the statements `fn` executes, with parameters inlined"""
+        statements = []
+        execute = db.session.execute
+
+        def recording_execute(stmt, *args, **kwargs):
+            statements.append(stmt)
+            return execute(stmt, *args, **kwargs)
+
+        db.session.execute = recording_execute
+        try:
+            fn()
+        finally:
+            del db.session.execute
+        return [str(s.compile(dialect=db.engine.dialect, compile_kwargs={'literal_binds': True}))
+                for s in statements]
+
+    def plan(self, sql):
+        if is_postgres():
+            return [row[0] for row in db.session.execute(text('EXPLAIN ' + sql))]
+        return [row[-1] for row in db.session.execute(text('EXPLAIN QUERY PLAN ' + sql))]
+
+    def assertNoFullScans(self, fn):
+        for sql in self.capture(fn):
+            for line in self.plan(sql):
+                for table in HOT_TABLES:
+                    self.assertNotIn(f'Seq Scan on {table}', line, sql)
+                    self.assertFalse(line.strip().startswith(f'SCAN {table}'), f'{line}\n{sql}')
+
+    def test_transaction_listing(self):
+        start, end = date.today() - timedelta(days=365), date.today()
+        self.assertNoFullScans(lambda: get_page(self.user_id, start, end, limit=10))
+
+    def test_raw_summary(self):
+        start, end = date.today() - timedelta(days=365), date.today()
+        self.assertNoFullScans(lambda: summarize_transactions(self.user_id, start, end, ['account']))
+
+    def test_rollup_summary(self):
+        start, end = date.today() - timedelta(days=365), date.today()
+        self.assertNoFullScans(lambda: summarize(self.user_id, start, end, ['account', 'category']))
+
+if __name__ == '__main__':
+    unittest.main()
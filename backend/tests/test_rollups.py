@@ -0,0 +1,75 @@
+import unittest
+from datetime import date, timedelta
+from types import SimpleNamespace
+from helpers import DatabaseTestCase
+from database.models import db, DailyRollup, MonthlyRollup
+from services import rollup_service
+from services.summary_service import summarize, summarize_transactions, _split_window
+
+class TestRollups(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = self.make_user()
+        self.account = self.make_account(self.user)
+        self.food = self.make_category('Food & Dining')
+
+    def snapshot(self):
+        return {
+            model.__tablename__: sorted(
+                (r.bank_account_id, r.category_id, getattr(r, period), round(r.income, 2),
+                 round(r.expenses, 2), r.transaction_count)
+                for r in model.query.all()
+            )
+            for model, period in ((DailyRollup, 'day'), (MonthlyRollup, 'month'))
+        }
+
+    def test_record_matches_rebuild(self):
+        rows = [
+            self.add_transaction(self.account, -12.5, date(2026, 1, 30), self.food),
+            self.add_transaction(self.account, -7.5, date(2026, 1, 30), self.food),
+            self.add_transaction(self.account, 2000, date(2026, 2, 1)),
+            self.add_transaction(self.account, -99, date(2026, 2, 14)),
+        ]
+        rollup_service.record(self.user.id, rows)
+        db.session.commit()
+        incremental = self.snapshot()
+
+        rollup_service.rebuild(self.user.id)
+        db.session.commit()
+        self.assertEqual(incremental, self.snapshot())
+        self.assertEqual(
+            incremental['daily_rollups'][0],
+            (self.account.id, 0, date(2026, 2, 1), 2000.0, 0.0, 1)
+        )
+
+    def test_record_removal(self):
+        row = SimpleNamespace(bank_account_id=self.account.id, category_id=None, date=date(2026, 3, 3), amount=-10.0)
+        rollup_service.record(self.user.id, [row, row])
+        rollup_service.record(self.user.id, [row], sign=-1)
+        db.session.commit()
+        daily = DailyRollup.query.one()
+        self.assertEqual((daily.expenses, daily.transaction_count), (10.0, 1))
+
+    def test_summary_across_month_boundaries(self):
+        start = date(2025, 11, 20)
+        day = start
+        while day < date(2026, 3, 10):
+            self.add_transaction(self.account, -(day.day % 7 + 1), day, self.food if day.day % 2 else None)
+            day += timedelta(days=3)
+        rollup_service.rebuild()
+        db.session.commit()
+
+        for window in [(date(2025, 11, 25), date(2026, 3, 5)), (date(2025, 12, 1), date(2026, 2, 28)),
+                       (date(2026, 1, 10), date(2026, 1, 20))]:
+            self.assertEqual(
+                summarize(self.user.id, *window, ['category']),
+                summarize_transactions(self.user.id, *window, ['category'])
+            )
+
+    def test_split_window(self):
+        self.assertEqual(_split_window(date(2025, 11, 25), date(2026, 3, 5)), (date(2025, 12, 1), date(2026, 3, 1)))
+        self.assertEqual(_split_window(date(2025, 12, 1), date(2026, 2, 28)), (date(2025, 12, 1), date(2026, 3, 1)))
+        self.assertEqual(_split_window(date(2026, 1, 10), date(2026, 1, 20)), (None, None))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,178 @@
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import date
+from sqlalchemy import create_engine, insert, select, text, update
+from sqlalchemy.exc import OperationalError
+from helpers import DatabaseTestCase
+from fake_redis import FakeRedisServer
+from database.config import Config
+from database.models import db, User, BankAccount, Transaction, DailyRollup, MonthlyRollup
+from database.routing import ReplicaSet, engine_options
+from services.cache import RedisCache
+from services.ingest_service import bump_data_version, upsert_transactions
+
+class TestEngineOptions(unittest.TestCase):
+    def config(self, **overrides):
+        return {key: getattr(Config, key) for key in dir(Config) if key.isupper()} | overrides
+
+    def test_pool_settings_and_statement_timeout(self):
+        options = engine_options(self.config(DATABASE_POOL_SIZE=7, DATABASE_STATEMENT_TIMEOUT_MS=1500),
+                                 'postgresql://u@h/db')
+        self.assertEqual(options['pool_size'], 7)
+        self.assertTrue(options['pool_pre_ping'])
+        self.assertEqual(options['connect_args'], {'options': '-c statement_timeout=1500'})
+        self.assertNotIn('connect_args', engine_options(self.config(), 'postgresql://u@h/db'))
+        self.assertEqual(engine_options(self.config(DATABASE_POOL_SIZE=7), 'sqlite:///x.db'), {})
+
+    @unittest.skipUnless(os.environ['DATABASE_URL'].startswith('postgresql'), 'statement_timeout needs Postgres')
+    def test_statement_timeout_cancels_slow_queries(self):
+        url = os.environ['DATABASE_URL']
+        engine = create_engine(url, **engine_options(self.config(DATABASE_STATEMENT_TIMEOUT_MS=50), url))
+        try:
+            with engine.connect() as conn, self.assertRaises(OperationalError):
+                conn.execute(text('SELECT pg_sleep(1)'))
+        finally:
+            engine.dispose()
+
+class TestReplicaRouting(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = self.make_user()
+        self.headers = self.auth_headers(self.user)
+        self.account = self.make_account(self.user, name='Primary')
+        self.ingest('p-1', 'primary row')
+
+        self.tmp = tempfile.mkdtemp()
+        self.replicas = [self.make_replica(name) for name in ('Replica A', 'Replica B')]
+        self.now = 0.0
+        self.app.extensions['db_replicas'] = ReplicaSet(self.replicas, retry_seconds=30, lag_seconds=5,
+                                                        clock=lambda: self.now)
+
+    def tearDown(self):
+        self.app.extensions['db_replicas'] = None
+        for engine in self.replicas:
+            engine.dispose()
+        shutil.rmtree(self.tmp)
+        super().tearDown()
+
+    def ingest(self, plaid_id, description):
+        upsert_transactions(self.user.id, [{
+            'bank_account_id': self.account.id,
+            'plaid_transaction_id': plaid_id,
+            'amount': -5.0,
+            'date': date.today(),
+            'description': description,
+            'merchant': None
+        }])
+        db.session.commit()
+
+    def make_replica(self, name):
+        """A replica holding the same user at the same version, with recognisable rows"""
+        engine = create_engine('sqlite:///' + os.path.join(self.tmp, f'{name}.db'))
+        db.metadata.create_all(engine)
+        with engine.begin() as conn:
+            conn.execute(insert(User).values(id=self.user.id, email=self.user.email, data_version=self.user.data_version))
+            conn.execute(insert(BankAccount).values(
+                id=self.account.id, user_id=self.user.id, plaid_account_id='acc', institution_name='Bank',
+                account_name=name, account_type='depository', balance=0
+            ))
+            conn.execute(insert(Transaction).values(
+                bank_account_id=self.account.id, plaid_transaction_id='r-1', amount=-7.0,
+                date=date.today(), description=f'{name} row'
+            ))
+            for model, period in ((DailyRollup, {'day': date.today()}), (MonthlyRollup, {'month': date.today().replace(day=1)})):
+                conn.execute(insert(model).values(
+                    user_id=self.user.id, bank_account_id=self.account.id, category_id=0,
+                    income=0, expenses=7.0, transaction_count=1, **period
+                ))
+        return engine
+
+    def account_name(self):
+        # The test shares one session across requests; start each from an empty identity map
+        db.session.expire_all()
+        response = self.client.get(f'/accounts/{self.user.id}')
+        self.assertEqual(response.status_code, 200)
+        return response.get_json()['accounts'][0]['name']
+
+    def test_reads_rotate_across_replicas(self):
+        self.assertEqual([self.account_name() for _ in range(4)], ['Replica A', 'Replica B'] * 2)
+
+        # Streamed from the replica; later identical requests hit the response cache
+        response = self.client.get('/api/transactions', headers=self.headers)
+        self.assertTrue(response.is_streamed)
+        self.assertEqual([row['description'] for row in response.get_json()], ['Replica A row'])
+        summary = self.client.get('/api/summary', headers=self.headers).get_json()
+        self.assertEqual((summary['count'], summary['expenses']), (1, 7.0))
+
+    def test_reads_stay_on_primary_after_a_write(self):
+        self.ingest('p-2', 'fresh sync')
+        self.assertEqual(self.account_name(), 'Primary')
+        body = self.client.get('/api/transactions', headers=self.headers).get_json()
+        self.assertEqual({row['description'] for row in body}, {'primary row', 'fresh sync'})
+
+        self.now = 6
+        self.assertIn(self.account_name(), ('Replica A', 'Replica B'))
+
+    def test_rolled_back_write_does_not_pin(self):
+        bump_data_version(self.user.id)
+        db.session.rollback()
+        db.session.commit()
+        self.assertIn(self.account_name(), ('Replica A', 'Replica B'))
+
+    def test_pin_is_shared_through_redis(self):
+        with FakeRedisServer() as server:
+            self.app.extensions['response_cache'] = RedisCache(server.url, ttl=60)
+            self.ingest('p-2', 'synced by the job worker')
+            # Another process knows nothing of the write but finds the marker
+            self.app.extensions['db_replicas'].primary_until.clear()
+            self.assertEqual(self.account_name(), 'Primary')
+            server.data.clear()
+            self.assertIn(self.account_name(), ('Replica A', 'Replica B'))
+
+    def test_lagging_replica_is_passed_over(self):
+        replicas = self.app.extensions['db_replicas']
+        lags = {self.replicas[0]: 30.0, self.replicas[1]: 0.5}
+        replicas.measure_lag = lambda engine: lags[engine]
+        self.assertEqual([self.account_name() for _ in range(3)], ['Replica B'] * 3)
+
+        lags[self.replicas[1]] = 30.0
+        self.assertEqual(self.account_name(), 'Replica B', 'the lag sample is still fresh')
+        self.now = 1
+        self.assertEqual(self.account_name(), 'Primary')
+
+    def test_unreachable_replica_is_skipped_then_retried(self):
+        broken = create_engine('sqlite:///' + os.path.join(self.tmp, 'missing', 'replica.db'))
+        replicas = self.app.extensions['db_replicas'] = ReplicaSet(
+            [broken, self.replicas[0]], retry_seconds=30, lag_seconds=5, clock=lambda: self.now
+        )
+        self.assertEqual([self.account_name() for _ in range(3)], ['Replica A'] * 3)
+        self.assertIn(broken, replicas.down_until)
+
+        # Only the broken one is left: fall back to the primary
+        replicas.engines = [broken]
+        replicas.down_until.clear()
+        self.assertEqual(self.account_name(), 'Primary')
+        self.now = 31
+        self.assertEqual(replicas.candidates(), [broken])
+
+    def test_writes_go_to_the_primary_while_routed(self):
+        session = db.session()
+        session.info['replica'] = self.replicas[0]
+        try:
+            self.assertEqual(session.execute(select(BankAccount.account_name)).scalar(), 'Replica A')
+            session.execute(update(User).where(User.id == self.user.id).values(full_name='Renamed'))
+            session.add(BankAccount(user_id=self.user.id, plaid_account_id='new', institution_name='Bank',
+                                    account_name='New', account_type='depository', balance=0))
+            session.flush()
+        finally:
+            session.info.pop('replica')
+        session.commit()
+        self.assertEqual(db.session.get(User, self.user.id).full_name, 'Renamed')
+        self.assertEqual(BankAccount.query.filter_by(user_id=self.user.id).count(), 2)
+        with self.replicas[0].connect() as conn:
+            self.assertEqual(conn.execute(select(User.full_name)).scalar(), None)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+import unittest
+from datetime import date, timedelta
+from helpers import DatabaseTestCase
+from services.search_service import search, terms, trigram_enabled
+
+class TestSearchService(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = self.make_user()
+        self.account = self.make_account(self.user)
+        self.today = date.today()
+        self.add_transaction(self.account, -23.5, self.today - timedelta(days=40),
+                             description='UBER *TRIP HELP.UBER.COM', merchant='Uber')
+        self.add_transaction(self.account, -41, self.today - timedelta(days=3),
+                             description='UBER EATS ORDER', merchant='Uber Eats')
+        self.add_transaction(self.account, -5.25, self.today, description='STARBUCKS STORE 1042', merchant='Starbucks')
+        self.add_transaction(self.account, 2000, self.today, description='PAYROLL DEPOSIT')
+        # Another user's ride
+        self.add_transaction(self.make_account(self.make_user()), -19, self.today, description='UBER TRIP', merchant='Uber')
+
+    def descriptions(self, results):
+        return [t['description'] for t in results]
+
+    def test_terms(self):
+        self.assertEqual(terms('  Uber*Eats, 12_34 '), ['uber', 'eats', '12', '34'])
+
+    def test_prefix_match_scoped_to_user(self):
+        results, next_cursor = search(self.user.id, 'ube')
+        self.assertEqual(sorted(self.descriptions(results)), ['UBER *TRIP HELP.UBER.COM', 'UBER EATS ORDER'])
+        self.assertIsNone(next_cursor)
+        self.assertEqual(self.descriptions(search(self.user.id, 'starb')[0]), ['STARBUCKS STORE 1042'])
+
+    def test_every_word_must_match(self):
+        results, _ = search(self.user.id, 'uber eat')
+        self.assertEqual(self.descriptions(results), ['UBER EATS ORDER'])
+
+    def test_filters(self):
+        month_ago = self.today - timedelta(days=30)
+        self.assertEqual(self.descriptions(search(self.user.id, 'uber', start_date=month_ago)[0]), ['UBER EATS ORDER'])
+        self.assertEqual(self.descriptions(search(self.user.id, 'uber', end_date=month_ago)[0]), ['UBER *TRIP HELP.UBER.COM'])
+        self.assertEqual(self.descriptions(search(self.user.id, 'uber', min_amount=20, max_amount=25)[0]),
+                         ['UBER *TRIP HELP.UBER.COM'])
+
+    def test_keyset_pagination(self):
+        for i in range(5):
+            self.add_transaction(self.account, -10 - i, self.today - timedelta(days=i), description=f'UBER TRIP {i}')
+        expected = [t['id'] for t in search(self.user.id, 'uber')[0]]
+        self.assertEqual(len(expected), 7)
+
+        seen, cursor = [], None
+        for _ in range(3):
+            page, cursor = search(self.user.id, 'uber', limit=3, cursor=cursor)
+            seen.extend(t['id'] for t in page)
+        self.assertIsNone(cursor)
+        self.assertEqual(seen, expected)
+
+    def test_results_ordered_by_score(self):
+        results, _ = search(self.user.id, 'uber')
+        scores = [t['score'] for t in results]
+        self.assertEqual(scores, sorted(scores, reverse=True))
+
+    def test_unknown_user(self):
+        self.assertEqual(search(self.user.id + 1000, 'uber'), ([], None))
+
+    def test_query_without_words(self):
+        with self.assertRaises(ValueError):
+            search(self.user.id, '*** ')
+
+    def test_fuzzy_match(self):
+        if not trigram_enabled():
+            self.skipTest('pg_trgm is not installed')
+        self.assertEqual(self.descriptions(search(self.user.id, 'starbucs')[0]), ['STARBUCKS STORE 1042'])
+
+class TestSearchEndpoint(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = self.make_user()
+        account = self.make_account(self.user)
+        self.add_transaction(account, -12, date(2026, 3, 14), description='UBER TRIP', merchant='Uber')
+        self.add_transaction(account, -12, date(2026, 5, 2), description='UBER TRIP', merchant='Uber')
+
+    def get(self, query):
+        return self.client.get(f'/api/transactions/search?{query}', headers=self.auth_headers(self.user))
+
+    def test_search(self):
+        response = self.get('q=uber&start=2026-03-01&end=2026-03-31')
+        self.assertEqual(response.status_code, 200)
+        body = response.get_json()
+        self.assertEqual([t['date'] for t in body['transactions']], ['2026-03-14'])
+        self.assertIsNone(body['next_cursor'])
+
+        body = self.get('q=uber&limit=1').get_json()
+        self.assertEqual(body['transactions'][0]['date'], '2026-05-02')
+        body = self.get(f"q=uber&limit=1&cursor={body['next_cursor']}").get_json()
+        self.assertEqual(body['transactions'][0]['date'], '2026-03-14')
+
+    def test_bad_requests(self):
+        for query in ['', 'q=', 'q=uber&start=March', 'q=uber&min_amount=ten', 'q=uber&limit=x', 'q=uber&cursor=bogus']:
+            response = self.get(query)
+            self.assertEqual(response.status_code, 400, query)
+            self.assertIn('detail', response.get_json())
+
+if __name__ == '__main__':
+    unittest.main()
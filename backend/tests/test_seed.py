@@ -0,0 +1,76 @@
+import unittest
+from datetime import date, timedelta
+from sqlalchemy import func, select
+from helpers import DatabaseTestCase
+from database.models import db, BankAccount, Budget, DailyRollup, Transaction, User, content_hash
+from services import category_service, password_service, seed_service
+
+END = date(2026, 3, 31)
+
+class TestGenerate(DatabaseTestCase):
+    def generate(self, users=2, seed=5):
+        return seed_service.generate(users, accounts=3, transactions=300, days=120, end=END, seed=seed)
+
+    def history(self):
+        return db.session.execute(
+            select(User.email, BankAccount.account_type, Transaction.date, Transaction.amount,
+                   Transaction.description, Transaction.merchant, Transaction.category_id)
+            .join(BankAccount, Transaction.bank_account_id == BankAccount.id)
+            .join(User, BankAccount.user_id == User.id)
+            .order_by(User.email, BankAccount.account_type, Transaction.date, Transaction.amount,
+                      Transaction.description)
+        ).all()
+
+    def test_generate(self):
+        self.assertEqual(self.generate(), {'users': 2, 'accounts': 6, 'transactions': 600, 'budgets': 6})
+        users = User.query.order_by(User.id).all()
+        self.assertTrue(password_service.verify_password(users[0].hashed_password, 'demo123')[0])
+        per_user = db.session.execute(
+            select(BankAccount.user_id, func.count(Transaction.id), func.min(Transaction.date), func.max(Transaction.date))
+            .join(Transaction, Transaction.bank_account_id == BankAccount.id).group_by(BankAccount.user_id)
+        ).all()
+        for _, count, first, last in per_user:
+            self.assertEqual(count, 300)
+            self.assertGreaterEqual(first, END - timedelta(days=119))
+            self.assertLessEqual(last, END)
+
+        payroll = Transaction.query.filter(Transaction.description == 'ACME CORP PAYROLL').all()
+        self.assertTrue(payroll and all(t.amount > 0 and t.date.weekday() == 4 for t in payroll))
+        self.assertEqual(db.session.execute(select(func.sum(DailyRollup.transaction_count))).scalar(), 600)
+        self.assertEqual(Budget.query.count(), 6)
+        # Rows carry the categories and hashes ingestion would give them
+        self.assertEqual(category_service.recategorize(users[0].id), 0)
+        sample = Transaction.query.first()
+        self.assertEqual(sample.content_hash, content_hash(sample.bank_account_id, sample.date,
+                                                         sample.amount, sample.description))
+
+    def test_deterministic(self):
+        self.generate()
+        first = self.history()
+        self.tearDown()
+        self.setUp()
+        # A user's rows do not depend on how many users are generated
+        self.generate(users=3)
+        second = self.history()
+        self.assertEqual([row for row in second if row.email != seed_service.email(5, 2)], first)
+
+        self.generate(seed=6)
+        self.assertNotEqual([row[1:] for row in self.history() if row.email == seed_service.email(6, 0)],
+                            [row[1:] for row in first if row.email == seed_service.email(5, 0)])
+
+    def test_refuses_a_used_seed(self):
+        self.generate(users=1)
+        with self.assertRaisesRegex(ValueError, 'seed 5'):
+            self.generate(users=1)
+        with self.assertRaises(ValueError):
+            seed_service.generate(1, accounts=4, seed=7)
+
+    def test_cli(self):
+        result = self.app.test_cli_runner().invoke(args=['seed', 'generate', '--users', '2', '--accounts', '1',
+                                                         '--transactions', '50', '--days', '60', '--seed', '3'])
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn('Created 2 users, 2 accounts, 100 transactions', result.output)
+        self.assertEqual(Transaction.query.count(), 100)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+import unittest
+from datetime import date, timedelta
+from sqlalchemy import event
+from helpers import DatabaseTestCase
+from database.models import db
+from services import rollup_service
+from services.summary_service import summarize, summarize_transactions
+
+class TestSummaryService(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = self.make_user()
+        self.checking = self.make_account(self.user, 'Checking')
+        self.savings = self.make_account(self.user, 'Savings')
+        self.food = self.make_category('Food & Dining')
+        self.today = date.today()
+
+        self.add_transaction(self.checking, 1000, self.today, description='Paycheck')
+        self.add_transaction(self.checking, -40, self.today, self.food)
+        self.add_transaction(self.savings, -60, self.today, self.food)
+        self.add_transaction(self.savings, 25, self.today)
+        # Outside the window and owned by another user
+        self.add_transaction(self.checking, -500, self.today - timedelta(days=400))
+        other = self.make_account(self.make_user())
+        self.add_transaction(other, -999, self.today)
+        rollup_service.rebuild()
+        db.session.commit()
+
+    def test_totals(self):
+        summary = summarize(self.user.id, self.today - timedelta(days=30), self.today)
+        self.assertEqual(summary, {'income': 1025.0, 'expenses': 100.0, 'net': 925.0, 'count': 4})
+
+    def test_breakdowns(self):
+        summary = summarize(self.user.id, self.today, self.today, ['account', 'category'])
+        self.assertEqual(summary['net'], 925.0)
+
+        by_account = {a['account_name']: a for a in summary['by_account']}
+        self.assertEqual(by_account['Checking']['net'], 960.0)
+        self.assertEqual(by_account['Savings']['count'], 2)
+
+        by_category = {c['category']: c for c in summary['by_category']}
+        self.assertEqual(by_category['Food & Dining']['expenses'], 100.0)
+        self.assertEqual(by_category[None]['income'], 1025.0)
+
+    def test_matches_raw_aggregate(self):
+        start = self.today - timedelta(days=450)
+        for breakdowns in ([], ['account', 'category']):
+            self.assertEqual(
+                summarize(self.user.id, start, self.today, breakdowns),
+                summarize_transactions(self.user.id, start, self.today, breakdowns)
+            )
+
+    def test_single_statement(self):
+        user_id = self.user.id
+        statements = []
+        listener = lambda *args: statements.append(args[2])
+        event.listen(db.engine, 'before_cursor_execute', listener)
+        try:
+            summarize(user_id, self.today, self.today, ['account', 'category'])
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', listener)
+        self.assertEqual(len(statements), 1)
+
+    def test_unknown_breakdown(self):
+        with self.assertRaises(ValueError):
+            summarize(self.user.id, self.today, self.today, ['merchant'])
+
+    def test_endpoint(self):
+        response = self.client.get(
+            '/api/summary?time_period=month&breakdown=category',
+            headers=self.auth_headers(self.user)
+        )
+        self.assertEqual(response.status_code, 200)
+        data = response.get_json()
+        self.assertEqual(data['income'], 1025.0)
+        self.assertIn('by_category', data)
+        self.assertIn('start', data['period'])
+
+        response = self.client.get('/api/summary?breakdown=bogus', headers=self.auth_headers(self.user))
+        self.assertEqual(response.status_code, 400)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+import json
+import unittest
+from datetime import date, timedelta
+from helpers import DatabaseTestCase
+from services.transaction_service import encode_cursor, decode_cursor
+
+class TestTransactionListing(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = self.make_user()
+        self.headers = self.auth_headers(self.user)
+        account = self.make_account(self.user)
+        food = self.make_category('Food & Dining')
+        today = date.today()
+        # Several rows share a date so the id tiebreaker matters
+        for i in range(12):
+            self.add_transaction(account, -i - 1, today - timedelta(days=i // 3 if today.day > 4 else 0),
+                                 food if i % 2 else None, description=f'Txn {i}', merchant='Uber')
+        self.add_transaction(self.make_account(self.make_user()), -1, today)
+
+    def get(self, query):
+        return self.client.get(f'/api/transactions?{query}', headers=self.headers)
+
+    def test_streamed_array(self):
+        response = self.get('time_period=month')
+        self.assertEqual(response.status_code, 200)
+        rows = json.loads(response.get_data(as_text=True))
+        self.assertEqual(len(rows), 12)
+        self.assertEqual(rows, sorted(rows, key=lambda r: (r['date'], r['id']), reverse=True))
+        self.assertEqual({r['category'] for r in rows}, {'Food & Dining', None})
+        self.assertEqual(rows[0]['merchant'], 'Uber')
+
+    def test_ndjson(self):
+        response = self.get('format=ndjson')
+        self.assertEqual(response.mimetype, 'application/x-ndjson')
+        lines = response.get_data(as_text=True).splitlines()
+        self.assertEqual([json.loads(line) for line in lines], json.loads(self.get('').get_data(as_text=True)))
+
+    def test_keyset_pages(self):
+        expected = json.loads(self.get('').get_data(as_text=True))
+        seen, cursor = [], None
+        while True:
+            response = self.get('limit=5' + (f'&cursor={cursor}' if cursor else ''))
+            data = response.get_json()
+            self.assertLessEqual(len(data['transactions']), 5)
+            seen += data['transactions']
+            cursor = data['next_cursor']
+            if not cursor:
+                break
+        self.assertEqual(seen, expected)
+
+    def test_bad_parameters(self):
+        self.assertEqual(self.get('limit=abc').status_code, 400)
+        self.assertEqual(self.get('cursor=not-a-cursor').status_code, 400)
+
+    def test_cursor_round_trip(self):
+        row = type('Row', (), {'date': date(2026, 1, 2), 'id': 42})
+        self.assertEqual(decode_cursor(encode_cursor(row)), (date(2026, 1, 2), 42))
+
+if __name__ == '__main__':
+    unittest.main()